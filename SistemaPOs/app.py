@@ -4,10 +4,12 @@ import os
 from flask import Flask, request, session
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from azdigital.integration import agildte_outbox
 from azdigital.routes.admin import bp as admin_bp
 from azdigital.routes.auth import bp as auth_bp
 from azdigital.routes.core import bp as core_bp
 from azdigital.routes.pos import bp as pos_bp
+from azdigital.utils import db_pool
 from azdigital.utils.env_config import (
     get_application_url_prefix,
     get_public_base_url,
@@ -83,6 +85,8 @@ def create_app() -> Flask:
         import warnings
         warnings.warn("AZ_SECRET_KEY no configurado. Configure AZ_SECRET_KEY en .env para producción.", UserWarning)
     app.secret_key = secret
+    # Una conexión PostgreSQL del pool por petición (hooks, decoradores y rutas la comparten).
+    db_pool.init_app(app)
 
     es_produccion = is_production_mode()
     app.config.update(
@@ -218,17 +222,11 @@ def create_app() -> Flask:
         # Refrescar rol desde BD para que SUPERADMIN se actualice sin cerrar sesión
         if session.get("user_id"):
             try:
-                import psycopg2
-                from database import ConexionDB
-                db = ConexionDB()
-                conn = psycopg2.connect(**db.config)
-                cur = conn.cursor()
-                cur.execute("SELECT rol FROM usuarios WHERE id = %s AND activo = TRUE", (session["user_id"],))
-                r = cur.fetchone()
-                cur.close()
-                conn.close()
-                if r and r[0]:
-                    session["rol"] = str(r[0]).strip().upper()
+                from azdigital.utils.sesion_snapshot import rol_usuario
+
+                rol = rol_usuario(session["user_id"])
+                if rol:
+                    session["rol"] = rol
             except Exception:
                 pass
 
@@ -244,15 +242,9 @@ def create_app() -> Flask:
         if path == "/suscripcion_expirada":
             return None
         try:
-            import psycopg2
-            from azdigital.repositories import empresas_repo
-            from database import ConexionDB
-            db = ConexionDB()
-            conn = psycopg2.connect(**db.config)
-            cur = conn.cursor()
-            detalle = empresas_repo.get_suscripcion_detalle(cur, session.get("empresa_id", 1))
-            cur.close()
-            conn.close()
+            from azdigital.utils.sesion_snapshot import suscripcion_empresa
+
+            detalle = suscripcion_empresa(session.get("empresa_id", 1))
             if not detalle["vigente"]:
                 from flask import redirect, url_for
                 return redirect(url_for("core.suscripcion_expirada"))
@@ -291,18 +283,12 @@ def create_app() -> Flask:
         uid = session.get("user_id")
         if uid:
             try:
-                import psycopg2
-                from database import ConexionDB
-                db = ConexionDB()
-                conn = psycopg2.connect(**db.config)
-                cur = conn.cursor()
-                cur.execute("SELECT rol FROM usuarios WHERE id = %s AND activo = TRUE", (uid,))
-                r = cur.fetchone()
-                cur.close()
-                conn.close()
-                if r and r[0]:
-                    ctx["rol_actual"] = str(r[0]).strip().upper()
-                    session["rol"] = ctx["rol_actual"]
+                from azdigital.utils.sesion_snapshot import rol_usuario
+
+                rol = rol_usuario(uid)
+                if rol:
+                    ctx["rol_actual"] = rol
+                    session["rol"] = rol
             except Exception:
                 pass
         rol = ctx.get("rol_actual") or ""
@@ -315,14 +301,14 @@ def create_app() -> Flask:
         ctx["puede_dar_baja_producto"] = puede_dar_baja_producto(rol)
         ctx["es_super"] = rol in ("ADMIN", "SUPERADMIN")
         try:
-            import psycopg2
             from database import ConexionDB
-            from azdigital.repositories import empresas_repo, productos_repo
+            from azdigital.repositories import productos_repo
+            from azdigital.utils.sesion_snapshot import suscripcion_empresa
             db = ConexionDB()
-            conn = psycopg2.connect(**db.config)
+            conn = db.conexion()
             cur = conn.cursor()
             emp_id = session.get("empresa_id", 1)
-            ctx["suscripcion"] = empresas_repo.get_suscripcion_detalle(cur, emp_id)
+            ctx["suscripcion"] = suscripcion_empresa(emp_id, cur)
             try:
                 ctx["alertas_inventario"] = productos_repo.productos_stock_bajo(cur, umbral=5, empresa_id=emp_id) or []
                 ctx["alertas_inventario_total"] = productos_repo.contar_productos_stock_bajo(cur, umbral=5, empresa_id=emp_id)
@@ -347,6 +333,9 @@ def create_app() -> Flask:
     if _prefix:
         app.wsgi_app = _StripApplicationPrefixMiddleware(app.wsgi_app, _prefix)
 
+    # Envío de ventas a AgilDTE en segundo plano (bandeja agildte_outbox); no-op sin AGILDTE_SYNC_ENABLED.
+    agildte_outbox.iniciar_despachador()
+
     return app
 
 
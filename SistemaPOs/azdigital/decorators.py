@@ -43,22 +43,15 @@ def login_required(fn: F) -> F:
 
 
 def _rol_desde_bd():
-    """Obtiene el rol actual desde BD (más fiable que sesión)."""
+    """Obtiene el rol actual desde BD (más fiable que sesión; instantánea de TTL corto)."""
     uid = session.get("user_id")
     if not uid:
         return None
     try:
-        import psycopg2
-        from database import ConexionDB
-        db = ConexionDB()
-        conn = psycopg2.connect(**db.config)
-        cur = conn.cursor()
-        cur.execute("SELECT rol FROM usuarios WHERE id = %s AND activo = TRUE", (uid,))
-        r = cur.fetchone()
-        cur.close()
-        conn.close()
-        if r and r[0]:
-            rol = str(r[0]).strip().upper()
+        from azdigital.utils.sesion_snapshot import rol_usuario
+
+        rol = rol_usuario(uid)
+        if rol:
             session["rol"] = rol
             return rol
     except Exception:
@@ -18,13 +18,11 @@ def _listar_actividades_local(
     offset: int = 0,
 ) -> dict[str, Any]:
     """Catálogo en PostgreSQL del POS (tabla actividades_economicas)."""
-    import psycopg2
-
     from azdigital.repositories import actividades_repo
     from database import ConexionDB
 
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         rows, total = actividades_repo.buscar_actividades(cur, search=search, limit=limit, offset=offset)
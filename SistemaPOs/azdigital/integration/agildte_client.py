@@ -585,10 +585,12 @@ class AgilDTEClient:
         data: Any = None,
         _retry_on_401: bool = True,
         timeout: float | None = None,
+        headers: dict[str, str] | None = None,
     ) -> httpx.Response:
         if not self._access:
             raise AgilDTEUnauthorizedError("No autenticado: llame a login() primero.")
-        headers = {"Authorization": f"Bearer {self._access}"}
+        req_headers = dict(headers or {})
+        req_headers["Authorization"] = f"Bearer {self._access}"
         url = self._url(path)
         effective_timeout = self.timeout if timeout is None else timeout
         with httpx.Client(timeout=effective_timeout) as c:
@@ -598,7 +600,7 @@ class AgilDTEClient:
                 params=params,
                 json=json_body,
                 data=data,
-                headers=headers,
+                headers=req_headers,
             )
         if r.status_code == 401 and _retry_on_401:
             if self._refresh_access():
@@ -610,6 +612,7 @@ class AgilDTEClient:
                     data=data,
                     _retry_on_401=False,
                     timeout=timeout,
+                    headers=headers,
                 )
             raise AgilDTEUnauthorizedError(
                 "401: sesión expirada o token inválido; vuelva a autenticarse.",
@@ -643,9 +646,10 @@ class AgilDTEClient:
         *,
         params: dict[str, Any] | None = None,
         timeout: float = 600.0,
+        headers: dict[str, str] | None = None,
     ) -> Any:
         """POST con timeout extendido (p. ej. procesar contingencia completa en AgilDTE)."""
-        r = self.request("POST", path, params=params, json_body=json_body, timeout=timeout)
+        r = self.request("POST", path, params=params, json_body=json_body, timeout=timeout, headers=headers)
         if r.status_code >= 400:
             _raise_for_status(r)
         return r.json() if r.content else None
@@ -700,11 +704,13 @@ class AgilDTEClient:
             b.setdefault("empresa", eid)
         return self.post_json(f"{API_PREFIX}/ventas/crear-con-detalles/", json_body=b)
 
-    def procesar_venta_pos(self, body: dict[str, Any]) -> Any:
+    def procesar_venta_pos(self, body: dict[str, Any], idempotency_key: str | None = None) -> Any:
         """
         POST /api/pos/procesar-venta/ — mismo cuerpo que crear-con-detalles;
         respuesta normalizada { ok, mensaje, venta } para el POS.
         Timeout largo (AgilDTE espera respuesta MH en modo síncrono).
+        ``idempotency_key``: cabecera Idempotency-Key; AgilDTE devuelve la venta ya creada con
+        esa clave en lugar de crear otra (reintentos de la bandeja agildte_outbox).
         """
         b = dict(body)
         eid = self.empresa_id
@@ -716,8 +722,9 @@ class AgilDTEClient:
             to = max(30.0, float(raw))
         except ValueError:
             to = 180.0
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
         return self.post_json_timeout(
-            f"{API_PREFIX}/pos/procesar-venta/", json_body=b, timeout=to
+            f"{API_PREFIX}/pos/procesar-venta/", json_body=b, timeout=to, headers=headers
         )
 
     def generar_dte_venta(self, venta_id: int, extra_params: dict[str, Any] | None = None) -> Any:
@@ -1116,6 +1123,7 @@ _PUBLIC_SYNC_KEYS = frozenset(
         "mensaje_agildte",
         "facturacion",
         "dte_persistido",
+        "pendiente",
     }
 )
 
@@ -0,0 +1,230 @@
+# Programador: Oscar Amaya Romero
+"""
+Envío de ventas a AgilDTE a través de la bandeja ``agildte_outbox``.
+
+guardar_venta escribe la fila en la misma transacción que la venta (``encolar_venta``): si la
+venta existe, su envío también. Con AGILDTE_SYNC_ASYNC=1 (predeterminado) la respuesta al POS no
+espera a AgilDTE: un hilo despachador por worker (``iniciar_despachador``) entrega la fila, y el
+ticket consulta /venta/<id>/dte_estado para mostrar código/sello cuando lleguen.
+
+El despachador usa las credenciales de servicio (AGILDTE_USERNAME/PASSWORD). Sin ellas no hay
+quién autentique fuera de la petición y guardar_venta entrega en línea con el JWT de la sesión,
+como antes, pero igual deja la fila para reintentar.
+
+Reintentos con espera exponencial (AGILDTE_OUTBOX_REINTENTO_SEG, tope AGILDTE_OUTBOX_REINTENTO_MAX_SEG)
+hasta AGILDTE_OUTBOX_MAX_INTENTOS. Errores que no se arreglan reintentando (datos del cliente,
+permiso, 4xx de AgilDTE como un rechazo de MH) dejan la fila FALLIDO al primer intento.
+Cada envío lleva Idempotency-Key: si un timeout hizo reintentar una venta que AgilDTE sí creó,
+AgilDTE devuelve la misma venta en lugar de duplicarla.
+"""
+from __future__ import annotations
+
+import dataclasses
+import logging
+import os
+import threading
+from typing import Any
+
+from azdigital.integration.agildte_client import _credenciales_servicio_validas, login_client_from_env
+from azdigital.integration.agildte_sync import _truthy_env, sync_venta_a_agildte
+from azdigital.repositories import agildte_outbox_repo
+
+logger = logging.getLogger(__name__)
+
+# Errores de sync_venta_a_agildte que requieren corregir datos o permisos: no se reintentan.
+_ERRORES_DEFINITIVOS = frozenset({"cliente_sin_nrc", "nrc_igual_documento", "forbidden"})
+
+_despertar = threading.Event()
+_hilo: threading.Thread | None = None
+_hilo_pid: int | None = None
+_hilo_lock = threading.Lock()
+
+
+def _entero_env(nombre: str, default: int) -> int:
+    try:
+        return int((os.environ.get(nombre) or "").strip() or default)
+    except ValueError:
+        return default
+
+
+def _segundos_arriendo() -> int:
+    """Más que el timeout de procesar-venta: un envío en curso no se toma dos veces."""
+    raw = (os.environ.get("AGILDTE_POS_VENTA_TIMEOUT") or "180").strip() or "180"
+    try:
+        timeout = max(30.0, float(raw))
+    except ValueError:
+        timeout = 180.0
+    return int(timeout) + 60
+
+
+def modo_asincrono() -> bool:
+    """True si guardar_venta solo encola y el despachador entrega (requiere credenciales de servicio)."""
+    return (
+        _truthy_env("AGILDTE_SYNC_ENABLED")
+        and _truthy_env("AGILDTE_SYNC_ASYNC", default=True)
+        and _credenciales_servicio_validas()
+    )
+
+
+def _linea_dict(ln: Any) -> dict[str, Any]:
+    if dataclasses.is_dataclass(ln):
+        return dataclasses.asdict(ln)
+    return dict(ln)
+
+
+def encolar_venta(
+    cur,
+    *,
+    empresa_id_local: int,
+    venta_id_local: int,
+    tipo_comprobante: str,
+    tipo_pago: str,
+    lineas: list[Any],
+    total_neto: float,
+    total_bruto: float,
+    descuento: float,
+    cliente_id: int | None,
+    cliente_nombre_ticket: str,
+) -> int | None:
+    """
+    Inserta la venta en la bandeja (antes del commit de la venta). None si la sync está
+    desactivada o la BD aún no tiene la tabla (scripts/alter_agildte_outbox.py).
+    """
+    if not _truthy_env("AGILDTE_SYNC_ENABLED") or not agildte_outbox_repo.tabla_existe(cur):
+        return None
+    datos = {
+        "tipo_comprobante": tipo_comprobante,
+        "tipo_pago": tipo_pago,
+        "lineas": [_linea_dict(ln) for ln in lineas],
+        "total_neto": float(total_neto),
+        "total_bruto": float(total_bruto),
+        "descuento": float(descuento),
+        "cliente_id": cliente_id,
+        "cliente_nombre_ticket": cliente_nombre_ticket,
+    }
+    outbox_id, _ = agildte_outbox_repo.encolar(cur, venta_id_local, empresa_id_local, datos)
+    return outbox_id
+
+
+def _espera_reintento(intentos: int) -> int | None:
+    """Segundos hasta el próximo intento, o None si ya se agotaron."""
+    if intentos >= _entero_env("AGILDTE_OUTBOX_MAX_INTENTOS", 10):
+        return None
+    base = max(1, _entero_env("AGILDTE_OUTBOX_REINTENTO_SEG", 15))
+    tope = max(base, _entero_env("AGILDTE_OUTBOX_REINTENTO_MAX_SEG", 1800))
+    return min(tope, base * 2 ** max(0, intentos - 1))
+
+
+def _es_definitivo(resultado: dict[str, Any]) -> bool:
+    if resultado.get("error") in _ERRORES_DEFINITIVOS:
+        return True
+    status = resultado.get("http_status")
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 409, 425, 429)
+
+
+def entregar(conn, cur, fila: dict[str, Any], cliente=None) -> dict[str, Any]:
+    """
+    Envía una fila ya arrendada y registra el resultado (código/sello en ventas y estado en la
+    bandeja) con un commit. ``cliente`` None: sesión Flask o credenciales de servicio.
+    """
+    datos = fila["datos"]
+    resultado = sync_venta_a_agildte(
+        cur=cur,
+        empresa_id_local=int(fila["empresa_id"] or 1),
+        venta_id_local=int(fila["venta_id"]),
+        tipo_comprobante=str(datos.get("tipo_comprobante") or "TICKET"),
+        tipo_pago=str(datos.get("tipo_pago") or "EFECTIVO"),
+        lineas=list(datos.get("lineas") or []),
+        total_neto=float(datos.get("total_neto") or 0),
+        total_bruto=float(datos.get("total_bruto") or 0),
+        descuento=float(datos.get("descuento") or 0),
+        cliente_id=datos.get("cliente_id"),
+        cliente_nombre_ticket=str(datos.get("cliente_nombre_ticket") or "Consumidor Final"),
+        cliente=cliente,
+        idempotency_key=fila["clave_idempotencia"],
+    )
+    guardado = {k: v for k, v in resultado.items() if k != "crear_respuesta"}
+    if resultado.get("ok"):
+        agildte_outbox_repo.marcar_enviado(cur, fila["id"], guardado)
+    else:
+        espera = None if _es_definitivo(resultado) else _espera_reintento(fila["intentos"])
+        error = str(resultado.get("mensaje_usuario") or resultado.get("error") or "Sin respuesta de AgilDTE")
+        agildte_outbox_repo.marcar_error(cur, fila["id"], error, guardado, espera)
+        logger.warning(
+            "AgilDTE outbox venta #%s intento %s: %s (%s)",
+            fila["venta_id"],
+            fila["intentos"],
+            error,
+            "reintento en %ss" % espera if espera is not None else "sin más reintentos",
+        )
+    conn.commit()
+    return resultado
+
+
+def entregar_ahora(conn, cur, outbox_id: int) -> dict[str, Any] | None:
+    """Envío en línea desde guardar_venta (modo sin despachador). None si otro ya la tomó."""
+    fila = agildte_outbox_repo.arrendar(cur, outbox_id, _segundos_arriendo())
+    conn.commit()
+    if fila is None:
+        return None
+    return entregar(conn, cur, fila)
+
+
+def despachar_pendientes(limite: int = 20) -> int:
+    """Entrega un lote de filas vencidas. Retorna cuántas se intentaron."""
+    from database import ConexionDB
+
+    conn = ConexionDB().conexion()
+    cur = conn.cursor()
+    try:
+        filas = agildte_outbox_repo.arrendar_pendientes(cur, limite, _segundos_arriendo())
+        conn.commit()
+        cliente = None
+        if filas:
+            try:
+                cliente = login_client_from_env()  # un login por lote, no por venta
+            except Exception:
+                cliente = None  # sync_venta_a_agildte lo reintenta y registra el error de cada fila
+        for fila in filas:
+            try:
+                entregar(conn, cur, fila, cliente=cliente)
+            except Exception:
+                conn.rollback()
+                logger.exception("AgilDTE outbox: error al registrar el envío de la venta #%s", fila["venta_id"])
+        return len(filas)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def avisar() -> None:
+    """Despierta al despachador (venta recién confirmada) sin esperar al siguiente sondeo."""
+    if iniciar_despachador():
+        _despertar.set()
+
+
+def _bucle() -> None:
+    intervalo = max(1, _entero_env("AGILDTE_OUTBOX_INTERVALO_SEG", 10))
+    while True:
+        _despertar.wait(intervalo)
+        _despertar.clear()
+        try:
+            while despachar_pendientes() > 0:
+                pass
+        except Exception:
+            logger.exception("AgilDTE outbox: fallo del despachador")
+
+
+def iniciar_despachador() -> bool:
+    """Arranca (una vez por proceso) el hilo despachador si corresponde el modo asíncrono."""
+    global _hilo, _hilo_pid
+    if not modo_asincrono():
+        return False
+    with _hilo_lock:
+        if _hilo is not None and _hilo_pid == os.getpid() and _hilo.is_alive():
+            return True
+        _hilo = threading.Thread(target=_bucle, name="agildte-outbox", daemon=True)
+        _hilo_pid = os.getpid()
+        _hilo.start()
+    _despertar.set()  # entregar lo que quedó pendiente antes del reinicio
+    return True
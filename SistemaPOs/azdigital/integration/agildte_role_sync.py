@@ -87,16 +87,17 @@ def sync_role_from_session_if_due(session: Any, request_path: str) -> None:
         data = {}
 
     try:
-        import psycopg2
-        from database import ConexionDB
+        from azdigital.utils.sesion_snapshot import invalidar_usuario
+        from azdigital.utils.db_pool import conexion_aparte
 
-        db = ConexionDB()
-        conn = psycopg2.connect(**db.config)
+        # Conexión propia: confirma o revierte la provisión sin tocar la transacción de la ruta.
+        conn = conexion_aparte()
         cur = conn.cursor()
         try:
             ok, _err = provision_if_missing(cur, data)
             if ok:
                 conn.commit()
+                invalidar_usuario(session["user_id"])
                 session["_agildte_role_sync_ts"] = now
                 cur.execute(
                     "SELECT rol, empresa_id FROM usuarios WHERE id = %s AND activo = TRUE",
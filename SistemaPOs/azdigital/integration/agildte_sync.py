@@ -112,11 +112,13 @@ def sync_venta_a_agildte(
     cliente_id: int | None,
     cliente_nombre_ticket: str,
     cliente: AgilDTEClient | None = None,
+    idempotency_key: str | None = None,
 ) -> dict[str, Any]:
     """
     Crea venta remota con POST /api/ventas/crear-con-detalles/ (encola o procesa DTE en AgilDTE).
 
     No llama a generar-dte después: el backend ya dispara facturación al crear la venta.
+    ``idempotency_key``: clave de la bandeja agildte_outbox (reintentos sin duplicar la venta).
 
     Retorna dict serializable para incluir en la respuesta JSON del POS (agildte_sync).
     """
@@ -182,7 +184,7 @@ def sync_venta_a_agildte(
             hora_emision=hora_sv,
             periodo_aplicado=periodo,
         )
-        creado = cli.procesar_venta_pos(body)
+        creado = cli.procesar_venta_pos(body, idempotency_key=idempotency_key)
         venta_payload = creado.get("venta") if isinstance(creado, dict) else None
         remote_id = _extraer_id_venta_remota(venta_payload if venta_payload is not None else creado)
         ok = True
@@ -256,9 +258,11 @@ def sync_venta_a_agildte(
         except Exception:
             texto_plano = ""
         mu = (texto_plano or "").strip() or "No se pudo sincronizar la venta con AgilDTE."
-        return public_sync_result(
-            {"ok": False, "error": "api", "mensaje_usuario": mu[:500]}
-        ) or {"ok": False, "error": "api"}
+        # http_status no llega al navegador (public_sync_result): lo usa la bandeja para decidir reintentos.
+        return dict(
+            public_sync_result({"ok": False, "error": "api", "mensaje_usuario": mu[:500]}) or {"ok": False, "error": "api"},
+            http_status=e.status_code,
+        )
     except Exception:
         return public_sync_result(
             {
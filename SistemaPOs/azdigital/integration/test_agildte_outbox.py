@@ -0,0 +1,95 @@
+# Bandeja agildte_outbox: encolado, reintentos y errores definitivos (sin AgilDTE ni PostgreSQL).
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.integration.test_agildte_outbox -v
+from __future__ import annotations
+
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from azdigital.integration import agildte_outbox
+from azdigital.repositories import agildte_outbox_repo
+from azdigital.services.ventas_service import LineaVenta
+
+
+def _fila(intentos=1):
+    return {
+        "id": 7,
+        "venta_id": 120,
+        "empresa_id": 3,
+        "clave_idempotencia": "k-120",
+        "datos": {"tipo_comprobante": "FACTURA", "lineas": [{"producto_id": 1, "cantidad": 2}], "total_neto": 5},
+        "intentos": intentos,
+    }
+
+
+class EntregarTests(unittest.TestCase):
+    def setUp(self):
+        entorno = patch.dict(
+            os.environ,
+            {"AGILDTE_OUTBOX_MAX_INTENTOS": "4", "AGILDTE_OUTBOX_REINTENTO_SEG": "10", "AGILDTE_OUTBOX_REINTENTO_MAX_SEG": "30"},
+        )
+        entorno.start()
+        self.addCleanup(entorno.stop)
+        self.conn, self.cur = MagicMock(name="conn"), MagicMock(name="cur")
+        for nombre in ("marcar_enviado", "marcar_error"):
+            p = patch.object(agildte_outbox_repo, nombre)
+            setattr(self, nombre, p.start())
+            self.addCleanup(p.stop)
+
+    def _entregar(self, resultado, intentos=1):
+        with patch.object(agildte_outbox, "sync_venta_a_agildte", return_value=resultado) as sync:
+            agildte_outbox.entregar(self.conn, self.cur, _fila(intentos))
+        self.conn.commit.assert_called_once()
+        return sync
+
+    def test_ok_marca_enviado_con_clave_de_idempotencia(self):
+        sync = self._entregar({"ok": True, "dte_persistido": True})
+        kw = sync.call_args.kwargs
+        self.assertEqual(kw["idempotency_key"], "k-120")
+        self.assertEqual((kw["venta_id_local"], kw["empresa_id_local"], kw["total_neto"]), (120, 3, 5.0))
+        self.marcar_enviado.assert_called_once_with(self.cur, 7, {"ok": True, "dte_persistido": True})
+        self.marcar_error.assert_not_called()
+
+    def test_error_transitorio_reintenta_con_espera_exponencial(self):
+        for intentos, espera in ((1, 10), (2, 20), (3, 30)):
+            self.conn.reset_mock()
+            self.marcar_error.reset_mock()
+            self._entregar({"ok": False, "error": "api", "http_status": 502}, intentos)
+            self.assertEqual(self.marcar_error.call_args[0][4], espera)
+
+    def test_intentos_agotados_o_error_definitivo_queda_fallido(self):
+        casos = (
+            ({"ok": False, "error": "interno"}, 4),
+            ({"ok": False, "error": "api", "http_status": 400, "mensaje_usuario": "Rechazado por MH"}, 1),
+            ({"ok": False, "error": "cliente_sin_nrc"}, 1),
+        )
+        for resultado, intentos in casos:
+            self.conn.reset_mock()
+            self._entregar(resultado, intentos)
+            self.assertIsNone(self.marcar_error.call_args[0][4])
+        self.assertEqual(self.marcar_error.call_args_list[1][0][2], "Rechazado por MH")
+
+
+class EncolarTests(unittest.TestCase):
+    def test_encola_lineas_serializables_solo_con_sync_activa(self):
+        cur = MagicMock(name="cur")
+        lineas = [LineaVenta(producto_id=1, cantidad=2.0, precio_unitario=1.5, subtotal=3.0, descripcion="Leche")]
+        kw = dict(
+            empresa_id_local=3, venta_id_local=120, tipo_comprobante="TICKET", tipo_pago="EFECTIVO", lineas=lineas,
+            total_neto=3, total_bruto=3, descuento=0, cliente_id=None, cliente_nombre_ticket="Consumidor Final",
+        )
+        with patch.object(agildte_outbox_repo, "tabla_existe", return_value=True), patch.object(
+            agildte_outbox_repo, "encolar", return_value=(9, "k")
+        ) as encolar:
+            with patch.dict(os.environ, {"AGILDTE_SYNC_ENABLED": "0"}):
+                self.assertIsNone(agildte_outbox.encolar_venta(cur, **kw))
+            with patch.dict(os.environ, {"AGILDTE_SYNC_ENABLED": "1"}):
+                self.assertEqual(agildte_outbox.encolar_venta(cur, **kw), 9)
+        _, venta_id, empresa_id, datos = encolar.call_args[0]
+        self.assertEqual((venta_id, empresa_id), (120, 3))
+        self.assertEqual(datos["lineas"][0]["descripcion"], "Leche")
+        self.assertEqual(datos["total_neto"], 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,15 @@
 # Programador: Oscar Amaya Romero
 from . import (
     actividades_repo,
+    agildte_outbox_repo,
+    catalogo_sync_repo,
     cierre_caja_repo,
     clientes_repo,
     historial_usuarios_repo,
     compras_repo,
     compras_reports_repo,
     empresas_repo,
+    esquema_repo,
     inventario_reports_repo,
     kardex_repo,
     lista_compras_repo,
@@ -0,0 +1,149 @@
+# Programador: Oscar Amaya Romero
+"""
+Bandeja de salida de ventas hacia AgilDTE (scripts/sql/schema_agildte_outbox.sql).
+
+Una fila por venta, escrita en la misma transacción que la venta. Para entregarla se arrienda
+(estado ENVIANDO hasta ``bloqueado_hasta``) y se confirma el arriendo antes de llamar a la API:
+la petición HTTP no deja abierta una transacción ni bloqueos. Si el proceso muere a medio envío,
+otro despachador la retoma al vencer el arriendo (mismo Idempotency-Key, sin duplicar en AgilDTE).
+"""
+from __future__ import annotations
+
+import json
+import uuid
+from typing import Any
+
+from psycopg2.extras import Json
+
+from azdigital.repositories import esquema_repo
+
+PENDIENTE = "PENDIENTE"
+ENVIANDO = "ENVIANDO"
+ENVIADO = "ENVIADO"
+FALLIDO = "FALLIDO"
+
+_COLUMNAS = "id, venta_id, empresa_id, clave_idempotencia, datos, intentos"
+
+
+def tabla_existe(cur) -> bool:
+    return esquema_repo.tabla_existe(cur, "agildte_outbox")
+
+
+def encolar(cur, venta_id: int, empresa_id: int | None, datos: dict[str, Any]) -> tuple[int, str]:
+    """Inserta la fila de la venta (dentro de la transacción de la venta). Retorna (id, clave)."""
+    clave = uuid.uuid4().hex
+    cur.execute(
+        """
+        INSERT INTO agildte_outbox (venta_id, empresa_id, clave_idempotencia, datos)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+        """,
+        (int(venta_id), empresa_id, clave, Json(datos)),
+    )
+    return int(cur.fetchone()[0]), clave
+
+
+def _fila(r) -> dict[str, Any]:
+    datos = r[4]
+    if isinstance(datos, str):
+        datos = json.loads(datos)
+    return {
+        "id": int(r[0]),
+        "venta_id": int(r[1]),
+        "empresa_id": int(r[2]) if r[2] is not None else None,
+        "clave_idempotencia": r[3],
+        "datos": datos or {},
+        "intentos": int(r[5] or 0),
+    }
+
+
+def arrendar_pendientes(cur, limite: int, segundos: int) -> list[dict[str, Any]]:
+    """
+    Toma hasta ``limite`` filas vencidas (PENDIENTE con proximo_intento cumplido, o ENVIANDO con
+    arriendo vencido) y las marca ENVIANDO por ``segundos``. SKIP LOCKED: varios workers a la vez
+    no toman la misma fila. El llamador confirma (commit) antes de enviar.
+    """
+    cur.execute(
+        f"""
+        UPDATE agildte_outbox o
+        SET estado = %s, intentos = o.intentos + 1,
+            bloqueado_hasta = CURRENT_TIMESTAMP + make_interval(secs => %s),
+            actualizado_en = CURRENT_TIMESTAMP
+        WHERE o.id IN (
+            SELECT id FROM agildte_outbox
+            WHERE (estado = %s AND proximo_intento <= CURRENT_TIMESTAMP)
+               OR (estado = %s AND bloqueado_hasta < CURRENT_TIMESTAMP)
+            ORDER BY proximo_intento, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {_COLUMNAS}
+        """,
+        (ENVIANDO, int(segundos), PENDIENTE, ENVIANDO, int(limite)),
+    )
+    return [_fila(r) for r in cur.fetchall() or []]
+
+
+def arrendar(cur, outbox_id: int, segundos: int) -> dict[str, Any] | None:
+    """Arrienda una fila concreta si sigue PENDIENTE (envío inmediato desde guardar_venta)."""
+    cur.execute(
+        f"""
+        UPDATE agildte_outbox
+        SET estado = %s, intentos = intentos + 1,
+            bloqueado_hasta = CURRENT_TIMESTAMP + make_interval(secs => %s),
+            actualizado_en = CURRENT_TIMESTAMP
+        WHERE id = %s AND estado = %s
+        RETURNING {_COLUMNAS}
+        """,
+        (ENVIANDO, int(segundos), int(outbox_id), PENDIENTE),
+    )
+    r = cur.fetchone()
+    return _fila(r) if r else None
+
+
+def marcar_enviado(cur, outbox_id: int, resultado: dict[str, Any]) -> None:
+    cur.execute(
+        """
+        UPDATE agildte_outbox
+        SET estado = %s, resultado = %s, ultimo_error = NULL, bloqueado_hasta = NULL,
+            actualizado_en = CURRENT_TIMESTAMP
+        WHERE id = %s
+        """,
+        (ENVIADO, Json(resultado), int(outbox_id)),
+    )
+
+
+def marcar_error(
+    cur,
+    outbox_id: int,
+    error: str,
+    resultado: dict[str, Any] | None,
+    reintentar_en: int | None,
+) -> None:
+    """Vuelve a PENDIENTE dentro de ``reintentar_en`` segundos, o FALLIDO si es None."""
+    estado = PENDIENTE if reintentar_en is not None else FALLIDO
+    cur.execute(
+        """
+        UPDATE agildte_outbox
+        SET estado = %s, ultimo_error = %s, resultado = %s, bloqueado_hasta = NULL,
+            proximo_intento = CURRENT_TIMESTAMP + make_interval(secs => %s),
+            actualizado_en = CURRENT_TIMESTAMP
+        WHERE id = %s
+        """,
+        (estado, (error or "")[:1000], Json(resultado) if resultado else None, int(reintentar_en or 0), int(outbox_id)),
+    )
+
+
+def estado_venta(cur, venta_id: int) -> dict[str, Any] | None:
+    """Estado de entrega de la venta (None si nunca pasó por la bandeja)."""
+    cur.execute(
+        "SELECT estado, intentos, ultimo_error, resultado FROM agildte_outbox WHERE venta_id = %s",
+        (int(venta_id),),
+    )
+    r = cur.fetchone()
+    if not r:
+        return None
+    resultado = r[3]
+    if isinstance(resultado, str):
+        resultado = json.loads(resultado)
+    return {"estado": r[0], "intentos": int(r[1] or 0), "ultimo_error": r[2], "resultado": resultado}
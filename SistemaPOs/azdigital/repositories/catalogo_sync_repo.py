@@ -0,0 +1,79 @@
+# Programador: Oscar Amaya Romero
+"""
+Sincronización incremental (delta) del catálogo POS offline.
+
+Requiere scripts/sql/schema_catalogo_sync.sql: triggers guardan en ``productos.cambio_txid`` el
+txid de la última transacción que tocó el producto, sus presentaciones, su stock por sucursal o
+sus promociones. El token que recibe la caja es ``<xmin del snapshot>.<fecha>``:
+
+- Todo lo confirmado después de leer tiene txid >= xmin, así que no se pierden cambios de
+  transacciones que seguían abiertas (a lo sumo se reenvían filas ya recibidas).
+- La fecha permite reenviar productos cuya promoción empezó o venció desde la última sync
+  (la vigencia cambia sin que cambie ninguna fila).
+"""
+from __future__ import annotations
+
+from datetime import date
+
+from azdigital.repositories import esquema_repo
+
+
+def disponible(cur) -> bool:
+    """True si la BD ya tiene las columnas/triggers de cambio (si no, la caja descarga completo)."""
+    return esquema_repo.columna_existe(cur, "productos", "cambio_txid")
+
+
+def token_actual(cur, hoy: date) -> str:
+    """Token para la próxima sync: tomarlo ANTES de leer los productos que se envían."""
+    cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+    return f"{int(cur.fetchone()[0])}.{hoy.isoformat()}"
+
+
+def parsear_token(token: str | None) -> tuple[int, date] | None:
+    """(txid, fecha) del token de la caja; None si falta o es inválido."""
+    try:
+        txid_txt, fecha_txt = str(token or "").strip().split(".", 1)
+        return int(txid_txt), date.fromisoformat(fecha_txt)
+    except ValueError:
+        return None
+
+
+def ids_cambiados(
+    cur,
+    empresa_id: int | None,
+    desde_txid: int,
+    desde_fecha: date,
+    hoy: date,
+    despues_de_id: int = 0,
+    limit: int = 500,
+) -> list[int]:
+    """
+    Ids de productos (activos o no) del alcance que cambiaron desde el token, en orden de id.
+    Incluye productos con promociones que iniciaron o vencieron entre ``desde_fecha`` y ``hoy``.
+    """
+    filtro_emp = " AND p.empresa_id = %s" if empresa_id else ""
+    params: list = [desde_txid]
+    if empresa_id:
+        params.append(empresa_id)
+    params.append(int(despues_de_id or 0))
+    sql = (
+        "SELECT p.id FROM productos p "
+        f"WHERE p.cambio_txid >= %s{filtro_emp} AND p.id > %s"
+    )
+    if desde_fecha < hoy and esquema_repo.tabla_existe(cur, "promociones"):
+        sql = (
+            f"SELECT id FROM ({sql} UNION "
+            "SELECT p.id FROM productos p "
+            "JOIN promocion_productos pp ON pp.producto_id = p.id "
+            "JOIN promociones pr ON pr.id = pp.promocion_id AND pr.empresa_id = p.empresa_id "
+            "WHERE ((pr.fecha_inicio > %s AND pr.fecha_inicio <= %s) OR (pr.fecha_fin >= %s AND pr.fecha_fin < %s))"
+            f"{filtro_emp} AND p.id > %s) c"
+        )
+        params += [desde_fecha, hoy, desde_fecha, hoy]
+        if empresa_id:
+            params.append(empresa_id)
+        params.append(int(despues_de_id or 0))
+    sql += " ORDER BY id LIMIT %s"
+    params.append(limit)
+    cur.execute(sql, tuple(params))
+    return [int(r[0]) for r in cur.fetchall() or []]
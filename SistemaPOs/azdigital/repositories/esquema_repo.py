@@ -0,0 +1,118 @@
+# Programador: Oscar Amaya Romero
+"""
+Registro de capacidades del esquema (tablas/columnas de ``public``) cargado una vez por proceso.
+
+Los repositorios preguntaban a information_schema en cada búsqueda, venta o movimiento de
+Kardex para soportar BD sin migrar. Aquí se carga una sola vez la lista de columnas (con una
+conexión aparte: solo ve DDL ya confirmado) y se responde desde memoria.
+
+- Lo que está en el registro existe: respuesta sin consultar la BD.
+- Lo que no está se consulta al catálogo con el cursor del llamador (igual que antes), así una
+  tabla creada en la transacción actual o una migración reciente se ve de inmediato.
+- El registro se recarga cada AZ_ESQUEMA_RECARGA_SEG segundos (por defecto 300) o tras
+  ``refrescar()`` (llamarlo después de confirmar DDL en caliente).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_columnas: dict[str, frozenset[str]] | None = None
+_cargado_en = 0.0
+_funciones: dict[str, tuple[bool, float]] = {}
+
+
+def _recarga_seg() -> float:
+    try:
+        return float((os.environ.get("AZ_ESQUEMA_RECARGA_SEG") or "").strip() or 300)
+    except ValueError:
+        return 300.0
+
+
+def _cargar() -> dict[str, frozenset[str]]:
+    from azdigital.utils.db_pool import conexion_aparte
+
+    conn = conexion_aparte()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = 'public'"
+        )
+        tablas: dict[str, set[str]] = {}
+        for tabla, columna in cur.fetchall() or []:
+            tablas.setdefault(str(tabla), set()).add(str(columna))
+        return {t: frozenset(cols) for t, cols in tablas.items()}
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _registro() -> dict[str, frozenset[str]]:
+    global _columnas, _cargado_en
+    ahora = time.monotonic()
+    if _columnas is not None and ahora - _cargado_en < _recarga_seg():
+        return _columnas
+    with _lock:
+        if _columnas is None or ahora - _cargado_en >= _recarga_seg():
+            try:
+                _columnas = _cargar()
+            except Exception as e:
+                # Sin registro se sigue consultando el catálogo como antes; se reintenta luego.
+                logger.warning("No se pudo cargar el registro de esquema: %s", e)
+                _columnas = _columnas or {}
+            _cargado_en = ahora
+        return _columnas
+
+
+def refrescar() -> None:
+    """Descarta el registro: la próxima consulta lo vuelve a cargar."""
+    global _columnas
+    with _lock:
+        _columnas = None
+        _funciones.clear()
+
+
+def tabla_existe(cur, tabla: str) -> bool:
+    """True si existe la tabla ``public.<tabla>``."""
+    if tabla in _registro():
+        return True
+    cur.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s",
+        (tabla,),
+    )
+    return cur.fetchone() is not None
+
+
+def columna_existe(cur, tabla: str, columna: str) -> bool:
+    """True si ``public.<tabla>`` tiene la columna."""
+    columna = columna.lower()
+    if columna in _registro().get(tabla, ()):
+        return True
+    cur.execute(
+        """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s AND column_name = %s
+        LIMIT 1
+        """,
+        (tabla, columna),
+    )
+    return cur.fetchone() is not None
+
+
+def funcion_existe(cur, nombre: str) -> bool:
+    """True si existe la función ``nombre`` (p. ej. az_normalizar); se recuerda AZ_ESQUEMA_RECARGA_SEG."""
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _funciones.get(nombre)
+    if entrada is not None and ahora - entrada[1] < _recarga_seg():
+        return entrada[0]
+    cur.execute("SELECT 1 FROM pg_proc WHERE proname = %s LIMIT 1", (nombre,))
+    existe = cur.fetchone() is not None
+    with _lock:
+        _funciones[nombre] = (existe, ahora)
+    return existe
@@ -4,6 +4,8 @@ from __future__ import annotations
 
 import uuid
 
+from azdigital.repositories import esquema_repo
+
 
 # Eventos predefinidos — Sesión
 EVENTO_LOGIN_OK = "LOGIN"
@@ -213,13 +215,7 @@ def listar(
 
 def tabla_existe(cur) -> bool:
     """Verifica si la tabla historial_usuarios existe."""
-    cur.execute(
-        """
-        SELECT 1 FROM information_schema.tables
-        WHERE table_schema = 'public' AND table_name = 'historial_usuarios'
-        """
-    )
-    return cur.fetchone() is not None
+    return esquema_repo.tabla_existe(cur, "historial_usuarios")
 
 
 _DDL_HISTORIAL_STMTS = (
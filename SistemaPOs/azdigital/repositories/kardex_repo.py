@@ -4,6 +4,9 @@ from __future__ import annotations
 import uuid
 
 from psycopg2 import errors as pg_errors
+from psycopg2.extras import execute_values
+
+from azdigital.repositories import esquema_repo
 
 TABLA_STOCK = "producto_stock_sucursal"
 TABLA_KARDEX = "inventario_kardex"
@@ -41,11 +44,7 @@ def etiqueta_motivo_ajuste(cod: str | None) -> str:
 
 
 def tabla_existe(cur, nombre: str) -> bool:
-    cur.execute(
-        "SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s",
-        (nombre,),
-    )
-    return cur.fetchone() is not None
+    return esquema_repo.tabla_existe(cur, nombre)
 
 
 def primera_sucursal_empresa(cur, empresa_id: int) -> int | None:
@@ -190,6 +189,81 @@ def descontar_stock_sucursal(cur, producto_id: int, cantidad: float, sucursal_id
     return True
 
 
+def descontar_stock_sucursal_lote(
+    cur, cantidades: dict[int, float], sucursal_id: int | None
+) -> tuple[set[int], int | None]:
+    """
+    Versión por lotes de descontar_stock_sucursal para varios productos (venta POS).
+    Bloquea las filas de producto_stock_sucursal en orden (producto, sucursal), reparte cada
+    cantidad con la misma prioridad (sucursal del usuario primero, luego por id) y aplica todo
+    en un solo UPDATE ... FROM (VALUES ...).
+    Retorna (productos que usan la tabla por sucursal, primer producto sin stock suficiente o None).
+    Si hay faltante no se modifica nada.
+    """
+    if not cantidades:
+        return set(), None
+    cur.execute(
+        """
+        SELECT producto_id, sucursal_id, cantidad FROM producto_stock_sucursal
+        WHERE producto_id = ANY(%s) ORDER BY producto_id, sucursal_id FOR UPDATE
+        """,
+        (sorted(cantidades),),
+    )
+    filas: dict[int, list[tuple[int, float]]] = {}
+    for pid, sid, cant in cur.fetchall() or []:
+        filas.setdefault(int(pid), []).append((int(sid), float(cant or 0)))
+
+    descuentos: list[tuple[int, int, float]] = []
+    for pid in cantidades:
+        rows = filas.get(pid)
+        if not rows:
+            continue
+        cantidad = float(cantidades[pid])
+        if sum(c for _, c in rows) < cantidad:
+            return set(filas), pid
+        if sucursal_id is not None:
+            orden = [r for r in rows if r[0] == int(sucursal_id)] + [r for r in rows if r[0] != int(sucursal_id)]
+        else:
+            orden = rows
+        restante = cantidad
+        for sid, c in orden:
+            if restante <= 0:
+                break
+            tomar = min(c, restante)
+            if tomar <= 0:
+                continue
+            descuentos.append((pid, sid, tomar))
+            restante -= tomar
+        if restante > 0.000001:
+            return set(filas), pid
+
+    if descuentos:
+        execute_values(
+            cur,
+            """
+            UPDATE producto_stock_sucursal AS pss SET cantidad = pss.cantidad - v.tomar
+            FROM (VALUES %s) AS v (producto_id, sucursal_id, tomar)
+            WHERE pss.producto_id = v.producto_id AND pss.sucursal_id = v.sucursal_id
+            """,
+            descuentos,
+            template="(%s::int, %s::int, %s::numeric)",
+            page_size=len(descuentos),
+        )
+        cur.execute(
+            """
+            UPDATE productos AS p SET stock_actual = s.total
+            FROM (
+                SELECT producto_id, COALESCE(SUM(cantidad), 0) AS total
+                FROM producto_stock_sucursal WHERE producto_id = ANY(%s)
+                GROUP BY producto_id
+            ) AS s
+            WHERE p.id = s.producto_id
+            """,
+            (sorted({d[0] for d in descuentos}),),
+        )
+    return set(filas), None
+
+
 def _costo_snapshot_producto(cur, producto_id: int) -> float | None:
     cur.execute(
         """
@@ -283,6 +357,53 @@ def insertar_kardex(
         )
 
 
+def insertar_kardex_lote(
+    cur,
+    empresa_id: int,
+    tipo: str,
+    movimientos: list[tuple[int, float, str | None, str | None]],
+    sucursal_id: int | None,
+    usuario_id: int | None,
+) -> None:
+    """
+    Varios movimientos del mismo tipo en un INSERT multi-fila (p. ej. SALIDA_VENTA de todas las
+    líneas). ``movimientos``: (producto_id, cantidad, notas, referencia).
+    Mismo respaldo que insertar_kardex si faltan columnas motivo_ajuste/costo_unitario.
+    """
+    if not movimientos or not tabla_existe(cur, TABLA_KARDEX):
+        return
+    filas = [
+        (empresa_id, pid, tipo.upper(), cant, sucursal_id, None, ref, (notas or "").strip() or None, usuario_id)
+        for pid, cant, notas, ref in movimientos
+    ]
+    sp = "spik" + uuid.uuid4().hex[:12]
+    cur.execute(f"SAVEPOINT {sp}")
+    try:
+        execute_values(
+            cur,
+            """
+            INSERT INTO inventario_kardex
+                (empresa_id, producto_id, tipo, cantidad, sucursal_id, sucursal_destino_id, referencia, notas, usuario_id, motivo_ajuste, costo_unitario)
+            VALUES %s
+            """,
+            [f + (None, None) for f in filas],
+            page_size=len(filas),
+        )
+        cur.execute(f"RELEASE SAVEPOINT {sp}")
+    except Exception:
+        cur.execute(f"ROLLBACK TO SAVEPOINT {sp}")
+        execute_values(
+            cur,
+            """
+            INSERT INTO inventario_kardex
+                (empresa_id, producto_id, tipo, cantidad, sucursal_id, sucursal_destino_id, referencia, notas, usuario_id)
+            VALUES %s
+            """,
+            filas,
+            page_size=len(filas),
+        )
+
+
 def listar_kardex_producto(cur, producto_id: int, limit: int = 200) -> list[tuple]:
     if not tabla_existe(cur, TABLA_KARDEX):
         return []
@@ -5,12 +5,11 @@ from __future__ import annotations
 
 from typing import Any
 
+from azdigital.repositories import esquema_repo
+
 
 def tabla_costos_existe(cur) -> bool:
-    cur.execute(
-        "SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = 'producto_costos'"
-    )
-    return cur.fetchone() is not None
+    return esquema_repo.tabla_existe(cur, "producto_costos")
 
 
 def listar_productos_para_compra(
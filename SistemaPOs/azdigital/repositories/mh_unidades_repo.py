@@ -4,14 +4,11 @@
 Los códigos permitidos y su orden viven en azdigital.utils.mh_cat003_unidades;
 al guardar productos se usa normalizar_codigo_mh (vía productos_repo).
 """
+from azdigital.repositories import esquema_repo
 
 
 def tabla_existe(cur) -> bool:
-    cur.execute(
-        "SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s",
-        ("mh_unidad_medida",),
-    )
-    return cur.fetchone() is not None
+    return esquema_repo.tabla_existe(cur, "mh_unidad_medida")
 
 
 def listar_todas(cur) -> list[tuple[str, str]]:
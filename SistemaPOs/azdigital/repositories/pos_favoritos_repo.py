@@ -3,6 +3,8 @@ from __future__ import annotations
 
 import json
 
+from azdigital.repositories import esquema_repo
+
 TABLA = "pos_favoritos_sucursal"
 MAX_ITEMS = 14
 MAX_JSON_CHARS = 120_000
@@ -28,14 +30,7 @@ _KEYS_PERMITIDAS = frozenset(
 
 
 def tabla_existe(cur) -> bool:
-    cur.execute(
-        """
-        SELECT 1 FROM information_schema.tables
-        WHERE table_schema = 'public' AND table_name = %s
-        """,
-        (TABLA,),
-    )
-    return cur.fetchone() is not None
+    return esquema_repo.tabla_existe(cur, TABLA)
 
 
 def sucursal_key(sucursal_id: int | None) -> int:
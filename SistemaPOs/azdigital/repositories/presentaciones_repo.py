@@ -8,6 +8,8 @@ import uuid
 from decimal import Decimal, InvalidOperation
 from typing import Any
 
+from azdigital.repositories import esquema_repo
+
 
 def _inferir_caja_desde_nombre(nombre_producto: str | None) -> int | None:
     """Ej. 'CAJA ... 60 SOBRES' → 60 para completar presentación Caja en POS."""
@@ -36,11 +38,7 @@ def _inferir_etiqueta_umb_desde_nombre(nombre_producto: str | None, umb_desde_bd
 
 
 def tabla_existe(cur) -> bool:
-    cur.execute(
-        "SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = %s",
-        ("producto_presentacion",),
-    )
-    return cur.fetchone() is not None
+    return esquema_repo.tabla_existe(cur, "producto_presentacion")
 
 
 def asegurar_tabla_presentacion(cur) -> bool:
@@ -101,32 +99,11 @@ def _asegurar_columna_codigo_barra(cur) -> None:
 
 def tiene_columna_codigo_barra(cur) -> bool:
     """True si existe ``producto_presentacion.codigo_barra`` (migración códigos por presentación)."""
-    if not tabla_existe(cur):
-        return False
-    cur.execute(
-        """
-        SELECT 1 FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = 'producto_presentacion'
-          AND column_name = 'codigo_barra'
-        LIMIT 1
-        """,
-    )
-    return cur.fetchone() is not None
+    return _tiene_columna(cur, "codigo_barra")
 
 
 def _tiene_columna(cur, nombre_columna: str) -> bool:
-    if not tabla_existe(cur):
-        return False
-    cur.execute(
-        """
-        SELECT 1 FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = 'producto_presentacion'
-          AND column_name = %s
-        LIMIT 1
-        """,
-        (nombre_columna,),
-    )
-    return cur.fetchone() is not None
+    return esquema_repo.columna_existe(cur, "producto_presentacion", nombre_columna)
 
 
 def tiene_columnas_regla_precio(cur) -> bool:
@@ -3,6 +3,8 @@ from __future__ import annotations
 
 from typing import Any
 
+from azdigital.repositories import esquema_repo
+
 
 def _mh_codigo_producto(codigo: str | None) -> str:
     from azdigital.utils.mh_cat003_unidades import normalizar_codigo_mh
@@ -12,16 +14,7 @@ def _mh_codigo_producto(codigo: str | None) -> str:
 
 def _productos_tiene_columna(cur, nombre_columna: str) -> bool:
     """True si la tabla productos tiene la columna (BD sin migración POS/MH)."""
-    cur.execute(
-        """
-        SELECT 1 FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = 'productos'
-        AND column_name = %s
-        LIMIT 1
-        """,
-        (nombre_columna.lower(),),
-    )
-    return cur.fetchone() is not None
+    return esquema_repo.columna_existe(cur, "productos", nombre_columna)
 
 
 def asegurar_columnas_baja(cur) -> bool:
@@ -40,6 +33,7 @@ def asegurar_columnas_baja(cur) -> bool:
             "ALTER TABLE productos ADD COLUMN IF NOT EXISTS usuario_baja_username VARCHAR(100)"
         )
         cur.connection.commit()
+        esquema_repo.refrescar()
         return _productos_tiene_columna(cur, "activo")
     except Exception:
         try:
@@ -124,7 +118,7 @@ def _buscar_via_presentacion_codigo_barra(
         "FROM productos p "
         "INNER JOIN producto_presentacion pp ON pp.producto_id = p.id "
         "AND pp.codigo_barra IS NOT NULL AND length(trim(pp.codigo_barra)) > 0 "
-        "AND TRIM(pp.codigo_barra) = %s"
+        "AND UPPER(TRIM(pp.codigo_barra)) = UPPER(%s)"
     )
     params: list[Any] = list(ex_params) + [c]
     if empresa_id:
@@ -139,6 +133,49 @@ def _buscar_via_presentacion_codigo_barra(
     return cur.fetchone()
 
 
+def listar_codigos_barra_pos(
+    cur, empresa_id: int | None, sucursal_id_usuario: int | None = None
+) -> list[tuple[str, int, int | None]]:
+    """
+    Todos los códigos escaneables del alcance POS para el índice en memoria (utils.codigos_cache):
+    (TRIM(código), producto_id, None) de productos y (UPPER(TRIM(código)), producto_id,
+    presentacion_id) de presentaciones. Mismos filtros que buscar_por_codigo; orden por id.
+    """
+    from azdigital.repositories import presentaciones_repo
+
+    filtro = ""
+    params: list[Any] = []
+    if empresa_id:
+        filtro += " AND p.empresa_id = %s"
+        params.append(empresa_id)
+    if sucursal_id_usuario is not None:
+        filtro += " AND (p.sucursal_id IS NULL OR p.sucursal_id = %s)"
+        params.append(sucursal_id_usuario)
+    filtro += _filtro_activos_sql(cur, "p", solo_activos=True)
+    sql = (
+        "SELECT TRIM(p.codigo_barra), p.id, NULL::integer, p.id AS orden_p, 0 AS orden_pp FROM productos p "
+        f"WHERE p.codigo_barra IS NOT NULL AND length(trim(p.codigo_barra)) > 0{filtro}"
+    )
+    args = list(params)
+    if presentaciones_repo.tabla_existe(cur) and presentaciones_repo.tiene_columna_codigo_barra(cur):
+        sql += (
+            " UNION ALL SELECT UPPER(TRIM(pp.codigo_barra)), p.id, pp.id, p.id, pp.id FROM productos p "
+            "JOIN producto_presentacion pp ON pp.producto_id = p.id "
+            f"WHERE pp.codigo_barra IS NOT NULL AND length(trim(pp.codigo_barra)) > 0{filtro}"
+        )
+        args += params
+    cur.execute(sql + " ORDER BY 4, 5", tuple(args))
+    return [(str(r[0]), int(r[1]), int(r[2]) if r[2] is not None else None) for r in cur.fetchall() or []]
+
+
+def existencia_pos(cur, producto_id: int, sucursal_id_usuario: int | None = None) -> float:
+    """Existencia POS de un producto (misma fórmula que la columna existencia de las búsquedas)."""
+    ex_sql, ex_params = _sql_existencia_pos("p", sucursal_id_usuario)
+    cur.execute(f"SELECT {ex_sql} FROM productos p WHERE p.id = %s", tuple(list(ex_params) + [int(producto_id)]))
+    r = cur.fetchone()
+    return float(r[0]) if r and r[0] is not None else 0.0
+
+
 def buscar_por_codigo(cur, codigo: str, empresa_id: int = None, sucursal_id_usuario: int | None = None):
     suc = sucursal_id_usuario
     ex_sql, ex_params = _sql_existencia_pos("p", suc)
@@ -197,17 +234,39 @@ def buscar_por_codigo(cur, codigo: str, empresa_id: int = None, sucursal_id_usua
         )
 
 
+def _patron_like(texto: str) -> str:
+    """Escapa comodines de LIKE en lo que escribió el usuario."""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def busqueda_indexada_disponible(cur) -> bool:
+    """True si la BD tiene az_normalizar() (scripts/sql/schema_busqueda_productos.sql)."""
+    return esquema_repo.funcion_existe(cur, "az_normalizar")
+
+
 def buscar_por_nombre(cur, q: str, limit: int = 10, empresa_id: int = None, sucursal_id_usuario: int | None = None):
+    """
+    Búsqueda por nombre (POS / inventario). Con schema_busqueda_productos.sql aplicado la
+    comparación es sin tildes ni mayúsculas sobre el índice trigram y el orden es: primero los
+    que empiezan con el texto, luego por similitud y nombre. Sin el esquema: UPPER LIKE como antes.
+    """
     suc = sucursal_id_usuario
     ex_sql, ex_params = _sql_existencia_pos("p", suc)
+    indexada = busqueda_indexada_disponible(cur)
     sql = (
         "SELECT p.id, p.nombre, p.precio_unitario, p.codigo_barra, COALESCE(p.promocion_tipo, ''), COALESCE(p.promocion_valor, 0), "
         "COALESCE(p.fraccionable, FALSE), p.unidades_por_caja, COALESCE(p.unidades_por_docena, 12), "
         "COALESCE(NULLIF(TRIM(p.mh_codigo_unidad), ''), '59'), "
         f"{ex_sql} AS existencia "
-        "FROM productos p WHERE UPPER(p.nombre) LIKE %s"
     )
-    params: list[Any] = list(ex_params) + [f"%{q.upper()}%"]
+    params: list[Any] = list(ex_params)
+    if indexada:
+        patron = _patron_like((q or "").strip())
+        sql += "FROM productos p WHERE az_normalizar(p.nombre) LIKE '%%' || az_normalizar(%s) || '%%'"
+        params.append(patron)
+    else:
+        sql += "FROM productos p WHERE UPPER(p.nombre) LIKE %s"
+        params.append(f"%{q.upper()}%")
     if empresa_id:
         sql += " AND p.empresa_id = %s"
         params.append(empresa_id)
@@ -215,6 +274,12 @@ def buscar_por_nombre(cur, q: str, limit: int = 10, empresa_id: int = None, sucu
         sql += " AND (p.sucursal_id IS NULL OR p.sucursal_id = %s)"
         params.append(sucursal_id_usuario)
     sql += _filtro_activos_sql(cur, "p", solo_activos=True)
+    if indexada:
+        sql += (
+            " ORDER BY (az_normalizar(p.nombre) LIKE az_normalizar(%s) || '%%') DESC,"
+            " similarity(az_normalizar(p.nombre), az_normalizar(%s)) DESC, UPPER(p.nombre)"
+        )
+        params += [patron, (q or "").strip()]
     sql += " LIMIT %s"
     params.append(limit)
     try:
@@ -348,6 +413,120 @@ def listar_catalogo_pos_modal_global(
         return []
 
 
+def listar_catalogo_pos_pagina(
+    cur,
+    empresa_id: int | None,
+    sucursal_id_usuario: int | None = None,
+    despues_de_id: int = 0,
+    limit: int = 500,
+    ids: list[int] | None = None,
+) -> list[tuple]:
+    """
+    Página del catálogo POS para caché offline, paginada por id (keyset: estable aunque
+    cambien nombres o se agreguen productos durante la descarga).
+    Mismas columnas que buscar_por_nombre. ``empresa_id`` None = catálogo global (superusuario).
+    ``ids``: solo esos productos (sync delta); los inactivos o de otra sucursal no se devuelven.
+    """
+    ex_sql, ex_params = _sql_existencia_pos("p", sucursal_id_usuario)
+    filtro = " AND p.id > %s"
+    params: list[Any] = [int(despues_de_id or 0)]
+    if ids is not None:
+        filtro += " AND p.id = ANY(%s)"
+        params.append(list(ids))
+    if empresa_id:
+        filtro += " AND p.empresa_id = %s"
+        params.append(empresa_id)
+    if sucursal_id_usuario is not None:
+        filtro += " AND (p.sucursal_id IS NULL OR p.sucursal_id = %s)"
+        params.append(sucursal_id_usuario)
+    filtro += _filtro_activos_sql(cur, "p", solo_activos=True)
+    sql = (
+        "SELECT p.id, p.nombre, p.precio_unitario, p.codigo_barra, COALESCE(p.promocion_tipo, ''), COALESCE(p.promocion_valor, 0), "
+        "COALESCE(p.fraccionable, FALSE), p.unidades_por_caja, COALESCE(p.unidades_por_docena, 12), "
+        "COALESCE(NULLIF(TRIM(p.mh_codigo_unidad), ''), '59'), "
+        f"{ex_sql} AS existencia "
+        f"FROM productos p WHERE TRUE{filtro} ORDER BY p.id LIMIT %s"
+    )
+    try:
+        cur.execute(sql, tuple(list(ex_params) + params + [limit]))
+        return list(cur.fetchall() or [])
+    except Exception:
+        cur.connection.rollback()
+    sql0 = (
+        "SELECT p.id, p.nombre, p.precio_unitario, p.codigo_barra, COALESCE(p.promocion_tipo, ''), COALESCE(p.promocion_valor, 0), "
+        f"COALESCE(p.stock_actual, 0) FROM productos p WHERE TRUE{filtro} ORDER BY p.id LIMIT %s"
+    )
+    cur.execute(sql0, tuple(params + [limit]))
+    return [tuple(list(r[:6]) + [False, None, 12, "59", float(r[6] or 0)]) for r in cur.fetchall() or []]
+
+
+def version_catalogo_pos(
+    cur,
+    empresa_id: int | None,
+    sucursal_id_usuario: int | None = None,
+    fecha=None,
+) -> str | None:
+    """
+    Huella (md5) de todo lo que entra en la caché offline del POS: filas de productos del alcance,
+    sus presentaciones y stock por sucursal, y las promociones de la empresa (más la fecha, porque
+    la vigencia depende del día). Una sola consulta agregada; sirve de ETag para que la caja no
+    vuelva a descargar un catálogo sin cambios. None si no se pudo calcular.
+    """
+    from azdigital.utils.db_savepoint import sql_opcional
+
+    filtro = ""
+    params: list[Any] = []
+    if empresa_id:
+        filtro += " AND p.empresa_id = %s"
+        params.append(empresa_id)
+    if sucursal_id_usuario is not None:
+        filtro += " AND (p.sucursal_id IS NULL OR p.sucursal_id = %s)"
+        params.append(sucursal_id_usuario)
+    filtro += _filtro_activos_sql(cur, "p", solo_activos=True)
+    partes = [f"(SELECT md5(COALESCE(string_agg(p::text, '|' ORDER BY p.id), '')) FROM productos p WHERE TRUE{filtro})"]
+    args: list[Any] = list(params)
+    for tabla, alias in (("producto_presentacion", "pp"), ("producto_stock_sucursal", "ps")):
+        if esquema_repo.tabla_existe(cur, tabla):
+            partes.append(
+                f"(SELECT md5(COALESCE(string_agg({alias}::text, '|' ORDER BY {alias}::text), '')) "
+                f"FROM {tabla} {alias} JOIN productos p ON p.id = {alias}.producto_id WHERE TRUE{filtro})"
+            )
+            args += params
+    if esquema_repo.tabla_existe(cur, "promociones"):
+        emp_promo = " WHERE pr.empresa_id = %s" if empresa_id else ""
+        partes.append(
+            "(SELECT md5(COALESCE(string_agg(pr::text || COALESCE(pp_ids, ''), '|' ORDER BY pr.id), '')) "
+            "FROM promociones pr LEFT JOIN LATERAL ("
+            "  SELECT string_agg(producto_id::text, ',' ORDER BY producto_id) AS pp_ids "
+            "  FROM promocion_productos WHERE promocion_id = pr.id"
+            f") x ON TRUE{emp_promo})"
+        )
+        if empresa_id:
+            args.append(empresa_id)
+    sql = "SELECT md5(concat_ws(':', %s, " + ", ".join(partes) + "))"
+
+    def _consultar():
+        cur.execute(sql, tuple([str(fecha or "")] + args))
+        r = cur.fetchone()
+        return str(r[0]) if r and r[0] else None
+
+    return sql_opcional(cur, _consultar)
+
+
+def token_pagina_catalogo_pos(ultimo_id: int, version: str | None) -> str:
+    """Token ``despues_de`` de la siguiente página: último id y versión de la primera página."""
+    return f"{int(ultimo_id)}.{version or ''}"
+
+
+def parsear_pagina_catalogo_pos(token: str | None) -> tuple[int, str | None]:
+    """(último id, versión) del token de página; un id suelto o inválido no trae versión."""
+    id_txt, _, version = str(token or "").strip().partition(".")
+    try:
+        return max(0, int(id_txt or 0)), version or None
+    except ValueError:
+        return 0, None
+
+
 def _empresa_id_de_producto(cur, producto_id: int, default: int = 1) -> int:
     try:
         cur.execute("SELECT empresa_id FROM productos WHERE id = %s", (int(producto_id),))
@@ -401,6 +580,48 @@ def get_precio_y_stock_for_update(cur, producto_id: int):
         return (r[0], r[1], r[2], r[3], False, None, 12, "59")
 
 
+def bloquear_productos_para_venta(cur, producto_ids: list[int]) -> dict[int, tuple]:
+    """
+    Versión por lotes de get_precio_y_stock_for_update (+ nombre) para todo un carrito.
+    Bloquea las filas en orden de id (dos cajas con los mismos productos no se interbloquean).
+    Retorna {id: (precio, stock, promo_tipo, promo_valor, fraccionable, unidades_por_caja,
+    unidades_por_docena, mh_codigo_unidad, nombre)}.
+    """
+    from azdigital.utils.db_savepoint import sql_opcional
+
+    if not producto_ids:
+        return {}
+    ids = sorted({int(i) for i in producto_ids})
+
+    def _completo():
+        cur.execute(
+            """SELECT id, precio_unitario, stock_actual,
+               COALESCE(NULLIF(TRIM(promocion_tipo), ''), NULL),
+               COALESCE(promocion_valor, 0),
+               COALESCE(fraccionable, FALSE),
+               unidades_por_caja,
+               COALESCE(unidades_por_docena, 12),
+               COALESCE(NULLIF(TRIM(mh_codigo_unidad), ''), '59'),
+               NULLIF(TRIM(nombre), '')
+               FROM productos WHERE id = ANY(%s) ORDER BY id FOR UPDATE""",
+            (ids,),
+        )
+        return {int(r[0]): tuple(r[1:]) for r in cur.fetchall()}
+
+    out = sql_opcional(cur, _completo)
+    if out is not None:
+        return out
+    cur.execute(
+        """SELECT id, precio_unitario, stock_actual,
+           COALESCE(NULLIF(TRIM(promocion_tipo), ''), NULL),
+           COALESCE(promocion_valor, 0),
+           NULLIF(TRIM(nombre), '')
+           FROM productos WHERE id = ANY(%s) ORDER BY id FOR UPDATE""",
+        (ids,),
+    )
+    return {int(r[0]): (r[1], r[2], r[3], r[4], False, None, 12, "59", r[5]) for r in cur.fetchall()}
+
+
 def descontar_stock(cur, producto_id: int, cantidad: float, sucursal_id: int | None = None) -> None:
     from azdigital.repositories import kardex_repo
 
@@ -414,6 +635,38 @@ def descontar_stock(cur, producto_id: int, cantidad: float, sucursal_id: int | N
     )
 
 
+def descontar_stock_lote(cur, cantidades: dict[int, float], sucursal_id: int | None = None) -> None:
+    """
+    descontar_stock para todas las líneas de una venta ({producto_id: cantidad UMB}).
+    Productos con stock por sucursal: se valida y reparte como en descontar_stock_sucursal
+    (ValueError «Stock insuficiente» si no alcanza). El resto: un UPDATE ... FROM (VALUES ...).
+    """
+    from psycopg2.extras import execute_values
+
+    from azdigital.repositories import kardex_repo
+
+    if not cantidades:
+        return
+    por_sucursal: set[int] = set()
+    if kardex_repo.tabla_existe(cur, kardex_repo.TABLA_STOCK):
+        por_sucursal, faltante = kardex_repo.descontar_stock_sucursal_lote(cur, cantidades, sucursal_id)
+        if faltante is not None:
+            raise ValueError("Stock insuficiente")
+    resto = [(pid, cant) for pid, cant in sorted(cantidades.items()) if pid not in por_sucursal]
+    if resto:
+        execute_values(
+            cur,
+            """
+            UPDATE productos AS p SET stock_actual = p.stock_actual - v.cantidad
+            FROM (VALUES %s) AS v (id, cantidad)
+            WHERE p.id = v.id
+            """,
+            resto,
+            template="(%s::int, %s::numeric)",
+            page_size=len(resto),
+        )
+
+
 def incrementar_stock(cur, producto_id: int, cantidad: float) -> None:
     """Devuelve unidades al inventario (p. ej. anular venta). Respeta stock por sucursal si aplica."""
     from azdigital.repositories import kardex_repo
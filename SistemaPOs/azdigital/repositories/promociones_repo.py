@@ -213,6 +213,43 @@ def get_promocion_activa_producto(cur, producto_id: int, empresa_id: int, fecha:
     return cur.fetchone()
 
 
+def map_promociones_activas_empresa(
+    cur,
+    producto_ids: list[int],
+    empresa_id: int,
+    fecha: date | None = None,
+) -> dict[int, tuple]:
+    """
+    get_promocion_activa_producto para varios productos en una consulta (venta desde carrito).
+    No captura errores: llamarlo dentro de sql_opcional para no perder los bloqueos de la venta.
+    """
+    if not producto_ids:
+        return {}
+    if fecha is None:
+        from azdigital.utils.fecha_sv import hoy_sv
+
+        fecha = hoy_sv()
+    cur.execute(
+        """
+        SELECT DISTINCT ON (pp.producto_id)
+               pp.producto_id,
+               pr.tipo, pr.valor, COALESCE(pr.valor_comprar, pr.valor, 2), COALESCE(pr.valor_pagar, 1),
+               pr.descuento_monto, pr.producto_regalo_id, COALESCE(pr.cantidad_min_compra, 1),
+               COALESCE(pr.cantidad_regalo, 1)
+        FROM promociones pr
+        JOIN promocion_productos pp ON pp.promocion_id = pr.id
+        WHERE pp.producto_id = ANY(%s)
+          AND pr.empresa_id = %s
+          AND COALESCE(pr.activa, TRUE) = TRUE
+          AND (pr.fecha_inicio IS NULL OR pr.fecha_inicio <= %s)
+          AND (pr.fecha_fin IS NULL OR pr.fecha_fin >= %s)
+        ORDER BY pp.producto_id, pr.fecha_inicio DESC NULLS LAST
+        """,
+        (list(producto_ids), empresa_id, fecha, fecha),
+    )
+    return {int(r[0]): tuple(r[1:]) for r in cur.fetchall()}
+
+
 def map_promociones_activas_para_productos(
     cur,
     producto_ids: list[int],
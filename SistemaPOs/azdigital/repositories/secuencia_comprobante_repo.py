@@ -2,10 +2,13 @@
 """Numeración de ticket/factura en caja por empresa, tipo y ambiente."""
 from __future__ import annotations
 
+from azdigital.repositories import esquema_repo
 from azdigital.utils.fecha_sv import hoy_sv
 
 
 def asegurar_tabla(cur) -> None:
+    if esquema_repo.tabla_existe(cur, "pos_secuencia_comprobante"):
+        return
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS pos_secuencia_comprobante (
@@ -0,0 +1,51 @@
+# Búsqueda de productos por nombre: consulta indexada (sin tildes, prefijo primero) o LIKE anterior.
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.repositories.test_busqueda_productos -v
+from __future__ import annotations
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+from azdigital.repositories import esquema_repo, productos_repo
+
+
+class BuscarPorNombreTests(unittest.TestCase):
+    def setUp(self):
+        registro = patch.object(esquema_repo, "_registro", return_value={"productos": frozenset({"id", "activo"})})
+        registro.start()
+        self.addCleanup(registro.stop)
+        esquema_repo.refrescar()
+        self.addCleanup(esquema_repo.refrescar)
+        self.cur = MagicMock(name="cur")
+        self.cur.fetchall.return_value = []
+
+    def _sql_busqueda(self):
+        return [c[0] for c in self.cur.execute.call_args_list if "FROM productos p" in c[0][0]][-1]
+
+    def test_indexada_con_filtros_y_orden(self):
+        self.cur.fetchone.return_value = (1,)  # az_normalizar existe
+        productos_repo.buscar_por_nombre(self.cur, " jabón 50%", limit=10, empresa_id=3, sucursal_id_usuario=None)
+        sql, params = self._sql_busqueda()
+        self.assertIn("az_normalizar(p.nombre) LIKE", sql)
+        self.assertIn("similarity(", sql)
+        self.assertIn("p.empresa_id = %s", sql)
+        self.assertIn("COALESCE(p.activo, TRUE) = TRUE", sql)
+        self.assertNotIn("UPPER(p.nombre) LIKE", sql)
+        self.assertEqual(params[-5:], ("jabón 50\\%", 3, "jabón 50\\%", "jabón 50%", 10))
+
+    def test_sin_esquema_usa_like_anterior(self):
+        self.cur.fetchone.return_value = None
+        productos_repo.buscar_por_nombre(self.cur, "leche", limit=5, empresa_id=3)
+        sql, params = self._sql_busqueda()
+        self.assertIn("UPPER(p.nombre) LIKE %s", sql)
+        self.assertNotIn("az_normalizar", sql)
+        self.assertEqual(params[-3:], ("%LECHE%", 3, 5))
+
+    def test_existencia_de_funcion_se_recuerda(self):
+        self.cur.fetchone.return_value = (1,)
+        for _ in range(5):
+            productos_repo.busqueda_indexada_disponible(self.cur)
+        self.assertEqual(self.cur.execute.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
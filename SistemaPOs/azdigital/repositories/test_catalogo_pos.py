@@ -0,0 +1,62 @@
+# Catálogo POS para caché offline: página por id y versión (ETag) en una consulta (cursor simulado).
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.repositories.test_catalogo_pos -v
+from __future__ import annotations
+
+import unittest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from azdigital.repositories import esquema_repo, productos_repo
+
+_TABLAS = {
+    "productos": frozenset({"id", "activo"}),
+    "producto_presentacion": frozenset({"id"}),
+    "producto_stock_sucursal": frozenset({"id"}),
+    "promociones": frozenset({"id"}),
+}
+
+
+class CatalogoPosTests(unittest.TestCase):
+    def setUp(self):
+        registro = patch.object(esquema_repo, "_registro", return_value=_TABLAS)
+        registro.start()
+        self.addCleanup(registro.stop)
+        self.cur = MagicMock(name="cur")
+
+    def test_pagina_por_id_con_filtros(self):
+        self.cur.fetchall.return_value = [(11,), (12,)]
+        filas = productos_repo.listar_catalogo_pos_pagina(self.cur, 3, 2, despues_de_id=10, limit=501)
+        self.assertEqual(filas, [(11,), (12,)])
+        sql, params = self.cur.execute.call_args[0]
+        self.assertIn("p.id > %s", sql)
+        self.assertIn("ORDER BY p.id LIMIT %s", sql)
+        self.assertNotIn("LIKE", sql)
+        # existencia (sucursal x2), despues_de, empresa, sucursal, limit
+        self.assertEqual(params, (2, 2, 10, 3, 2, 501))
+
+    def test_version_una_consulta_y_depende_de_la_fecha(self):
+        self.cur.fetchone.return_value = ("abc123",)
+        v = productos_repo.version_catalogo_pos(self.cur, 3, None, date(2026, 1, 15))
+        self.assertEqual(v, "abc123")
+        consultas = [c[0][0] for c in self.cur.execute.call_args_list if "md5" in c[0][0]]
+        self.assertEqual(len(consultas), 1)
+        for tabla in ("productos", "producto_presentacion", "producto_stock_sucursal", "promociones"):
+            self.assertIn(tabla, consultas[0])
+        params = [c[0][1] for c in self.cur.execute.call_args_list if "md5" in c[0][0]][0]
+        self.assertEqual(params[0], "2026-01-15")
+
+    def test_version_none_si_falla(self):
+        self.cur.execute.side_effect = lambda sql, *a: (_ for _ in ()).throw(RuntimeError("x")) if "md5" in sql else None
+        self.assertIsNone(productos_repo.version_catalogo_pos(self.cur, 3))
+
+    def test_token_de_pagina_lleva_la_version(self):
+        token = productos_repo.token_pagina_catalogo_pos(500, "abc123")
+        self.assertEqual(productos_repo.parsear_pagina_catalogo_pos(token), (500, "abc123"))
+        self.assertEqual(productos_repo.parsear_pagina_catalogo_pos(productos_repo.token_pagina_catalogo_pos(7, None)), (7, None))
+        self.assertEqual(productos_repo.parsear_pagina_catalogo_pos("42"), (42, None))
+        self.assertEqual(productos_repo.parsear_pagina_catalogo_pos(None), (0, None))
+        self.assertEqual(productos_repo.parsear_pagina_catalogo_pos("x.abc"), (0, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+# Sincronización delta del catálogo POS: token txid.fecha y productos cambiados (cursor simulado).
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.repositories.test_catalogo_sync_repo -v
+from __future__ import annotations
+
+import unittest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from azdigital.repositories import catalogo_sync_repo, esquema_repo
+
+_HOY = date(2026, 3, 10)
+
+
+class CatalogoSyncRepoTests(unittest.TestCase):
+    def setUp(self):
+        registro = patch.object(
+            esquema_repo,
+            "_registro",
+            return_value={"productos": frozenset({"id", "cambio_txid"}), "promociones": frozenset({"id"})},
+        )
+        registro.start()
+        self.addCleanup(registro.stop)
+        self.cur = MagicMock(name="cur")
+
+    def test_token_ida_y_vuelta(self):
+        self.cur.fetchone.return_value = (98765,)
+        token = catalogo_sync_repo.token_actual(self.cur, _HOY)
+        self.assertEqual(token, "98765.2026-03-10")
+        self.assertEqual(catalogo_sync_repo.parsear_token(token), (98765, _HOY))
+        for invalido in (None, "", "abc", "12", "12.ayer"):
+            self.assertIsNone(catalogo_sync_repo.parsear_token(invalido))
+
+    def test_mismo_dia_solo_por_txid(self):
+        self.cur.fetchall.return_value = [(4,), (9,)]
+        ids = catalogo_sync_repo.ids_cambiados(self.cur, 2, 500, _HOY, _HOY, despues_de_id=3, limit=11)
+        self.assertEqual(ids, [4, 9])
+        sql, params = self.cur.execute.call_args[0]
+        self.assertNotIn("promociones", sql)
+        self.assertEqual(params, (500, 2, 3, 11))
+
+    def test_otro_dia_incluye_promociones_que_iniciaron_o_vencieron(self):
+        self.cur.fetchall.return_value = []
+        ayer = date(2026, 3, 9)
+        catalogo_sync_repo.ids_cambiados(self.cur, None, 500, ayer, _HOY)
+        sql, params = self.cur.execute.call_args[0]
+        self.assertIn("UNION", sql)
+        self.assertNotIn("empresa_id = %s", sql)
+        self.assertEqual(params, (500, 0, ayer, _HOY, ayer, _HOY, 0, 500))
+
+    def test_disponible_segun_columna(self):
+        self.assertTrue(catalogo_sync_repo.disponible(self.cur))
+        with patch.object(esquema_repo, "_registro", return_value={"productos": frozenset({"id"})}):
+            self.cur.fetchone.return_value = None
+            self.assertFalse(catalogo_sync_repo.disponible(self.cur))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# Registro de esquema en memoria: sin consultas a information_schema para tablas/columnas conocidas.
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.repositories.test_esquema_repo -v
+from __future__ import annotations
+
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from azdigital.repositories import esquema_repo, kardex_repo, productos_repo, secuencia_comprobante_repo
+
+_COLUMNAS = [
+    ("productos", "id"),
+    ("productos", "activo"),
+    ("inventario_kardex", "id"),
+    ("producto_stock_sucursal", "id"),
+    ("pos_secuencia_comprobante", "ultimo"),
+]
+
+
+class EsquemaRepoTests(unittest.TestCase):
+    def setUp(self):
+        entorno = patch.dict(os.environ, {"AZ_ESQUEMA_RECARGA_SEG": "300"})
+        entorno.start()
+        self.addCleanup(entorno.stop)
+        self.carga = patch.object(
+            esquema_repo,
+            "_cargar",
+            side_effect=lambda: {t: frozenset(c for tt, c in _COLUMNAS if tt == t) for t, _ in _COLUMNAS},
+        )
+        self.cargar_mock = self.carga.start()
+        self.addCleanup(self.carga.stop)
+        esquema_repo.refrescar()
+        self.addCleanup(esquema_repo.refrescar)
+        self.cur = MagicMock(name="cur")
+
+    def test_venta_no_consulta_el_catalogo(self):
+        for _ in range(20):
+            self.assertEqual(productos_repo._filtro_activos_sql(self.cur), " AND COALESCE(p.activo, TRUE) = TRUE")
+            self.assertTrue(kardex_repo.tabla_existe(self.cur, kardex_repo.TABLA_KARDEX))
+            self.assertTrue(kardex_repo.tabla_existe(self.cur, kardex_repo.TABLA_STOCK))
+            secuencia_comprobante_repo.asegurar_tabla(self.cur)
+        self.cur.execute.assert_not_called()
+        self.assertEqual(self.cargar_mock.call_count, 1)
+
+    def test_desconocido_consulta_con_cursor_del_llamador(self):
+        self.cur.fetchone.return_value = (1,)
+        self.assertTrue(esquema_repo.columna_existe(self.cur, "productos", "fraccionable"))
+        self.cur.fetchone.return_value = None
+        self.assertFalse(esquema_repo.tabla_existe(self.cur, "producto_presentacion"))
+        self.assertEqual(self.cur.execute.call_count, 2)
+
+    def test_refrescar_y_recarga_periodica(self):
+        with patch.object(esquema_repo.time, "monotonic", return_value=1000.0):
+            esquema_repo.tabla_existe(self.cur, "productos")
+        with patch.object(esquema_repo.time, "monotonic", return_value=1100.0):
+            esquema_repo.tabla_existe(self.cur, "productos")
+        self.assertEqual(self.cargar_mock.call_count, 1)
+        with patch.object(esquema_repo.time, "monotonic", return_value=1301.0):
+            esquema_repo.tabla_existe(self.cur, "productos")
+        self.assertEqual(self.cargar_mock.call_count, 2)
+        esquema_repo.refrescar()
+        with patch.object(esquema_repo.time, "monotonic", return_value=1302.0):
+            esquema_repo.tabla_existe(self.cur, "productos")
+        self.assertEqual(self.cargar_mock.call_count, 3)
+
+    def test_si_falla_la_carga_se_consulta_como_antes(self):
+        self.cargar_mock.side_effect = RuntimeError("sin conexión")
+        self.cur.fetchone.return_value = (1,)
+        self.assertTrue(esquema_repo.tabla_existe(self.cur, "productos"))
+        self.cur.execute.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -295,6 +295,45 @@ def crear_detalle(
         raise
 
 
+def crear_detalles(cur, venta_id: int, lineas: list[tuple]) -> None:
+    """
+    crear_detalle para todas las líneas en un INSERT multi-fila.
+    ``lineas``: (producto_id, cantidad, precio_unitario, subtotal, texto_cantidad, presentacion_id).
+    Mismo respaldo por columnas opcionales que crear_detalle (SAVEPOINT por intento).
+    """
+    from psycopg2.extras import execute_values
+
+    if not lineas:
+        return
+    filas = [
+        (venta_id, pid, cant, precio, sub, (tx or "").strip() or None, pres)
+        for pid, cant, precio, sub, tx, pres in lineas
+    ]
+    intentos = [
+        ("producto_id, cantidad, precio_unitario, subtotal, texto_cantidad, presentacion_id", 7),
+        ("producto_id, cantidad, precio_unitario, subtotal, texto_cantidad", 6),
+        ("producto_id, cantidad, precio_unitario, subtotal", 5),
+    ]
+    if all(f[6] is None for f in filas):
+        intentos = intentos[1:]
+    for i, (cols, n) in enumerate(intentos):
+        sp = "spvd" + uuid.uuid4().hex[:14]
+        cur.execute(f"SAVEPOINT {sp}")
+        try:
+            execute_values(
+                cur,
+                f"INSERT INTO venta_detalles (venta_id, {cols}) VALUES %s",
+                [f[:n] for f in filas],
+                page_size=len(filas),
+            )
+            cur.execute(f"RELEASE SAVEPOINT {sp}")
+            return
+        except Exception:
+            cur.execute(f"ROLLBACK TO SAVEPOINT {sp}")
+            if i == len(intentos) - 1:
+                raise
+
+
 def get_venta(cur, venta_id: int, empresa_id: int = None):
     """
     Retorna: id, fecha, total, cliente_nombre, tipo_comprobante, cliente_id,
@@ -8,7 +8,6 @@ import html
 import unicodedata
 from io import BytesIO, StringIO
 
-import psycopg2
 from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, send_file, session, url_for
 from werkzeug.security import generate_password_hash
 
@@ -42,6 +41,8 @@ from azdigital.utils.precio_umb_desde_caja import (
     aplicar_derivacion_desde_presentacion,
     presentacion_tiene_monto_derivable,
 )
+from azdigital.utils import codigos_cache
+from azdigital.utils.sesion_snapshot import invalidar_empresa, invalidar_usuario, rol_usuario
 from azdigital.integration.agildte_client import AgilDTEAPIError, login_client_from_request_or_env
 from database import ConexionDB
 
@@ -214,7 +215,7 @@ def reporte():
     primera_fecha_ventas = None
     total_ventas_empresa = 0
 
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -263,7 +264,7 @@ def reporte():
         LIMIT 10
     """
     top_productos = db.ejecutar_sql(sql_top, (inicio, fin, emp), es_select=True) or []
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         sugerencia_compra = productos_repo.productos_stock_bajo(cur, umbral=10, empresa_id=emp) or []
@@ -358,7 +359,7 @@ def _datos_cabecera_reporte_ventas(inicio: str, fin: str) -> dict[str, str]:
     nombre_empresa = (session.get("empresa_nombre") or "Empresa").strip() or "Empresa"
     nombre_sucursal = "Todas las sucursales (consolidado empresa)"
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         emp = empresas_repo.get_empresa(cur, emp_id)
@@ -392,7 +393,7 @@ def _datos_cabecera_inventario(periodo_txt: str = "", sucursal_nombre: str = Non
     nombre_empresa = (session.get("empresa_nombre") or "Empresa").strip() or "Empresa"
     nombre_sucursal = sucursal_nombre if sucursal_nombre else "Todas las sucursales"
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         emp = empresas_repo.get_empresa(cur, emp_id)
@@ -741,7 +742,7 @@ def _reporte_f983_excel_elegante(filas, ejercicio):
 def reporte_kardex_detallado():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -805,7 +806,7 @@ def reporte_f983():
     emp_id = _empresa_id()
     ejercicio = int(request.args.get("ejercicio", hoy_sv().year))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = []
@@ -856,7 +857,7 @@ def reporte_f983_exportar_excel():
     except ImportError:
         return "<p>Instala openpyxl: pip install openpyxl</p>", 500
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = inventario_reports_repo.listar_productos_para_f983(cur, emp_id, ejercicio)
@@ -879,7 +880,7 @@ def reporte_valuacion():
     sucursal_id_raw = request.args.get("sucursal_id", "").strip()
     suc_id = int(sucursal_id_raw) if sucursal_id_raw.isdigit() else None
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = []
@@ -950,7 +951,7 @@ def reporte_lista_compras():
     """Lista de productos a comprar (stock bajo) y sugerencias de precios justos."""
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -1007,6 +1008,7 @@ def reporte_lista_compras():
                             f"Producto #{prod_id} lista compras: {msg}",
                         )
                         conn.commit()
+                        codigos_cache.invalidar()
                         flash(msg, "success")
                     else:
                         conn.rollback()
@@ -1047,6 +1049,7 @@ def reporte_lista_compras():
                         f"Lista compras: {ok_n} precio(s) actualizados (margen {margen_sugerido:g}%)",
                     )
                     conn.commit()
+                    codigos_cache.invalidar()
                     flash(
                         f"Se actualizaron {ok_n} producto(s)."
                         + (f" {skip_n} omitido(s) sin costo." if skip_n else ""),
@@ -1078,6 +1081,7 @@ def reporte_lista_compras():
                             lista_compras_repo.registrar_costo_compra(cur, prod_id, costo_new, 1, session.get("user_id"), "Actualización lista compras")
                         registrar_accion(cur, historial_usuarios_repo.EVENTO_PRODUCTO_EDITADO, f"Producto #{prod_id} (lista compras)")
                         conn.commit()
+                        codigos_cache.invalidar()
                         flash("Producto actualizado.", "success")
                     else:
                         conn.rollback()
@@ -1162,7 +1166,7 @@ def reactivar_producto_route(producto_id: int):
         flash("Solo Gerente o superusuario puede reactivar productos.", "danger")
         return redirect(url_for("admin.reporte_productos_baja"))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -1175,6 +1179,7 @@ def reactivar_producto_route(producto_id: int):
                 f"Producto #{producto_id} reactivado en inventario",
             )
             conn.commit()
+            codigos_cache.invalidar()
             flash("Producto reactivado. Ya aparece de nuevo en inventario y en caja.", "success")
         else:
             conn.rollback()
@@ -1193,7 +1198,7 @@ def reactivar_producto_route(producto_id: int):
 def reporte_productos_baja():
     """Productos dados de baja (no eliminados de BD) con motivo y fecha."""
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -1226,7 +1231,7 @@ def reporte_productos_baja():
 @rol_requerido("GERENTE", "CONTADOR", "BODEGUERO")
 def reporte_movimientos():
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -1512,7 +1517,7 @@ def reporte_kardex_exportar_excel():
     inicio = request.args.get("inicio", hoy_sv().replace(month=1, day=1).strftime("%Y-%m-%d"))
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         prod_id = int(producto_id) if producto_id.isdigit() else None
@@ -1578,7 +1583,7 @@ def reporte_kardex_exportar_pdf():
     inicio = request.args.get("inicio", hoy_sv().replace(month=1, day=1).strftime("%Y-%m-%d"))
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         prod_id = int(producto_id) if producto_id.isdigit() else None
@@ -1617,7 +1622,7 @@ def reporte_valuacion_exportar_excel():
     sucursal_id = request.args.get("sucursal_id", "").strip()
     suc_id = int(sucursal_id) if sucursal_id.isdigit() else None
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = inventario_reports_repo.listar_valuacion_inventario(cur, emp_id, sucursal_id=suc_id)
@@ -1701,7 +1706,7 @@ def reporte_valuacion_exportar_pdf():
     sucursal_id = request.args.get("sucursal_id", "").strip()
     suc_id = int(sucursal_id) if sucursal_id.isdigit() else None
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = inventario_reports_repo.listar_valuacion_inventario(cur, emp_id, sucursal_id=suc_id)
@@ -1715,7 +1720,7 @@ def reporte_valuacion_exportar_pdf():
     except ImportError:
         return "<p>Instala reportlab: pip install reportlab</p>", 500
     db2 = ConexionDB()
-    conn2 = psycopg2.connect(**db2.config)
+    conn2 = db2.conexion()
     cur2 = conn2.cursor()
     sucursales = sucursales_repo.listar_sucursales_min(cur2, empresa_id=emp_id) or []
     cur2.close()
@@ -1744,7 +1749,7 @@ def reporte_valuacion_exportar_pdf():
 def reporte_movimientos_exportar_excel():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if _es_superadmin_db(cur):
@@ -1760,7 +1765,7 @@ def reporte_movimientos_exportar_excel():
     inicio = request.args.get("inicio", "").strip() or hoy.replace(day=1).strftime("%Y-%m-%d")
     fin = request.args.get("fin", "").strip() or hoy.strftime("%Y-%m-%d")
     db2 = ConexionDB()
-    conn2 = psycopg2.connect(**db2.config)
+    conn2 = db2.conexion()
     cur2 = conn2.cursor()
     try:
         prod_id = int(producto_id) if producto_id.isdigit() else None
@@ -1857,7 +1862,7 @@ def reporte_movimientos_exportar_excel():
 def reporte_movimientos_exportar_pdf():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if _es_superadmin_db(cur):
@@ -1873,7 +1878,7 @@ def reporte_movimientos_exportar_pdf():
     inicio = request.args.get("inicio", "").strip() or hoy.replace(day=1).strftime("%Y-%m-%d")
     fin = request.args.get("fin", "").strip() or hoy.strftime("%Y-%m-%d")
     db2 = ConexionDB()
-    conn2 = psycopg2.connect(**db2.config)
+    conn2 = db2.conexion()
     cur2 = conn2.cursor()
     try:
         prod_id = int(producto_id) if producto_id.isdigit() else None
@@ -1931,7 +1936,7 @@ def reporte_movimientos_exportar_pdf():
 def reporte_mermas_ajustes():
     """Pérdidas por merma, avería y faltantes (Kardex AJUSTE_SALIDA con motivo y costo)."""
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -1994,7 +1999,7 @@ def reporte_f983_exportar_pdf():
     emp_id = _empresa_id()
     ejercicio = int(request.args.get("ejercicio", hoy_sv().year))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = inventario_reports_repo.listar_productos_para_f983(cur, emp_id, ejercicio)
@@ -2034,7 +2039,7 @@ def reporte_libro_iva():
     ultima_fecha_ccf = None
     total_ccf_empresa = 0
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -2124,7 +2129,7 @@ def reporte_ventas_producto():
     primera_fecha_ventas = None
     ultima_fecha_ventas = None
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -2190,7 +2195,7 @@ def contingencia():
     """Plan de Contingencia MH: DTEs pendientes, evento y sincronización."""
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -2259,7 +2264,7 @@ def contingencia_registrar_evento():
         flash("Formato de fecha inválido. Use YYYY-MM-DDTHH:MM", "warning")
         return redirect(url_for("admin.contingencia"))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -2339,7 +2344,7 @@ def reporte_documentos_anulados():
     ultima_fecha_anul = None
     total_anulados_empresa = 0
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -2404,7 +2409,7 @@ def imprimir_comprobante_invalidacion(venta_id: int):
     """Comprobante de Invalidación para justificar contablemente la anulación."""
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -2453,7 +2458,7 @@ def reporte_corte_caja():
     uid = int(usuario_id) if usuario_id.isdigit() else None
     sid = int(sucursal_id) if sucursal_id.isdigit() else None
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         datos = cierre_caja_repo.obtener_datos_corte(cur, emp_id, fecha, usuario_id=uid, sucursal_id=sid)
@@ -2535,7 +2540,7 @@ def reporte_corte_caja_ticket():
     uid = int(usuario_id) if usuario_id.isdigit() else None
     sid = int(sucursal_id) if sucursal_id.isdigit() else None
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         datos = cierre_caja_repo.obtener_datos_corte(cur, emp_id, fecha, usuario_id=uid, sucursal_id=sid)
@@ -2585,7 +2590,7 @@ def reporte_corte_caja_exportar_pdf():
     uid = int(usuario_id) if usuario_id.isdigit() else None
     sid = int(sucursal_id) if sucursal_id.isdigit() else None
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         datos = cierre_caja_repo.obtener_datos_corte(cur, emp_id, fecha, usuario_id=uid, sucursal_id=sid)
@@ -2705,7 +2710,7 @@ def cierre_caja():
     user_id = session.get("user_id")
     suc_sid = _sucursal_id_session()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         apertura = None
@@ -2733,7 +2738,7 @@ def cierre_caja_apertura():
         flash("Sesión inválida", "danger")
         return redirect(url_for("admin.cierre_caja"))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         existente = cierre_caja_repo.apertura_abierta(cur, int(user_id), emp_id, suc_sid)
@@ -2768,7 +2773,7 @@ def cierre_caja_cerrar():
         flash("Datos inválidos", "danger")
         return redirect(url_for("admin.cierre_caja"))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         ok = cierre_caja_repo.cerrar_caja(cur, cierre_id, ventas_efectivo, ventas_tarjeta, ventas_credito, ventas_otro, salidas, monto_real, emp_id)
@@ -2792,7 +2797,7 @@ def cierre_caja_comprobante(cierre_id):
     """Comprobante de Cierre de Caja — vista para imprimir en ticket 80mm o panel admin."""
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cierre = cierre_caja_repo.get_cierre_con_cabecera(cur, cierre_id)
@@ -2810,7 +2815,7 @@ def cierre_caja_comprobante(cierre_id):
 def reporte_cuentas_cobrar():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = []
@@ -2898,7 +2903,7 @@ def reporte_libro_iva_exportar_excel():
     inicio = request.args.get("inicio", hoy_sv_str())
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_libro_iva(cur, emp_id, inicio, fin)
@@ -2925,7 +2930,7 @@ def reporte_libro_iva_exportar_csv():
     inicio = request.args.get("inicio", hoy_sv_str())
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_libro_iva(cur, emp_id, inicio, fin)
@@ -2954,7 +2959,7 @@ def reporte_libro_iva_exportar_pdf():
     inicio = request.args.get("inicio", hoy_sv_str())
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_libro_iva(cur, emp_id, inicio, fin)
@@ -2987,7 +2992,7 @@ def reporte_libro_iva_compras():
     ultima_fecha_compras = None
     total_compras_empresa = 0
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -3055,7 +3060,7 @@ def reporte_libro_iva_compras_exportar_excel():
     inicio = request.args.get("inicio", hoy_sv_str())
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = compras_reports_repo.listar_libro_iva_compras(cur, emp_id, inicio, fin)
@@ -3081,7 +3086,7 @@ def reporte_libro_iva_compras_exportar_csv():
     inicio = request.args.get("inicio", hoy_sv_str())
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = compras_reports_repo.listar_libro_iva_compras(cur, emp_id, inicio, fin)
@@ -3110,7 +3115,7 @@ def reporte_libro_iva_compras_exportar_pdf():
     inicio = request.args.get("inicio", hoy_sv_str())
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = compras_reports_repo.listar_libro_iva_compras(cur, emp_id, inicio, fin)
@@ -3134,7 +3139,7 @@ def reporte_ventas_producto_exportar_excel():
     inicio = request.args.get("inicio", hoy_sv_str())
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_ventas_por_producto(cur, emp_id, inicio, fin)
@@ -3160,7 +3165,7 @@ def reporte_ventas_producto_exportar_pdf():
     inicio = request.args.get("inicio", hoy_sv_str())
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_ventas_por_producto(cur, emp_id, inicio, fin)
@@ -3184,7 +3189,7 @@ def reporte_documentos_anulados_exportar_excel():
     inicio = request.args.get("inicio", "")
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_documentos_anulados(cur, emp_id, inicio or None, fin or None)
@@ -3210,7 +3215,7 @@ def reporte_documentos_anulados_exportar_pdf():
     inicio = request.args.get("inicio", "")
     fin = request.args.get("fin", hoy_sv_str())
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_documentos_anulados(cur, emp_id, inicio or None, fin or None)
@@ -3231,7 +3236,7 @@ def reporte_documentos_anulados_exportar_pdf():
 def reporte_cuentas_cobrar_exportar_excel():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_cuentas_por_cobrar(cur, emp_id)
@@ -3255,7 +3260,7 @@ def reporte_cuentas_cobrar_exportar_excel():
 def reporte_cuentas_cobrar_exportar_pdf():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         filas = ventas_reports_repo.listar_cuentas_por_cobrar(cur, emp_id)
@@ -3277,7 +3282,7 @@ def configuracion():
     if session.get("rol") not in ("ADMIN", "SUPERADMIN"):
         return redirect(url_for("core.index"))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -3415,7 +3420,7 @@ def crear_empresa_route():
     conn = None
     cur = None
     try:
-        conn = psycopg2.connect(**ConexionDB().config)
+        conn = ConexionDB().conexion()
         cur = conn.cursor()
         codigo_act = (form.get("codigo_actividad_economica") or "").strip()
         actividad = form.get("actividad", "") or ""
@@ -3474,7 +3479,7 @@ def _eliminar_empresa_y_redirigir(empresa_id: int):
         flash("ID de empresa no válido.", "danger")
         return _rd("/configuracion")
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if empresas_repo.contar_empresas(cur) <= 1:
@@ -3499,6 +3504,7 @@ def _eliminar_empresa_y_redirigir(empresa_id: int):
                 f"Empresa eliminada: {nombre or empresa_id}",
             )
             conn.commit()
+            invalidar_empresa(empresa_id)
             flash(f"Empresa «{nombre or empresa_id}» eliminada correctamente.", "success")
             restantes = empresas_repo.listar_empresas(cur) or []
             if restantes:
@@ -3574,7 +3580,7 @@ def configuracion_modo_operacion():
             emp_id, modo, confirmar_reinicio=confirmar, cliente=cli
         )
         amb_nuevo = "00" if modo == "online" else "01"
-        conn = psycopg2.connect(**ConexionDB().config)
+        conn = ConexionDB().conexion()
         cur = conn.cursor()
         try:
             empresas_repo.set_ambiente_mh(cur, emp_id, amb_nuevo)
@@ -3613,7 +3619,7 @@ def configuracion_sincronizar_agildte():
     conn = None
     cur = None
     try:
-        conn = psycopg2.connect(**ConexionDB().config)
+        conn = ConexionDB().conexion()
         cur = conn.cursor()
         empresas_repo.aplicar_empresa_agildte_en_bd(cur, emp_id, agildte_data)
         registrar_accion(
@@ -3680,7 +3686,7 @@ def guardar_configuracion():
     conn = None
     cur = None
     try:
-        conn = psycopg2.connect(**db.config)
+        conn = db.conexion()
         cur = conn.cursor()
         if codigo_actividad:
             desc = actividades_repo.get_descripcion_por_codigo(cur, codigo_actividad)
@@ -3703,6 +3709,7 @@ def guardar_configuracion():
         )
         registrar_accion(cur, historial_usuarios_repo.EVENTO_CONFIG_EMPRESA, "Configuración empresa actualizada")
         conn.commit()
+        invalidar_empresa(emp_id)
         flash("Configuración guardada correctamente.", "success")
     except Exception as e:
         try:
@@ -3873,7 +3880,7 @@ def _acceso_producto_inventario(cur, producto_id: int, emp_id: int, es_super: bo
 def inventario():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if presentaciones_repo.tabla_existe(cur):
@@ -3947,7 +3954,7 @@ def _filas_exportacion_inventario(cur, es_super: bool, emp_id: int) -> tuple[lis
 @rol_requerido("GERENTE", "BODEGUERO")
 def inventario_exportar_excel():
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         emp_id = _empresa_id()
@@ -4051,7 +4058,7 @@ def inventario_exportar_excel():
 @rol_requerido("GERENTE", "BODEGUERO")
 def inventario_exportar_pdf():
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         emp_id = _empresa_id()
@@ -4091,7 +4098,7 @@ def inventario_presentaciones_producto(producto_id: int):
     """UMB + presentaciones adicionales (Tira, etc.) para el modal de inventario."""
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -4352,7 +4359,7 @@ def inventario_plantilla_carga():
     except ImportError:
         return "<p>Instala openpyxl: pip install openpyxl</p>", 500
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -4418,7 +4425,7 @@ def inventario_cargar_masivo():
         emp_id = int(request.form.get("empresa_id"))
 
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -4509,6 +4516,7 @@ def inventario_cargar_masivo():
                     errores.append(f"'{nom}': {err_msg[:80]}")
 
         conn.commit()
+        codigos_cache.invalidar()
         if creados > 0 or actualizados > 0:
             partes = []
             if creados:
@@ -4582,7 +4590,7 @@ def _validar_supervisor_ajuste_inventario(cur, username: str, password: str) ->
 def inventario_kardex(producto_id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -4670,7 +4678,7 @@ def inventario_registrar_movimiento():
         return redirect(url_for("admin.inventario_kardex", producto_id=producto_id))
 
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     uid = session.get("user_id")
     try:
@@ -4739,7 +4747,7 @@ def inventario_registrar_movimiento():
 @rol_requerido("GERENTE", "BODEGUERO")
 def inventario_conteo_fisico():
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -4979,7 +4987,7 @@ def inventario_conteo_fisico_exportar_excel():
     form = request.form
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if _es_superadmin_db(cur):
@@ -4990,7 +4998,7 @@ def inventario_conteo_fisico_exportar_excel():
         cur.close()
         conn.close()
     db2 = ConexionDB()
-    conn2 = psycopg2.connect(**db2.config)
+    conn2 = db2.conexion()
     cur2 = conn2.cursor()
     try:
         suc_raw = (form.get("sucursal_id") or "").strip()
@@ -5107,7 +5115,7 @@ def inventario_conteo_fisico_exportar_pdf():
     form = request.form
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if _es_superadmin_db(cur):
@@ -5121,7 +5129,7 @@ def inventario_conteo_fisico_exportar_pdf():
     sucursal_id = int(suc_raw) if suc_raw.isdigit() else None
     fecha_txt = (form.get("fecha_conteo") or hoy_sv_str())[:10]
     db2 = ConexionDB()
-    conn2 = psycopg2.connect(**db2.config)
+    conn2 = db2.conexion()
     cur2 = conn2.cursor()
     try:
         filas, grandes, resumen, suc_nom = _construir_datos_reporte_conteo(cur2, emp_id, sucursal_id, fecha_txt, form)
@@ -5308,7 +5316,7 @@ def guardar_producto():
         return _guardar_producto_respuesta("El nombre del producto es requerido.", ok=False)
 
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -5437,6 +5445,7 @@ def guardar_producto():
             kardex_repo.reemplazar_stock_unificado(cur, int(producto_id), suc_para_stock, stock_f)
             registrar_accion(cur, historial_usuarios_repo.EVENTO_PRODUCTO_EDITADO, f"Producto #{producto_id} actualizado")
             conn.commit()
+            codigos_cache.invalidar()
             flash("Producto actualizado.", "success")
         else:
             target_emp = _empresa_id_desde_form_super(cur, es_super, form.get("empresa_id"), emp_id)
@@ -5501,6 +5510,7 @@ def guardar_producto():
                 det_aud += " (desde Registrar compra)"
             registrar_accion(cur, historial_usuarios_repo.EVENTO_PRODUCTO_CREADO, det_aud)
             conn.commit()
+            codigos_cache.invalidar()
             if _guardar_producto_es_ajax():
                 from azdigital.services.compras_service import opciones_presentacion_compra
 
@@ -5567,7 +5577,7 @@ def eliminar_producto(producto_id):
         return redirect(url_for("admin.inventario"))
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         motivo = (request.form.get("motivo_baja") or "").strip()
@@ -5594,6 +5604,7 @@ def eliminar_producto(producto_id):
                 f"Producto #{producto_id} dado de baja: {motivo[:120]}",
             )
             conn.commit()
+            codigos_cache.invalidar()
             flash("Producto dado de baja. Ya no aparece en inventario ni en caja.", "success")
         else:
             conn.rollback()
@@ -5613,7 +5624,7 @@ def eliminar_producto(producto_id):
 def promociones():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -5629,7 +5640,7 @@ def promociones():
 def promociones_nueva():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         productos = productos_repo.listar_inventario(cur, limit=500, empresa_id=emp_id) or []
@@ -5682,6 +5693,7 @@ def promociones_nueva():
             )
             registrar_accion(cur, historial_usuarios_repo.EVENTO_PROMOCION_CREADA, "Promoción creada")
             conn.commit()
+            codigos_cache.invalidar()
             flash("Promoción creada.", "success")
             return redirect(url_for("admin.promociones"))
         return render_template("promocion_form.html", productos=productos, promocion=None)
@@ -5695,7 +5707,7 @@ def promociones_nueva():
 def promociones_editar(promocion_id: int):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         promocion = promociones_repo.get_promocion(cur, promocion_id, empresa_id=emp_id)
@@ -5753,6 +5765,7 @@ def promociones_editar(promocion_id: int):
             )
             registrar_accion(cur, historial_usuarios_repo.EVENTO_PROMOCION_EDITADA, f"Promoción #{promocion_id} actualizada")
             conn.commit()
+            codigos_cache.invalidar()
             flash("Promoción actualizada.", "success")
             return redirect(url_for("admin.promociones"))
         return render_template("promocion_form.html", productos=productos, promocion=promocion, prod_ids=prod_ids)
@@ -5766,12 +5779,13 @@ def promociones_editar(promocion_id: int):
 def promociones_eliminar(promocion_id: int):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if promociones_repo.eliminar_promocion(cur, promocion_id, empresa_id=emp_id):
             registrar_accion(cur, historial_usuarios_repo.EVENTO_PROMOCION_ELIMINADA, f"Promoción #{promocion_id} eliminada")
             conn.commit()
+            codigos_cache.invalidar()
             flash("Promoción eliminada.", "success")
         else:
             flash("Promoción no encontrada.", "warning")
@@ -5795,10 +5809,7 @@ def _es_superadmin_db(cur):
     uid = session.get("user_id")
     if not uid:
         return False
-    cur.execute("SELECT rol FROM usuarios WHERE id = %s AND activo = TRUE", (uid,))
-    r = cur.fetchone()
-    rol = str(r[0] or "").strip().upper() if r else ""
-    return rol in ("ADMIN", "SUPERADMIN")
+    return rol_usuario(uid, cur) in ("ADMIN", "SUPERADMIN")
 
 
 @bp.route("/usuarios")
@@ -5806,7 +5817,7 @@ def _es_superadmin_db(cur):
 def usuarios():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -5855,7 +5866,7 @@ def usuarios_slash():
 def historial_usuarios():
     """Muestra el historial de accesos (login, logout, cambios de contraseña)."""
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -5924,7 +5935,7 @@ def historial_usuarios():
 def editar_usuario(id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -5988,7 +5999,7 @@ def guardar_usuario():
     sucursal_id = form.get("sucursal")
     # Verificar superadmin desde BD
     db_check = ConexionDB()
-    conn_check = psycopg2.connect(**db_check.config)
+    conn_check = db_check.conexion()
     cur_check = conn_check.cursor()
     cur_check.execute("SELECT rol FROM usuarios WHERE id = %s", (session.get("user_id"),))
     r_rol = cur_check.fetchone()
@@ -6020,7 +6031,7 @@ def guardar_usuario():
             flash("Solo un superusuario puede crear otros superusuarios.", "warning")
 
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if usuario_id and usuario_id.isdigit():
@@ -6028,6 +6039,7 @@ def guardar_usuario():
             usuarios_repo.actualizar_usuario(cur, int(usuario_id), username, pw_hash, rol, sucursal_id, empresa_id)
             registrar_accion(cur, historial_usuarios_repo.EVENTO_USUARIO_EDITADO, f"Usuario {username} actualizado")
             conn.commit()
+            invalidar_usuario(int(usuario_id))
             flash("Usuario actualizado correctamente.", "success")
         else:
             pw_hash = generate_password_hash(password)
@@ -6051,7 +6063,7 @@ def eliminar_usuario(usuario_id):
     if request.method == "GET":
         return redirect(url_for("admin.usuarios"))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         cur.execute("SELECT rol FROM usuarios WHERE id = %s", (session.get("user_id"),))
@@ -6071,6 +6083,7 @@ def eliminar_usuario(usuario_id):
         usuarios_repo.eliminar_usuario(cur, usuario_id)
         registrar_accion(cur, historial_usuarios_repo.EVENTO_USUARIO_ELIMINADO, f"Usuario #{usuario_id} desactivado")
         conn.commit()
+        invalidar_usuario(usuario_id)
         flash("Usuario desactivado correctamente.", "success")
     except Exception as e:
         conn.rollback()
@@ -6088,7 +6101,7 @@ def eliminar_usuario(usuario_id):
 def proveedores():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6115,7 +6128,7 @@ def proveedores():
 def proveedores_editar(id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6151,7 +6164,7 @@ def guardar_proveedor():
     emp_id = _empresa_id()
     es_super = False
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6208,7 +6221,7 @@ def guardar_proveedor():
 def eliminar_proveedor(id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6235,7 +6248,7 @@ def compras_cargar_dte():
     """Carga JSON DTE del proveedor, extrae codigoGeneracion y selloRecepcion."""
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6319,7 +6332,7 @@ def compras_registrar_desde_dte():
         flash("No hay DTE válido en sesión. Cargue el archivo JSON nuevamente.", "warning")
         return redirect(url_for("admin.compras_cargar_dte") + (f"?empresa_id={emp_id}" if emp_id else ""))
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         prov = proveedores_repo.buscar_por_nit(cur, dte_temp["emisor_nit"], emp_id)
@@ -6547,7 +6560,7 @@ def _compras_tpl_context(cur, emp_id, es_super, **kw):
 def compras():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6578,7 +6591,7 @@ def compras():
 def compras_nueva():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6634,7 +6647,7 @@ def compras_editar(id):
         return redirect(url_for("admin.compras"))
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6712,7 +6725,7 @@ def compras_eliminar(id):
         return redirect(request.referrer or url_for("admin.compras"))
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6755,7 +6768,7 @@ def compras_eliminar(id):
 def compras_ver(id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -6792,7 +6805,7 @@ def compras_ver(id):
 def clientes():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         rol_str = str(session.get("rol") or "").strip().upper()
@@ -6854,7 +6867,7 @@ def clientes_embed_redirect(cid=None):
 def editar_cliente(id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         rol_str = str(session.get("rol") or "").strip().upper()
@@ -6993,7 +7006,7 @@ def guardar_cliente():
             return redirect(url_for("admin.clientes"))
 
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         rol_str = str(session.get("rol") or "").strip().upper()
@@ -7108,7 +7121,7 @@ def eliminar_cliente(cliente_id):
     rol_str = str(session.get("rol") or "").strip().upper()
     es_super = rol_str in ("ADMIN", "SUPERADMIN")
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if not es_super:
@@ -7152,7 +7165,7 @@ def _empresa_id_desde_form_super(cur, es_super: bool, form_empresa_id: str | Non
 def sucursales():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -7191,7 +7204,7 @@ def sucursales_slash():
 def editar_sucursal(id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -7239,7 +7252,7 @@ def guardar_sucursal():
         return redirect(url_for("admin.sucursales"))
 
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     emp_id = _empresa_id()
     try:
@@ -7282,7 +7295,7 @@ def eliminar_sucursal(sucursal_id):
         return redirect(url_for("admin.sucursales"))
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _es_superadmin_db(cur)
@@ -7311,7 +7324,7 @@ def eliminar_sucursal(sucursal_id):
 def gestion_ventas():
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     ambiente_empresa = "01"
     try:
@@ -7397,7 +7410,7 @@ def _resolver_venta_remota_agildte(cli, *, empresa_id: int, codigo_generacion: s
 def gestion_ventas_generar_json(venta_id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         venta = ventas_repo.get_venta(cur, venta_id, empresa_id=emp_id)
@@ -7443,7 +7456,7 @@ def gestion_ventas_generar_json(venta_id):
 def gestion_ventas_generar_pdf(venta_id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         venta = ventas_repo.get_venta(cur, venta_id, empresa_id=emp_id)
@@ -7493,7 +7506,7 @@ def gestion_ventas_generar_pdf(venta_id):
 def gestion_ventas_editar(venta_id):
     emp_id = _empresa_id()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         v = ventas_repo.get_venta(cur, venta_id, empresa_id=emp_id)
@@ -7558,7 +7571,7 @@ def gestion_ventas_eliminar(venta_id):
     motivo = (request.form.get("motivo_anulacion") or "").strip() or "Anulación por gestión"
     usuario_id = session.get("user_id")
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if ventas_repo.eliminar_venta_restaurar_stock(cur, venta_id, emp_id, motivo_anulacion=motivo, usuario_anulo_id=usuario_id):
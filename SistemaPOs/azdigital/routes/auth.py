@@ -4,7 +4,6 @@ from __future__ import annotations
 import os
 import time
 
-import psycopg2
 import httpx
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
 from werkzeug.security import generate_password_hash
@@ -14,6 +13,7 @@ from azdigital.services.auth_service import verificar_password
 from azdigital.integration.agildte_client import resolve_agildte_base_url
 from database import ConexionDB
 from azdigital.repositories import historial_usuarios_repo, usuarios_repo
+from azdigital.utils.db_pool import conexion_aparte
 
 bp = Blueprint("auth", __name__)
 
@@ -74,7 +74,7 @@ def _bootstrap_session_from_row(db: ConexionDB, u: tuple) -> None:
     session["empresa_id"] = int(empresa_id) if empresa_id else 1
     try:
         from azdigital.repositories import empresas_repo
-        conn2 = psycopg2.connect(**db.config)
+        conn2 = db.conexion()
         cur2 = conn2.cursor()
         emp = empresas_repo.get_empresa(cur2, session["empresa_id"])
         vista = empresas_repo.empresa_row_a_vista(emp) if emp else None
@@ -90,8 +90,8 @@ def _bootstrap_session_from_row(db: ConexionDB, u: tuple) -> None:
 def _registrar_historial(evento: str, usuario_id=None, username=None, detalle=None):
     """Registra evento en historial. No falla si la tabla no existe."""
     try:
-        db = ConexionDB()
-        conn = psycopg2.connect(**db.config)
+        # Conexión propia: el commit del historial no confirma lo que la ruta tenga abierto.
+        conn = conexion_aparte()
         cur = conn.cursor()
         ip = request.remote_addr if request else None
         ua = (request.user_agent.string[:500] if request and request.user_agent else None)
@@ -170,7 +170,7 @@ def auth_agildte():
     try:
         from azdigital.integration.agildte_sso_provision import provision_if_missing
 
-        conn = psycopg2.connect(**db.config)
+        conn = db.conexion()
         cur = conn.cursor()
         ok, err = provision_if_missing(cur, data)
         if not ok:
@@ -255,7 +255,7 @@ def login():
         db = ConexionDB()
         conn = None
         try:
-            conn = psycopg2.connect(**db.config)
+            conn = db.conexion()
             cur = conn.cursor()
             u = usuarios_repo.get_usuario_login(cur, user_in)
             cur.close()
@@ -334,7 +334,7 @@ def cambiar_password():
         if len(nueva) < 4:
             return render_template("cambiar_password.html", error="La contraseña debe tener al menos 4 caracteres.")
         db = ConexionDB()
-        conn = psycopg2.connect(**db.config)
+        conn = db.conexion()
         cur = conn.cursor()
         try:
             u = usuarios_repo.get_usuario_login(cur, session.get("username", ""))
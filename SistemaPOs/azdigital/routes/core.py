@@ -3,7 +3,6 @@ from __future__ import annotations
 
 from datetime import date, timedelta
 
-import psycopg2
 from flask import Blueprint, current_app, jsonify, redirect, render_template, request, session, url_for
 
 from azdigital.decorators import login_required, _rol_desde_bd
@@ -51,7 +50,7 @@ def entrar_empresa(empresa_id):
 
     try:
         db = ConexionDB()
-        conn = psycopg2.connect(**db.config)
+        conn = db.conexion()
         cur = conn.cursor()
         emp = empresas_repo.get_empresa(cur, empresa_id)
         cur.close()
@@ -218,7 +217,7 @@ def _render_dashboard():
     ventas_sucursal = []
     top_clientes_cf = []
     try:
-        conn = psycopg2.connect(**db.config)
+        conn = db.conexion()
         cur = conn.cursor()
         stock_bajo = productos_repo.productos_stock_bajo(cur, umbral=5, empresa_id=emp_id) or []
         n_stock_bajo_total = productos_repo.contar_productos_stock_bajo(cur, umbral=5, empresa_id=emp_id)
@@ -436,7 +435,7 @@ def index():
     rol = _rol_desde_bd()
     if rol in ("ADMIN", "SUPERADMIN"):
         db = ConexionDB()
-        conn = psycopg2.connect(**db.config)
+        conn = db.conexion()
         cur = conn.cursor()
         empresas = empresas_repo.listar_empresas_detalle(cur) or []
         cur.close()
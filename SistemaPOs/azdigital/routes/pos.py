@@ -5,12 +5,13 @@ from datetime import date
 import os
 from pathlib import Path
 
-import psycopg2
 from flask import Blueprint, current_app, flash, jsonify, make_response, redirect, render_template, request, session, url_for
 
 from azdigital.decorators import login_required, rol_requerido
 from azdigital.repositories import (
     actividades_repo,
+    agildte_outbox_repo,
+    catalogo_sync_repo,
     clientes_repo,
     empresas_repo,
     historial_usuarios_repo,
@@ -25,14 +26,18 @@ from azdigital.repositories import (
 from azdigital.services.auth_service import verificar_password
 from azdigital.utils.fecha_sv import hoy_sv
 from azdigital.services.whatsapp_notificacion_service import preparar_envio_whatsapp_venta
+from azdigital.integration import agildte_outbox
 from azdigital.integration.agildte_client import public_sync_result
 from azdigital.integration.agildte_sync import intentar_sync_venta_si_habilitado
 from azdigital.services.ventas_service import aplicar_descuento, crear_venta_desde_carrito, persistir_venta
 from azdigital.utils.env_config import get_application_url_prefix
+from azdigital.utils import codigos_cache
+from azdigital.utils.db_savepoint import sql_opcional
 from azdigital.utils.historial_helper import registrar_accion
 from azdigital.utils.mh_cat003_unidades import normalizar_codigo_mh
 from azdigital.utils.numero_letras import numero_a_letras_dolares
 from azdigital.utils.qr_dte import generar_qr_dte_base64, url_consulta_publica_dte
+from azdigital.utils.sesion_snapshot import rol_usuario
 from azdigital.utils.validar_documentos import validar_nit, validar_nrc
 from database import ConexionDB
 
@@ -43,10 +48,7 @@ def _pos_es_superadmin_db(cur) -> bool:
     uid = session.get("user_id")
     if not uid:
         return False
-    cur.execute("SELECT rol FROM usuarios WHERE id = %s AND activo = TRUE", (uid,))
-    r = cur.fetchone()
-    rol = str(r[0] or "").strip().upper() if r else ""
-    return rol in ("ADMIN", "SUPERADMIN")
+    return rol_usuario(uid, cur) in ("ADMIN", "SUPERADMIN")
 
 
 def _pos_contexto_productos(cur) -> dict:
@@ -65,9 +67,7 @@ def _pos_contexto_productos(cur) -> dict:
     use_global = es_super
     if not use_global:
         try:
-            cur.execute("SELECT COUNT(*) FROM productos WHERE empresa_id = %s", (emp_id,))
-            n = int((cur.fetchone() or [0])[0])
-            if n == 0:
+            if not codigos_cache.empresa_tiene_productos(cur, emp_id):
                 cur.execute(
                     """
                     SELECT empresa_id FROM productos
@@ -232,7 +232,7 @@ def ventas_pos_clientes_embed(cid: int | None = None):
     except (TypeError, ValueError):
         emp_id = 1
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _pos_es_superadmin_db(cur)
@@ -283,7 +283,7 @@ def autorizar_eliminar_item():
     if not username or not password:
         return jsonify({"ok": False, "msg": "Usuario y contraseña requeridos."})
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         u = usuarios_repo.get_usuario_login(cur, username)
@@ -306,7 +306,7 @@ def autorizar_eliminar_item():
 def buscar_clientes():
     q = (request.args.get("q") or "").strip().upper()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         emp_id = session.get("empresa_id", 1)
@@ -334,7 +334,7 @@ def buscar_clientes():
 @rol_requerido(*_ROLES_POS)
 def cliente_datos(cliente_id: int):
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         try:
@@ -394,7 +394,7 @@ def cliente_form_meta():
     cur = None
     try:
         try:
-            conn = psycopg2.connect(**db.config)
+            conn = db.conexion()
         except Exception as ex:
             current_app.logger.exception("cliente_form_meta: conexión DB")
             try:
@@ -549,7 +549,7 @@ def cliente_guardar_json():
             return jsonify({"ok": False, "msg": msg}), 400
 
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _pos_es_superadmin_db(cur)
@@ -664,7 +664,7 @@ def cliente_eliminar_json(cliente_id: int):
     except (TypeError, ValueError):
         emp_id = 1
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         es_super = _pos_es_superadmin_db(cur)
@@ -688,115 +688,202 @@ def cliente_eliminar_json(cliente_id: int):
         conn.close()
 
 
+def _producto_escaneado_json(cur, r: tuple, emp_id: int) -> dict:
+    """JSON de /buscar_producto a partir de una fila de buscar_por_codigo (o del catálogo POS)."""
+    emp_promo = productos_repo._empresa_id_de_producto(cur, int(r[0]), emp_id)
+    promo_tipo = (r[4] or "").strip().upper() if len(r) > 4 else ""
+    promo_val = float(r[5]) if len(r) > 5 and r[5] else 0
+    promo_vc, promo_vp, promo_dm = 2, 1, None
+    try:
+        promo_activa = promociones_repo.get_promocion_activa_producto(cur, r[0], emp_promo, hoy_sv())
+        if promo_activa:
+            promo_tipo, promo_val = promo_activa[0], float(promo_activa[1] or 0)
+            if len(promo_activa) > 4:
+                promo_vc = float(promo_activa[2] or 2)
+                promo_vp = float(promo_activa[3] or 1)
+                promo_dm = float(promo_activa[4]) if promo_activa[4] is not None else None
+            if promo_tipo == "DESCUENTO_CANTIDAD" and len(promo_activa) > 6 and promo_activa[6] is not None:
+                promo_vc = float(promo_activa[6])
+    except Exception:
+        pass
+    if promo_tipo not in ("2X1", "3X2", "PORCENTAJE", "DESCUENTO_MONTO", "VOLUMEN", "REGALO", "PRECIO_FIJO", "DESCUENTO_CANTIDAD"):
+        promo_tipo = ""
+    fracc = bool(r[6]) if len(r) > 6 else False
+    uxcaja = int(r[7]) if len(r) > 7 and r[7] is not None else None
+    uxdoc = int(r[8]) if len(r) > 8 and r[8] is not None else 12
+    mh = normalizar_codigo_mh(str(r[9]) if len(r) > 9 else None)
+    nom_prod = str(r[1] or "").strip() if len(r) > 1 else None
+    pres = presentaciones_repo.lista_para_pos_json(cur, int(r[0]), uxdoc, uxcaja, nombre_producto=nom_prod)
+    ex_val = float(r[10]) if len(r) > 10 and r[10] is not None else 0.0
+    pres_scan = int(r[11]) if len(r) > 11 and r[11] is not None else None
+    return {
+        "id": r[0], "nombre": r[1], "precio": float(r[2]), "codigo": (r[3] or "").strip(),
+        "promocion_tipo": promo_tipo, "promocion_valor": promo_val,
+        "promocion_valor_comprar": promo_vc, "promocion_valor_pagar": promo_vp, "promocion_descuento_monto": promo_dm,
+        "fraccionable": fracc, "unidades_por_caja": uxcaja, "unidades_por_docena": uxdoc, "mh_codigo_unidad": mh,
+        "presentaciones": pres,
+        "existencia": ex_val,
+        "presentacion_escaneada_id": pres_scan,
+    }
+
+
 @bp.route("/buscar_producto/<codigo>")
 @rol_requerido(*_ROLES_POS)
 def buscar_producto(codigo: str):
+    """
+    Escaneo en caja. El código se resuelve con el índice en memoria (utils.codigos_cache) y el JSON
+    del producto se reutiliza entre escaneos; la existencia se lee en vivo (o con TTL de segundos).
+    Si el código no está en el índice se busca en la BD como siempre.
+    """
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         ctx = _pos_contexto_productos(cur)
         emp_id = ctx["emp_id"]
         suc_f = ctx["suc_f"]
         filtro_emp = None if ctx["use_global"] else emp_id
+        alcance = (filtro_emp, suc_f)
+        hit = None
+        try:
+            hit = codigos_cache.resolver(cur, codigo, filtro_emp, suc_f)
+        except Exception:
+            conn.rollback()
+        if hit:
+            pid, pres_scan = hit
+            fecha = hoy_sv()
+            datos = codigos_cache.producto_json(alcance, pid, fecha)
+            if datos is None:
+                filas = productos_repo.listar_catalogo_pos_pagina(
+                    cur, filtro_emp, sucursal_id_usuario=suc_f, limit=1, ids=[pid]
+                )
+                if filas:
+                    datos = _producto_escaneado_json(cur, filas[0], emp_id)
+                    codigos_cache.guardar_producto_json(alcance, pid, fecha, datos)
+            if datos is not None:
+                datos["existencia"] = codigos_cache.existencia(cur, pid, suc_f)
+                datos["presentacion_escaneada_id"] = pres_scan
+                return jsonify(datos)
         r = productos_repo.buscar_por_codigo(
             cur, codigo, empresa_id=filtro_emp, sucursal_id_usuario=suc_f
         )
         if not r:
             return jsonify({"error": "No encontrado"}), 404
-        emp_promo = productos_repo._empresa_id_de_producto(cur, int(r[0]), emp_id)
-        promo_tipo = (r[4] or "").strip().upper() if len(r) > 4 else ""
-        promo_val = float(r[5]) if len(r) > 5 and r[5] else 0
-        promo_vc, promo_vp, promo_dm = 2, 1, None
-        try:
-            promo_activa = promociones_repo.get_promocion_activa_producto(cur, r[0], emp_promo, hoy_sv())
-            if promo_activa:
-                promo_tipo, promo_val = promo_activa[0], float(promo_activa[1] or 0)
-                if len(promo_activa) > 4:
-                    promo_vc = float(promo_activa[2] or 2)
-                    promo_vp = float(promo_activa[3] or 1)
-                    promo_dm = float(promo_activa[4]) if promo_activa[4] is not None else None
-                if promo_tipo == "DESCUENTO_CANTIDAD" and len(promo_activa) > 6 and promo_activa[6] is not None:
-                    promo_vc = float(promo_activa[6])
-        except Exception:
-            pass
-        if promo_tipo not in ("2X1", "3X2", "PORCENTAJE", "DESCUENTO_MONTO", "VOLUMEN", "REGALO", "PRECIO_FIJO", "DESCUENTO_CANTIDAD"):
-            promo_tipo = ""
-        fracc = bool(r[6]) if len(r) > 6 else False
-        uxcaja = int(r[7]) if len(r) > 7 and r[7] is not None else None
-        uxdoc = int(r[8]) if len(r) > 8 and r[8] is not None else 12
-        mh = normalizar_codigo_mh(str(r[9]) if len(r) > 9 else None)
-        nom_prod = str(r[1] or "").strip() if len(r) > 1 else None
-        pres = presentaciones_repo.lista_para_pos_json(cur, int(r[0]), uxdoc, uxcaja, nombre_producto=nom_prod)
-        ex_val = float(r[10]) if len(r) > 10 and r[10] is not None else 0.0
-        pres_scan = int(r[11]) if len(r) > 11 and r[11] is not None else None
-        return jsonify({
-            "id": r[0], "nombre": r[1], "precio": float(r[2]), "codigo": (r[3] or "").strip(),
-            "promocion_tipo": promo_tipo, "promocion_valor": promo_val,
-            "promocion_valor_comprar": promo_vc, "promocion_valor_pagar": promo_vp, "promocion_descuento_monto": promo_dm,
-            "fraccionable": fracc, "unidades_por_caja": uxcaja, "unidades_por_docena": uxdoc, "mh_codigo_unidad": mh,
-            "presentaciones": pres,
-            "existencia": ex_val,
-            "presentacion_escaneada_id": pres_scan,
-        })
+        return jsonify(_producto_escaneado_json(cur, r, emp_id))
     finally:
         cur.close()
         conn.close()
 
 
+_CACHE_POS_LIMITE = 500
+_CACHE_POS_LIMITE_MAX = 2000
+
+
 @bp.route("/productos_pos_cache")
 @rol_requerido(*_ROLES_POS)
 def productos_pos_cache():
-    """Lista todos los productos para cache offline del POS. Máx 800 para no exceder localStorage."""
+    """
+    Catálogo completo para caché offline del POS, por páginas (``despues_de`` = último id recibido,
+    ``limite`` = tamaño de página). Promociones y presentaciones se cargan en lote por página.
+    ETag = versión del catálogo: con If-None-Match igual responde 304 y la caja conserva su caché.
+    La versión (md5 de todo el catálogo) se calcula en la primera página o con If-None-Match;
+    las siguientes la reciben en el token ``siguiente`` (``<último id>.<versión>``).
+    """
+    despues_de, version = productos_repo.parsear_pagina_catalogo_pos(request.args.get("despues_de"))
+    try:
+        limite = int(request.args.get("limite") or _CACHE_POS_LIMITE)
+    except (TypeError, ValueError):
+        limite = _CACHE_POS_LIMITE
+    limite = min(max(limite, 1), _CACHE_POS_LIMITE_MAX)
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         ctx = _pos_contexto_productos(cur)
         emp_id = ctx["emp_id"]
         suc_f = ctx["suc_f"]
         filtro_emp = None if ctx["use_global"] else emp_id
-        res = productos_repo.buscar_por_nombre(
-            cur, "", limit=800, empresa_id=filtro_emp, sucursal_id_usuario=suc_f
-        ) or []
-        productos = []
-        for r in res:
-            promo_tipo = (r[4] or "").strip().upper() if len(r) > 4 else ""
-            promo_val = float(r[5]) if len(r) > 5 and r[5] else 0
-            promo_vc, promo_vp, promo_dm = 2, 1, None
-            try:
-                emp_promo = productos_repo._empresa_id_de_producto(cur, int(r[0]), emp_id)
-                promo_activa = promociones_repo.get_promocion_activa_producto(
-                    cur, r[0], emp_promo, hoy_sv()
-                )
-                if promo_activa:
-                    promo_tipo, promo_val = promo_activa[0], float(promo_activa[1] or 0)
-                    if len(promo_activa) > 4:
-                        promo_vc = float(promo_activa[2] or 2)
-                        promo_vp = float(promo_activa[3] or 1)
-                        promo_dm = float(promo_activa[4]) if promo_activa[4] is not None else None
-                    if promo_tipo == "DESCUENTO_CANTIDAD" and len(promo_activa) > 6 and promo_activa[6] is not None:
-                        promo_vc = float(promo_activa[6])
-            except Exception:
-                pass
-            if promo_tipo not in ("2X1", "3X2", "PORCENTAJE", "DESCUENTO_MONTO", "VOLUMEN", "REGALO", "PRECIO_FIJO", "DESCUENTO_CANTIDAD"):
-                promo_tipo = ""
-            fracc = bool(r[6]) if len(r) > 6 else False
-            uxcaja = int(r[7]) if len(r) > 7 and r[7] is not None else None
-            uxdoc = int(r[8]) if len(r) > 8 and r[8] is not None else 12
-            mh = normalizar_codigo_mh(str(r[9]) if len(r) > 9 else None)
-            nom_prod = str(r[1] or "").strip() if len(r) > 1 else None
-            pres = presentaciones_repo.lista_para_pos_json(cur, int(r[0]), uxdoc, uxcaja, nombre_producto=nom_prod)
-            ex_cache = float(r[10]) if len(r) > 10 and r[10] is not None else 0.0
-            productos.append({
-                "id": r[0], "nombre": r[1], "precio": float(r[2]), "codigo": (r[3] or "").strip(),
-                "promocion_tipo": promo_tipo, "promocion_valor": promo_val,
-                "promocion_valor_comprar": promo_vc, "promocion_valor_pagar": promo_vp, "promocion_descuento_monto": promo_dm,
-                "fraccionable": fracc, "unidades_por_caja": uxcaja, "unidades_por_docena": uxdoc, "mh_codigo_unidad": mh,
-                "presentaciones": pres,
-                "existencia": ex_cache,
-            })
-        return jsonify({"productos": productos, "empresa_id": emp_id, "catalogo_global": ctx["use_global"]})
+        if despues_de == 0 or request.if_none_match:
+            version = productos_repo.version_catalogo_pos(cur, filtro_emp, suc_f, hoy_sv())
+        if version and request.if_none_match.contains(version):
+            resp = make_response("", 304)
+            resp.set_etag(version)
+            return resp
+        # Token delta antes de leer: lo que cambie durante la descarga llega en la próxima sync.
+        version_delta = None
+        if despues_de == 0 and catalogo_sync_repo.disponible(cur):
+            version_delta = catalogo_sync_repo.token_actual(cur, hoy_sv())
+        res = productos_repo.listar_catalogo_pos_pagina(
+            cur, filtro_emp, sucursal_id_usuario=suc_f, despues_de_id=despues_de, limit=limite + 1
+        )
+        hay_mas = len(res) > limite
+        res = res[:limite]
+        productos = _filas_a_catalogo_pos_json(cur, res, emp_id, use_global=ctx["use_global"])
+        resp = jsonify({
+            "productos": productos,
+            "empresa_id": emp_id,
+            "catalogo_global": ctx["use_global"],
+            "siguiente": productos_repo.token_pagina_catalogo_pos(res[-1][0], version) if hay_mas else None,
+            "version": version,
+            "version_delta": version_delta,
+        })
+        if version:
+            resp.set_etag(version)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+    finally:
+        cur.close()
+        conn.close()
+
+
+@bp.route("/productos_pos_delta")
+@rol_requerido(*_ROLES_POS)
+def productos_pos_delta():
+    """
+    Cambios del catálogo POS desde ``desde`` (token version_delta de la última sync).
+    Devuelve productos nuevos/modificados (mismo JSON que /productos_pos_cache, con promociones,
+    presentaciones y existencia) y ``eliminados``: ids dados de baja o fuera del alcance de la caja.
+    ``completo: true`` = token inválido o BD sin triggers de cambio; descargar /productos_pos_cache.
+    """
+    desde = catalogo_sync_repo.parsear_token(request.args.get("desde"))
+    try:
+        despues_de = max(0, int(request.args.get("despues_de") or 0))
+    except (TypeError, ValueError):
+        despues_de = 0
+    try:
+        limite = int(request.args.get("limite") or _CACHE_POS_LIMITE)
+    except (TypeError, ValueError):
+        limite = _CACHE_POS_LIMITE
+    limite = min(max(limite, 1), _CACHE_POS_LIMITE_MAX)
+    db = ConexionDB()
+    conn = db.conexion()
+    cur = conn.cursor()
+    try:
+        if desde is None or not catalogo_sync_repo.disponible(cur):
+            return jsonify({"completo": True, "productos": [], "eliminados": [], "siguiente": None, "version": None})
+        ctx = _pos_contexto_productos(cur)
+        emp_id = ctx["emp_id"]
+        suc_f = ctx["suc_f"]
+        filtro_emp = None if ctx["use_global"] else emp_id
+        hoy = hoy_sv()
+        version = catalogo_sync_repo.token_actual(cur, hoy)
+        ids = catalogo_sync_repo.ids_cambiados(
+            cur, filtro_emp, desde[0], desde[1], hoy, despues_de_id=despues_de, limit=limite + 1
+        )
+        hay_mas = len(ids) > limite
+        ids = ids[:limite]
+        res = productos_repo.listar_catalogo_pos_pagina(
+            cur, filtro_emp, sucursal_id_usuario=suc_f, limit=len(ids) or 1, ids=ids
+        ) if ids else []
+        visibles = {int(r[0]) for r in res}
+        return jsonify({
+            "completo": False,
+            "productos": _filas_a_catalogo_pos_json(cur, res, emp_id, use_global=ctx["use_global"]),
+            "eliminados": [i for i in ids if i not in visibles],
+            "empresa_id": emp_id,
+            "siguiente": ids[-1] if hay_mas else None,
+            "version": version,
+        })
     finally:
         cur.close()
         conn.close()
@@ -929,7 +1016,7 @@ def _filas_a_catalogo_pos_json(cur, rows: list[tuple], emp_id: int, *, use_globa
 def pos_catalogo_productos():
     """Catálogo completo para modal POS: existencia + precio (misma sucursal/empresa que sesión)."""
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         ctx = _pos_contexto_productos(cur)
@@ -959,7 +1046,7 @@ def pos_catalogo_productos():
 def buscar_por_nombre():
     q = request.args.get("q", "").upper()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         ctx = _pos_contexto_productos(cur)
@@ -1036,7 +1123,7 @@ def guardar_venta():
     conn = None
     cur = None
     try:
-        conn = psycopg2.connect(**db.config)
+        conn = db.conexion()
         cur = conn.cursor()
 
         emp_id = session.get("empresa_id", 1)
@@ -1140,7 +1227,26 @@ def guardar_venta():
             historial_usuarios_repo.EVENTO_VENTA_CREADA,
             f"Venta #{venta_id}. Total ${total_neto:,.2f}",
         )
+        # Bandeja AgilDTE en la misma transacción: si la venta queda, su envío también.
+        outbox_id = sql_opcional(
+            cur,
+            lambda: agildte_outbox.encolar_venta(
+                cur,
+                empresa_id_local=int(emp_id),
+                venta_id_local=int(venta_id),
+                tipo_comprobante=tipo_comp,
+                tipo_pago=str(pago or "EFECTIVO"),
+                lineas=lineas,
+                total_neto=float(total_neto),
+                total_bruto=float(total_bruto),
+                descuento=float(descuento_aplicado),
+                cliente_id=cliente_id,
+                cliente_nombre_ticket=str(cliente or "Consumidor Final"),
+            ),
+            None,
+        )
         conn.commit()
+        codigos_cache.invalidar_stock([ln.producto_id for ln in lineas])
 
         cur.execute("SELECT 1 FROM ventas WHERE id = %s", (venta_id,))
         if cur.fetchone() is None:
@@ -1155,19 +1261,33 @@ def guardar_venta():
                 500,
             )
 
-        agildte_sync = intentar_sync_venta_si_habilitado(
-            cur=cur,
-            empresa_id_local=int(emp_id),
-            venta_id_local=int(venta_id),
-            tipo_comprobante=tipo_comp,
-            tipo_pago=str(pago or "EFECTIVO"),
-            lineas=lineas,
-            total_neto=float(total_neto),
-            total_bruto=float(total_bruto),
-            descuento=float(descuento_aplicado),
-            cliente_id=cliente_id,
-            cliente_nombre_ticket=str(cliente or "Consumidor Final"),
-        )
+        if outbox_id is not None:
+            # Con despachador el ticket no espera a AgilDTE; sin credenciales de servicio se
+            # entrega aquí con el JWT de la sesión y, si falla, la fila queda para reintento.
+            agildte_sync = None
+            if not agildte_outbox.modo_asincrono():
+                agildte_sync = agildte_outbox.entregar_ahora(conn, cur, outbox_id)
+            if agildte_sync is None:
+                agildte_outbox.avisar()
+                agildte_sync = {
+                    "ok": True,
+                    "pendiente": True,
+                    "mensaje_usuario": "DTE en proceso con AgilDTE; el código y el sello se muestran al confirmarse.",
+                }
+        else:
+            agildte_sync = intentar_sync_venta_si_habilitado(
+                cur=cur,
+                empresa_id_local=int(emp_id),
+                venta_id_local=int(venta_id),
+                tipo_comprobante=tipo_comp,
+                tipo_pago=str(pago or "EFECTIVO"),
+                lineas=lineas,
+                total_neto=float(total_neto),
+                total_bruto=float(total_bruto),
+                descuento=float(descuento_aplicado),
+                cliente_id=cliente_id,
+                cliente_nombre_ticket=str(cliente or "Consumidor Final"),
+            )
         if agildte_sync is not None and not agildte_sync.get("ok"):
             current_app.logger.warning("AgilDTE sync venta #%s: %s", venta_id, agildte_sync)
 
@@ -1180,7 +1300,7 @@ def guardar_venta():
                     "No se pudo confirmar en BD los datos DTE devueltos por AgilDTE (venta #%s)",
                     venta_id,
                 )
-        elif agildte_sync is not None:
+        elif agildte_sync is not None and not agildte_sync.get("pendiente"):
             # Aunque no se marcaron campos DTE, hacer commit de cualquier UPDATE parcial
             # y dejar traza para diagnóstico (ticket sin código = sync incompleto).
             try:
@@ -1569,7 +1689,7 @@ def imprimir_ticket(venta_id: int):
     formato = (request.args.get("formato") or "").strip().lower()
     copias = int(request.args.get("copias", 1) or 1)
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         existe, venta_emp = ventas_repo.venta_existe_y_empresa_id(cur, venta_id)
@@ -1601,6 +1721,50 @@ def imprimir_ticket(venta_id: int):
         conn.close()
 
 
+@bp.route("/venta/<int:venta_id>/dte_estado")
+@rol_requerido(*_ROLES_POS)
+def venta_dte_estado(venta_id: int):
+    """
+    Estado del DTE de una venta para el POS tras guardar_venta: código/sello en la BD local y, si
+    pasó por la bandeja AgilDTE, su estado de envío. ``listo`` = ya no hay nada más que esperar.
+    """
+    sess_emp = int(session.get("empresa_id") or 1)
+    db = ConexionDB()
+    conn = db.conexion()
+    cur = conn.cursor()
+    try:
+        existe, venta_emp = ventas_repo.venta_existe_y_empresa_id(cur, venta_id)
+        if not existe:
+            return jsonify({"error": "No encontrada"}), 404
+        rol = (session.get("rol") or "").strip().upper()
+        if venta_emp is not None and venta_emp != sess_emp and rol not in ("ADMIN", "SUPERADMIN"):
+            return jsonify({"error": "Sin permiso"}), 403
+        v = ventas_repo.get_venta(cur, venta_id, empresa_id=None)
+        envio = None
+        if agildte_outbox_repo.tabla_existe(cur):
+            envio = agildte_outbox_repo.estado_venta(cur, venta_id)
+        codigo = (v[14] or "").strip() if v else ""
+        sello = (v[16] or "").strip() if v else ""
+        estado_envio = envio["estado"] if envio else None
+        out = {
+            "venta_id": venta_id,
+            "codigo_generacion": codigo,
+            "numero_control": (v[15] or "").strip() if v else "",
+            "sello_recepcion": sello,
+            "estado_dte": (v[17] or "").strip() if v else "",
+            "envio": estado_envio,
+            "intentos": envio["intentos"] if envio else 0,
+            "mensaje_usuario": envio["ultimo_error"] if envio and estado_envio != agildte_outbox_repo.ENVIADO else None,
+            "listo": bool(sello) or estado_envio in (None, agildte_outbox_repo.ENVIADO, agildte_outbox_repo.FALLIDO),
+        }
+        resp = jsonify(out)
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    finally:
+        cur.close()
+        conn.close()
+
+
 @bp.route("/publico/comprobante/<int:venta_id>")
 def publico_comprobante_venta(venta_id: int):
     """Comprobante imprimible con token firmado (enlace WhatsApp). Sin sesión."""
@@ -1615,7 +1779,7 @@ def publico_comprobante_venta(venta_id: int):
         return "Enlace no válido.", 403
     formato = (request.args.get("formato") or "").strip().lower()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         tpl, ctx = _tpl_comprobante_venta(
@@ -1645,7 +1809,7 @@ def publico_dte_json_venta(venta_id: int):
     if vid != venta_id:
         return jsonify({"error": "Enlace no válido"}), 403
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         payload = construir_json_dte_mh_venta(cur, venta_id, eid)
@@ -1673,7 +1837,7 @@ def pos_favoritos_get():
     emp_id = int(session.get("empresa_id") or 1)
     suc_id = _sucursal_session_int()
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if not pos_favoritos_repo.tabla_existe(cur):
@@ -1704,7 +1868,7 @@ def pos_favoritos_post():
     if items is None:
         items = []
     db = ConexionDB()
-    conn = psycopg2.connect(**db.config)
+    conn = db.conexion()
     cur = conn.cursor()
     try:
         if not pos_favoritos_repo.tabla_existe(cur):
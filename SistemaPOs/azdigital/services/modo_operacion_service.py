@@ -55,11 +55,10 @@ def obtener_ambiente_empresa(empresa_id: int, cur=None) -> str:
             return local
     else:
         try:
-            import psycopg2
             from database import ConexionDB
             from azdigital.repositories import empresas_repo
 
-            conn = psycopg2.connect(**ConexionDB().config)
+            conn = ConexionDB().conexion()
             c = conn.cursor()
             try:
                 local = empresas_repo.get_ambiente_mh(c, empresa_id)
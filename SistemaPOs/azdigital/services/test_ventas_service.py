@@ -0,0 +1,199 @@
+# Venta POS por lotes: precios del carrito y persistencia de detalle/stock/Kardex (cursor simulado, sin PostgreSQL).
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.services.test_ventas_service -v
+from __future__ import annotations
+
+import unittest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from azdigital.repositories import esquema_repo, ventas_repo
+from azdigital.services import ventas_service
+
+_PRODUCTOS = {
+    # id: (precio, stock, promo_tipo, promo_valor, fraccionable, upc, upd, mh, nombre)
+    1: (1.50, 100, None, 0, False, 12, 12, "59", "Jabón"),
+    2: (2.00, 100, None, 0, False, None, 12, "59", "Leche"),
+    3: (0.75, 50, None, 0, False, None, 12, "59", "Galleta"),
+    9: (1.00, 4, None, 0, False, None, 12, "59", "Llavero"),
+}
+_PRESENTACIONES = [
+    # producto_id, id, nombre, factor_umb, es_umb, orden
+    (1, 10, "Unidad", 1, True, 1),
+    (1, 11, "Fardo", 12, False, 2),
+]
+_PROMOS = [
+    # producto_id, tipo, valor, comprar, pagar, descuento_monto, regalo_id, min_compra, cant_regalo
+    (2, "REGALO", 0, 2, 1, None, 9, 2, 1),
+    (3, "PORCENTAJE", 10, 2, 1, None, None, 1, 1),
+]
+
+
+class _CursorFalso:
+    """Responde las consultas por lote del carrito y registra cada sentencia ejecutada."""
+
+    def __init__(self):
+        self.sentencias: list[str] = []
+        self.connection = MagicMock(name="conn")
+        self._filas: list[tuple] = []
+
+    def execute(self, sql, params=None):
+        self.sentencias.append(sql)
+        if "FROM producto_presentacion" in sql:
+            self._filas = [p for p in _PRESENTACIONES if p[0] in params[0]]
+        elif "FROM promociones" in sql:
+            self._filas = [p for p in _PROMOS if p[0] in params[0]]
+        elif "FROM productos" in sql:
+            self.bloqueados = list(params[0])
+            self._filas = [(i, *_PRODUCTOS[i]) for i in params[0] if i in _PRODUCTOS]
+        else:
+            self._filas = []
+
+    def fetchall(self):
+        return self._filas
+
+    def fetchone(self):
+        return self._filas[0] if self._filas else None
+
+
+def _carrito(lineas: int) -> list:
+    base = [
+        {"producto_id": 3, "cantidad": 2},
+        {"producto_id": 1, "cantidad": 1, "presentacion_id": 11},
+        {"producto_id": 2, "cantidad": 2},
+    ]
+    return [dict(base[i % len(base)]) for i in range(lineas)]
+
+
+class CrearVentaDesdeCarritoTests(unittest.TestCase):
+    def setUp(self):
+        registro = patch.object(
+            esquema_repo,
+            "_registro",
+            return_value={"producto_presentacion": frozenset({"id", "nombre", "factor_umb", "es_umb", "orden"})},
+        )
+        registro.start()
+        self.addCleanup(registro.stop)
+
+    def _vender(self, carrito):
+        cur = _CursorFalso()
+        total, lineas = ventas_service.crear_venta_desde_carrito(cur, carrito, 1, date(2026, 1, 15))
+        return cur, total, lineas
+
+    def test_consultas_no_crecen_con_las_lineas(self):
+        cur3, _, _ = self._vender(_carrito(3))
+        cur30, _, _ = self._vender(_carrito(30))
+        self.assertEqual(len(cur3.sentencias), len(cur30.sentencias))
+        self.assertEqual(sum("FOR UPDATE" in s for s in cur30.sentencias), 1)
+
+    def test_bloqueo_en_orden_de_id_incluye_regalos(self):
+        cur, _, _ = self._vender(_carrito(3))
+        self.assertEqual(cur.bloqueados, [1, 2, 3, 9])
+
+    def test_precios_presentacion_y_promociones(self):
+        _, total, lineas = self._vender(_carrito(3))
+        galleta, fardo, regalo, leche = lineas
+        self.assertAlmostEqual(galleta.subtotal, 1.35)
+        self.assertEqual((fardo.cantidad, fardo.presentacion_id), (12.0, 11))
+        self.assertAlmostEqual(fardo.subtotal, 18.0)
+        self.assertEqual(leche.producto_id, 2)
+        self.assertEqual((regalo.producto_id, regalo.cantidad, regalo.subtotal), (9, 1.0, 0.0))
+        self.assertEqual(regalo.descripcion, "Llavero")
+        self.assertAlmostEqual(total, 1.35 + 18.0 + 4.0)
+
+    def test_errores_se_mantienen(self):
+        with self.assertRaisesRegex(ValueError, "Producto no existe: 77"):
+            self._vender([{"producto_id": 77, "cantidad": 1}])
+        with self.assertRaisesRegex(ValueError, "Presentación inválida"):
+            self._vender([{"producto_id": 1, "cantidad": 1, "presentacion_id": 99}])
+        with self.assertRaisesRegex(ValueError, "Stock insuficiente"):
+            self._vender([{"producto_id": 3, "cantidad": 51}])
+
+
+class _CursorPersistencia:
+    """Registra sentencias (execute_values incluido) y simula stock por sucursal del producto 1."""
+
+    def __init__(self, stock_sucursal):
+        self.sentencias: list[str] = []
+        self.valores: list[list[tuple]] = []
+        self.connection = MagicMock(name="conn")
+        self.connection.encoding = "UTF8"
+        self._stock = stock_sucursal
+        self._filas: list[tuple] = []
+        self._pendientes: list[tuple] = []
+
+    def mogrify(self, template, args):
+        self._pendientes.append(tuple(args))
+        return b"(...)"
+
+    def execute(self, sql, params=None):
+        sql = sql.decode() if isinstance(sql, bytes) else sql
+        self.sentencias.append(sql)
+        self.valores.append(self._pendientes)
+        self._pendientes = []
+        if "FROM producto_stock_sucursal" in sql and "FOR UPDATE" in sql:
+            self._filas = [f for f in self._stock if f[0] in params[0]]
+        else:
+            self._filas = []
+
+    def fetchall(self):
+        return self._filas
+
+    def fetchone(self):
+        return self._filas[0] if self._filas else None
+
+    def valores_de(self, fragmento: str) -> list[tuple]:
+        out: list[tuple] = []
+        for sql, vals in zip(self.sentencias, self.valores):
+            if fragmento in sql:
+                out.extend(vals)
+        return out
+
+
+class PersistirVentaTests(unittest.TestCase):
+    def setUp(self):
+        registro = patch.object(
+            esquema_repo,
+            "_registro",
+            return_value={"inventario_kardex": frozenset({"id"}), "producto_stock_sucursal": frozenset({"id"})},
+        )
+        registro.start()
+        self.addCleanup(registro.stop)
+        for objetivo in (
+            patch.object(ventas_service, "calcular_retencion_iva", return_value=0.0),
+            patch.object(ventas_repo, "crear_venta", return_value=55),
+        ):
+            objetivo.start()
+            self.addCleanup(objetivo.stop)
+
+    def _persistir(self, lineas, stock=((1, 1, 3), (1, 2, 10))):
+        cur = _CursorPersistencia(list(stock))
+        ventas_service.persistir_venta(cur, 7, "Cliente", "EFECTIVO", 0.0, lineas, 1, 1)
+        return cur
+
+    def _lineas(self, n: int):
+        base = [
+            ventas_service.LineaVenta(1, 2.0, 1.0, 2.0, "2 u", None, "Jabón"),
+            ventas_service.LineaVenta(2, 5.0, 1.0, 5.0, None, 4, "Leche"),
+        ]
+        return [base[i % 2] for i in range(n)]
+
+    def test_sentencias_no_crecen_con_las_lineas(self):
+        cur2 = self._persistir(self._lineas(2))
+        cur6 = self._persistir(self._lineas(6), stock=((1, 1, 30),))
+        self.assertEqual(len(cur2.sentencias), len(cur6.sentencias))
+        self.assertEqual(len(cur6.valores_de("INSERT INTO venta_detalles")), 6)
+        self.assertEqual(len(cur6.valores_de("INSERT INTO inventario_kardex")), 6)
+
+    def test_reparte_por_sucursal_y_descuenta_resto_en_productos(self):
+        cur = self._persistir(self._lineas(4))
+        # Producto 1: 4 UMB, primero la sucursal del usuario (1) y luego la 2.
+        self.assertEqual(cur.valores_de("UPDATE producto_stock_sucursal"), [(1, 1, 3.0), (1, 2, 1.0)])
+        self.assertEqual(cur.valores_de("SET stock_actual = p.stock_actual - v.cantidad"), [(2, 10.0)])
+
+    def test_stock_insuficiente_por_sucursal(self):
+        with self.assertRaisesRegex(ValueError, "Stock insuficiente"):
+            self._persistir(self._lineas(4), stock=((1, 1, 1), (1, 2, 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
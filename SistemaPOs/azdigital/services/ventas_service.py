@@ -2,9 +2,8 @@
 from __future__ import annotations
 
 import math
-import uuid
 from dataclasses import dataclass
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
 from datetime import date
 
@@ -159,26 +158,47 @@ def _parse_item_carrito(p) -> dict:
     raise ValueError("Formato de carrito inválido")
 
 
+def _presentacion_por_id(filas: list[tuple], presentacion_id: int) -> tuple[Decimal, str] | None:
+    """Equivalente en memoria de presentaciones_repo.fila_por_id."""
+    for r in filas:
+        if int(r[0]) != presentacion_id:
+            continue
+        if r[2] is None:
+            return None
+        try:
+            return Decimal(str(r[2])), str(r[1] or "").strip() or "Presentación"
+        except (InvalidOperation, ValueError):
+            return None
+    return None
+
+
+def _presentacion_por_factor(filas: list[tuple], fac: Decimal) -> tuple[int, str] | None:
+    """Equivalente en memoria de presentaciones_repo.buscar_por_factor (menor id con ese factor)."""
+    mejor: tuple[int, str] | None = None
+    for r in filas:
+        try:
+            if r[2] is None or Decimal(str(r[2])) != fac:
+                continue
+        except (InvalidOperation, ValueError):
+            continue
+        if mejor is None or int(r[0]) < mejor[0]:
+            mejor = (int(r[0]), str(r[1] or "").strip() or "Presentación")
+    return mejor
+
+
 def _resolver_cantidad_presentacion(
-    cur,
     item: dict,
-    producto_id: int,
     unidad_venta: str,
     upc: int | None,
     upd: int,
+    filas: list[tuple],
 ) -> tuple[float, str | None, int | None]:
     """
     Convierte cantidad en presentación a UMB (stock/Kardex).
+    ``filas``: presentaciones del producto (presentaciones_repo.listar_por_productos).
     Retorna (cantidad_base, nombre para ticket, presentacion_id si aplica).
     """
     c_ui = float(item["cantidad_ui"])
-    if not presentaciones_repo.tabla_existe(cur):
-        return (
-            cantidad_base_desde_ui(c_ui, unidad_venta, upc, upd),
-            None,
-            None,
-        )
-    filas = presentaciones_repo.listar_por_producto(cur, producto_id)
     if not filas:
         return (
             cantidad_base_desde_ui(c_ui, unidad_venta, upc, upd),
@@ -188,7 +208,7 @@ def _resolver_cantidad_presentacion(
 
     pres_id = item.get("presentacion_id")
     if pres_id is not None and pres_id > 0:
-        fp = presentaciones_repo.fila_por_id(cur, int(pres_id), producto_id)
+        fp = _presentacion_por_id(filas, int(pres_id))
         if not fp:
             raise ValueError("Presentación inválida")
         fac, nombre = fp
@@ -200,7 +220,7 @@ def _resolver_cantidad_presentacion(
             fac_dec = Decimal(str(fac_raw))
         except Exception:
             raise ValueError("Factor de presentación inválido")
-        bp = presentaciones_repo.buscar_por_factor(cur, producto_id, fac_dec)
+        bp = _presentacion_por_factor(filas, fac_dec)
         if not bp:
             raise ValueError("El factor no coincide con las presentaciones del producto")
         pid, nombre = bp
@@ -211,7 +231,7 @@ def _resolver_cantidad_presentacion(
         for r in filas:
             if len(r) > 3 and r[3]:
                 return cantidad_base_desde_factor(c_ui, float(r[2])), str(r[1] or "").strip(), int(r[0])
-        bp = presentaciones_repo.buscar_por_factor(cur, producto_id, Decimal("1"))
+        bp = _presentacion_por_factor(filas, Decimal("1"))
         if bp:
             pid, nombre = bp
             return cantidad_base_desde_factor(c_ui, 1.0), nombre, pid
@@ -224,7 +244,7 @@ def _resolver_cantidad_presentacion(
         tf = Decimal(int(upc))
     else:
         tf = Decimal("1")
-    bp = presentaciones_repo.buscar_por_factor(cur, producto_id, tf) if tf is not None else None
+    bp = _presentacion_por_factor(filas, tf) if tf is not None else None
     if bp:
         pid, nombre = bp
         return cantidad_base_desde_factor(c_ui, float(tf)), nombre, pid
@@ -232,6 +252,28 @@ def _resolver_cantidad_presentacion(
     return cant, None, None
 
 
+def _promocion_de_fila(fila: tuple | None) -> dict:
+    """Parámetros de promoción (fila de map_promociones_activas_empresa) con los valores por defecto del POS."""
+    promo = {
+        "comprar": 2, "pagar": 1, "descuento_monto": None,
+        "regalo_id": None, "min_compra": 1, "cant_regalo": 1,
+    }
+    if not fila:
+        return promo
+    promo["tipo"] = fila[0]
+    promo["valor"] = float(fila[1] or 0)
+    if len(fila) > 2:
+        promo["comprar"] = float(fila[2] or 2)
+        promo["pagar"] = float(fila[3] or 1)
+        promo["descuento_monto"] = float(fila[4]) if fila[4] is not None else None
+        promo["regalo_id"] = int(fila[5]) if fila[5] else None
+        promo["min_compra"] = float(fila[6] or 1)
+        promo["cant_regalo"] = float(fila[7] or 1)
+        if promo["tipo"] == "DESCUENTO_CANTIDAD":
+            promo["comprar"] = promo["min_compra"]
+    return promo
+
+
 def crear_venta_desde_carrito(
     cur, carrito, empresa_id: int = 1, fecha_venta: date | None = None
 ) -> tuple[float, list[LineaVenta]]:
@@ -240,36 +282,45 @@ def crear_venta_desde_carrito(
 
     Por cada tipo de medida, `LineaVenta.cantidad` queda siempre en UMB; `persistir_venta` descuenta
     ese mismo valor de `productos` / `producto_stock_sucursal` y registra Kardex `SALIDA_VENTA`.
+
+    Productos, presentaciones y promociones se cargan en pocas consultas para todo el carrito
+    (los productos y regalos se bloquean juntos en orden de id, evitando interbloqueos entre cajas);
+    luego cada línea se calcula en memoria.
     """
-    total = 0.0
-    lineas: list[LineaVenta] = []
+    from azdigital.utils.db_savepoint import sql_opcional
     from azdigital.utils.fecha_sv import hoy_sv
 
+    total = 0.0
+    lineas: list[LineaVenta] = []
     fecha = fecha_venta or hoy_sv()
 
-    for p in carrito:
-        item = _parse_item_carrito(p)
+    items = [_parse_item_carrito(p) for p in carrito]
+    ids = sorted({it["producto_id"] for it in items})
+    presentaciones = presentaciones_repo.listar_por_productos(cur, ids) if ids else {}
+    promos = sql_opcional(
+        cur, lambda: promociones_repo.map_promociones_activas_empresa(cur, ids, empresa_id, fecha), {}
+    ) or {}
+    regalos = {int(f[5]) for f in promos.values() if len(f) > 5 and f[5]}
+    productos = productos_repo.bloquear_productos_para_venta(cur, sorted(set(ids) | regalos))
+
+    for item in items:
         producto_id = item["producto_id"]
         modo = item["modo"]
         unidad_venta = item["unidad_venta"]
 
-        prod = productos_repo.get_precio_y_stock_for_update(cur, producto_id)
+        prod = productos.get(producto_id)
         if not prod:
             raise ValueError(f"Producto no existe: {producto_id}")
-        nombre_producto = productos_repo.get_nombre_producto(cur, producto_id) or "Producto"
+        nombre_producto = prod[8] or "Producto"
         precio_unitario = float(prod[0])
         precio_carrito = item.get("precio_carrito")
         if precio_carrito is not None and precio_carrito >= 0:
             precio_unitario = float(precio_carrito)
         stock_actual = float(prod[1] if prod[1] is not None else 0)
-        promo_tipo = (prod[2] or "").strip() if len(prod) > 2 else None
-        promo_val = float(prod[3]) if len(prod) > 3 and prod[3] else 0
-        fraccionable = bool(prod[4]) if len(prod) > 4 else False
-        upc = int(prod[5]) if len(prod) > 5 and prod[5] is not None else None
-        upd = int(prod[6]) if len(prod) > 6 and prod[6] is not None else 12
-        mh_cod = normalizar_codigo_mh(str(prod[7]) if len(prod) > 7 else None)
-        promo_comprar, promo_pagar, promo_desc_monto = 2, 1, None
-        promo_regalo_id, promo_min_compra, promo_cant_regalo = None, 1, 1
+        fraccionable = bool(prod[4])
+        upc = int(prod[5]) if prod[5] is not None else None
+        upd = int(prod[6]) if prod[6] is not None else 12
+        mh_cod = normalizar_codigo_mh(str(prod[7]))
 
         texto_cant: str | None = None
         pres_lin: int | None = None
@@ -288,7 +339,7 @@ def crear_venta_desde_carrito(
             if c_ui <= 0:
                 raise ValueError("Cantidad inválida")
             cantidad, nombre_pres, pres_lin = _resolver_cantidad_presentacion(
-                cur, item, producto_id, unidad_venta, upc, upd
+                item, unidad_venta, upc, upd, presentaciones.get(producto_id, [])
             )
             texto_cant = texto_presentacion_cantidad(
                 c_ui,
@@ -307,38 +358,19 @@ def crear_venta_desde_carrito(
                 f"Si usó cantidad, recuerde que es en libras/unidad base, no en dólares."
             )
 
-        from azdigital.utils.db_savepoint import sql_opcional
+        # Sin promoción vigente se usan las columnas promocion_* del producto.
+        promo = _promocion_de_fila(promos.get(producto_id))
+        promo_tipo = promo.get("tipo", (prod[2] or "").strip())
+        promo_val = promo.get("valor", float(prod[3]) if prod[3] else 0)
 
-        def _cargar_promo():
-            nonlocal promo_tipo, promo_val, promo_comprar, promo_pagar, promo_desc_monto
-            nonlocal promo_regalo_id, promo_min_compra, promo_cant_regalo
-            promo_activa = promociones_repo.get_promocion_activa_producto(
-                cur, producto_id, empresa_id, fecha
-            )
-            if not promo_activa:
-                return
-            promo_tipo = promo_activa[0]
-            promo_val = float(promo_activa[1] or 0)
-            if len(promo_activa) > 2:
-                promo_comprar = float(promo_activa[2] or 2)
-                promo_pagar = float(promo_activa[3] or 1)
-                promo_desc_monto = float(promo_activa[4]) if promo_activa[4] is not None else None
-                promo_regalo_id = int(promo_activa[5]) if promo_activa[5] else None
-                promo_min_compra = float(promo_activa[6] or 1)
-                promo_cant_regalo = float(promo_activa[7] or 1)
-                if promo_tipo == "DESCUENTO_CANTIDAD":
-                    promo_comprar = promo_min_compra
-
-        sql_opcional(cur, _cargar_promo)
-
-        if promo_tipo == "REGALO" and promo_regalo_id and cantidad >= promo_min_compra:
-            grupos_regalo = int(cantidad // promo_min_compra)
-            cant_regalo = grupos_regalo * promo_cant_regalo
-            prod_regalo = productos_repo.get_precio_y_stock_for_update(cur, promo_regalo_id)
+        if promo_tipo == "REGALO" and promo["regalo_id"] and cantidad >= promo["min_compra"]:
+            grupos_regalo = int(cantidad // promo["min_compra"])
+            cant_regalo = grupos_regalo * promo["cant_regalo"]
+            prod_regalo = productos.get(promo["regalo_id"])
             if prod_regalo and float(prod_regalo[1] or 0) >= cant_regalo:
-                nom_reg = productos_repo.get_nombre_producto(cur, promo_regalo_id) or "Regalo"
+                nom_reg = prod_regalo[8] or "Regalo"
                 lineas.append(
-                    LineaVenta(promo_regalo_id, cant_regalo, 0.0, 0.0, None, None, nom_reg)
+                    LineaVenta(promo["regalo_id"], cant_regalo, 0.0, 0.0, None, None, nom_reg)
                 )
 
         if modo == "MONTO":
@@ -357,7 +389,7 @@ def crear_venta_desde_carrito(
         calc_tipo = None if promo_tipo == "REGALO" else promo_tipo
         subtotal, precio_efectivo = _calcular_subtotal_con_promo(
             precio_unitario, cantidad, calc_tipo, promo_val,
-            valor_comprar=promo_comprar, valor_pagar=promo_pagar, descuento_monto=promo_desc_monto,
+            valor_comprar=promo["comprar"], valor_pagar=promo["pagar"], descuento_monto=promo["descuento_monto"],
         )
         total += subtotal
         lineas.append(
@@ -498,43 +530,36 @@ def persistir_venta(
     if tc in ("FACTURA", "CREDITO_FISCAL") and emitir_contingencia and causa_contingencia is not None:
         ventas_repo.actualizar_causa_contingencia(cur, venta_id, causa_contingencia, empresa_id=empresa_id)
     suc = int(sucursal_id) if sucursal_id is not None and str(sucursal_id).strip().isdigit() else None
+    ventas_repo.crear_detalles(
+        cur,
+        venta_id,
+        [
+            (ln.producto_id, ln.cantidad, ln.precio_unitario, ln.subtotal, ln.texto_cantidad, ln.presentacion_id)
+            for ln in lineas
+        ],
+    )
+    cantidades: dict[int, float] = {}
     for ln in lineas:
-        ventas_repo.crear_detalle(
+        cantidades[ln.producto_id] = cantidades.get(ln.producto_id, 0.0) + float(ln.cantidad)
+    productos_repo.descontar_stock_lote(cur, cantidades, suc)
+    from azdigital.repositories import kardex_repo
+    from azdigital.utils.db_savepoint import sql_opcional
+
+    # SAVEPOINT: un fallo en kardex no debe abortar toda la transacción (dejaría la venta
+    # sin commit o commit inválido).
+    sql_opcional(
+        cur,
+        lambda: kardex_repo.insertar_kardex_lote(
             cur,
-            venta_id,
-            ln.producto_id,
-            ln.cantidad,
-            ln.precio_unitario,
-            ln.subtotal,
-            texto_cantidad=ln.texto_cantidad,
-            presentacion_id=ln.presentacion_id,
-        )
-        productos_repo.descontar_stock(cur, ln.producto_id, ln.cantidad, suc)
-        try:
-            from azdigital.repositories import kardex_repo
-
-            if kardex_repo.tabla_existe(cur, kardex_repo.TABLA_KARDEX):
-                # SAVEPOINT: un fallo en kardex no debe abortar toda la transacción (dejaría la venta
-                # sin commit o commit inválido; antes el except: pass ocultaba el estado abortado).
-                sp_k = "spkx" + uuid.uuid4().hex[:12]
-                cur.execute(f"SAVEPOINT {sp_k}")
-                try:
-                    kardex_repo.insertar_kardex(
-                        cur,
-                        empresa_id,
-                        ln.producto_id,
-                        "SALIDA_VENTA",
-                        ln.cantidad,
-                        suc,
-                        None,
-                        usuario_id,
-                        f"Cant. en UMB (inventario): {ln.cantidad:g}",
-                        referencia=f"Venta #{venta_id}",
-                    )
-                    cur.execute(f"RELEASE SAVEPOINT {sp_k}")
-                except Exception:
-                    cur.execute(f"ROLLBACK TO SAVEPOINT {sp_k}")
-        except Exception:
-            pass
+            empresa_id,
+            "SALIDA_VENTA",
+            [
+                (ln.producto_id, ln.cantidad, f"Cant. en UMB (inventario): {ln.cantidad:g}", f"Venta #{venta_id}")
+                for ln in lineas
+            ],
+            suc,
+            usuario_id,
+        ),
+    )
     return venta_id
 
@@ -0,0 +1,182 @@
+# Programador: Oscar Amaya Romero
+"""
+Índice en memoria (por proceso) de códigos de barras para /buscar_producto.
+
+Cada escaneo consultaba ``buscar_por_codigo`` y, si no había match, la búsqueda por código de
+presentación. Aquí se guarda, por alcance (empresa o catálogo global + sucursal):
+
+- ``codigo -> (producto_id, presentacion_id | None)``: se carga completo en una consulta la
+  primera vez que se escanea en ese alcance (LRU de AZ_CODIGOS_CACHE_ALCANCES alcances).
+- El JSON del producto para el POS sin existencia (LRU de AZ_CODIGOS_CACHE_PRODUCTOS). Se descarta
+  al cambiar el día, porque la promoción vigente depende de la fecha.
+- La existencia, con TTL corto AZ_CODIGOS_STOCK_TTL (por defecto 3 s; 0 = siempre en vivo).
+- Si la empresa de sesión tiene productos (chequeo de _pos_contexto_productos en cada escaneo).
+
+Índice y JSON caducan a los AZ_CODIGOS_CACHE_TTL segundos (por defecto 60). admin.py llama
+``invalidar()`` al guardar productos, presentaciones o promociones, y guardar_venta llama
+``invalidar_stock`` con lo vendido. Igual que sesion_snapshot, solo alcanza al worker que atendió
+el cambio; en los demás el TTL acota el desfase. Un código que no está en el índice se sigue
+buscando en la BD (producto recién creado en otro worker).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+_lock = threading.Lock()
+# (empresa_id | None, sucursal_id | None) -> (cargado_en, {codigo: (pid, pres)}, {CODIGO: (pid, pres)})
+_indices: OrderedDict[tuple, tuple[float, dict, dict]] = OrderedDict()
+# (alcance, producto_id) -> (cargado_en, fecha, json sin existencia)
+_productos: OrderedDict[tuple, tuple[float, Any, dict[str, Any]]] = OrderedDict()
+# (producto_id, sucursal_id) -> (expira, existencia)
+_stock: dict[tuple, tuple[float, float]] = {}
+# empresa_id -> cargado_en, solo empresas que sí tienen productos (ver _pos_contexto_productos)
+_empresas_con_productos: dict[int, float] = {}
+# Sube con cada invalidar(): una carga que empezó antes no se guarda (quedaría desactualizada).
+_generacion = 0
+
+
+def _env_float(nombre: str, defecto: float) -> float:
+    try:
+        return float((os.environ.get(nombre) or "").strip() or defecto)
+    except ValueError:
+        return defecto
+
+
+def _ttl() -> float:
+    return _env_float("AZ_CODIGOS_CACHE_TTL", 60)
+
+
+def _vigente(cargado_en: float) -> bool:
+    return time.monotonic() - cargado_en < _ttl()
+
+
+def _podar(tabla: OrderedDict, maximo: int) -> None:
+    while len(tabla) > max(1, maximo):
+        tabla.popitem(last=False)
+
+
+def _indice(cur, empresa_id: int | None, sucursal_id: int | None) -> tuple[dict, dict] | None:
+    from azdigital.repositories import productos_repo
+
+    if _ttl() <= 0:
+        return None
+    clave = (empresa_id, sucursal_id)
+    with _lock:
+        entrada = _indices.get(clave)
+        if entrada is not None and _vigente(entrada[0]):
+            _indices.move_to_end(clave)
+            return entrada[1], entrada[2]
+    with _lock:
+        generacion = _generacion
+    cargado_en = time.monotonic()
+    por_producto: dict[str, tuple[int, int | None]] = {}
+    por_presentacion: dict[str, tuple[int, int | None]] = {}
+    for codigo, pid, pres_id in productos_repo.listar_codigos_barra_pos(cur, empresa_id, sucursal_id):
+        destino = por_producto if pres_id is None else por_presentacion
+        destino.setdefault(codigo, (int(pid), int(pres_id) if pres_id is not None else None))
+    with _lock:
+        if generacion == _generacion:
+            _indices[clave] = (cargado_en, por_producto, por_presentacion)
+            _indices.move_to_end(clave)
+            _podar(_indices, int(_env_float("AZ_CODIGOS_CACHE_ALCANCES", 32)))
+    return por_producto, por_presentacion
+
+
+def resolver(cur, codigo: str, empresa_id: int | None, sucursal_id: int | None) -> tuple[int, int | None] | None:
+    """
+    (producto_id, presentacion_id) como buscar_por_codigo: primero código del producto, luego de
+    presentación (sin distinguir mayúsculas). None si no está en el índice (buscar en la BD).
+    """
+    c = (codigo or "").strip()
+    if not c:
+        return None
+    idx = _indice(cur, empresa_id, sucursal_id)
+    if idx is None:
+        return None
+    return idx[0].get(c) or idx[1].get(c.upper())
+
+
+def producto_json(alcance: tuple, producto_id: int, fecha) -> dict[str, Any] | None:
+    """Copia del JSON guardado (sin existencia) o None."""
+    clave = (alcance, int(producto_id))
+    with _lock:
+        entrada = _productos.get(clave)
+        if entrada is None or not _vigente(entrada[0]) or entrada[1] != fecha:
+            return None
+        _productos.move_to_end(clave)
+        return dict(entrada[2])
+
+
+def guardar_producto_json(alcance: tuple, producto_id: int, fecha, datos: dict[str, Any]) -> None:
+    if _ttl() <= 0:
+        return
+    clave = (alcance, int(producto_id))
+    sin_stock = {k: v for k, v in datos.items() if k not in ("existencia", "presentacion_escaneada_id")}
+    with _lock:
+        _productos[clave] = (time.monotonic(), fecha, sin_stock)
+        _productos.move_to_end(clave)
+        _podar(_productos, int(_env_float("AZ_CODIGOS_CACHE_PRODUCTOS", 5000)))
+
+
+def existencia(cur, producto_id: int, sucursal_id: int | None) -> float:
+    """Existencia POS del producto (productos_repo.existencia_pos) con TTL corto."""
+    from azdigital.repositories import productos_repo
+
+    clave = (int(producto_id), sucursal_id)
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _stock.get(clave)
+    if entrada is not None and entrada[0] > ahora:
+        return entrada[1]
+    valor = productos_repo.existencia_pos(cur, int(producto_id), sucursal_id)
+    ttl = _env_float("AZ_CODIGOS_STOCK_TTL", 3)
+    if ttl > 0:
+        with _lock:
+            if len(_stock) >= 4096:
+                _stock.clear()
+            _stock[clave] = (ahora + ttl, valor)
+    return valor
+
+
+def empresa_tiene_productos(cur, empresa_id: int) -> bool:
+    """
+    True si la empresa tiene algún producto. Solo se recuerda el True (la respuesta de casi todas
+    las cajas); una empresa sin productos se vuelve a consultar en cada escaneo.
+    """
+    eid = int(empresa_id)
+    with _lock:
+        cargado_en = _empresas_con_productos.get(eid)
+    if cargado_en is not None and _vigente(cargado_en):
+        return True
+    cur.execute("SELECT EXISTS (SELECT 1 FROM productos WHERE empresa_id = %s)", (eid,))
+    r = cur.fetchone()
+    tiene = bool(r and r[0])
+    if tiene and _ttl() > 0:
+        with _lock:
+            if len(_empresas_con_productos) >= 4096:
+                _empresas_con_productos.clear()
+            _empresas_con_productos[eid] = time.monotonic()
+    return tiene
+
+
+def invalidar_stock(producto_ids) -> None:
+    """Descarta la existencia cacheada de esos productos (todas las sucursales)."""
+    ids = {int(i) for i in producto_ids}
+    with _lock:
+        for clave in [k for k in _stock if k[0] in ids]:
+            del _stock[clave]
+
+
+def invalidar() -> None:
+    """Descarta índices, JSON y existencias (tras guardar productos/presentaciones/promociones)."""
+    global _generacion
+    with _lock:
+        _generacion += 1
+        _indices.clear()
+        _productos.clear()
+        _stock.clear()
+        _empresas_con_productos.clear()
@@ -0,0 +1,250 @@
+# Programador: Oscar Amaya Romero
+"""
+Pool de conexiones PostgreSQL por proceso y conexión única por petición Flask.
+
+- Cada worker de gunicorn crea su propio ThreadedConnectionPool al primer uso (nunca se
+  comparte tras un fork). Tamaño: AZ_DB_POOL_MIN / AZ_DB_POOL_MAX (por defecto 1 / 8, debe
+  cubrir los --threads del worker). AZ_DB_POOL_MAX=0 desactiva el pool (conexión nueva cada vez).
+- Dentro de una petición, ``obtener_conexion()`` devuelve siempre la misma conexión (guardada en
+  ``flask.g``): before_request, decoradores de rol, la ruta y ``ConexionDB`` comparten una sola
+  conexión en lugar de abrir varias. ``conn.close()`` no la cierra: si nadie más la está usando
+  revierte lo no confirmado, igual que cerraba la conexión antes. Al terminar la petición
+  (teardown) vuelve al pool. Si su transacción falló y alguien la sigue usando, las siguientes
+  llamadas reciben una conexión aparte en lugar de revertirla.
+- Lo que confirma o revierte por su cuenta (``ConexionDB.ejecutar_sql``, historial, provisión de
+  roles) usa ``conexion_aparte()`` para no tocar la transacción abierta de la ruta.
+- Fuera de una petición (scripts, hilos) cada llamada toma una conexión del pool y
+  ``close()`` la devuelve. Si el pool está agotado se abre una conexión extra que se cierra al liberar.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any, Callable
+
+import psycopg2
+from psycopg2 import extensions, pool as pg_pool
+
+from azdigital.utils.env_config import postgres_connection_kwargs
+
+logger = logging.getLogger(__name__)
+
+_pool: pg_pool.ThreadedConnectionPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+_G_CONN = "_az_db_conn"
+_G_USOS = "_az_db_usos"
+_G_HILO = "_az_db_hilo"
+
+
+def _entero_env(nombre: str, default: int) -> int:
+    try:
+        return int((os.environ.get(nombre) or "").strip() or default)
+    except ValueError:
+        return default
+
+
+def _abrir(config: dict[str, Any]):
+    conn = psycopg2.connect(**config)
+    # Refuerza client encoding por si el server ignora options.
+    try:
+        conn.set_client_encoding(os.environ.get("AZ_DB_CLIENT_ENCODING", "UTF8"))
+    except Exception:
+        pass
+    return conn
+
+
+class _PoolAZ(pg_pool.ThreadedConnectionPool):
+    """
+    Abre AZ_DB_POOL_MIN conexiones al crearse y el resto bajo demanda; conserva hasta maxconn
+    inactivas (el pool base cierra al devolver toda conexión que exceda minconn).
+    """
+
+    def __init__(self, minconn: int, maxconn: int, **kwargs):
+        super().__init__(minconn, maxconn, **kwargs)
+        self.minconn = maxconn
+
+    def _connect(self, key=None):
+        conn = _abrir(self._kwargs)
+        if key is not None:
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+        else:
+            self._pool.append(conn)
+        return conn
+
+
+def _obtener_pool() -> pg_pool.ThreadedConnectionPool | None:
+    global _pool, _pool_pid
+    maximo = _entero_env("AZ_DB_POOL_MAX", 8)
+    if maximo <= 0:
+        return None
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            # Tras fork el pool heredado pertenece al padre: no se cierra, solo se descarta.
+            minimo = min(max(0, _entero_env("AZ_DB_POOL_MIN", 1)), maximo)
+            _pool = _PoolAZ(minimo, maximo, **postgres_connection_kwargs())
+            _pool_pid = pid
+        return _pool
+
+
+def cerrar_pool() -> None:
+    """Cierra todas las conexiones del pool del proceso actual (tests / apagado)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _pool_pid = None
+
+
+def _tomar(config: dict[str, Any]):
+    """Conexión del pool (o nueva si no hay pool / está agotado / config distinta)."""
+    p = _obtener_pool()
+    if p is None or config != postgres_connection_kwargs():
+        return _abrir(config)
+    for _ in range(2):
+        try:
+            conn = p.getconn()
+        except pg_pool.PoolError:
+            return _abrir(config)
+        if not conn.closed:
+            return conn
+        p.putconn(conn, close=True)
+    return _abrir(config)
+
+
+def _devolver(conn) -> None:
+    p = _pool if _pool_pid == os.getpid() else None
+    if conn.closed:
+        if p is not None and id(conn) in p._rused:
+            p.putconn(conn, close=True)
+        return
+    try:
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        if conn.autocommit:
+            conn.autocommit = False
+    except Exception:
+        logger.warning("Conexión PostgreSQL descartada al devolverla al pool", exc_info=True)
+        if p is not None and id(conn) in p._rused:
+            p.putconn(conn, close=True)
+        else:
+            conn.close()
+        return
+    if p is not None and id(conn) in p._rused:
+        p.putconn(conn)
+    else:
+        conn.close()
+
+
+class ConexionPrestada:
+    """
+    Conexión psycopg2 entregada por ``obtener_conexion()``: se usa igual (cursor, commit,
+    rollback…) pero ``close()`` la libera en vez de cerrarla.
+    """
+
+    __slots__ = ("_conn", "_liberar", "_cerrada")
+
+    def __init__(self, conn, liberar: Callable[[Any], None]):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_liberar", liberar)
+        object.__setattr__(self, "_cerrada", False)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._conn, nombre, valor)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self) -> None:
+        if self._cerrada:
+            return
+        object.__setattr__(self, "_cerrada", True)
+        self._liberar(self._conn)
+
+    def __del__(self):
+        # Rutas que salen por excepción sin cerrar: libera igual al descartar el objeto.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _conexion_de_peticion(config: dict[str, Any]) -> ConexionPrestada | None:
+    try:
+        from flask import g, has_request_context
+    except ImportError:
+        return None
+    if not has_request_context():
+        return None
+    hilo = threading.get_ident()
+    conn = g.get(_G_CONN)
+    if conn is not None and g.get(_G_HILO) != hilo:
+        return None  # hilo secundario con el contexto copiado: conexión propia
+    if conn is None or conn.closed:
+        if conn is not None:
+            _devolver(conn)
+        conn = _tomar(config)
+        setattr(g, _G_CONN, conn)
+        setattr(g, _G_HILO, hilo)
+        setattr(g, _G_USOS, 0)
+    elif conn.info.transaction_status == extensions.TRANSACTION_STATUS_INERROR:
+        if g.get(_G_USOS, 0) > 0:
+            # Quien la tiene abierta debe recibir el error de su transacción, no perderla en
+            # silencio: esta llamada usa una conexión aparte.
+            logger.warning("Conexión de la petición con transacción fallida en uso; se entrega una aparte")
+            return None
+        conn.rollback()
+    setattr(g, _G_USOS, g.get(_G_USOS, 0) + 1)
+
+    def _soltar(c):
+        if not has_request_context() or g.get(_G_CONN) is not c:
+            return  # la petición ya terminó: el teardown la devolvió al pool
+        usos = max(0, g.get(_G_USOS, 1) - 1)
+        setattr(g, _G_USOS, usos)
+        if usos == 0 and not c.closed and c.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            c.rollback()
+
+    return ConexionPrestada(conn, _soltar)
+
+
+def obtener_conexion(config: dict[str, Any] | None = None) -> ConexionPrestada:
+    """Conexión de la petición actual (compartida) o, fuera de Flask, una del pool."""
+    config = config if config is not None else postgres_connection_kwargs()
+    compartida = _conexion_de_peticion(config)
+    if compartida is not None:
+        return compartida
+    return ConexionPrestada(_tomar(config), _devolver)
+
+
+def conexion_aparte(config: dict[str, Any] | None = None) -> ConexionPrestada:
+    """Conexión del pool que no es la de la petición (no ve su transacción abierta)."""
+    return ConexionPrestada(_tomar(config if config is not None else postgres_connection_kwargs()), _devolver)
+
+
+def liberar_conexion_peticion(exc: BaseException | None = None) -> None:
+    """teardown_appcontext: devuelve al pool la conexión de la petición."""
+    from flask import g
+
+    conn = g.pop(_G_CONN, None)
+    g.pop(_G_USOS, None)
+    g.pop(_G_HILO, None)
+    if conn is not None:
+        _devolver(conn)
+
+
+def init_app(app) -> None:
+    app.teardown_appcontext(liberar_conexion_peticion)
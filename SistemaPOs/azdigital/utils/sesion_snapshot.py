@@ -0,0 +1,115 @@
+# Programador: Oscar Amaya Romero
+"""
+Instantánea en memoria (por proceso) del rol/activo del usuario y la suscripción de la empresa.
+
+Los hooks before_request, ``rol_requerido`` y el context processor consultaban ``usuarios`` y
+``empresas`` en cada petición (incluidos AJAX como /buscar_producto o /favoritos). Aquí se guardan
+AZ_SESION_CACHE_TTL segundos (por defecto 30; 0 = sin caché).
+
+Invalidación: admin.py al editar/desactivar usuarios o empresas y agildte_role_sync al cambiar el
+rol llaman ``invalidar_usuario`` / ``invalidar_empresa``. Solo alcanza al worker que atendió el
+cambio; en los demás el TTL acota cuánto tarda en verse una revocación.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any
+
+_MAX_ENTRADAS = 4096
+
+_lock = threading.Lock()
+_usuarios: dict[int, tuple[float, str | None]] = {}
+_suscripciones: dict[int, tuple[float, dict[str, Any]]] = {}
+
+
+def _ttl() -> float:
+    try:
+        return float((os.environ.get("AZ_SESION_CACHE_TTL") or "").strip() or 30)
+    except ValueError:
+        return 30.0
+
+
+def _leer(tabla: dict, clave: int):
+    with _lock:
+        entrada = tabla.get(clave)
+    if entrada is None or entrada[0] < time.monotonic():
+        return None
+    return entrada
+
+
+def _guardar(tabla: dict, clave: int, valor) -> None:
+    ttl = _ttl()
+    if ttl <= 0:
+        return
+    ahora = time.monotonic()
+    with _lock:
+        if len(tabla) >= _MAX_ENTRADAS:
+            for k in [k for k, (expira, _) in tabla.items() if expira < ahora]:
+                del tabla[k]
+            if len(tabla) >= _MAX_ENTRADAS:
+                tabla.clear()
+        tabla[clave] = (ahora + ttl, valor)
+
+
+def _con_cursor(cur, fn):
+    if cur is not None:
+        return fn(cur)
+    from database import ConexionDB
+
+    conn = ConexionDB().conexion()
+    c = conn.cursor()
+    try:
+        return fn(c)
+    finally:
+        c.close()
+        conn.close()
+
+
+def rol_usuario(user_id, cur=None) -> str | None:
+    """Rol en mayúsculas del usuario activo; None si no existe, está inactivo o no tiene rol."""
+    uid = int(user_id)
+    entrada = _leer(_usuarios, uid)
+    if entrada is not None:
+        return entrada[1]
+
+    def _consultar(c):
+        c.execute("SELECT rol FROM usuarios WHERE id = %s AND activo = TRUE", (uid,))
+        r = c.fetchone()
+        return str(r[0]).strip().upper() if r and r[0] else None
+
+    rol = _con_cursor(cur, _consultar)
+    _guardar(_usuarios, uid, rol)
+    return rol
+
+
+def suscripcion_empresa(empresa_id, cur=None) -> dict[str, Any]:
+    """empresas_repo.get_suscripcion_detalle con caché (devuelve una copia)."""
+    from azdigital.repositories import empresas_repo
+
+    eid = int(empresa_id)
+    entrada = _leer(_suscripciones, eid)
+    if entrada is not None:
+        return dict(entrada[1])
+    detalle = _con_cursor(cur, lambda c: empresas_repo.get_suscripcion_detalle(c, eid))
+    _guardar(_suscripciones, eid, dict(detalle))
+    return detalle
+
+
+def invalidar_usuario(user_id=None) -> None:
+    """Descarta la instantánea de un usuario (o de todos si user_id es None)."""
+    with _lock:
+        if user_id is None:
+            _usuarios.clear()
+        else:
+            _usuarios.pop(int(user_id), None)
+
+
+def invalidar_empresa(empresa_id=None) -> None:
+    """Descarta la suscripción cacheada de una empresa (o de todas)."""
+    with _lock:
+        if empresa_id is None:
+            _suscripciones.clear()
+        else:
+            _suscripciones.pop(int(empresa_id), None)
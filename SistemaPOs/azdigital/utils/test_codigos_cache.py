@@ -0,0 +1,98 @@
+# Índice en memoria de códigos de barras del POS (repositorio simulado, sin PostgreSQL).
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.utils.test_codigos_cache -v
+from __future__ import annotations
+
+import os
+import unittest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from azdigital.repositories import productos_repo
+from azdigital.utils import codigos_cache
+
+_CODIGOS = [("7401", 1, None), ("7402", 2, None), ("SIXPACK-1", 1, 10)]
+
+
+class CodigosCacheTests(unittest.TestCase):
+    def setUp(self):
+        entorno = patch.dict(
+            os.environ,
+            {"AZ_CODIGOS_CACHE_TTL": "60", "AZ_CODIGOS_CACHE_ALCANCES": "2", "AZ_CODIGOS_STOCK_TTL": "3"},
+        )
+        entorno.start()
+        self.addCleanup(entorno.stop)
+        listar = patch.object(productos_repo, "listar_codigos_barra_pos", return_value=list(_CODIGOS))
+        self.listar = listar.start()
+        self.addCleanup(listar.stop)
+        existencia = patch.object(productos_repo, "existencia_pos", return_value=5.0)
+        self.existencia = existencia.start()
+        self.addCleanup(existencia.stop)
+        codigos_cache.invalidar()
+        self.addCleanup(codigos_cache.invalidar)
+        self.cur = MagicMock(name="cur")
+
+    def test_indice_se_carga_una_vez_por_alcance(self):
+        self.assertEqual(codigos_cache.resolver(self.cur, " 7401 ", 3, None), (1, None))
+        self.assertEqual(codigos_cache.resolver(self.cur, "sixpack-1", 3, None), (1, 10))
+        self.assertIsNone(codigos_cache.resolver(self.cur, "9999", 3, None))
+        self.assertEqual(self.listar.call_count, 1)
+        codigos_cache.resolver(self.cur, "7401", 3, 8)
+        self.assertEqual(self.listar.call_count, 2)
+
+    def test_codigo_de_producto_distingue_mayusculas(self):
+        self.listar.return_value = [("abc", 1, None), ("ABC", 2, 20)]
+        self.assertEqual(codigos_cache.resolver(self.cur, "abc", 3, None), (1, None))
+        self.assertEqual(codigos_cache.resolver(self.cur, "Abc", 3, None), (2, 20))
+
+    def test_lru_y_ttl(self):
+        for emp in (1, 2, 3):
+            codigos_cache.resolver(self.cur, "7401", emp, None)
+        codigos_cache.resolver(self.cur, "7401", 1, None)  # expulsada (máximo 2 alcances)
+        self.assertEqual(self.listar.call_count, 4)
+        with patch.object(codigos_cache.time, "monotonic", return_value=10**9):
+            codigos_cache.resolver(self.cur, "7401", 1, None)
+        self.assertEqual(self.listar.call_count, 5)
+
+    def test_json_sin_existencia_y_por_dia(self):
+        hoy = date(2026, 3, 10)
+        datos = {"id": 1, "precio": 1.5, "existencia": 9.0, "presentacion_escaneada_id": 10}
+        codigos_cache.guardar_producto_json((3, None), 1, hoy, datos)
+        self.assertEqual(codigos_cache.producto_json((3, None), 1, hoy), {"id": 1, "precio": 1.5})
+        self.assertIsNone(codigos_cache.producto_json((3, None), 1, date(2026, 3, 11)))
+        self.assertIsNone(codigos_cache.producto_json((3, 8), 1, hoy))
+
+    def test_existencia_con_ttl_corto_e_invalidacion_por_venta(self):
+        for _ in range(3):
+            self.assertEqual(codigos_cache.existencia(self.cur, 1, None), 5.0)
+        self.assertEqual(self.existencia.call_count, 1)
+        self.existencia.return_value = 4.0
+        codigos_cache.invalidar_stock([1])
+        self.assertEqual(codigos_cache.existencia(self.cur, 1, None), 4.0)
+        with patch.dict(os.environ, {"AZ_CODIGOS_STOCK_TTL": "0"}):
+            codigos_cache.invalidar_stock([1])
+            codigos_cache.existencia(self.cur, 1, None)
+            codigos_cache.existencia(self.cur, 1, None)
+        self.assertEqual(self.existencia.call_count, 4)
+
+    def test_invalidar_descarta_indice_cargado_en_paralelo(self):
+        def _listar(*_a):
+            codigos_cache.invalidar()  # admin guarda un producto mientras se carga el índice
+            return list(_CODIGOS)
+
+        self.listar.side_effect = _listar
+        codigos_cache.resolver(self.cur, "7401", 3, None)
+        self.listar.side_effect = None
+        codigos_cache.resolver(self.cur, "7401", 3, None)
+        self.assertEqual(self.listar.call_count, 2)
+
+    def test_empresa_con_productos_solo_recuerda_true(self):
+        self.cur.fetchone.return_value = (False,)
+        self.assertFalse(codigos_cache.empresa_tiene_productos(self.cur, 3))
+        self.cur.fetchone.return_value = (True,)
+        for _ in range(3):
+            self.assertTrue(codigos_cache.empresa_tiene_productos(self.cur, 3))
+        self.assertEqual(self.cur.execute.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# Pool de conexiones PostgreSQL y conexión compartida por petición (sin servidor: conexiones simuladas).
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.utils.test_db_pool -v
+from __future__ import annotations
+
+import importlib.util
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from psycopg2 import extensions
+
+from azdigital.utils import db_pool
+
+_FLASK_AVAILABLE = importlib.util.find_spec("flask") is not None
+
+
+def _conexion_falsa():
+    conn = MagicMock(name="conn")
+    conn.closed = 0
+    conn.autocommit = False
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class _Base(unittest.TestCase):
+    def setUp(self):
+        entorno = patch.dict(os.environ, {"AZ_DB_POOL_MIN": "0", "AZ_DB_POOL_MAX": "2"})
+        entorno.start()
+        self.addCleanup(entorno.stop)
+        self.abrir = patch.object(db_pool, "_abrir", side_effect=lambda cfg: _conexion_falsa())
+        self.abrir_mock = self.abrir.start()
+        self.addCleanup(self.abrir.stop)
+        db_pool.cerrar_pool()
+        self.addCleanup(db_pool.cerrar_pool)
+
+
+class PoolFueraDePeticionTests(_Base):
+    def test_close_devuelve_al_pool(self):
+        c1 = db_pool.obtener_conexion()
+        raw = c1._conn
+        c1.close()
+        c2 = db_pool.obtener_conexion()
+        self.assertIs(c2._conn, raw)
+        c2.close()
+        self.assertEqual(self.abrir_mock.call_count, 1)
+        raw.close.assert_not_called()
+
+    def test_pool_agotado_abre_conexion_extra(self):
+        prestadas = [db_pool.obtener_conexion() for _ in range(3)]
+        self.assertEqual(self.abrir_mock.call_count, 3)
+        extra = prestadas[2]._conn
+        for c in prestadas:
+            c.close()
+        extra.close.assert_called_once()
+
+    def test_transaccion_abierta_se_revierte_al_devolver(self):
+        c = db_pool.obtener_conexion()
+        c._conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        c.close()
+        c._conn.rollback.assert_called()
+
+
+@unittest.skipUnless(_FLASK_AVAILABLE, "Requiere flask instalado (entorno SistemaPOs)")
+class ConexionPorPeticionTests(_Base):
+    def setUp(self):
+        super().setUp()
+        from flask import Flask
+
+        self.app = Flask(__name__)
+        db_pool.init_app(self.app)
+
+    def test_una_conexion_por_peticion_y_reutilizada_entre_peticiones(self):
+        with self.app.test_request_context():
+            a = db_pool.obtener_conexion()
+            b = db_pool.obtener_conexion()
+            self.assertIs(a._conn, b._conn)
+            a.close()
+            b.close()
+            c = db_pool.obtener_conexion()
+            self.assertIs(c._conn, a._conn)
+            raw = a._conn
+        with self.app.test_request_context():
+            self.assertIs(db_pool.obtener_conexion()._conn, raw)
+        self.assertEqual(self.abrir_mock.call_count, 1)
+        raw.close.assert_not_called()
+
+    def test_close_interno_no_revierte_transaccion_del_externo(self):
+        with self.app.test_request_context():
+            externa = db_pool.obtener_conexion()
+            raw = externa._conn
+            raw.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+            interna = db_pool.obtener_conexion()
+            interna.close()
+            raw.rollback.assert_not_called()
+            externa.close()
+            raw.rollback.assert_called_once()
+
+    def test_transaccion_fallida_en_uso_no_se_revierte(self):
+        with self.app.test_request_context():
+            ruta = db_pool.obtener_conexion()
+            raw = ruta._conn
+            raw.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+            with self.assertLogs(db_pool.logger, "WARNING"):
+                otra = db_pool.obtener_conexion()
+            self.assertIsNot(otra._conn, raw)
+            otra.close()
+            raw.rollback.assert_not_called()
+            ruta.close()
+
+    def test_ejecutar_sql_fallido_no_pierde_la_escritura_de_la_ruta(self):
+        from database import ConexionDB
+
+        with self.app.test_request_context():
+            ruta = db_pool.obtener_conexion()
+            raw = ruta._conn
+            ruta.cursor().execute("UPDATE productos SET stock = 1 WHERE id = 1")
+            raw.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+            falla = _conexion_falsa()
+            falla.cursor.return_value.execute.side_effect = RuntimeError("tabla inexistente")
+            self.abrir_mock.side_effect = lambda cfg: falla
+            with patch("builtins.print"):
+                self.assertIsNone(ConexionDB().ejecutar_sql("INSERT INTO historial VALUES (1)"))
+            falla.rollback.assert_called_once()
+            raw.rollback.assert_not_called()
+            raw.commit.assert_not_called()
+            ruta.commit()
+            raw.commit.assert_called_once()
+            ruta.close()
+
+    def test_teardown_libera_aunque_la_ruta_no_cierre(self):
+        with self.app.test_request_context():
+            raw = db_pool.obtener_conexion()._conn
+            raw.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+        raw.rollback.assert_called()
+        self.assertEqual(len(db_pool._pool._used), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
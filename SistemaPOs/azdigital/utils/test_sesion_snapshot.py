@@ -0,0 +1,69 @@
+# Instantánea de rol / suscripción por usuario y empresa (cursor simulado, sin PostgreSQL).
+# Ejecutar: cd SistemaPOs && python -m unittest azdigital.utils.test_sesion_snapshot -v
+from __future__ import annotations
+
+import os
+import unittest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from azdigital.utils import sesion_snapshot
+
+
+def _cursor(fila):
+    cur = MagicMock(name="cur")
+    cur.fetchone.return_value = fila
+    return cur
+
+
+class SesionSnapshotTests(unittest.TestCase):
+    def setUp(self):
+        entorno = patch.dict(os.environ, {"AZ_SESION_CACHE_TTL": "30"})
+        entorno.start()
+        self.addCleanup(entorno.stop)
+        sesion_snapshot.invalidar_usuario()
+        sesion_snapshot.invalidar_empresa()
+        self.addCleanup(sesion_snapshot.invalidar_usuario)
+        self.addCleanup(sesion_snapshot.invalidar_empresa)
+
+    def test_rol_se_consulta_una_vez_hasta_invalidar(self):
+        cur = _cursor(("cajero",))
+        for _ in range(3):
+            self.assertEqual(sesion_snapshot.rol_usuario(7, cur), "CAJERO")
+        self.assertEqual(cur.execute.call_count, 1)
+
+        cur.fetchone.return_value = None  # desactivado por un admin
+        sesion_snapshot.invalidar_usuario(7)
+        self.assertIsNone(sesion_snapshot.rol_usuario(7, cur))
+        self.assertIsNone(sesion_snapshot.rol_usuario(7, cur))
+        self.assertEqual(cur.execute.call_count, 2)
+
+    def test_ttl_vencido_vuelve_a_consultar(self):
+        cur = _cursor(("GERENTE",))
+        with patch.object(sesion_snapshot.time, "monotonic", return_value=1000.0):
+            sesion_snapshot.rol_usuario(3, cur)
+        with patch.object(sesion_snapshot.time, "monotonic", return_value=1031.0):
+            sesion_snapshot.rol_usuario(3, cur)
+        self.assertEqual(cur.execute.call_count, 2)
+
+    def test_suscripcion_cacheada_por_empresa(self):
+        cur = _cursor((True, date(2099, 1, 1)))
+        primero = sesion_snapshot.suscripcion_empresa(1, cur)
+        primero["vigente"] = False  # el llamador no altera la caché
+        self.assertTrue(sesion_snapshot.suscripcion_empresa(1, cur)["vigente"])
+        self.assertEqual(cur.execute.call_count, 1)
+        sesion_snapshot.suscripcion_empresa(2, cur)
+        sesion_snapshot.invalidar_empresa(1)
+        sesion_snapshot.suscripcion_empresa(1, cur)
+        self.assertEqual(cur.execute.call_count, 3)
+
+    def test_ttl_cero_desactiva_cache(self):
+        cur = _cursor(("ADMIN",))
+        with patch.dict(os.environ, {"AZ_SESION_CACHE_TTL": "0"}):
+            sesion_snapshot.rol_usuario(5, cur)
+            sesion_snapshot.rol_usuario(5, cur)
+        self.assertEqual(cur.execute.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ import os
 
 import psycopg2
 
+from azdigital.utils.db_pool import conexion_aparte, obtener_conexion
 from azdigital.utils.env_config import postgres_connection_kwargs
 
 
@@ -11,15 +12,18 @@ class ConexionDB:
         # DATABASE_URL (PaaS) o AZ_DB_*; ver azdigital/utils/env_config.py
         self.config = postgres_connection_kwargs()
 
+    def conexion(self):
+        """
+        Conexión del pool (la misma durante toda la petición Flask; ver azdigital/utils/db_pool.py).
+        Se usa como la de psycopg2.connect; close() la devuelve en lugar de cerrarla.
+        """
+        return obtener_conexion(self.config)
+
     def ejecutar_sql(self, query, params=None, es_select=False):
+        # Conexión propia: su commit/rollback no debe tocar la transacción abierta de la ruta.
         conn = None
         try:
-            conn = psycopg2.connect(**self.config)
-            # Refuerza client encoding por si el server ignora options.
-            try:
-                conn.set_client_encoding(os.environ.get("AZ_DB_CLIENT_ENCODING", "UTF8"))
-            except Exception:
-                pass
+            conn = conexion_aparte(self.config)
             cur = conn.cursor()
             cur.execute(query, params)
             
@@ -0,0 +1,26 @@
+# Programador: Oscar Amaya Romero
+"""Extensiones pg_trgm/unaccent e índices de búsqueda de productos (nombre y código de barras)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
+if os.path.exists(env_path):
+    with open(env_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                k, v = line.split("=", 1)
+                k, v = k.strip(), v.strip().strip('"').strip("'")
+                if k and k not in os.environ:
+                    os.environ[k] = v
+
+from database import ConexionDB
+
+db = ConexionDB()
+sql_path = os.path.join(os.path.dirname(__file__), "sql", "schema_busqueda_productos.sql")
+with open(sql_path, "r", encoding="utf-8") as f:
+    # Un solo execute: el archivo define una función con cuerpo $$ ... $$.
+    db.ejecutar_sql(f.read())
+print("OK: índices de búsqueda de productos (requiere permiso para CREATE EXTENSION).")
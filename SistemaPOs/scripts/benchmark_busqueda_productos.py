@@ -0,0 +1,134 @@
+# Programador: Oscar Amaya Romero
+"""
+Benchmark de búsqueda de productos (nombre y código de barras) con y sin índices.
+
+Crea una tabla TEMPORAL ``productos`` (oculta a public.productos solo en esta sesión) con N
+productos sintéticos, mide buscar_por_nombre / buscar_por_codigo y el LIKE anterior, crea los
+mismos índices que scripts/sql/schema_busqueda_productos.sql y vuelve a medir. Todo se revierte
+al final: no modifica datos.
+
+Uso: python scripts/benchmark_busqueda_productos.py [--productos 50000] [--repeticiones 20]
+Requiere AZ_DB_* / DATABASE_URL y haber aplicado scripts/alter_busqueda_productos.py.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+env_path = os.path.join(ROOT, ".env")
+if os.path.exists(env_path):
+    with open(env_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                k, v = line.split("=", 1)
+                k, v = k.strip(), v.strip().strip('"').strip("'")
+                if k and k not in os.environ:
+                    os.environ[k] = v
+
+_MARCAS = ["Dos Pinos", "Salud", "Foremost", "Nestlé", "Diana", "Kern's", "Sello de Oro", "Lido", "Pozuelo", "Ariel"]
+_PRODUCTOS = [
+    "Leche entera", "Leche deslactosada", "Café molido", "Azúcar morena", "Jabón de baño", "Galleta María",
+    "Arroz precocido", "Frijol rojo", "Aceite vegetal", "Atún en agua", "Consomé de pollo", "Jugo de naranja",
+    "Pan dulce", "Crema ácida", "Queso duro", "Detergente en polvo", "Papel higiénico", "Pasta dental",
+    "Champú anticaspa", "Salsa de tomate",
+]
+_TAMANOS = ["250 g", "500 g", "1 kg", "5 lb", "1 L", "2 L", "12 oz", "6 unid", "24 sobres", "400 ml"]
+_BUSQUEDAS = ["LECHE", "cafe", "jabon", "ARROZ PRE", "galleta mar", "champu", "ZZZ", "sal"]
+
+
+def _medir(fn, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def _poblar(cur, n: int, empresa_id: int) -> list[str]:
+    from psycopg2.extras import execute_values
+
+    cur.execute("CREATE TEMP TABLE productos (LIKE public.productos INCLUDING DEFAULTS)")
+    rnd = random.Random(2026)
+    filas = []
+    codigos = []
+    for i in range(1, n + 1):
+        nombre = f"{rnd.choice(_PRODUCTOS)} {rnd.choice(_MARCAS)} {rnd.choice(_TAMANOS)}"
+        codigo = f"74{i:011d}"
+        codigos.append(codigo)
+        filas.append((i, empresa_id, nombre, codigo, round(rnd.uniform(0.25, 25), 2), rnd.randint(0, 200)))
+    execute_values(
+        cur,
+        "INSERT INTO productos (id, empresa_id, nombre, codigo_barra, precio_unitario, stock_actual) VALUES %s",
+        filas,
+        page_size=5000,
+    )
+    cur.execute("ANALYZE productos")
+    return codigos
+
+
+def main() -> None:
+    from azdigital.repositories import productos_repo
+    from database import ConexionDB
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--productos", type=int, default=50000)
+    ap.add_argument("--repeticiones", type=int, default=20)
+    ap.add_argument("--empresa", type=int, default=1)
+    args = ap.parse_args()
+
+    conn = ConexionDB().conexion()
+    cur = conn.cursor()
+    try:
+        if not productos_repo.busqueda_indexada_disponible(cur):
+            print("ERROR: falta az_normalizar(); ejecute python scripts/alter_busqueda_productos.py")
+            sys.exit(1)
+        codigos = _poblar(cur, args.productos, args.empresa)
+        rnd = random.Random(7)
+        muestra = [rnd.choice(codigos) for _ in range(len(_BUSQUEDAS))]
+        emp = args.empresa
+        rep = args.repeticiones
+
+        def _like_anterior(q):
+            cur.execute(
+                "SELECT id FROM productos WHERE UPPER(nombre) LIKE %s AND empresa_id = %s LIMIT 10",
+                (f"%{q.upper()}%", emp),
+            )
+            return cur.fetchall()
+
+        casos = [
+            ("nombre (LIKE anterior)", lambda: [_like_anterior(q) for q in _BUSQUEDAS]),
+            ("nombre (buscar_por_nombre)", lambda: [productos_repo.buscar_por_nombre(cur, q, 10, emp) for q in _BUSQUEDAS]),
+            ("código (buscar_por_codigo)", lambda: [productos_repo.buscar_por_codigo(cur, c, emp) for c in muestra]),
+        ]
+        resultados: dict[str, list[float]] = {}
+        for etapa in ("sin índices", "con índices"):
+            if etapa == "con índices":
+                cur.execute("CREATE INDEX ON productos USING gin (az_normalizar(nombre) gin_trgm_ops)")
+                cur.execute("CREATE INDEX ON productos (TRIM(codigo_barra), empresa_id)")
+                cur.execute("ANALYZE productos")
+            for nombre, fn in casos:
+                por_consulta = _medir(fn, rep) / len(_BUSQUEDAS)
+                resultados.setdefault(nombre, []).append(por_consulta)
+
+        print(f"{args.productos} productos, mediana de {rep} rondas, ms por consulta")
+        print(f"{'caso':32} {'sin índices':>12} {'con índices':>12}")
+        for nombre, (antes, despues) in resultados.items():
+            print(f"{nombre:32} {antes:12.2f} {despues:12.2f}")
+        print("Ejemplo 'jabon':", [r[1] for r in productos_repo.buscar_por_nombre(cur, "jabon", 3, emp)])
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -36,19 +36,32 @@ def _load_dotenv():
 _load_dotenv()
 
 
-def _run_sql_script(conn, sql_text: str) -> None:
-    """Ejecuta sentencias separadas por ';' (sin punto y coma dentro de funciones)."""
+def _sentencias_sql(sql_text: str) -> list[str]:
+    """Separa por ';' fuera de cuerpos $$ ... $$ (funciones plpgsql)."""
     lines = []
     for line in sql_text.splitlines():
         if line.strip().startswith("--"):
             continue
         lines.append(line)
-    buf = "\n".join(lines)
-    cur = conn.cursor()
-    for part in buf.split(";"):
-        st = part.strip()
-        if not st:
+    out: list[str] = []
+    actual = ""
+    for i, bloque in enumerate("\n".join(lines).split("$$")):
+        if i % 2:
+            actual += "$$" + bloque + "$$"
             continue
+        partes = bloque.split(";")
+        actual += partes[0]
+        for p in partes[1:]:
+            out.append(actual)
+            actual = p
+    out.append(actual)
+    return [st.strip() for st in out if st.strip()]
+
+
+def _run_sql_script(conn, sql_text: str) -> None:
+    """Ejecuta sentencias separadas por ';' (respeta funciones con cuerpo $$)."""
+    cur = conn.cursor()
+    for st in _sentencias_sql(sql_text):
         cur.execute(st)
     cur.close()
 
@@ -63,6 +76,9 @@ SQL_SCRIPTS = (
     "sql/schema_ventas_ambiente_emision.sql",
     "sql/schema_historial_usuarios.sql",
     "sql/schema_productos_baja_logica.sql",
+    "sql/schema_catalogo_sync.sql",
+    "sql/schema_busqueda_productos.sql",
+    "sql/schema_agildte_outbox.sql",
 )
 
 
@@ -0,0 +1,24 @@
+-- Bandeja de salida (outbox) de ventas hacia AgilDTE.
+-- guardar_venta inserta la fila en la misma transacción que la venta; un despachador en segundo
+-- plano la entrega (POST /api/pos/procesar-venta/) con reintentos. clave_idempotencia viaja en la
+-- cabecera Idempotency-Key: un reintento tras un timeout no crea otra venta en AgilDTE.
+-- estado: PENDIENTE -> ENVIANDO (arrendada hasta bloqueado_hasta) -> ENVIADO | FALLIDO.
+CREATE TABLE IF NOT EXISTS agildte_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    venta_id INTEGER NOT NULL UNIQUE REFERENCES ventas(id) ON DELETE CASCADE,
+    empresa_id INTEGER,
+    clave_idempotencia VARCHAR(64) NOT NULL UNIQUE,
+    datos JSONB NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'PENDIENTE',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    proximo_intento TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    bloqueado_hasta TIMESTAMP,
+    ultimo_error TEXT,
+    resultado JSONB,
+    creado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    actualizado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_agildte_outbox_pendientes
+    ON agildte_outbox(proximo_intento)
+    WHERE estado IN ('PENDIENTE', 'ENVIANDO');
@@ -0,0 +1,21 @@
+-- Búsqueda indexada de productos en POS/inventario.
+-- Nombre: índice trigram (pg_trgm) sobre az_normalizar(nombre) = mayúsculas sin tildes; sirve a
+-- LIKE '%texto%' y a similarity() para ordenar. Código de barras: índices de expresión con el
+-- mismo TRIM()/UPPER(TRIM()) que usan buscar_por_codigo y la búsqueda por presentación.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() es STABLE; este envoltorio con diccionario explícito es IMMUTABLE (usable en índices).
+CREATE OR REPLACE FUNCTION az_normalizar(texto TEXT) RETURNS TEXT AS $$
+    SELECT upper(public.unaccent('public.unaccent'::regdictionary, COALESCE(texto, '')))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX IF NOT EXISTS idx_productos_nombre_trgm
+    ON productos USING gin (az_normalizar(nombre) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_productos_codigo_barra_trim
+    ON productos (TRIM(codigo_barra), empresa_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_producto_presentacion_codigo_barra
+    ON producto_presentacion (upper(trim(codigo_barra)))
+    WHERE codigo_barra IS NOT NULL AND length(trim(codigo_barra)) > 0;
@@ -0,0 +1,74 @@
+-- Sincronización incremental (delta) del catálogo POS offline.
+-- Cada fila guarda el txid de la transacción que la modificó (cambio_txid) y la hora (actualizado_en).
+-- Cambios en presentaciones, stock por sucursal, promociones y sus productos marcan también el producto
+-- afectado: GET /productos_pos_delta solo consulta productos.cambio_txid.
+-- Se usa txid (no una secuencia) para no perder filas de transacciones aún abiertas: el token del
+-- cliente es el xmin del snapshot, todo lo confirmado después tiene txid >= ese valor.
+ALTER TABLE productos ADD COLUMN IF NOT EXISTS cambio_txid BIGINT;
+ALTER TABLE productos ADD COLUMN IF NOT EXISTS actualizado_en TIMESTAMP;
+ALTER TABLE producto_presentacion ADD COLUMN IF NOT EXISTS cambio_txid BIGINT;
+ALTER TABLE producto_presentacion ADD COLUMN IF NOT EXISTS actualizado_en TIMESTAMP;
+ALTER TABLE promociones ADD COLUMN IF NOT EXISTS cambio_txid BIGINT;
+ALTER TABLE promociones ADD COLUMN IF NOT EXISTS actualizado_en TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_productos_empresa_cambio ON productos(empresa_id, cambio_txid);
+
+CREATE OR REPLACE FUNCTION catalogo_marcar_cambio() RETURNS trigger AS $$
+BEGIN
+    NEW.cambio_txid := txid_current();
+    NEW.actualizado_en := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION catalogo_marcar_producto() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE productos SET cambio_txid = txid_current()
+        WHERE id = OLD.producto_id AND cambio_txid IS DISTINCT FROM txid_current();
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        UPDATE productos SET cambio_txid = txid_current()
+        WHERE id = NEW.producto_id AND cambio_txid IS DISTINCT FROM txid_current();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION catalogo_marcar_productos_promocion() RETURNS trigger AS $$
+BEGIN
+    UPDATE productos p SET cambio_txid = txid_current()
+    FROM promocion_productos pp
+    WHERE pp.promocion_id = NEW.id AND p.id = pp.producto_id
+      AND p.cambio_txid IS DISTINCT FROM txid_current();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_productos_cambio ON productos;
+CREATE TRIGGER trg_productos_cambio BEFORE INSERT OR UPDATE ON productos
+    FOR EACH ROW EXECUTE FUNCTION catalogo_marcar_cambio();
+
+DROP TRIGGER IF EXISTS trg_presentacion_cambio ON producto_presentacion;
+CREATE TRIGGER trg_presentacion_cambio BEFORE INSERT OR UPDATE ON producto_presentacion
+    FOR EACH ROW EXECUTE FUNCTION catalogo_marcar_cambio();
+
+DROP TRIGGER IF EXISTS trg_presentacion_producto ON producto_presentacion;
+CREATE TRIGGER trg_presentacion_producto AFTER INSERT OR UPDATE OR DELETE ON producto_presentacion
+    FOR EACH ROW EXECUTE FUNCTION catalogo_marcar_producto();
+
+DROP TRIGGER IF EXISTS trg_stock_sucursal_producto ON producto_stock_sucursal;
+CREATE TRIGGER trg_stock_sucursal_producto AFTER INSERT OR UPDATE OR DELETE ON producto_stock_sucursal
+    FOR EACH ROW EXECUTE FUNCTION catalogo_marcar_producto();
+
+DROP TRIGGER IF EXISTS trg_promociones_cambio ON promociones;
+CREATE TRIGGER trg_promociones_cambio BEFORE INSERT OR UPDATE ON promociones
+    FOR EACH ROW EXECUTE FUNCTION catalogo_marcar_cambio();
+
+DROP TRIGGER IF EXISTS trg_promociones_productos ON promociones;
+CREATE TRIGGER trg_promociones_productos AFTER UPDATE ON promociones
+    FOR EACH ROW EXECUTE FUNCTION catalogo_marcar_productos_promocion();
+
+DROP TRIGGER IF EXISTS trg_promocion_productos_producto ON promocion_productos;
+CREATE TRIGGER trg_promocion_productos_producto AFTER INSERT OR UPDATE OR DELETE ON promocion_productos
+    FOR EACH ROW EXECUTE FUNCTION catalogo_marcar_producto();
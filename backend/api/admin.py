@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Cliente, Compra, Venta, Empresa, Producto, DetalleVenta, Liquidacion, RetencionRecibida, PerfilUsuario, Correlativo, ActividadEconomica, TareaFacturacion
+from .models import Cliente, Compra, Venta, Empresa, Producto, DetalleVenta, Liquidacion, RetencionRecibida, PerfilUsuario, Correlativo, ActividadEconomica, TareaFacturacion, ReservaCorrelativo
 
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
@@ -277,6 +277,14 @@ class CorrelativoAdmin(admin.ModelAdmin):
         }),
     )
 
+@admin.register(ReservaCorrelativo)
+class ReservaCorrelativoAdmin(admin.ModelAdmin):
+    list_display = ('empresa', 'tipo_dte', 'anio', 'desde', 'hasta', 'estado', 'devueltos', 'motivo', 'creada_at')
+    list_filter = ('estado', 'tipo_dte', 'anio')
+    search_fields = ('empresa__nombre', 'motivo')
+    readonly_fields = [f.name for f in ReservaCorrelativo._meta.fields]
+    ordering = ('-creada_at',)
+
 # --- PERFIL DE USUARIO ---
 # Solo gestiona la vinculación usuario ↔ empresa.
 # El ROL se asigna en la sección "Grupos" del mismo formulario de Usuario.
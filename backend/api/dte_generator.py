@@ -2,6 +2,7 @@
 Servicio para generar archivos JSON de DTE (Documento Tributario Electrónico)
 según el estándar del Ministerio de Hacienda de El Salvador.
 """
+import logging
 import uuid
 from datetime import datetime, timezone, timedelta
 
@@ -13,6 +14,8 @@ from django.utils import timezone as django_timezone
 from .constants import DTE_LINEA_DESCRIPCION_MAX_LENGTH
 from .models import Venta, Empresa, Cliente
 
+logger = logging.getLogger(__name__)
+
 
 def obtener_codigo_departamento_municipio(departamento_nombre=None, municipio_nombre=None):
     """
@@ -182,19 +185,43 @@ class CorrelativoDTE:
         Returns:
             str: Número de control formateado con exactamente 31 caracteres
         """
-        from .models import Correlativo, Empresa
-        from django.db import transaction
-        from datetime import datetime
-        
         # Validar que empresa_id existe
         if not empresa_id:
             raise ValueError("empresa_id es requerido para generar el correlativo")
         
-        # Obtener el año actual
-        anio_actual = django_timezone.localdate().year
-        
         # Usar transacción + select_for_update para evitar condiciones de carrera en concurrencia
+        _, correlativo = CorrelativoDTE._incrementar(empresa_id, tipo_dte, 1)
+        
+        return CorrelativoDTE.formatear_numero_control(correlativo, tipo_dte, sucursal, punto)
+
+    @staticmethod
+    def formatear_numero_control(correlativo, tipo_dte='03', sucursal='M001', punto='P001'):
+        """DTE-{tipo}-{codEstable}{codPunto}-{correlativo_15_digitos}; valida los 31 caracteres."""
+        # Formatear correlativo con 15 dígitos (parte final del número de control)
+        correlativo_formateado = str(correlativo).zfill(15)
+        
+        # Construir número de control: DTE-{tipo}-{codEstable}{codPunto}-{correlativo}
+        # Ejemplo: DTE-01-M001P001-000000000000001 (31 caracteres)
+        numero_control = f"DTE-{tipo_dte}-{sucursal}{punto}-{correlativo_formateado}"
+        
+        # Validar que tenga exactamente 31 caracteres
+        if len(numero_control) != 31:
+            raise ValueError(
+                f"El número de control debe tener 31 caracteres, tiene {len(numero_control)}: {numero_control}"
+            )
+        
+        return numero_control
+
+    @staticmethod
+    def _incrementar(empresa_id, tipo_dte, cantidad):
+        """
+        Suma `cantidad` al Correlativo del año (empresa, tipo) bajo select_for_update y devuelve
+        (anio, primer correlativo tomado). Reintenta si dos hilos crean la fila del año a la vez.
+        """
+        from .models import Correlativo
         from django.db import IntegrityError
+
+        anio_actual = django_timezone.localdate().year
         max_retries = 3
         for attempt in range(max_retries):
             try:
@@ -205,29 +232,88 @@ class CorrelativoDTE:
                         anio=anio_actual,
                         defaults={'ultimo_correlativo': 0}
                     )
-                    correlativo_obj.ultimo_correlativo += 1
+                    inicio = correlativo_obj.ultimo_correlativo + 1
+                    correlativo_obj.ultimo_correlativo += cantidad
                     correlativo_obj.save()
-                    correlativo = correlativo_obj.ultimo_correlativo
-                break
+                return anio_actual, inicio
             except IntegrityError:
                 if attempt == max_retries - 1:
                     raise
-                continue
-        
-        # Formatear correlativo con 15 dígitos (parte final del número de control)
-        correlativo_formateado = str(correlativo).zfill(15)
-        
-        # Construir número de control: DTE-{tipo}-{codEstable}{codPunto}-{correlativo}
-        # Ejemplo: DTE-01-M001P001-000000000000001 (31 caracteres)
-        numero_control = f"DTE-{tipo_dte}-{sucursal}{punto}-{correlativo_formateado}"
-        
-        # Validar que tenga exactamente 31 caracteres
-        if len(numero_control) != 31:
-            raise ValueError(
-                f"El número de control debe tener 31 caracteres, tiene {len(numero_control)}: {numero_control}"
+
+    @staticmethod
+    def reservar_bloque(empresa_id, tipo_dte, cantidad, motivo=''):
+        """
+        Reserva `cantidad` correlativos consecutivos con un solo bloqueo de la fila Correlativo
+        (emisión masiva, contingencia) y los registra en una ReservaCorrelativo.
+
+        La reserva se confirma en su propia transacción corta: el bloqueo no se mantiene mientras
+        se guardan las ventas y las emisiones individuales siguen numerando en paralelo. Quien
+        reserva debe llamar a cerrar_reserva con los números que usó.
+        """
+        from .models import ReservaCorrelativo
+
+        if not empresa_id:
+            raise ValueError("empresa_id es requerido para generar el correlativo")
+        if cantidad <= 0:
+            raise ValueError("La cantidad a reservar debe ser mayor que cero")
+        with transaction.atomic():
+            anio, inicio = CorrelativoDTE._incrementar(empresa_id, tipo_dte, cantidad)
+            return ReservaCorrelativo.objects.create(
+                empresa_id=empresa_id,
+                tipo_dte=tipo_dte,
+                anio=anio,
+                desde=inicio,
+                hasta=inicio + cantidad - 1,
+                motivo=(motivo or '')[:200],
             )
-        
-        return numero_control
+
+    @staticmethod
+    def numeros_de_reserva(reserva, sucursal='M001', punto='P001'):
+        """Números de control (31 caracteres) de la reserva, en orden."""
+        return [
+            CorrelativoDTE.formatear_numero_control(n, reserva.tipo_dte, sucursal, punto)
+            for n in range(reserva.desde, reserva.hasta + 1)
+        ]
+
+    @staticmethod
+    def cerrar_reserva(reserva, usados=()):
+        """
+        Cierra la reserva indicando qué números se usaron (números de control o correlativos).
+
+        Si el Correlativo sigue en el último número del bloque (nadie tomó números después), los
+        no usados del final vuelven al contador y la numeración queda sin huecos. Los que no
+        pueden devolverse se guardan en no_usados (estado ConHuecos) para auditoría.
+        """
+        from .models import Correlativo, ReservaCorrelativo
+
+        usados_int = {int(str(u)[-15:]) for u in usados}
+        with transaction.atomic():
+            correlativo_obj = Correlativo.objects.select_for_update().get(
+                empresa_id=reserva.empresa_id, tipo_dte=reserva.tipo_dte, anio=reserva.anio,
+            )
+            reserva = ReservaCorrelativo.objects.select_for_update().get(pk=reserva.pk)
+            if reserva.estado != 'Reservada':
+                return reserva
+            sin_usar = [n for n in range(reserva.desde, reserva.hasta + 1) if n not in usados_int]
+            devueltos = 0
+            if correlativo_obj.ultimo_correlativo == reserva.hasta:
+                while sin_usar and sin_usar[-1] == reserva.hasta - devueltos:
+                    sin_usar.pop()
+                    devueltos += 1
+                if devueltos:
+                    correlativo_obj.ultimo_correlativo -= devueltos
+                    correlativo_obj.save(update_fields=['ultimo_correlativo'])
+            reserva.devueltos = devueltos
+            reserva.no_usados = sin_usar
+            reserva.estado = 'ConHuecos' if sin_usar else 'Cerrada'
+            reserva.cerrada_at = django_timezone.now()
+            reserva.save(update_fields=['devueltos', 'no_usados', 'estado', 'cerrada_at'])
+        if sin_usar:
+            logger.warning(
+                "Reserva de correlativos #%s (empresa %s, DTE-%s %s): %s números sin usar no devueltos",
+                reserva.pk, reserva.empresa_id, reserva.tipo_dte, reserva.anio, len(sin_usar),
+            )
+        return reserva
 
 
 class DTEGenerator:
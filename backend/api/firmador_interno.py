@@ -6,8 +6,11 @@ Compatible con el formato usado por GoFirmadorDTE-SV (encodied en base64, clave
 import base64
 import hashlib
 import logging
+import os
 import re
+import threading
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional, Tuple
 
@@ -229,6 +232,77 @@ def _key_bytes_to_jwk_rsa(key_bytes: bytes, password: Optional[str] = None) -> O
         return None
 
 
+# Caché de claves ya cargadas: (ruta, mtime_ns, tamaño, sha512(password)) -> (jwk, password_ok).
+# Evita releer el XML y reconstruir la clave RSA por cada DTE (contingencia / lotes).
+_CLAVES_CACHE: "OrderedDict[tuple, Tuple[jwk.JWK, bool]]" = OrderedDict()
+_CLAVES_LOCK = threading.Lock()
+
+
+def _max_claves_cache() -> int:
+    try:
+        from django.conf import settings
+        return max(1, int(getattr(settings, 'FIRMADOR_CACHE_MAX_CERTIFICADOS', 32)))
+    except Exception:
+        return 32
+
+
+def _cargar_clave_firma(path_certificado: Path, password: str, validar_password: bool = True) -> Tuple[jwk.JWK, bool]:
+    """
+    Devuelve (jwk, password_ok) para el certificado, usando la caché en memoria.
+    Si el archivo cambia (mtime/tamaño) o cambia el password, la clave de caché cambia sola.
+    """
+    ruta = str(Path(path_certificado).resolve())
+    st = os.stat(ruta)
+    password_hex = _sha512_hex(password or "")
+    clave = (ruta, st.st_mtime_ns, st.st_size, password_hex)
+    with _CLAVES_LOCK:
+        entrada = _CLAVES_CACHE.get(clave)
+        if entrada is not None:
+            _CLAVES_CACHE.move_to_end(clave)
+            return entrada
+
+    key_bytes, clave_hex = _parse_certificado_mh_xml(path_certificado)
+    if not key_bytes:
+        raise ValueError(
+            "No se pudo extraer la clave privada del certificado XML. "
+            "Verifica que el archivo sea el .crt descargado del portal de MH (formato XML con <CertificadoMH><privateKey><encodied>...). "
+            "Si lo subiste por la app, prueba descargarlo de nuevo de factura.gob.sv y volver a cargarlo."
+        )
+    password_ok = not clave_hex or password_hex == clave_hex
+    if validar_password and not password_ok:
+        raise ValueError("Password del certificado no válido")
+    jwk_key = _key_bytes_to_jwk_rsa(key_bytes, password=password)
+    if not jwk_key:
+        raise ValueError(
+            "No se pudo cargar la clave RSA desde el certificado. "
+            "Asegúrate de usar el archivo .crt tal cual lo descargas del portal de MH (factura.gob.sv), "
+            "sin abrirlo ni guardarlo con otro programa. Vuelve a descargarlo y súbelo de nuevo en la empresa."
+        )
+    entrada = (jwk_key, password_ok)
+    with _CLAVES_LOCK:
+        # Una sola entrada por ruta: la versión anterior del archivo/password ya no sirve
+        for k in [k for k in _CLAVES_CACHE if k[0] == ruta]:
+            del _CLAVES_CACHE[k]
+        _CLAVES_CACHE[clave] = entrada
+        while len(_CLAVES_CACHE) > _max_claves_cache():
+            _CLAVES_CACHE.popitem(last=False)
+    return entrada
+
+
+def invalidar_cache_firmador(path_certificado: Optional[Path] = None) -> None:
+    """
+    Descarta claves cacheadas del certificado indicado (o todas si path_certificado es None).
+    Se llama al cambiar Empresa.archivo_certificado o clave_certificado.
+    """
+    with _CLAVES_LOCK:
+        if path_certificado is None:
+            _CLAVES_CACHE.clear()
+            return
+        ruta = str(Path(path_certificado).resolve())
+        for k in [k for k in _CLAVES_CACHE if k[0] == ruta]:
+            del _CLAVES_CACHE[k]
+
+
 def validar_password_certificado(path_certificado: Path, password: str) -> bool:
     """Comprueba si el password coincide con el hash guardado en el certificado MH."""
     _, clave_hex = _parse_certificado_mh_xml(path_certificado)
@@ -254,22 +328,9 @@ def firmar_dte_interno(
         )
     if not path_certificado.exists():
         raise FileNotFoundError(f"Certificado no encontrado: {path_certificado}")
-    key_bytes, clave_hex = _parse_certificado_mh_xml(path_certificado)
-    if not key_bytes:
-        raise ValueError(
-            "No se pudo extraer la clave privada del certificado XML. "
-            "Verifica que el archivo sea el .crt descargado del portal de MH (formato XML con <CertificadoMH><privateKey><encodied>...). "
-            "Si lo subiste por la app, prueba descargarlo de nuevo de factura.gob.sv y volver a cargarlo."
-        )
-    if validar_password and clave_hex and _sha512_hex(password) != clave_hex:
+    jwk_key, password_ok = _cargar_clave_firma(path_certificado, password, validar_password)
+    if validar_password and not password_ok:
         raise ValueError("Password del certificado no válido")
-    jwk_key = _key_bytes_to_jwk_rsa(key_bytes, password=password)
-    if not jwk_key:
-        raise ValueError(
-            "No se pudo cargar la clave RSA desde el certificado. "
-            "Asegúrate de usar el archivo .crt tal cual lo descargas del portal de MH (factura.gob.sv), "
-            "sin abrirlo ni guardarlo con otro programa. Vuelve a descargarlo y súbelo de nuevo en la empresa."
-        )
     # Payload: el JSON tal cual (string). JWS compacto con RS512.
     payload_bytes = dte_json.encode("utf-8") if isinstance(dte_json, str) else dte_json
     jws_obj = jws.JWS(payload_bytes)
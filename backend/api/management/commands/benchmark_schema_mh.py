@@ -0,0 +1,187 @@
+"""
+Benchmark de validación contra schemas MH (mh_schema_validator).
+
+Arma DTE 01/03/05/14 con 1, 50 y 500 ítems (builders reales, emisor/receptor/ítems fijos,
+sin base de datos) y mide el costo por DTE de:
+  - anterior: Draft7Validator nuevo + copia del DTE con floats → Decimal en cada llamada
+  - actual:   validar_dte_contra_schema (validador compilado en caché, multipleOf decimal)
+
+Uso:
+  python manage.py benchmark_schema_mh
+  python manage.py benchmark_schema_mh --repeticiones 50 --items 1 50 500
+"""
+import time
+from datetime import date
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand
+
+from api.models import Empresa, Venta
+from api.utils.builders.director import get_builder
+from api.utils.mh_schema_validator import (
+    _cargar_schema,
+    _floats_a_decimal,
+    resolver_schema_path,
+    validar_dte_contra_schema,
+)
+
+EMISOR = {
+    'nit': '06140101011019',
+    'nrc': '1234567',
+    'nombre': 'Empresa de Prueba',
+    'codActividad': '62010',
+    'descActividad': 'Servicios de tecnología',
+    'nombreComercial': 'Empresa Prueba',
+    'direccion': {'departamento': '06', 'municipio': '23', 'distrito': '14', 'complemento': 'San Salvador'},
+    'telefono': '50322222222',
+    'correo': 'facturas@empresa.test',
+    'codEstable': 'M001',
+    'codPuntoVenta': 'P001',
+}
+
+RECEPTOR = {
+    'tipoDocumento': '36',
+    'numDocumento': '06140101011019',
+    'nrc': '7654321',
+    'nombre': 'Cliente de Prueba',
+    'codActividad': '62010',
+    'descActividad': 'Servicios de tecnología',
+    'nombreComercial': 'Cliente Prueba',
+    'direccion': {'departamento': '06', 'municipio': '23', 'distrito': '14', 'complemento': 'San Salvador'},
+    'telefono': '50370000000',
+    'correo': 'cliente@example.com',
+}
+
+ITEM_BASE = {
+    'tipoItem': 1,
+    'numeroDocumento': None,
+    'cantidad': 3.0,
+    'codigo': 'ITEM-1',
+    'codTributo': None,
+    'uniMedida': 59,
+    'descripcion': 'Producto de prueba',
+    'precioUni': 13.19,
+    'montoDescu': 0.0,
+    'ventaNoSuj': 0.0,
+    'ventaExenta': 0.0,
+    'ventaGravada': 39.57,
+    'psv': 0.0,
+    'noGravado': 0.0,
+}
+
+
+def _empresa():
+    return Empresa(
+        id=1, nit='06140101011019', nrc='1234567', nombre='Empresa de Prueba',
+        cod_actividad='62010', desc_actividad='Servicios de tecnología',
+        cod_establecimiento='M001', cod_punto_venta='P001',
+        departamento='06', municipio='23', distrito='14', direccion='San Salvador',
+        telefono='22222222', correo='facturas@empresa.test',
+    )
+
+
+def _venta(tipo_venta, tipo_dte):
+    return Venta(
+        id=10, empresa=_empresa(), tipo_venta=tipo_venta,
+        fecha_emision=date(2026, 7, 30), hora_emision='10:15:30',
+        codigo_generacion='AAAAAAAA-BBBB-4CCC-8DDD-EEEEEEEEEEEE',
+        numero_control=f'DTE-{tipo_dte}-M001P001-000000000000001',
+        condicion_operacion=1,
+        documento_relacionado_tipo='03',
+        documento_relacionado_tipo_generacion=2,
+        codigo_generacion_referenciado='11111111-2222-4333-8444-555555555555',
+        documento_relacionado_fecha_emision=date(2026, 7, 20),
+        iva_retenido_1=0, iva_retenido_2=0,
+    )
+
+
+def _items(tipo_dte, n):
+    items = []
+    for i in range(1, n + 1):
+        item = dict(ITEM_BASE, numItem=i)
+        if tipo_dte == '01':
+            item.update(tributos=None, ivaItem=4.55)
+        else:
+            item.update(tributos=['20'])
+        if tipo_dte == '05':
+            item.pop('psv')
+            item.update(ivaPerci=0.0, totalIva=0.0, ivaRete=0.0)
+        items.append(item)
+    return items
+
+
+def construir_dte(tipo_dte, n_items):
+    """DTE de prueba con n_items ítems (sin tocar la base de datos)."""
+    if tipo_dte == '14':
+        documento = {
+            'items': [
+                {'cantidad': 3, 'precioUni': 13.19, 'descripcion': 'Compra de prueba', 'codigo': f'C-{i}'}
+                for i in range(n_items)
+            ],
+            'nit_proveedor': '012345678',
+            'nombre_proveedor': 'Proveedor Informal',
+            'fecha_emision': date(2026, 7, 30),
+            'hora_emision': '10:15:30',
+            'numero_control': 'DTE-14-M001P001-000000000000001',
+        }
+        builder = get_builder('14', documento, _empresa())
+        return builder.generar_json(ambiente='00', generar_codigo=True, generar_numero_control=False)
+
+    tipo_venta = {'01': 'CF', '03': 'CCF', '05': 'NC'}[tipo_dte]
+    builder = get_builder(tipo_dte, _venta(tipo_venta, tipo_dte))
+    emisor = dict(EMISOR)
+    receptor = dict(RECEPTOR)
+    if tipo_dte == '05':
+        # fe-nc-v4 no lleva códigos de establecimiento en el emisor.
+        emisor.pop('codEstable')
+        emisor.pop('codPuntoVenta')
+    elif tipo_dte == '01':
+        receptor.pop('nombreComercial')
+    elif tipo_dte == '03':
+        receptor['nit'] = receptor.pop('numDocumento')
+        receptor.pop('tipoDocumento')
+    with (
+        patch.object(builder, '_construir_emisor', return_value=emisor),
+        patch.object(builder, '_construir_receptor', return_value=receptor),
+        patch.object(builder, '_generar_items', return_value=_items(tipo_dte, n_items)),
+    ):
+        return builder.generar_json(ambiente='00', generar_codigo=False, generar_numero_control=False)
+
+
+def _validar_anterior(dte, tipo_dte):
+    from jsonschema import Draft7Validator
+
+    validator = Draft7Validator(_cargar_schema(resolver_schema_path(tipo_dte)))
+    return list(validator.iter_errors(_floats_a_decimal(dte)))
+
+
+def _medir(fn, repeticiones):
+    fn()  # calentamiento (carga de schema / validador)
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        fn()
+    return (time.perf_counter() - inicio) * 1000 / repeticiones
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de validar DTE 01/03/05/14 contra los schemas MH locales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipos', nargs='+', default=['01', '03', '05', '14'])
+        parser.add_argument('--items', nargs='+', type=int, default=[1, 50, 500])
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rep = max(1, options['repeticiones'])
+        self.stdout.write(f'{"DTE":<5}{"ítems":>7}{"anterior ms":>14}{"actual ms":>12}{"x":>7}  errores schema')
+        for tipo in options['tipos']:
+            for n in options['items']:
+                dte = construir_dte(tipo, n)
+                errores = validar_dte_contra_schema(dte, tipo_dte=tipo, strict=False)
+                ms_anterior = _medir(lambda: _validar_anterior(dte, tipo), rep)
+                ms_actual = _medir(lambda: validar_dte_contra_schema(dte, tipo_dte=tipo, strict=False), rep)
+                self.stdout.write(
+                    f'{tipo:<5}{n:>7}{ms_anterior:>14.3f}{ms_actual:>12.3f}'
+                    f'{ms_anterior / ms_actual if ms_actual else 0:>7.1f}  {len(errores)}'
+                    + (f' ({errores[0]})' if errores else '')
+                )
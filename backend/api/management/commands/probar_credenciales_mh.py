@@ -80,7 +80,7 @@ class Command(BaseCommand):
             from api.services.facturacion_service import FacturacionService, AutenticacionMHError
 
             svc = FacturacionService(empresa)
-            token = svc.obtener_token()
+            token = svc.obtener_token(usar_cache=False)
             if token:
                 self.stdout.write(self.style.SUCCESS(f"\n✅ Autenticación OK. Token obtenido (len={len(token)})."))
             else:
@@ -1,17 +1,25 @@
 """
 Management command para procesar tareas de facturación pendientes.
-Ejecutar periódicamente (cron cada 1-5 min) cuando USE_ASYNC_FACTURACION=True.
+Ejecutar periódicamente (cron cada 1-5 min) cuando USE_ASYNC_FACTURACION=True,
+o como worker permanente (--worker) con varias tareas en paralelo.
+Sin --worker y con MH_LOTE_HABILITADO, las tareas reclamadas se envían a MH en lotes (recepcionlote)
+y cada ejecución recoge el resultado de los lotes que quedaron pendientes.
+También reanuda las cargas masivas que un reinicio del proceso web dejó a medias.
 
 Uso:
   python manage.py procesar_tareas_facturacion
-  python manage.py procesar_tareas_facturacion --loop  # Bucle continuo (cada 30s)
+  python manage.py procesar_tareas_facturacion --worker              # Worker concurrente (LISTEN/NOTIFY o poll corto)
+  python manage.py procesar_tareas_facturacion --worker --hilos 8
+  python manage.py procesar_tareas_facturacion --loop                # Alias de --worker (compatibilidad)
 """
-import time
 import logging
+import signal
+import threading
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from api.tasks import procesar_tareas_pendientes
+from api.tasks import ejecutar_worker, procesar_tareas_pendientes, reanudar_jobs_segundo_plano
 
 logger = logging.getLogger(__name__)
 
@@ -20,29 +28,63 @@ class Command(BaseCommand):
     help = 'Procesa tareas de facturación pendientes (envío a MH, correo)'
 
     def add_arguments(self, parser):
+        parser.add_argument(
+            '--worker',
+            action='store_true',
+            help='Worker permanente: reclama tareas con SKIP LOCKED y las procesa en paralelo',
+        )
         parser.add_argument(
             '--loop',
             action='store_true',
-            help='Ejecutar en bucle cada 30 segundos',
+            help='Alias de --worker (antes: bucle cada 30 segundos)',
+        )
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=getattr(settings, 'FACTURACION_WORKER_HILOS', 4),
+            help='Tareas procesadas en paralelo por el worker',
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=getattr(settings, 'FACTURACION_WORKER_POLL_SEGUNDOS', 2.0),
+            help='Segundos entre consultas a la cola si no llega NOTIFY',
         )
         parser.add_argument(
             '--limite',
             type=int,
             default=20,
-            help='Máximo de tareas a procesar por ejecución',
+            help='Máximo de tareas a procesar por ejecución (modo sin --worker)',
         )
 
     def handle(self, *args, **options):
-        loop = options['loop']
-        limite = options['limite']
-
-        if loop:
-            self.stdout.write('Modo bucle: procesando cada 30 segundos. Ctrl+C para salir.')
-            while True:
-                n = procesar_tareas_pendientes(limite=limite)
-                if n > 0:
-                    self.stdout.write(self.style.SUCCESS(f'Procesadas {n} tareas'))
-                time.sleep(30)
+        if options['worker'] or options['loop']:
+            hilos = max(1, options['hilos'])
+            detener = threading.Event()
+
+            def _salir(signum, frame):
+                self.stdout.write('Señal recibida: terminando tareas en curso...')
+                detener.set()
+
+            signal.signal(signal.SIGTERM, _salir)
+            signal.signal(signal.SIGINT, _salir)
+
+            def _on_tarea(tarea_id, terminada):
+                if terminada:
+                    self.stdout.write(self.style.SUCCESS(f'Tarea {tarea_id} procesada'))
+                else:
+                    self.stdout.write(f'Tarea {tarea_id} reprogramada para reintento')
+
+            self.stdout.write(
+                f'Modo worker: {hilos} hilos, poll {options["poll"]}s. Ctrl+C para salir.'
+            )
+            ejecutar_worker(
+                hilos=hilos,
+                poll_segundos=options['poll'],
+                detener=detener,
+                on_tarea=_on_tarea,
+            )
         else:
-            n = procesar_tareas_pendientes(limite=limite)
+            reanudar_jobs_segundo_plano()
+            n = procesar_tareas_pendientes(limite=options['limite'])
             self.stdout.write(self.style.SUCCESS(f'Procesadas {n} tareas'))
@@ -0,0 +1,48 @@
+"""
+Levanta el simulador local de MH (auth, recepción individual y por lotes, contingencia,
+anulación y firmador) para probar la facturación sin conexión al Ministerio de Hacienda.
+
+Uso:
+  python manage.py simulador_mh
+  python manage.py simulador_mh --puerto 8114 --rechazar <codigoGeneracion> --consultas-en-proceso 2
+
+Y en el backend que se quiere probar:
+  MH_URL_BASE=http://127.0.0.1:8114
+  USE_INTERNAL_FIRMADOR=false FIRMADOR_URL=http://127.0.0.1:8114/   # opcional: firma simulada
+"""
+from django.core.management.base import BaseCommand
+
+from api.utils.mh_simulador import SimuladorMH
+
+
+class Command(BaseCommand):
+    help = 'Servidor local que imita las APIs de MH y del firmador (solo desarrollo y pruebas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--puerto', type=int, default=8114)
+        parser.add_argument(
+            '--rechazar',
+            action='append',
+            default=[],
+            help='codigoGeneracion que el simulador rechaza (se puede repetir)',
+        )
+        parser.add_argument(
+            '--consultas-en-proceso',
+            type=int,
+            default=1,
+            help='Consultas de un lote que responden vacío antes de dar el resultado',
+        )
+
+    def handle(self, *args, **options):
+        simulador = SimuladorMH(
+            host=options['host'],
+            puerto=options['puerto'],
+            rechazar=options['rechazar'],
+            consultas_en_proceso=options['consultas_en_proceso'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Simulador MH escuchando en {simulador.url}. Ctrl+C para salir.'))
+        try:
+            simulador.servir()
+        except KeyboardInterrupt:
+            self.stdout.write('Simulador MH detenido')
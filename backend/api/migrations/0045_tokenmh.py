@@ -0,0 +1,32 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+import api.utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0044_venta_nombre_comercial_receptor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenMH',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambiente', models.CharField(choices=[('00', 'PRODUCCION'), ('01', 'PRUEBAS')], max_length=2)),
+                ('user_api_mh', models.CharField(max_length=50)),
+                ('token', api.utils.fields.EncryptedTextField(blank=True, help_text='Token MH vigente (cifrado en BD)', null=True)),
+                ('obtenido_at', models.DateTimeField(blank=True, null=True)),
+                ('expira_at', models.DateTimeField(blank=True, help_text='Vencimiento estimado del token', null=True)),
+                ('actualizada_at', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_mh', to='api.empresa')),
+            ],
+            options={
+                'verbose_name': 'Token MH',
+                'verbose_name_plural': 'Tokens MH',
+                'unique_together': {('empresa', 'ambiente', 'user_api_mh')},
+            },
+        ),
+    ]
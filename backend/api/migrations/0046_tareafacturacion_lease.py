@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0045_tokenmh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tareafacturacion',
+            name='worker_id',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='tareafacturacion',
+            name='bloqueada_hasta',
+            field=models.DateTimeField(
+                blank=True,
+                help_text='Vencimiento del lease del worker que procesa la tarea (estado Procesando)',
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='tareafacturacion',
+            index=models.Index(fields=['estado', 'proximo_reintento'], name='api_tareafa_estado_4df5c6_idx'),
+        ),
+    ]
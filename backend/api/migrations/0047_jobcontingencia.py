@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0046_tareafacturacion_lease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobContingencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('EnCola', 'En cola'), ('Procesando', 'Procesando'), ('Completado', 'Completado'), ('Error', 'Error')], default='EnCola', max_length=20)),
+                ('mensaje', models.CharField(blank=True, default='', max_length=500)),
+                ('venta_ids', models.JSONField(default=list, help_text='Ventas PendienteEnvio incluidas en el reporte')),
+                ('ventas_excluidas', models.IntegerField(default=0)),
+                ('tipo_contingencia', models.IntegerField(default=1)),
+                ('motivo', models.CharField(blank=True, max_length=500, null=True)),
+                ('total', models.IntegerField(default=0)),
+                ('aceptadas', models.IntegerField(default=0)),
+                ('rechazadas', models.IntegerField(default=0)),
+                ('errores', models.IntegerField(default=0)),
+                ('detalles', models.JSONField(blank=True, default=list)),
+                ('reporte_contingencia', models.JSONField(blank=True, null=True)),
+                ('resultado_contingencia', models.JSONField(blank=True, null=True)),
+                ('creado_at', models.DateTimeField(auto_now_add=True)),
+                ('actualizado_at', models.DateTimeField(auto_now=True)),
+                ('finalizado_at', models.DateTimeField(blank=True, null=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs_contingencia', to='api.empresa')),
+            ],
+            options={
+                'verbose_name': 'Job de Contingencia',
+                'verbose_name_plural': 'Jobs de Contingencia',
+                'ordering': ['-creado_at'],
+            },
+        ),
+    ]
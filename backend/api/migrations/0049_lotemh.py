@@ -0,0 +1,36 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0048_venta_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteMH',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambiente', models.CharField(choices=[('00', 'PRODUCCION'), ('01', 'PRUEBAS')], default='01', max_length=2)),
+                ('id_envio', models.CharField(max_length=36)),
+                ('codigo_lote', models.CharField(db_index=True, max_length=100)),
+                ('estado', models.CharField(choices=[('Enviado', 'Enviado (esperando resultado de MH)'), ('Completado', 'Completado'), ('Error', 'Error')], default='Enviado', max_length=20)),
+                ('venta_ids', models.JSONField(default=list, help_text='Ventas incluidas en el lote')),
+                ('documentos', models.JSONField(default=dict, help_text='codigoGeneracion → venta_id, fecha/hora del DTE y estado MH del documento')),
+                ('mensaje', models.CharField(blank=True, default='', max_length=500)),
+                ('consultas', models.IntegerField(default=0)),
+                ('creado_at', models.DateTimeField(auto_now_add=True)),
+                ('actualizado_at', models.DateTimeField(auto_now=True)),
+                ('finalizado_at', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes_mh', to='api.empresa')),
+            ],
+            options={
+                'verbose_name': 'Lote MH',
+                'verbose_name_plural': 'Lotes MH',
+                'ordering': ['-creado_at'],
+                'indexes': [models.Index(fields=['estado', 'empresa'], name='api_lotemh_estado_493689_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0049_lotemh'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCargaMasiva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('EnCola', 'En cola'), ('Procesando', 'Procesando'), ('Completado', 'Completado'), ('Error', 'Error')], default='EnCola', max_length=20)),
+                ('mensaje', models.CharField(blank=True, default='', max_length=500)),
+                ('filas', models.JSONField(default=list, help_text='Filas de carga_masiva_upload enviadas a emitir')),
+                ('total', models.IntegerField(default=0)),
+                ('creadas', models.IntegerField(default=0)),
+                ('errores', models.IntegerField(default=0)),
+                ('venta_ids', models.JSONField(default=list, help_text='Ventas creadas por el job')),
+                ('resultados', models.JSONField(blank=True, default=list, help_text='Por fila: _fila y venta_id/numero_control, o error')),
+                ('creado_at', models.DateTimeField(auto_now_add=True)),
+                ('actualizado_at', models.DateTimeField(auto_now=True)),
+                ('finalizado_at', models.DateTimeField(blank=True, null=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs_carga_masiva', to='api.empresa')),
+            ],
+            options={
+                'verbose_name': 'Job de Carga Masiva',
+                'verbose_name_plural': 'Jobs de Carga Masiva',
+                'ordering': ['-creado_at'],
+            },
+        ),
+    ]
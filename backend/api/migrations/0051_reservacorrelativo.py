@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0050_jobcargamasiva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaCorrelativo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_dte', models.CharField(max_length=2)),
+                ('anio', models.IntegerField()),
+                ('desde', models.IntegerField()),
+                ('hasta', models.IntegerField()),
+                ('estado', models.CharField(choices=[('Reservada', 'Reservada'), ('Cerrada', 'Cerrada (usados o devueltos)'), ('ConHuecos', 'Cerrada con números sin usar')], default='Reservada', max_length=20)),
+                ('devueltos', models.IntegerField(default=0, help_text='Números del final del bloque devueltos al Correlativo')),
+                ('no_usados', models.JSONField(blank=True, default=list, help_text='Correlativos del bloque que quedaron sin usar (huecos)')),
+                ('motivo', models.CharField(blank=True, default='', max_length=200)),
+                ('creada_at', models.DateTimeField(auto_now_add=True)),
+                ('cerrada_at', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_correlativo', to='api.empresa')),
+            ],
+            options={
+                'verbose_name': 'Reserva de correlativos',
+                'verbose_name_plural': 'Reservas de correlativos',
+                'ordering': ['-creada_at'],
+                'indexes': [models.Index(fields=['empresa', 'tipo_dte', 'anio'], name='api_reserva_empresa_90b036_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0051_reservacorrelativo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobcargamasiva',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='jobcargamasiva',
+            constraint=models.UniqueConstraint(fields=('empresa', 'idempotency_key'), name='uniq_job_carga_masiva_idempotency_key'),
+        ),
+    ]
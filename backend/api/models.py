@@ -256,6 +256,36 @@ class Empresa(models.Model):
                 cleaned = val.strip()
                 setattr(self, field, cleaned if cleaned else None)
         super().save(*args, **kwargs)
+        self._invalidar_firma_si_cambio()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._firma_original = instancia._firma_actual()
+        return instancia
+
+    def _firma_actual(self):
+        """(nombre archivo certificado, clave) tal como están cargados; None si el campo está diferido."""
+        if 'archivo_certificado' not in self.__dict__ or 'clave_certificado' not in self.__dict__:
+            return None
+        archivo = self.__dict__['archivo_certificado']
+        return (getattr(archivo, 'name', archivo) or '', self.__dict__['clave_certificado'] or '')
+
+    def _invalidar_firma_si_cambio(self):
+        """Descarta la clave de firma cacheada (firmador_interno) si cambió el certificado o su clave."""
+        original = getattr(self, '_firma_original', None)
+        actual = self._firma_actual()
+        if original is None or actual is None or original == actual:
+            self._firma_original = actual
+            return
+        from .firmador_interno import invalidar_cache_firmador
+        for nombre in {original[0], actual[0]}:
+            if nombre:
+                try:
+                    invalidar_cache_firmador(self.archivo_certificado.storage.path(nombre))
+                except Exception:
+                    invalidar_cache_firmador()
+        self._firma_original = actual
 
     def __str__(self):
         return self.nombre
@@ -601,6 +631,9 @@ class Venta(models.Model):
     
     # Observaciones/errores de MH cuando el documento es rechazado (JSON o texto)
     observaciones_mh = models.TextField(blank=True, null=True, help_text="Errores/observaciones de MH al rechazar")
+
+    # Cabecera Idempotency-Key de PosAgil (bandeja agildte_outbox): un reintento devuelve esta venta
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     
     # Método para calcular totales desde detalles
     def calcular_totales(self):
@@ -984,6 +1017,48 @@ class Correlativo(models.Model):
         return f"{self.empresa.nombre} - DTE-{self.tipo_dte} - Año {self.anio} - Correlativo: {self.ultimo_correlativo}"
 
 
+# --- TABLA 8.1: RESERVAS DE CORRELATIVOS (bloques para emisión masiva) ---
+class ReservaCorrelativo(models.Model):
+    """
+    Bloque de correlativos [desde, hasta] tomado de una vez con CorrelativoDTE.reservar_bloque
+    (carga masiva y otros jobs). Al cerrarla, los números sin usar del final del bloque vuelven al
+    Correlativo si nadie tomó números después (numeración sin huecos); los demás quedan en
+    no_usados como registro auditable de los huecos.
+    """
+    ESTADO_CHOICES = [
+        ('Reservada', 'Reservada'),
+        ('Cerrada', 'Cerrada (usados o devueltos)'),
+        ('ConHuecos', 'Cerrada con números sin usar'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='reservas_correlativo')
+    tipo_dte = models.CharField(max_length=2)
+    anio = models.IntegerField()
+    desde = models.IntegerField()
+    hasta = models.IntegerField()
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='Reservada')
+    devueltos = models.IntegerField(default=0, help_text="Números del final del bloque devueltos al Correlativo")
+    no_usados = models.JSONField(default=list, blank=True, help_text="Correlativos del bloque que quedaron sin usar (huecos)")
+    motivo = models.CharField(max_length=200, blank=True, default='')
+    creada_at = models.DateTimeField(auto_now_add=True)
+    cerrada_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Reserva de correlativos"
+        verbose_name_plural = "Reservas de correlativos"
+        ordering = ['-creada_at']
+        indexes = [
+            models.Index(fields=['empresa', 'tipo_dte', 'anio']),
+        ]
+
+    @property
+    def cantidad(self) -> int:
+        return self.hasta - self.desde + 1
+
+    def __str__(self):
+        return f"DTE-{self.tipo_dte} {self.anio} [{self.desde}-{self.hasta}] empresa #{self.empresa_id} - {self.estado}"
+
+
 # --- TABLA 9: TAREA FACTURACIÓN (Cola de envíos asíncronos) ---
 class TareaFacturacion(models.Model):
     """
@@ -1011,6 +1086,12 @@ class TareaFacturacion(models.Model):
         help_text='Tras aceptación MH y correo, enviar mensaje WhatsApp al teléfono indicado.',
     )
     whatsapp_telefono_destino = models.CharField(max_length=32, blank=True, default='')
+    # Lease del worker que la reclamó: si vence sin heartbeat, otro worker la retoma
+    worker_id = models.CharField(max_length=100, blank=True, default='')
+    bloqueada_hasta = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Vencimiento del lease del worker que procesa la tarea (estado Procesando)",
+    )
     creada_at = models.DateTimeField(auto_now_add=True)
     actualizada_at = models.DateTimeField(auto_now=True)
 
@@ -1018,6 +1099,178 @@ class TareaFacturacion(models.Model):
         verbose_name = "Tarea de Facturación"
         verbose_name_plural = "Tareas de Facturación"
         ordering = ['proximo_reintento', 'creada_at']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_reintento']),
+        ]
 
     def __str__(self):
         return f"Tarea venta #{self.venta_id} - {self.estado}"
+
+
+# --- TABLA 10: TOKEN MH (caché de /seguridad/auth compartida entre procesos) ---
+class TokenMH(models.Model):
+    """
+    Token de autenticación MH compartido por los workers de gunicorn y procesar_tareas_facturacion.
+    Una fila por (empresa, ambiente, user_api_mh). La fila también funciona como candado
+    (select_for_update): solo un proceso renueva el token a la vez y el resto reutiliza el resultado.
+    """
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='tokens_mh',
+    )
+    ambiente = models.CharField(max_length=2, choices=Empresa.AMBIENTE_CHOICES)
+    user_api_mh = models.CharField(max_length=50)
+    token = EncryptedTextField(blank=True, null=True, help_text="Token MH vigente (cifrado en BD)")
+    obtenido_at = models.DateTimeField(null=True, blank=True)
+    expira_at = models.DateTimeField(null=True, blank=True, help_text="Vencimiento estimado del token")
+    actualizada_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Token MH"
+        verbose_name_plural = "Tokens MH"
+        unique_together = ('empresa', 'ambiente', 'user_api_mh')
+
+    def __str__(self):
+        return f"Token MH empresa #{self.empresa_id} ({self.ambiente}) - vence {self.expira_at}"
+
+
+# --- TABLA 11: JOB DE CONTINGENCIA (reenvío en segundo plano tras contingencia MH) ---
+class JobContingencia(models.Model):
+    """
+    Cierre de contingencia ejecutado en segundo plano: envía el evento F05 y luego
+    retransmite en paralelo las ventas PendienteEnvio. El front consulta el progreso por id.
+    """
+    ESTADO_CHOICES = [
+        ('EnCola', 'En cola'),
+        ('Procesando', 'Procesando'),
+        ('Completado', 'Completado'),
+        ('Error', 'Error'),
+    ]
+
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='jobs_contingencia',
+    )
+    creado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='EnCola')
+    mensaje = models.CharField(max_length=500, blank=True, default='')
+    venta_ids = models.JSONField(default=list, help_text="Ventas PendienteEnvio incluidas en el reporte")
+    ventas_excluidas = models.IntegerField(default=0)
+    tipo_contingencia = models.IntegerField(default=1)
+    motivo = models.CharField(max_length=500, blank=True, null=True)
+    total = models.IntegerField(default=0)
+    aceptadas = models.IntegerField(default=0)
+    rechazadas = models.IntegerField(default=0)
+    errores = models.IntegerField(default=0)
+    detalles = models.JSONField(default=list, blank=True)
+    reporte_contingencia = models.JSONField(null=True, blank=True)
+    resultado_contingencia = models.JSONField(null=True, blank=True)
+    creado_at = models.DateTimeField(auto_now_add=True)
+    actualizado_at = models.DateTimeField(auto_now=True)
+    finalizado_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Job de Contingencia"
+        verbose_name_plural = "Jobs de Contingencia"
+        ordering = ['-creado_at']
+
+    @property
+    def pendientes(self) -> int:
+        return max(0, self.total - self.aceptadas - self.rechazadas - self.errores)
+
+    def __str__(self):
+        return f"Contingencia empresa #{self.empresa_id} - {self.estado} ({self.aceptadas}/{self.total})"
+
+
+# --- TABLA 12: LOTES ENVIADOS A MH (recepcionlote) ---
+class LoteMH(models.Model):
+    """
+    Lote de DTE firmados enviado a /fesv/recepcionlote/ (contingencia y cola de facturación).
+    MH responde el resultado de cada documento de forma diferida: el lote queda Enviado hasta
+    que consultadtelote devuelve todos sus documentos (ver services.mh_lote).
+    """
+    ESTADO_CHOICES = [
+        ('Enviado', 'Enviado (esperando resultado de MH)'),
+        ('Completado', 'Completado'),
+        ('Error', 'Error'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='lotes_mh')
+    ambiente = models.CharField(max_length=2, choices=Empresa.AMBIENTE_CHOICES, default='01')
+    id_envio = models.CharField(max_length=36)
+    codigo_lote = models.CharField(max_length=100, db_index=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='Enviado')
+    venta_ids = models.JSONField(default=list, help_text="Ventas incluidas en el lote")
+    documentos = models.JSONField(
+        default=dict,
+        help_text="codigoGeneracion → venta_id, fecha/hora del DTE y estado MH del documento",
+    )
+    mensaje = models.CharField(max_length=500, blank=True, default='')
+    consultas = models.IntegerField(default=0)
+    creado_at = models.DateTimeField(auto_now_add=True)
+    actualizado_at = models.DateTimeField(auto_now=True)
+    finalizado_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Lote MH"
+        verbose_name_plural = "Lotes MH"
+        ordering = ['-creado_at']
+        indexes = [
+            models.Index(fields=['estado', 'empresa']),
+        ]
+
+    def __str__(self):
+        return f"Lote {self.codigo_lote} empresa #{self.empresa_id} - {self.estado} ({len(self.venta_ids)} DTE)"
+
+
+# --- TABLA 13: JOB DE EMISIÓN DE CARGA MASIVA ---
+class JobCargaMasiva(models.Model):
+    """
+    Emisión en segundo plano de las filas validadas en Carga Masiva: crea las ventas por bloques
+    (bulk_create), reserva sus números de control y las encola en TareaFacturacion. El front
+    consulta el progreso por id; la transmisión a MH la hace la cola de facturación.
+    """
+    ESTADO_CHOICES = [
+        ('EnCola', 'En cola'),
+        ('Procesando', 'Procesando'),
+        ('Completado', 'Completado'),
+        ('Error', 'Error'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='jobs_carga_masiva')
+    creado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='EnCola')
+    mensaje = models.CharField(max_length=500, blank=True, default='')
+    filas = models.JSONField(default=list, help_text="Filas de carga_masiva_upload enviadas a emitir")
+    total = models.IntegerField(default=0)
+    creadas = models.IntegerField(default=0)
+    errores = models.IntegerField(default=0)
+    venta_ids = models.JSONField(default=list, help_text="Ventas creadas por el job")
+    resultados = models.JSONField(
+        default=list, blank=True,
+        help_text="Por fila: _fila y venta_id/numero_control, o error",
+    )
+    # Cabecera Idempotency-Key del front: reenviar la misma emisión devuelve este job
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    creado_at = models.DateTimeField(auto_now_add=True)
+    actualizado_at = models.DateTimeField(auto_now=True)
+    finalizado_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Job de Carga Masiva"
+        verbose_name_plural = "Jobs de Carga Masiva"
+        ordering = ['-creado_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'idempotency_key'], name='uniq_job_carga_masiva_idempotency_key',
+            ),
+        ]
+
+    @property
+    def pendientes(self) -> int:
+        return max(0, self.total - self.creadas - self.errores)
+
+    def __str__(self):
+        return f"Carga masiva empresa #{self.empresa_id} - {self.estado} ({self.creadas}/{self.total})"
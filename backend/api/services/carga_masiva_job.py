@@ -0,0 +1,446 @@
+"""
+Emisión en segundo plano de Carga Masiva (POST /api/carga-masiva/emitir/).
+
+El front envía una sola vez las filas que devolvió carga_masiva_upload y consulta el progreso
+por id, así que un cierre de mes de miles de facturas no depende de que el navegador siga abierto.
+
+1) Clientes CCF sin cliente_id: se buscan por NRC y los que faltan se crean en un INSERT.
+2) Por bloques de CARGA_MASIVA_FILAS_POR_TRANSACCION filas: números de control reservados en
+   bloque por tipo DTE (ReservaCorrelativo) y, en una transacción, Venta y DetalleVenta con
+   bulk_create y una TareaFacturacion por venta (o PendienteEnvio si la empresa está en
+   contingencia). Si el bloque falla, sus números vuelven al Correlativo o quedan auditados.
+3) La cola de facturación transmite a MH (worker, o un hilo al terminar el job); el endpoint
+   de progreso cuenta las ventas del job por estado_dte.
+
+Un solo job activo por empresa. El progreso de cada bloque se guarda en la misma transacción que
+sus ventas, así que un job interrumpido (reinicio del proceso, ver jobs_segundo_plano) se reanuda
+saltando las filas que ya tienen resultado, sin duplicar facturas: lo retoma el worker de
+facturación o la siguiente consulta de progreso.
+
+Los montos por línea siguen las mismas reglas que POST /ventas/crear-con-detalles/ con el
+payload que armaba el front por fila: CF con precio IVA incluido, CCF con precio sin IVA.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from ..dte_generator import CorrelativoDTE
+from ..models import (
+    Cliente, DetalleVenta, JobCargaMasiva, Producto, ReservaCorrelativo, TareaFacturacion, Venta,
+)
+from .jobs_segundo_plano import ESTADOS_ACTIVOS, interrumpidos, latido, tomar_job
+from ..utils.mh_documento import normalizar_nrc_mh
+
+logger = logging.getLogger(__name__)
+
+CENTAVOS = Decimal('0.01')
+IVA = Decimal('0.13')
+TIPO_VENTA_POR_DTE = {'01': 'CF', '03': 'CCF'}
+# Estados de una venta del job que todavía esperan resultado de MH
+ESTADOS_EN_TRANSMISION = ('Generado', 'Enviado', 'ErrorEnvio')
+
+
+def _dinero(valor) -> Decimal:
+    return Decimal(valor).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def job_carga_masiva_dict(job: JobCargaMasiva) -> Dict[str, Any]:
+    """Respuesta del endpoint de progreso: creación de ventas y su estado_dte actual."""
+    por_estado = {}
+    if job.venta_ids:
+        por_estado = {
+            r['estado_dte']: r['n']
+            for r in Venta.objects.filter(pk__in=job.venta_ids)
+            .values('estado_dte').annotate(n=Count('id')).order_by()
+        }
+    return {
+        "job_id": job.id,
+        "empresa_id": job.empresa_id,
+        "estado": job.estado,
+        "mensaje": job.mensaje,
+        "total": job.total,
+        "creadas": job.creadas,
+        "errores": job.errores,
+        "pendientes": job.pendientes,
+        "por_estado_dte": por_estado,
+        "en_transmision": sum(por_estado.get(e, 0) for e in ESTADOS_EN_TRANSMISION),
+        "resultados": job.resultados,
+        "creado_at": job.creado_at,
+        "finalizado_at": job.finalizado_at,
+    }
+
+
+def iniciar_job_carga_masiva(job_id: int) -> None:
+    """Lanza el job en un hilo tras el commit (mismo patrón que iniciar_job_contingencia)."""
+    from ..tasks import _disparar_en_hilo
+
+    def _run():
+        close_old_connections()
+        try:
+            ejecutar_job_carga_masiva(job_id)
+        except Exception:
+            logger.exception('Error en job de carga masiva %s', job_id)
+            JobCargaMasiva.objects.filter(pk=job_id).update(
+                estado='Error', mensaje='Error inesperado procesando la carga masiva.',
+                finalizado_at=timezone.now(),
+            )
+        finally:
+            close_old_connections()
+
+    transaction.on_commit(lambda: _disparar_en_hilo(_run))
+
+
+def job_carga_masiva_activo(empresa_id: int) -> Optional[JobCargaMasiva]:
+    """Job EnCola/Procesando de la empresa (reanudando antes los interrumpidos), o None."""
+    reanudar_jobs_interrumpidos(empresa_id)
+    return JobCargaMasiva.objects.filter(empresa_id=empresa_id, estado__in=ESTADOS_ACTIVOS).first()
+
+
+def reanudar_jobs_interrumpidos(empresa_id: Optional[int] = None) -> List[int]:
+    """
+    Vuelve a lanzar los jobs activos cuyo proceso dejó de dar latido. El UPDATE condicional
+    evita que dos procesos reanuden el mismo job.
+    """
+    qs = JobCargaMasiva.objects.all()
+    if empresa_id is not None:
+        qs = qs.filter(empresa_id=empresa_id)
+    reanudados = []
+    for job_id in interrumpidos(qs).values_list('pk', flat=True):
+        if interrumpidos(JobCargaMasiva.objects.filter(pk=job_id)).update(
+            estado='EnCola', mensaje='Reanudando la emisión interrumpida.', actualizado_at=timezone.now(),
+        ):
+            logger.warning('Carga masiva job %s interrumpido: se reanuda', job_id)
+            iniciar_job_carga_masiva(job_id)
+            reanudados.append(job_id)
+    return reanudados
+
+
+def _texto(fila: Dict[str, Any], campo: str, largo: int) -> Optional[str]:
+    valor = str(fila.get(campo) or '').strip()
+    return valor[:largo] or None
+
+
+def _fecha(fila: Dict[str, Any]) -> date:
+    valor = fila.get('fecha')
+    return date.fromisoformat(str(valor)[:10]) if valor else timezone.localdate()
+
+
+def _items(fila: Dict[str, Any]) -> List[Dict[str, Any]]:
+    items = fila.get('items') or []
+    if not items and fila.get('producto'):
+        items = [{
+            'producto': fila.get('producto'),
+            'cantidad': fila.get('cantidad') or 1,
+            'precio_unitario': fila.get('precio_unitario') or 0,
+            'producto_id': fila.get('producto_id'),
+        }]
+    return items
+
+
+def _error_fila(fila: Dict[str, Any]) -> Optional[str]:
+    """Revalida lo mínimo para emitir (el front puede haber editado la fila tras el upload)."""
+    if fila.get('_errores'):
+        return '; '.join(str(e) for e in fila['_errores'])
+    tipo = fila.get('tipo_dte')
+    if tipo not in TIPO_VENTA_POR_DTE:
+        return 'Tipo DTE debe ser 01 (Consumidor Final) o 03 (Crédito Fiscal)'
+    items = _items(fila)
+    if not items:
+        return 'Al menos un producto/descripción es requerido'
+    try:
+        for item in items:
+            if Decimal(str(item.get('cantidad') or 1)) <= 0 or Decimal(str(item.get('precio_unitario') or 0)) < 0:
+                return 'Cantidad y precio unitario inválidos'
+        _fecha(fila)
+    except (InvalidOperation, ValueError, TypeError):
+        return 'Cantidad, precio unitario o fecha inválidos'
+    if tipo == '03':
+        if not normalizar_nrc_mh(str(fila.get('cliente') or '')):
+            return 'Crédito Fiscal (03) requiere NRC del cliente en columna "cliente"'
+        if not str(fila.get('nit') or '').strip():
+            return 'Crédito Fiscal (03) requiere NIT o DUI en columna "nit". DUI=9 dígitos, NIT=14 dígitos.'
+    return None
+
+
+def _documento(fila: Dict[str, Any]) -> Tuple[str, str]:
+    """(tipo_documento, dígitos) del NIT/DUI de la fila: 9 dígitos = DUI, si no NIT."""
+    digitos = ''.join(c for c in str(fila.get('nit') or '') if c.isdigit())
+    return ('DUI' if len(digitos) == 9 else 'NIT'), digitos
+
+
+def _resolver_clientes(empresa, filas: List[Dict[str, Any]]) -> Dict[int, int]:
+    """
+    Cliente de cada fila CCF (índice en `filas` → cliente_id). Usa cliente_id si es de la empresa;
+    si no, busca por NRC y crea en un solo INSERT los clientes que no existen.
+    """
+    ccf = [(i, f) for i, f in enumerate(filas) if f['tipo_dte'] == '03']
+    if not ccf:
+        return {}
+    ids_propios = set(
+        Cliente.objects.filter(empresa=empresa, pk__in=[f['cliente_id'] for _, f in ccf if f.get('cliente_id')])
+        .values_list('id', flat=True)
+    )
+    resultado, por_nrc = {}, defaultdict(list)
+    for i, fila in ccf:
+        if fila.get('cliente_id') in ids_propios:
+            resultado[i] = fila['cliente_id']
+        else:
+            por_nrc[normalizar_nrc_mh(str(fila.get('cliente') or ''))].append(i)
+    if not por_nrc:
+        return resultado
+
+    existentes = {}
+    for cliente_id, nrc in Cliente.objects.filter(empresa=empresa, nrc__in=list(por_nrc)).order_by('id').values_list('id', 'nrc'):
+        existentes.setdefault(nrc, cliente_id)
+    nuevos = []
+    for nrc, indices in por_nrc.items():
+        if nrc in existentes:
+            continue
+        fila = filas[indices[0]]
+        tipo_doc, digitos = _documento(fila)
+        nuevos.append(Cliente(
+            empresa=empresa,
+            nrc=nrc,
+            nombre=_texto(fila, 'nombre_receptor', 200) or f'Cliente {nrc}',
+            nombre_comercial=_texto(fila, 'nombre_comercial', 200),
+            tipo_documento=tipo_doc,
+            documento_identidad=digitos,
+            nit=digitos if tipo_doc == 'NIT' else None,
+            dui=digitos if tipo_doc == 'DUI' else None,
+            direccion=_texto(fila, 'direccion', 500),
+            email_contacto=_texto(fila, 'correo', 254),
+            cod_actividad=_texto(fila, 'cod_actividad', 6),
+            desc_actividad=_texto(fila, 'desc_actividad', 150),
+            departamento=(_texto(fila, 'departamento', 2) or '06'),
+            municipio=(_texto(fila, 'municipio', 2) or '14'),
+            distrito=(_texto(fila, 'municipio', 2) or '14'),
+            telefono=_texto(fila, 'telefono', 20),
+        ))
+    if nuevos:
+        with transaction.atomic():
+            for cliente in Cliente.objects.bulk_create(nuevos):
+                existentes[cliente.nrc] = cliente.id
+    for nrc, indices in por_nrc.items():
+        for i in indices:
+            resultado[i] = existentes[nrc]
+    return resultado
+
+
+def _detalles(fila: Dict[str, Any], productos: Dict[int, Producto]) -> List[DetalleVenta]:
+    """Líneas de la venta (sin guardar) con los montos que calcula el flujo de una factura."""
+    es_cf = fila['tipo_dte'] == '01'
+    detalles = []
+    for numero, item in enumerate(_items(fila), start=1):
+        cantidad = _dinero(Decimal(str(item.get('cantidad') or 1))) or CENTAVOS
+        precio = Decimal(str(item.get('precio_unitario') or 0))
+        if es_cf:
+            # Precio con IVA incluido: gravado = total / 1.13
+            total = _dinero(cantidad * precio)
+            gravada = _dinero(total / Decimal('1.13'))
+            iva = total - gravada
+            precio_unitario = _dinero(gravada / cantidad)
+        else:
+            gravada = _dinero(cantidad * precio)
+            iva = _dinero(gravada * IVA)
+            precio_unitario = _dinero(precio)
+        producto = productos.get(item.get('producto_id'))
+        descripcion = str(item.get('producto') or '').strip()
+        detalles.append(DetalleVenta(
+            producto=producto,
+            descripcion_libre=(descripcion or (producto.descripcion if producto else 'Item sin producto'))[:1000],
+            codigo_libre=None if producto else 'LIBRE',
+            numero_item=numero,
+            cantidad=cantidad,
+            precio_unitario=precio_unitario,
+            monto_descuento=Decimal('0.00'),
+            venta_no_sujeta=Decimal('0.00'),
+            venta_exenta=Decimal('0.00'),
+            venta_gravada=gravada,
+            iva_item=iva,
+        ))
+    return detalles
+
+
+def _venta(empresa, fila: Dict[str, Any], cliente_id: Optional[int], estado_dte: str, detalles) -> Venta:
+    tipo = fila['tipo_dte']
+    fecha = _fecha(fila)
+    venta = Venta(
+        empresa=empresa,
+        cliente_id=cliente_id,
+        fecha_emision=fecha,
+        periodo_aplicado=fecha.strftime('%Y-%m'),
+        tipo_venta=TIPO_VENTA_POR_DTE[tipo],
+        clase_documento='4',
+        clasificacion_venta='1',
+        tipo_ingreso='3',
+        condicion_operacion=1,
+        codigo_generacion=str(uuid.uuid4()).upper(),
+        estado_dte=estado_dte,
+        ambiente_emision=empresa.ambiente or '01',
+        direccion_receptor=_texto(fila, 'direccion', 500),
+        correo_receptor=_texto(fila, 'correo', 200),
+        nombre_comercial_receptor=_texto(fila, 'nombre_comercial', 200),
+        departamento_receptor=_texto(fila, 'departamento', 2),
+        municipio_receptor=_texto(fila, 'municipio', 2),
+        distrito_receptor=_texto(fila, 'municipio', 2),
+        cod_actividad_receptor=_texto(fila, 'cod_actividad', 20),
+        desc_actividad_receptor=_texto(fila, 'desc_actividad', 250),
+        venta_gravada=sum((d.venta_gravada for d in detalles), Decimal('0.00')),
+        debito_fiscal=sum((d.iva_item for d in detalles), Decimal('0.00')),
+    )
+    if tipo == '01':
+        venta.nombre_receptor = _texto(fila, 'nombre_receptor', 200) or 'Consumidor Final'
+        venta.documento_receptor = _texto(fila, 'documento_receptor', 50)
+        venta.tipo_doc_receptor = 'NIT' if venta.documento_receptor else None
+    else:
+        tipo_doc, digitos = _documento(fila)
+        venta.nombre_receptor = _texto(fila, 'nombre_receptor', 200) or _texto(fila, 'cliente', 200)
+        venta.nrc_receptor = normalizar_nrc_mh(str(fila.get('cliente') or '')) or None
+        venta.documento_receptor = digitos
+        venta.tipo_doc_receptor = tipo_doc
+    return venta
+
+
+def _motivo_reserva(job: JobCargaMasiva) -> str:
+    return f'Carga masiva job {job.id}'
+
+
+def _cerrar_reservas_abiertas(job: JobCargaMasiva) -> None:
+    """Reservas que un proceso interrumpido dejó abiertas: se cierran con las ventas que sí quedaron."""
+    for reserva in ReservaCorrelativo.objects.filter(
+        empresa_id=job.empresa_id, estado='Reservada', motivo=_motivo_reserva(job),
+    ):
+        numeros = CorrelativoDTE.numeros_de_reserva(reserva)
+        usados = Venta.objects.filter(empresa_id=job.empresa_id, numero_control__in=numeros)
+        CorrelativoDTE.cerrar_reserva(reserva, usados.values_list('numero_control', flat=True))
+
+
+def _crear_bloque(job, filas, clientes, productos, estado_dte: str, inicio: int) -> List[Dict[str, Any]]:
+    """
+    Crea las ventas de un bloque de filas en una transacción y devuelve su resultado por fila.
+    El progreso del job se guarda en la misma transacción (reanudar no repite el bloque).
+    """
+    empresa = job.empresa
+    ventas, detalles = [], []
+    for i, fila in enumerate(filas, start=inicio):
+        lineas = _detalles(fila, productos)
+        ventas.append(_venta(empresa, fila, clientes.get(i), estado_dte, lineas))
+        detalles.append(lineas)
+    # Una reserva de correlativos por tipo DTE para todo el bloque, confirmada antes de guardar
+    # las ventas para no bloquear el Correlativo durante los INSERT
+    por_tipo = defaultdict(list)
+    for venta in ventas:
+        por_tipo[venta.tipo_venta].append(venta)
+    reservas = []
+    try:
+        for tipo_venta, grupo in por_tipo.items():
+            tipo_dte = '01' if tipo_venta == 'CF' else '03'
+            reserva = CorrelativoDTE.reservar_bloque(empresa.id, tipo_dte, len(grupo), motivo=_motivo_reserva(job))
+            reservas.append(reserva)
+            for venta, numero in zip(grupo, CorrelativoDTE.numeros_de_reserva(reserva)):
+                venta.numero_control = numero
+        with transaction.atomic():
+            Venta.objects.bulk_create(ventas)
+            for venta, lineas in zip(ventas, detalles):
+                for linea in lineas:
+                    linea.venta = venta
+            DetalleVenta.objects.bulk_create([linea for lineas in detalles for linea in lineas])
+            if estado_dte == 'Generado':
+                from ..tasks import notificar_tareas_encoladas
+
+                TareaFacturacion.objects.bulk_create([TareaFacturacion(venta=venta) for venta in ventas])
+                notificar_tareas_encoladas()
+            creadas = [
+                {"_fila": fila.get('_fila'), "venta_id": venta.id, "numero_control": venta.numero_control}
+                for fila, venta in zip(filas, ventas)
+            ]
+            JobCargaMasiva.objects.filter(pk=job.pk).update(
+                resultados=job.resultados + creadas,
+                creadas=job.creadas + len(creadas),
+                venta_ids=job.venta_ids + [v.id for v in ventas],
+                mensaje=f'{job.creadas + len(creadas)} de {job.total} facturas creadas.',
+                actualizado_at=timezone.now(),
+            )
+    except Exception:
+        # Ninguna venta del bloque quedó guardada: se devuelven los números (o quedan como huecos)
+        for reserva in reservas:
+            CorrelativoDTE.cerrar_reserva(reserva)
+        raise
+    for reserva in reservas:
+        CorrelativoDTE.cerrar_reserva(reserva, CorrelativoDTE.numeros_de_reserva(reserva))
+    return creadas
+
+
+def ejecutar_job_carga_masiva(job_id: int) -> JobCargaMasiva:
+    """
+    Crea y encola las ventas del job por bloques, guardando el progreso tras cada bloque.
+    Las filas que ya tienen resultado (job reanudado) se saltan.
+    """
+    if not tomar_job(JobCargaMasiva, job_id):
+        # Ya lo ejecuta otro hilo/proceso, o terminó
+        return JobCargaMasiva.objects.get(pk=job_id)
+    with latido(JobCargaMasiva, job_id):
+        return _ejecutar(JobCargaMasiva.objects.select_related('empresa').get(pk=job_id))
+
+
+def _ejecutar(job: JobCargaMasiva) -> JobCargaMasiva:
+    from ..tasks import disparar_procesamiento_cola
+
+    empresa = job.empresa
+    _cerrar_reservas_abiertas(job)
+    hechas = {r.get('_fila') for r in job.resultados}
+    validas = []
+    for fila in job.filas:
+        if fila.get('_fila') in hechas:
+            continue
+        error = _error_fila(fila)
+        if error:
+            job.resultados.append({"_fila": fila.get('_fila'), "error": error})
+            job.errores += 1
+        else:
+            validas.append(fila)
+    job.save(update_fields=['resultados', 'errores', 'actualizado_at'])
+
+    clientes = _resolver_clientes(empresa, validas)
+    producto_ids = {item.get('producto_id') for fila in validas for item in _items(fila) if item.get('producto_id')}
+    productos = Producto.objects.filter(empresa=empresa, pk__in=producto_ids).in_bulk() if producto_ids else {}
+    # En contingencia no se encolan: quedan para el cierre de contingencia (como crear-con-detalles)
+    estado_dte = 'PendienteEnvio' if empresa.contingencia_activa else 'Generado'
+
+    tamano = max(1, int(getattr(settings, 'CARGA_MASIVA_FILAS_POR_TRANSACCION', 250)))
+    for inicio in range(0, len(validas), tamano):
+        bloque = validas[inicio:inicio + tamano]
+        try:
+            creadas = _crear_bloque(job, bloque, clientes, productos, estado_dte, inicio)
+        except Exception as e:
+            logger.exception('Carga masiva job %s: error creando filas %s-%s', job.id, inicio, inicio + len(bloque))
+            job.resultados.extend({"_fila": f.get('_fila'), "error": f'No se pudo crear la venta: {e}'} for f in bloque)
+            job.errores += len(bloque)
+            job.save(update_fields=['resultados', 'errores', 'actualizado_at'])
+        else:
+            job.resultados.extend(creadas)
+            job.creadas += len(creadas)
+            job.venta_ids.extend(r['venta_id'] for r in creadas)
+
+    job.estado = 'Completado' if job.creadas or not job.total else 'Error'
+    if estado_dte == 'PendienteEnvio':
+        job.mensaje = f'{job.creadas} facturas registradas en contingencia; se enviarán a MH al desactivarla.'
+    else:
+        job.mensaje = f'{job.creadas} facturas creadas y en cola de envío a Hacienda.'
+    if job.errores:
+        job.mensaje += f' {job.errores} filas con error.'
+    job.finalizado_at = timezone.now()
+    job.save(update_fields=[
+        'resultados', 'errores', 'estado', 'mensaje', 'finalizado_at', 'actualizado_at',
+    ])
+    if job.venta_ids and estado_dte == 'Generado':
+        disparar_procesamiento_cola(limite=len(job.venta_ids))
+    return job
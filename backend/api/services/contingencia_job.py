@@ -0,0 +1,256 @@
+"""
+Cierre de contingencia en segundo plano (EmpresaViewSet.procesar_contingencia_completa).
+
+1) Genera y envía a MH el evento de contingencia (F05).
+2) Si MH lo recibe, retransmite las ventas PendienteEnvio en paralelo
+   (CONTINGENCIA_HILOS hilos, MH_RATE_LIMIT_POR_SEGUNDO por empresa), o con
+   MH_LOTE_HABILITADO en lotes de recepcionlote (ver mh_lote).
+3) El progreso (aceptadas / rechazadas / errores / pendientes) queda en JobContingencia.
+
+Solo hay un job activo por empresa (el endpoint responde 409 si ya hay uno). Un job que quedó
+activo porque su proceso se reinició se marca Error (ver jobs_segundo_plano); sus ventas sin
+enviar siguen en PendienteEnvio y se incluyen al volver a lanzar el cierre.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from ..models import JobContingencia, Venta
+from ..utils.contingencia import generar_reporte_contingencia
+from . import mh_lote
+from .jobs_segundo_plano import ESTADOS_ACTIVOS, interrumpidos, latido, tomar_job
+from .mh_rate_limit import limitador_empresa
+
+logger = logging.getLogger(__name__)
+
+
+def job_contingencia_dict(job: JobContingencia) -> Dict[str, Any]:
+    """Respuesta del endpoint de progreso (mismo formato final que el antiguo cierre síncrono)."""
+    return {
+        "job_id": job.id,
+        "empresa_id": job.empresa_id,
+        "estado": job.estado,
+        "mensaje": job.mensaje,
+        "total": job.total,
+        "aceptadas": job.aceptadas,
+        "rechazadas": job.rechazadas,
+        "errores": job.errores,
+        "pendientes": job.pendientes,
+        "ventas_procesadas": job.venta_ids,
+        "ventas_excluidas": job.ventas_excluidas,
+        "reporte_contingencia": job.reporte_contingencia,
+        "resultado_contingencia": job.resultado_contingencia,
+        "resumen_envio": {
+            "total": job.total,
+            "aceptadas": job.aceptadas,
+            "rechazadas": job.rechazadas,
+            "errores": job.errores,
+            "detalles": job.detalles,
+        },
+        "creado_at": job.creado_at,
+        "finalizado_at": job.finalizado_at,
+    }
+
+
+def cerrar_jobs_interrumpidos(empresa_id: int) -> int:
+    """Marca Error los jobs activos de la empresa cuyo proceso dejó de dar latido."""
+    return interrumpidos(JobContingencia.objects.filter(empresa_id=empresa_id)).update(
+        estado='Error',
+        mensaje='Proceso interrumpido (reinicio del servidor). Las ventas sin enviar siguen en '
+                'PendienteEnvio: vuelva a procesar la contingencia.',
+        finalizado_at=timezone.now(),
+    )
+
+
+def job_contingencia_activo(empresa_id: int):
+    """Job EnCola/Procesando de la empresa (tras cerrar los interrumpidos), o None."""
+    cerrar_jobs_interrumpidos(empresa_id)
+    return JobContingencia.objects.filter(empresa_id=empresa_id, estado__in=ESTADOS_ACTIVOS).first()
+
+
+def iniciar_job_contingencia(job: JobContingencia) -> None:
+    """Lanza el job en un hilo tras el commit (mismo patrón que encolar_y_disparar_facturacion)."""
+    from ..tasks import _disparar_en_hilo
+
+    job_id = job.id
+
+    def _run():
+        close_old_connections()
+        try:
+            ejecutar_job_contingencia(job_id)
+        except Exception:
+            logger.exception('Error en job de contingencia %s', job_id)
+            JobContingencia.objects.filter(pk=job_id).update(
+                estado='Error', mensaje='Error inesperado procesando la contingencia.',
+                finalizado_at=timezone.now(),
+            )
+        finally:
+            close_old_connections()
+
+    transaction.on_commit(lambda: _disparar_en_hilo(_run))
+
+
+def _enviar_venta(venta_id: int, empresa_id: int) -> Dict[str, Any]:
+    """Firma y transmite una venta (se ejecuta en un hilo del pool)."""
+    from .facturacion_service import FacturacionService, FacturacionServiceError
+
+    close_old_connections()
+    try:
+        venta = (
+            Venta.objects.select_related('empresa', 'cliente')
+            .prefetch_related('detalles__producto')
+            .get(pk=venta_id)
+        )
+        limitador_empresa(empresa_id).adquirir()
+        try:
+            resultado = FacturacionService(venta.empresa).procesar_factura(venta)
+        except FacturacionServiceError as e:
+            venta.refresh_from_db()
+            return {"venta_id": venta.id, "estado_dte": venta.estado_dte, "mensaje": str(e), "_tipo": "error"}
+        aceptado = resultado.get("exito") and venta.estado_dte == "AceptadoMH"
+        return {
+            "venta_id": venta.id,
+            "estado_dte": venta.estado_dte,
+            "mensaje": resultado.get("mensaje"),
+            "codigo_generacion": resultado.get("codigo_generacion"),
+            "numero_control": resultado.get("numero_control"),
+            "_tipo": "aceptada" if aceptado else "rechazada",
+        }
+    except Exception as e:
+        logger.exception('Error reenviando venta %s en contingencia', venta_id)
+        estado = Venta.objects.filter(pk=venta_id).values_list('estado_dte', flat=True).first()
+        return {"venta_id": venta_id, "estado_dte": estado, "mensaje": f"Error inesperado: {str(e)}", "_tipo": "error"}
+    finally:
+        close_old_connections()
+
+
+def ejecutar_job_contingencia(job_id: int) -> JobContingencia:
+    """Ejecuta el cierre de contingencia completo y va guardando el progreso en el job."""
+    if not tomar_job(JobContingencia, job_id):
+        # Ya lo ejecuta otro hilo/proceso, o terminó / se marcó interrumpido
+        return JobContingencia.objects.get(pk=job_id)
+    with latido(JobContingencia, job_id):
+        return _ejecutar(JobContingencia.objects.select_related('empresa').get(pk=job_id))
+
+
+def _ejecutar(job: JobContingencia) -> JobContingencia:
+    from .facturacion_service import EnvioMHError, FacturacionService, FacturacionServiceError
+
+    empresa = job.empresa
+    ventas = list(
+        Venta.objects.filter(empresa=empresa, estado_dte='PendienteEnvio', id__in=job.venta_ids)
+        .order_by('fecha_emision', 'id')
+    )
+    if not ventas:
+        job.estado = 'Completado'
+        job.mensaje = 'No hay ventas en estado PendienteEnvio para procesar.'
+        job.finalizado_at = timezone.now()
+        job.save(update_fields=['estado', 'mensaje', 'finalizado_at', 'actualizado_at'])
+        return job
+
+    now_sv = timezone.localtime(timezone.now())
+    # Ambiente del evento: mismo mapeo que para DTE (DTE_AMBIENTE_CODE).
+    servicio = FacturacionService(empresa)
+    ambiente_mh = servicio.DTE_AMBIENTE_CODE.get(servicio.codigo_ambiente_mh, servicio.codigo_ambiente_mh)
+
+    if empresa.contingencia_f_inicio and empresa.contingencia_h_inicio:
+        f_inicio_dt = datetime.combine(
+            empresa.contingencia_f_inicio,
+            empresa.contingencia_h_inicio,
+            tzinfo=timezone.get_current_timezone(),
+        )
+    else:
+        f_inicio_dt = datetime.combine(
+            ventas[0].fecha_emision,
+            now_sv.time().replace(microsecond=0),
+            tzinfo=timezone.get_current_timezone(),
+        )
+
+    # 1) Generar y enviar el evento de contingencia
+    reporte_json = generar_reporte_contingencia(
+        empresa=empresa,
+        ventas=ventas,
+        ambiente_mh=ambiente_mh,
+        f_inicio=f_inicio_dt,
+        f_fin=now_sv,
+        tipo_contingencia=int(job.tipo_contingencia or 1),
+        motivo=job.motivo,
+        nombre_responsable=None,
+        tipo_doc_responsable=None,
+        numero_doc_responsable=None,
+    )
+    job.reporte_contingencia = reporte_json
+    job.total = len(ventas)
+    job.venta_ids = [v.id for v in ventas]
+
+    try:
+        resultado_cont = servicio.enviar_evento_contingencia(reporte_json)
+    except (EnvioMHError, FacturacionServiceError) as e:
+        job.estado = 'Error'
+        job.mensaje = f"Error al enviar el evento de contingencia a MH: {str(e)}"[:500]
+        job.finalizado_at = timezone.now()
+        job.save()
+        return job
+
+    job.resultado_contingencia = resultado_cont
+    if (resultado_cont or {}).get("estado") != "RECIBIDO":
+        job.estado = 'Error'
+        job.mensaje = "MH no recibió el evento de contingencia."
+        job.finalizado_at = timezone.now()
+        job.save()
+        return job
+    job.save()
+
+    # 2) Reenviar las ventas en paralelo, limitado por empresa
+    lock = threading.Lock()
+
+    def _registrar(detalle: Dict[str, Any]) -> None:
+        tipo = detalle.pop("_tipo")
+        with lock:
+            if tipo == "aceptada":
+                job.aceptadas += 1
+            elif tipo == "rechazada":
+                job.rechazadas += 1
+            elif tipo == "error":
+                job.errores += 1
+            # "pendiente": lote recibido por MH sin resultado aún (queda en job.pendientes)
+            job.detalles.append(detalle)
+            job.save(update_fields=['aceptadas', 'rechazadas', 'errores', 'detalles', 'actualizado_at'])
+
+    if mh_lote.habilitado() and len(ventas) > 1:
+        resultados = mh_lote.transmitir_ventas([v.id for v in ventas])
+        for venta in ventas:
+            _registrar(resultados[venta.id])
+    else:
+        hilos = max(1, int(getattr(settings, 'CONTINGENCIA_HILOS', 4)))
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='contingencia') as pool:
+            for detalle in pool.map(lambda v: _enviar_venta(v.id, empresa.id), ventas):
+                _registrar(detalle)
+
+    empresa.refresh_from_db()
+    empresa.contingencia_activa = False
+    empresa.contingencia_f_fin = now_sv.date()
+    empresa.contingencia_h_fin = now_sv.time().replace(microsecond=0)
+    empresa.save(update_fields=[
+        'contingencia_activa',
+        'contingencia_f_fin',
+        'contingencia_h_fin',
+    ])
+
+    job.estado = 'Completado'
+    job.mensaje = "Proceso de contingencia completado."
+    if job.pendientes:
+        job.mensaje += f" {job.pendientes} ventas esperan el resultado de su lote en MH."
+    job.finalizado_at = timezone.now()
+    job.save(update_fields=['estado', 'mensaje', 'finalizado_at', 'actualizado_at'])
+    logger.info(
+        'Contingencia empresa %s: %s aceptadas, %s rechazadas, %s errores',
+        empresa.id, job.aceptadas, job.rechazadas, job.errores,
+    )
+    return job
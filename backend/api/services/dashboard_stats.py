@@ -0,0 +1,108 @@
+"""
+KPIs del dashboard (ventas procesadas del mes) calculados en la base de datos y cacheados.
+
+- Una sola consulta agrupada por fecha_emision da el total del mes, la cantidad de DTE,
+  las ventas de hoy y la serie por día (≤ 31 filas en vez de recorrer cada venta en Python).
+- El resultado se guarda en la caché de Django por (empresas, ambiente, día) durante
+  DASHBOARD_STATS_CACHE_SECONDS (0 = sin caché).
+- invalidar_dashboard_stats() sube la versión de la empresa cuando una venta queda AceptadoMH,
+  así la próxima lectura recalcula. Con la caché local por proceso (LocMemCache) la invalidación
+  solo alcanza al proceso que transmitió; en los demás el TTL corto acota el desfase.
+"""
+import calendar
+import hashlib
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Sum
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_PROCESADOS = ('AceptadoMH', 'Enviado')
+
+# Total a pagar por venta (mismo cálculo que views._total_pagar_venta).
+_TOTAL_PAGAR = Sum(
+    F('venta_gravada') + F('venta_exenta') + F('venta_no_sujeta') + F('debito_fiscal')
+    - F('iva_retenido_1') - F('iva_retenido_2'),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+def _ttl() -> int:
+    return int(getattr(settings, 'DASHBOARD_STATS_CACHE_SECONDS', 60))
+
+
+def _clave_version(empresa_id) -> str:
+    return f'dashboard_stats:version:{empresa_id}'
+
+
+def _clave_cache(empresa_ids: Iterable[int], ambiente: Optional[str], hoy: date) -> str:
+    ids = sorted(int(e) for e in empresa_ids)
+    versiones = cache.get_many([_clave_version(e) for e in ids])
+    partes = [hoy.isoformat(), ambiente or '*']
+    partes += [f'{e}.{versiones.get(_clave_version(e), 0)}' for e in ids]
+    return 'dashboard_stats:' + hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+def calcular_resumen_mes(empresa_ids: Iterable[int], ambiente: Optional[str], hoy: date) -> Dict:
+    """total_ventas_mes, cantidad_dtes_mes, ventas_hoy y ventas_por_dia con una consulta agregada."""
+    from ..models import Venta
+
+    _, ultimo_dia = calendar.monthrange(hoy.year, hoy.month)
+    qs = Venta.objects.filter(
+        empresa_id__in=list(empresa_ids),
+        estado_dte__in=ESTADOS_PROCESADOS,
+        fecha_emision__gte=date(hoy.year, hoy.month, 1),
+        fecha_emision__lte=date(hoy.year, hoy.month, ultimo_dia),
+    )
+    if ambiente:
+        qs = qs.filter(ambiente_emision=ambiente)
+    filas = qs.order_by().values('fecha_emision').annotate(total=_TOTAL_PAGAR, cantidad=Count('id'))
+
+    por_dia = {d: Decimal('0.00') for d in range(1, ultimo_dia + 1)}
+    cantidad = 0
+    for fila in filas:
+        por_dia[fila['fecha_emision'].day] += Decimal(str(fila['total'] or 0))
+        cantidad += fila['cantidad']
+
+    return {
+        "total_ventas_mes": round(float(sum(por_dia.values())), 2),
+        "cantidad_dtes_mes": cantidad,
+        "ventas_hoy": round(float(por_dia[hoy.day]), 2),
+        "ventas_por_dia": [
+            {"dia": f"{d:02d}", "total": round(float(por_dia[d]), 2)}
+            for d in range(1, ultimo_dia + 1)
+        ],
+    }
+
+
+def resumen_mes(empresa_ids: Iterable[int], ambiente: Optional[str], hoy: date) -> Dict:
+    """calcular_resumen_mes con caché de TTL corto."""
+    empresa_ids = list(empresa_ids)
+    ttl = _ttl()
+    if ttl <= 0:
+        return calcular_resumen_mes(empresa_ids, ambiente, hoy)
+    clave = _clave_cache(empresa_ids, ambiente, hoy)
+    resumen = cache.get(clave)
+    if resumen is None:
+        resumen = calcular_resumen_mes(empresa_ids, ambiente, hoy)
+        cache.set(clave, resumen, ttl)
+    return resumen
+
+
+def invalidar_dashboard_stats(empresa_id) -> None:
+    """Descarta los KPIs cacheados de la empresa (p. ej. una venta pasó a AceptadoMH)."""
+    if empresa_id is None:
+        return
+    clave = _clave_version(empresa_id)
+    try:
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.set(clave, 1, None)
+    except Exception as e:
+        logger.warning('No se pudo invalidar el dashboard de la empresa %s: %s', empresa_id, e)
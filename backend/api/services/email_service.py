@@ -19,7 +19,7 @@ from email.mime.base import MIMEBase
 from email import encoders
 
 from ..dte_generator import DTEGenerator
-from ..utils.pdf_generator import generar_pdf_venta
+from ..utils.pdf_cache import obtener_pdf_venta
 
 logger = logging.getLogger(__name__)
 
@@ -173,8 +173,7 @@ def enviar_factura_email(
 
     # Generar PDF
     try:
-        pdf_buffer = generar_pdf_venta(venta)
-        pdf_bytes = pdf_buffer.getvalue() if hasattr(pdf_buffer, 'getvalue') else pdf_buffer.read()
+        pdf_bytes = obtener_pdf_venta(venta).contenido
     except Exception as e:
         logger.error(f"Error generando PDF para venta {venta.id}: {e}")
         return False
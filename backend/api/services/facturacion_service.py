@@ -6,16 +6,22 @@ Reemplaza el script legacy enviar_factura_final.py con una implementación orien
 """
 import json
 import logging
+import uuid
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlsplit
 
 import requests
 from django.conf import settings
+from django.db import transaction
 
 from ..firmador_interno import firmar_dte_interno
 from ..models import Empresa, Venta
 from ..utils.builders import generar_dte
 from ..utils.mh_schema_validator import MhSchemaValidationError, validar_dte_contra_schema
+from . import http_pool
+from .dashboard_stats import invalidar_dashboard_stats
+from .mh_token_cache import invalidar_token, obtener_token_cacheado
 
 logger = logging.getLogger(__name__)
 
@@ -116,12 +122,16 @@ class FacturacionService:
             'recepcion': 'https://api.dtes.mh.gob.sv/fesv/recepciondte',
             'anulardte': 'https://api.dtes.mh.gob.sv/fesv/anulardte',
             'contingencia': 'https://api.dtes.mh.gob.sv/fesv/contingencia',
+            'recepcionlote': 'https://api.dtes.mh.gob.sv/fesv/recepcionlote/',
+            'consultadtelote': 'https://api.dtes.mh.gob.sv/fesv/recepcion/consultadtelote/',
         },
         '01': {  # Pruebas
             'auth': 'https://apitest.dtes.mh.gob.sv/seguridad/auth',
             'recepcion': 'https://apitest.dtes.mh.gob.sv/fesv/recepciondte',
             'anulardte': 'https://apitest.dtes.mh.gob.sv/fesv/anulardte',
             'contingencia': 'https://apitest.dtes.mh.gob.sv/fesv/contingencia',
+            'recepcionlote': 'https://apitest.dtes.mh.gob.sv/fesv/recepcionlote/',
+            'consultadtelote': 'https://apitest.dtes.mh.gob.sv/fesv/recepcion/consultadtelote/',
         }
     }
 
@@ -163,10 +173,17 @@ class FacturacionService:
             ambiente = '01'
         
         self.ambiente = ambiente
-        self.url_auth = self.URLS_MH[ambiente]['auth']
-        self.url_recepcion = self.URLS_MH[ambiente]['recepcion']
-        self.url_anulardte = self.URLS_MH[ambiente]['anulardte']
-        self.url_contingencia = self.URLS_MH[ambiente]['contingencia']
+        urls = self.URLS_MH[ambiente]
+        # MH_URL_BASE (p. ej. simulador_mh local): mismas rutas, otro host
+        base_local = (getattr(settings, 'MH_URL_BASE', '') or '').rstrip('/')
+        if base_local:
+            urls = {clave: base_local + urlsplit(url).path for clave, url in urls.items()}
+        self.url_auth = urls['auth']
+        self.url_recepcion = urls['recepcion']
+        self.url_anulardte = urls['anulardte']
+        self.url_contingencia = urls['contingencia']
+        self.url_recepcion_lote = urls['recepcionlote']
+        self.url_consulta_lote = urls['consultadtelote']
         
         # El código de ambiente MH es el mismo que el valor del campo (ya viene como '00' o '01')
         self.codigo_ambiente_mh = ambiente
@@ -182,16 +199,64 @@ class FacturacionService:
         nit_emisor = (self.empresa.nit or self.empresa.nrc or "").replace('-', '').replace(' ', '')
         return nit_emisor or "000000000"
     
-    def obtener_token(self) -> Optional[str]:
+    def obtener_token(self, usar_cache: bool = True) -> Optional[str]:
         """
         Obtiene el token de autenticación del Ministerio de Hacienda.
-        
+
+        Por defecto reutiliza el token compartido en TokenMH (ver mh_token_cache) y solo
+        llama a /seguridad/auth cuando no hay uno vigente.
+
+        Args:
+            usar_cache: False fuerza un POST a /seguridad/auth (p. ej. probar credenciales)
+
         Returns:
             Token de autenticación o None si falla
             
         Raises:
             AutenticacionMHError: Si hay un error en la autenticación
         """
+        if not usar_cache:
+            return self._autenticar_mh()
+        user = (self.empresa.user_api_mh or '').strip()
+        return obtener_token_cacheado(self.empresa.pk, self.ambiente, user, self._autenticar_mh)
+
+    def invalidar_token(self, token_rechazado: Optional[str] = None) -> None:
+        """Descarta el token cacheado (MH respondió 401)."""
+        user = (self.empresa.user_api_mh or '').strip()
+        invalidar_token(self.empresa.pk, self.ambiente, user, token_rechazado)
+
+    def _post_mh(self, url: str, payload: Dict[str, Any], token: str, timeout: int = 60) -> requests.Response:
+        """
+        POST autenticado a MH por la conexión persistente (http_pool). Si MH responde 401 (token
+        vencido o revocado), invalida el token cacheado y reintenta una sola vez con uno nuevo.
+        ``timeout`` es el de lectura; el de conexión es HTTP_CONNECT_TIMEOUT_SEGUNDOS.
+        """
+        headers = {
+            "Authorization": token,
+            "Content-Type": "application/json",
+            "User-Agent": "Mozilla/5.0",
+        }
+        resp = http_pool.post(http_pool.MH, url, json=payload, headers=headers, timeout_lectura=timeout)
+        if resp.status_code != 401:
+            return resp
+        logger.warning("MH respondió 401 en %s: se renueva el token y se reintenta", url)
+        self.invalidar_token(token)
+        headers["Authorization"] = self.obtener_token()
+        return http_pool.post(http_pool.MH, url, json=payload, headers=headers, timeout_lectura=timeout)
+
+    def _get_mh(self, url: str, token: str, timeout: int = 60) -> requests.Response:
+        """GET autenticado a MH (consultas); ante un 401 renueva el token y reintenta una vez."""
+        headers = {"Authorization": token, "User-Agent": "Mozilla/5.0"}
+        resp = http_pool.get(http_pool.MH, url, headers=headers, timeout_lectura=timeout)
+        if resp.status_code != 401:
+            return resp
+        logger.warning("MH respondió 401 en %s: se renueva el token y se reintenta", url)
+        self.invalidar_token(token)
+        headers["Authorization"] = self.obtener_token()
+        return http_pool.get(http_pool.MH, url, headers=headers, timeout_lectura=timeout)
+
+    def _autenticar_mh(self) -> str:
+        """POST a /seguridad/auth con las credenciales de la empresa (sin caché)."""
         user = (self.empresa.user_api_mh or '').strip()
         pwd = (self.empresa.clave_api_mh or '').strip()
         # PRUEBA: si MH_PASSWORD_OVERRIDE está definido, usa ese valor para validar (ej: espacio en BD)
@@ -214,7 +279,7 @@ class FacturacionService:
         
         try:
             logger.info(f"Autenticando con MH en {self.url_auth}...")
-            resp = requests.post(self.url_auth, data=payload, headers=headers, timeout=30)
+            resp = http_pool.post(http_pool.MH, self.url_auth, data=payload, headers=headers, timeout_lectura=30)
             
             if resp.status_code == 200:
                 datos = resp.json()
@@ -297,7 +362,9 @@ class FacturacionService:
 
         try:
             logger.info(f"Firmando documento DTE con firmador en {self.URL_FIRMADOR}...")
-            resp = requests.post(self.URL_FIRMADOR, json=payload, headers=headers, timeout=60)
+            resp = http_pool.post(
+                http_pool.FIRMADOR, self.URL_FIRMADOR, json=payload, headers=headers, timeout_lectura=60,
+            )
             
             if resp.status_code == 200:
                 datos = resp.json()
@@ -359,15 +426,10 @@ class FacturacionService:
             "nit": nit_emisor,
             "documento": evento_firmado,
         }
-        headers = {
-            "Authorization": token,
-            "Content-Type": "application/json",
-            "User-Agent": "Mozilla/5.0",
-        }
 
         try:
             logger.info(f"Enviando evento de contingencia a {self.url_contingencia} para NIT {nit_emisor}...")
-            resp = requests.post(self.url_contingencia, json=payload, headers=headers, timeout=60)
+            resp = self._post_mh(self.url_contingencia, payload, token, timeout=60)
             logger.info(f"📡 Respuesta Contingencia MH: {resp.status_code}")
 
             datos = {}
@@ -404,6 +466,8 @@ class FacturacionService:
             error_msg = f"Error de conexión enviando contingencia a MH: {str(e)}"
             logger.error("❌ Error conexión contingencia MH: %s", error_msg, exc_info=True)
             raise EnvioMHTransitorioError(error_msg) from e
+        except (AutenticacionMHError, EnvioMHError):
+            raise
         except Exception as e:
             error_msg = f"Error inesperado enviando contingencia a MH: {str(e)}"
             logger.error("❌ Error inesperado contingencia MH: %s", error_msg, exc_info=True)
@@ -450,15 +514,9 @@ class FacturacionService:
             "codigoGeneracion": codigo_upper
         }
         
-        headers_mh = {
-            "Authorization": token,  # Token Bearer
-            "Content-Type": "application/json",
-            "User-Agent": "Mozilla/5.0"
-        }
-        
         try:
             logger.info(f"Enviando DTE a MH en {self.url_recepcion} (ambiente: {self.empresa.ambiente})...")
-            resp = requests.post(self.url_recepcion, json=envio_mh, headers=headers_mh, timeout=60)
+            resp = self._post_mh(self.url_recepcion, envio_mh, token, timeout=60)
             
             logger.info(f"📡 Respuesta Servidor: {resp.status_code}")
             
@@ -525,15 +583,208 @@ class FacturacionService:
             error_msg = f"Error de conexión enviando a MH: {str(e)}"
             logger.error("❌ Error Conexión MH: %s", error_msg, exc_info=True)
             raise EnvioMHTransitorioError(error_msg) from e
-        except EnvioMHError:
-            raise
-        except EnvioMHTransitorioError:
+        except (AutenticacionMHError, EnvioMHError):
             raise
         except Exception as e:
             error_msg = f"Error inesperado enviando a MH: {str(e)}"
             logger.error("❌ Error inesperado enviando a MH: %s", error_msg, exc_info=True)
             raise EnvioMHError(error_msg) from e
     
+    # Versión del envelope de recepcionlote (cada documento conserva la versión de su tipo DTE)
+    VERSION_LOTE = 2
+
+    @staticmethod
+    def _json_respuesta_lote(resp: requests.Response, operacion: str) -> Dict[str, Any]:
+        """JSON de una respuesta 200/201; 5xx → EnvioMHTransitorioError, otro status → EnvioMHError."""
+        if resp.status_code in (200, 201):
+            try:
+                return resp.json()
+            except ValueError as e:
+                raise EnvioMHTransitorioError(f"MH devolvió una respuesta no JSON en {operacion}") from e
+        error_msg = f"Error HTTP {resp.status_code} en {operacion}: {resp.text[:500]}"
+        logger.error("❌ MH %s: %s", operacion, error_msg)
+        if resp.status_code >= 500:
+            raise EnvioMHTransitorioError(error_msg)
+        err = EnvioMHError(error_msg)
+        try:
+            err.datos_mh = resp.json()
+        except ValueError:
+            pass
+        raise err
+
+    def enviar_lote(self, documentos: List[str]) -> Dict[str, Any]:
+        """
+        Envía varios DTE firmados (JWS) en una sola petición a /fesv/recepcionlote/.
+
+        MH solo confirma la recepción (estado RECIBIDO y codigoLote); el resultado de cada
+        documento se obtiene después con consultar_lote.
+
+        Returns:
+            Respuesta de MH (incluye codigoLote e idEnvio)
+
+        Raises:
+            EnvioMHTransitorioError: timeout, conexión o 5xx (el lote puede reenviarse)
+            EnvioMHError: MH no recibió el lote
+        """
+        token = self.obtener_token()
+        if not token:
+            raise EnvioMHError("No se pudo obtener el token de autenticación")
+        envio = {
+            "ambiente": self.DTE_AMBIENTE_CODE.get(self.codigo_ambiente_mh, self.codigo_ambiente_mh),
+            "idEnvio": str(uuid.uuid4()).upper(),
+            "version": self.VERSION_LOTE,
+            "nitEmisor": self._nit_emisor_limpio(),
+            "documentos": list(documentos),
+        }
+        try:
+            logger.info(f"Enviando lote de {len(documentos)} DTE a MH en {self.url_recepcion_lote}...")
+            resp = self._post_mh(self.url_recepcion_lote, envio, token, timeout=120)
+        except requests.exceptions.RequestException as e:
+            raise EnvioMHTransitorioError(f"Error de conexión enviando lote a MH: {str(e)}") from e
+        datos = self._json_respuesta_lote(resp, "recepcionlote")
+        if datos.get("estado") != "RECIBIDO" or not datos.get("codigoLote"):
+            err = EnvioMHError(datos.get("descripcionMsg") or "MH no recibió el lote")
+            err.datos_mh = datos
+            raise err
+        datos.setdefault("idEnvio", envio["idEnvio"])
+        logger.info(f"📦 Lote recibido por MH: {datos['codigoLote']}")
+        return datos
+
+    def consultar_lote(self, codigo_lote: str) -> Dict[str, Any]:
+        """
+        Consulta el resultado de un lote (/fesv/recepcion/consultadtelote/<codigoLote>).
+
+        Returns:
+            {"procesados": [...], "rechazados": [...]} tal como responde MH; los documentos que
+            MH aún no procesa no aparecen en ninguna de las dos listas.
+        """
+        token = self.obtener_token()
+        if not token:
+            raise EnvioMHError("No se pudo obtener el token de autenticación")
+        try:
+            resp = self._get_mh(self.url_consulta_lote + codigo_lote, token, timeout=60)
+        except requests.exceptions.RequestException as e:
+            raise EnvioMHTransitorioError(f"Error de conexión consultando lote en MH: {str(e)}") from e
+        datos = self._json_respuesta_lote(resp, "consultadtelote")
+        return {
+            "procesados": list(datos.get("procesados") or []),
+            "rechazados": list(datos.get("rechazados") or []),
+        }
+
+    def preparar_dte(self, venta: Venta) -> Dict[str, Any]:
+        """
+        Genera el JSON DTE de la venta, lo valida contra el schema MH local y lo firma (sin enviarlo).
+
+        Lo usan procesar_factura (envío individual) y mh_lote (envío por lotes).
+
+        Returns:
+            {"json_dte", "dte_firmado", "tipo_dte", "codigo_generacion", "numero_control"}
+
+        Raises:
+            MhSchemaValidationError, FirmaDTEError, AutenticacionMHError
+        """
+        # PASO 1: Generar JSON DTE usando director (Patrón Strategy)
+        logger.info("1. Generando JSON DTE...")
+        # DTE_AMBIENTE_CODE invierte: empresa='01'(Pruebas)→DTE='00' | empresa='00'(Prod)→DTE='01'
+        ambiente_dte = self.DTE_AMBIENTE_CODE.get(self.codigo_ambiente_mh, self.codigo_ambiente_mh)
+        json_dte = generar_dte(venta, ambiente=ambiente_dte)
+        logger.info(f"   🌐 empresa.ambiente={self.codigo_ambiente_mh} → DTE ambiente={ambiente_dte}")
+
+        tmap = {'CF': '01', 'CCF': '03', 'NC': '05', 'ND': '06', 'FSE': '14'}
+        tipo_dte = tmap.get(venta.tipo_venta, '03')
+        if tipo_dte in TIPOS_DTE_SCHEMA_STRICT:
+            try:
+                from jsonschema import Draft7Validator  # noqa: F401
+                schema_disponible = True
+            except ImportError:
+                schema_disponible = False
+                logger.warning(
+                    'jsonschema no instalado: se omite validación local del DTE %s',
+                    tipo_dte,
+                )
+            if schema_disponible:
+                errores_schema = validar_dte_contra_schema(
+                    json_dte, tipo_dte=tipo_dte, strict=False,
+                )
+                if errores_schema:
+                    logger.warning(
+                        'DTE %s venta #%s no cumple schema MH local: %s',
+                        tipo_dte, venta.id, errores_schema[:5],
+                    )
+                    raise MhSchemaValidationError(
+                        f'DTE {tipo_dte} inválido según schema MH: {errores_schema[0]}',
+                        errores=errores_schema,
+                    )
+
+        # Obtener código de generación y número de control (MH exige MAYÚSCULAS)
+        codigo_generacion = (venta.codigo_generacion or json_dte['identificacion']['codigoGeneracion'] or '').upper()
+        numero_control = venta.numero_control or json_dte['identificacion']['numeroControl']
+        logger.info(f"   ✅ DTE generado (UUID: {codigo_generacion}, Control: {numero_control})")
+
+        # PASO 2: Firmar documento
+        logger.info("2. Firmando documento...")
+        dte_firmado = self.firmar_dte(json_dte)
+        if not dte_firmado:
+            raise FirmaDTEError("No se pudo obtener el JWS firmado")
+        logger.info("   ✅ Documento firmado correctamente")
+
+        return {
+            "json_dte": json_dte,
+            "dte_firmado": dte_firmado,
+            "tipo_dte": tipo_dte,
+            "codigo_generacion": codigo_generacion,
+            "numero_control": numero_control,
+        }
+
+    def registrar_aceptacion(
+        self,
+        venta: Venta,
+        *,
+        dte_firmado: str,
+        sello: Optional[str],
+        codigo_generacion: str,
+        numero_control: str,
+        identificacion: Dict[str, Any],
+    ) -> None:
+        """Marca la venta AceptadoMH con el sello y la fecha/hora reales del DTE."""
+        venta.estado_dte = 'AceptadoMH'
+        venta.sello_recepcion = sello
+        venta.dte_firmado = dte_firmado  # Guardar JWS para descarga posterior
+        venta.codigo_generacion = codigo_generacion
+        venta.numero_control = numero_control
+        venta.hora_emision = identificacion.get('horEmi') or venta.hora_emision
+        # Guardar la fecEmi real del DTE (hora El Salvador) para que NC/ND la referencien correctamente
+        fec_emi_dte = identificacion.get('fecEmi')
+        if fec_emi_dte:
+            from datetime import date
+            try:
+                venta.fecha_emision = date.fromisoformat(fec_emi_dte)
+            except (ValueError, TypeError):
+                pass
+        venta.save()
+        empresa_id = venta.empresa_id
+        transaction.on_commit(lambda: invalidar_dashboard_stats(empresa_id))
+
+    def registrar_rechazo(
+        self,
+        venta: Venta,
+        datos: Dict[str, Any],
+        descripcion: Optional[str] = None,
+        observaciones: Any = None,
+    ) -> None:
+        """Marca la venta RechazadoMH y guarda código/descripción/observaciones de MH."""
+        venta.estado_dte = 'RechazadoMH'
+        codigo = datos.get('codigoMsg', datos.get('codigo'))
+        desc = descripcion if descripcion is not None else datos.get('descripcionMsg', '')
+        obs = observaciones if observaciones is not None else datos.get('observaciones')
+        obs_list = obs if isinstance(obs, list) else ([str(obs)] if obs else [])
+        venta.observaciones_mh = json.dumps({
+            'codigo': codigo,
+            'descripcion': desc,
+            'observaciones': obs_list
+        })
+        venta.save()
+
     def procesar_factura(self, venta: Venta) -> Dict[str, Any]:
         """
         Procesa una factura completa: genera DTE, firma y envía a MH.
@@ -578,97 +829,42 @@ class FacturacionService:
             "errores": []
         }
         
+        preparado = None
         try:
-            # PASO 1: Generar JSON DTE usando director (Patrón Strategy)
-            logger.info("1. Generando JSON DTE...")
-            # DTE_AMBIENTE_CODE invierte: empresa='01'(Pruebas)→DTE='00' | empresa='00'(Prod)→DTE='01'
-            ambiente_dte = self.DTE_AMBIENTE_CODE.get(self.codigo_ambiente_mh, self.codigo_ambiente_mh)
-            json_dte = generar_dte(venta, ambiente=ambiente_dte)
-            logger.info(f"   🌐 empresa.ambiente={self.codigo_ambiente_mh} → DTE ambiente={ambiente_dte}")
-
-            tmap = {'CF': '01', 'CCF': '03', 'NC': '05', 'ND': '06', 'FSE': '14'}
-            tipo_dte = tmap.get(venta.tipo_venta, '03')
-            if tipo_dte in TIPOS_DTE_SCHEMA_STRICT:
-                try:
-                    from jsonschema import Draft7Validator  # noqa: F401
-                    schema_disponible = True
-                except ImportError:
-                    schema_disponible = False
-                    logger.warning(
-                        'jsonschema no instalado: se omite validación local del DTE %s',
-                        tipo_dte,
-                    )
-                if schema_disponible:
-                    errores_schema = validar_dte_contra_schema(
-                        json_dte, tipo_dte=tipo_dte, strict=False,
-                    )
-                    if errores_schema:
-                        logger.warning(
-                            'DTE %s venta #%s no cumple schema MH local: %s',
-                            tipo_dte, venta.id, errores_schema[:5],
-                        )
-                        raise MhSchemaValidationError(
-                            f'DTE {tipo_dte} inválido según schema MH: {errores_schema[0]}',
-                            errores=errores_schema,
-                        )
-            
-            # Obtener código de generación y número de control (MH exige MAYÚSCULAS)
-            codigo_generacion = (venta.codigo_generacion or json_dte['identificacion']['codigoGeneracion'] or '').upper()
-            numero_control = venta.numero_control or json_dte['identificacion']['numeroControl']
-            
+            # PASOS 1 y 2: generar JSON DTE y firmar
+            preparado = self.preparar_dte(venta)
+            json_dte = preparado["json_dte"]
+            dte_firmado = preparado["dte_firmado"]
+            codigo_generacion = preparado["codigo_generacion"]
+            numero_control = preparado["numero_control"]
             resultado["codigo_generacion"] = codigo_generacion
             resultado["numero_control"] = numero_control
             
-            logger.info(f"   ✅ DTE generado (UUID: {codigo_generacion}, Control: {numero_control})")
-            
-            # PASO 2: Firmar documento
-            logger.info("2. Firmando documento...")
-            dte_firmado = self.firmar_dte(json_dte)
-            
-            if not dte_firmado:
-                raise FirmaDTEError("No se pudo obtener el JWS firmado")
-            
-            logger.info("   ✅ Documento firmado correctamente")
-            
             # PASO 3: Enviar a MH
             logger.info("3. Enviando a Ministerio de Hacienda...")
-            respuesta_mh = self.enviar_dte(dte_firmado, codigo_generacion, tipo_dte)
+            respuesta_mh = self.enviar_dte(dte_firmado, codigo_generacion, preparado["tipo_dte"])
             
             # Actualizar resultado con la respuesta de MH
             resultado.update(respuesta_mh)
             
             # Si fue exitoso, actualizar la venta
             if respuesta_mh.get("exito"):
-                venta.estado_dte = 'AceptadoMH'
-                venta.sello_recepcion = respuesta_mh.get("sello_recibido")
-                venta.dte_firmado = dte_firmado  # Guardar JWS para descarga posterior
-                venta.codigo_generacion = codigo_generacion
-                venta.numero_control = numero_control
-                venta.hora_emision = json_dte.get('identificacion', {}).get('horEmi') or venta.hora_emision
-                # Guardar la fecEmi real del DTE (hora El Salvador) para que NC/ND la referencien correctamente
-                fec_emi_dte = json_dte.get('identificacion', {}).get('fecEmi')
-                if fec_emi_dte:
-                    from datetime import date
-                    try:
-                        venta.fecha_emision = date.fromisoformat(fec_emi_dte)
-                    except (ValueError, TypeError):
-                        pass
-                venta.save()
-                
+                self.registrar_aceptacion(
+                    venta,
+                    dte_firmado=dte_firmado,
+                    sello=respuesta_mh.get("sello_recibido"),
+                    codigo_generacion=codigo_generacion,
+                    numero_control=numero_control,
+                    identificacion=json_dte.get('identificacion', {}),
+                )
                 logger.info(f"🎉🎉🎉 ¡ÉXITO TOTAL! FACTURA #{venta.id} ACEPTADA 🎉🎉🎉")
             else:
-                venta.estado_dte = 'RechazadoMH'
-                datos = respuesta_mh.get('datos_completos') or {}
-                codigo = datos.get('codigoMsg', datos.get('codigo'))
-                desc = respuesta_mh.get('mensaje', datos.get('descripcionMsg', ''))
-                obs = respuesta_mh.get('observaciones')
-                obs_list = obs if isinstance(obs, list) else ([str(obs)] if obs else [])
-                venta.observaciones_mh = json.dumps({
-                    'codigo': codigo,
-                    'descripcion': desc,
-                    'observaciones': obs_list
-                })
-                venta.save()
+                self.registrar_rechazo(
+                    venta,
+                    respuesta_mh.get('datos_completos') or {},
+                    descripcion=respuesta_mh.get('mensaje'),
+                    observaciones=respuesta_mh.get('observaciones'),
+                )
                 logger.warning(f"⚠️ FACTURA #{venta.id} RECHAZADA POR MH")
                 # DEBUG: incluir JSON DTE enviado (antes de firma) para diagnosticar errores de MH
                 resultado["dte_json_preview"] = json_dte
@@ -730,11 +926,9 @@ class FacturacionService:
                 venta.observaciones_mh = error_msg
             venta.save()
             err = FacturacionServiceError(error_msg)
-            try:
-                err.json_dte = json_dte
-                err.receptor_preview = json_dte.get("receptor", {})
-            except NameError:
-                pass
+            if preparado:
+                err.json_dte = preparado["json_dte"]
+                err.receptor_preview = preparado["json_dte"].get("receptor", {})
             raise err from e
             
         except Exception as e:
@@ -962,18 +1156,12 @@ class FacturacionService:
             "codigoGeneracion": codigo_anulacion,
         }
 
-        headers = {
-            "Authorization": token,
-            "Content-Type": "application/json",
-            "User-Agent": "Mozilla/5.0",
-        }
-
         # DTE_ANULAR_URL: override en settings si necesario. Manual MH 4.5: anulardte
         url_envio = getattr(settings, 'DTE_ANULAR_URL', None) or self.url_anulardte
 
         try:
             logger.info(f"Enviando evento de invalidación a {url_envio}...")
-            resp_mh = requests.post(url_envio, json=payload, headers=headers, timeout=60)
+            resp_mh = self._post_mh(url_envio, payload, token, timeout=60)
             logger.info(f"Respuesta MH: {resp_mh.status_code}")
 
             if resp_mh.status_code in [200, 201]:
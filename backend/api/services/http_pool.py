@@ -0,0 +1,105 @@
+"""
+Conexiones HTTP persistentes (keep-alive) hacia MH, el firmador externo y Meta (WhatsApp Cloud).
+
+Cada destino tiene un HTTPAdapter (pool de urllib3) compartido por todos los hilos del proceso, así
+que un DTE ya no paga un handshake TCP + TLS nuevo contra api.dtes.mh.gob.sv. requests.Session no es
+segura entre hilos (cookies, cabeceras): cada hilo usa su propia sesión montada sobre el adapter
+compartido, que sí lo es. Las sesiones no guardan cookies: el mismo hilo llama a MH con las
+credenciales de distintas empresas y una cookie de una respuesta no debe viajar con la siguiente.
+
+HTTP_POOL_MAXSIZE: conexiones que se conservan por host; conviene >= hilos que llaman a la vez
+(worker de facturación, contingencia). Si hay más, urllib3 abre conexiones extra y las descarta.
+Timeouts: (conexión, lectura). La conexión es HTTP_CONNECT_TIMEOUT_SEGUNDOS para todos los destinos
+(un host caído falla rápido); la lectura la fija cada endpoint.
+"""
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Tuple
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+MH = 'mh'
+FIRMADOR = 'firmador'
+META = 'meta'
+
+_adapters: Dict[str, HTTPAdapter] = {}
+_adapters_pid = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _adapter(destino: str) -> HTTPAdapter:
+    global _adapters_pid
+    adapter = _adapters.get(destino)
+    if adapter is not None and _adapters_pid == os.getpid():
+        return adapter
+    with _lock:
+        if _adapters_pid != os.getpid():
+            # Tras un fork (gunicorn --preload) las conexiones del padre no sirven en el hijo
+            _adapters.clear()
+            _adapters_pid = os.getpid()
+        adapter = _adapters.get(destino)
+        if adapter is None:
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=max(1, int(getattr(settings, 'HTTP_POOL_MAXSIZE', 10))),
+                max_retries=0,
+            )
+            _adapters[destino] = adapter
+        return adapter
+
+
+def sesion(destino: str) -> requests.Session:
+    """Sesión del hilo actual para ``destino`` (MH, FIRMADOR o META)."""
+    adapter = _adapter(destino)
+    sesiones = getattr(_local, 'sesiones', None)
+    if sesiones is None:
+        sesiones = _local.sesiones = {}
+    actual = sesiones.get(destino)
+    if actual is None or actual.get_adapter('https://') is not adapter:
+        actual = requests.Session()
+        # allowed_domains vacío: ninguna cookie de respuesta se guarda ni se reenvía
+        actual.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        actual.mount('https://', adapter)
+        actual.mount('http://', adapter)
+        sesiones[destino] = actual
+    return actual
+
+
+def timeout(lectura: float) -> Tuple[float, float]:
+    return (float(getattr(settings, 'HTTP_CONNECT_TIMEOUT_SEGUNDOS', 5)), float(lectura))
+
+
+def post(destino: str, url: str, *, timeout_lectura: float, **kwargs: Any) -> requests.Response:
+    return sesion(destino).post(url, timeout=timeout(timeout_lectura), **kwargs)
+
+
+def get(destino: str, url: str, *, timeout_lectura: float, **kwargs: Any) -> requests.Response:
+    return sesion(destino).get(url, timeout=timeout(timeout_lectura), **kwargs)
+
+
+def estadisticas() -> Dict[str, Dict[str, Dict[str, int]]]:
+    """
+    Por destino y host: peticiones hechas, conexiones abiertas y peticiones que reutilizaron
+    una conexión ya abierta (solo pools vivos de este proceso).
+    """
+    with _lock:
+        adapters = dict(_adapters)
+    resultado = {}
+    for destino, adapter in adapters.items():
+        hosts = {}
+        pools = adapter.poolmanager.pools
+        for clave in pools.keys():
+            pool = pools.get(clave)
+            if pool is None:
+                continue
+            hosts[f'{pool.scheme}://{pool.host}:{pool.port}'] = {
+                'peticiones': pool.num_requests,
+                'conexiones': pool.num_connections,
+                'reutilizadas': max(0, pool.num_requests - pool.num_connections),
+            }
+        resultado[destino] = hosts
+    return resultado
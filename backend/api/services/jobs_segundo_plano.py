@@ -0,0 +1,60 @@
+"""
+Jobs que corren en un hilo del proceso web (JobContingencia, JobCargaMasiva).
+
+Mientras un job está activo (EnCola / Procesando) un hilo de latido renueva su actualizado_at.
+Si el proceso que lo ejecutaba muere (deploy, reinicio, OOM) el latido se detiene: pasados
+JOB_SIN_LATIDO_SEGUNDOS el job se considera interrumpido y quien consulte o lance otro job de
+la empresa lo cierra (contingencia) o lo reanuda (carga masiva).
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_ACTIVOS = ('EnCola', 'Procesando')
+
+
+def sin_latido() -> timedelta:
+    """Tiempo sin latido tras el que un job activo se da por interrumpido."""
+    return timedelta(seconds=max(30, int(getattr(settings, 'JOB_SIN_LATIDO_SEGUNDOS', 300))))
+
+
+def tomar_job(modelo, job_id: int) -> bool:
+    """EnCola -> Procesando con un UPDATE condicional: False si otro hilo/proceso ya lo tomó."""
+    return bool(
+        modelo.objects.filter(pk=job_id, estado='EnCola')
+        .update(estado='Procesando', actualizado_at=timezone.now())
+    )
+
+
+def interrumpidos(queryset):
+    """Jobs activos del queryset cuyo latido se detuvo."""
+    return queryset.filter(estado__in=ESTADOS_ACTIVOS, actualizado_at__lt=timezone.now() - sin_latido())
+
+
+@contextmanager
+def latido(modelo, job_id: int):
+    """Renueva actualizado_at del job en un hilo mientras dura el bloque."""
+    detener = threading.Event()
+    intervalo = sin_latido().total_seconds() / 4
+
+    def _run():
+        while not detener.wait(intervalo):
+            try:
+                modelo.objects.filter(pk=job_id, estado__in=ESTADOS_ACTIVOS).update(actualizado_at=timezone.now())
+            except Exception:
+                logger.exception('Error renovando latido de %s %s', modelo.__name__, job_id)
+            finally:
+                close_old_connections()
+
+    threading.Thread(target=_run, daemon=True, name=f'latido-{modelo.__name__}-{job_id}').start()
+    try:
+        yield
+    finally:
+        detener.set()
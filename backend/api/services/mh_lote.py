@@ -0,0 +1,294 @@
+"""
+Transmisión de DTE a MH por lotes (/fesv/recepcionlote/ y /fesv/recepcion/consultadtelote/).
+
+Con MH_LOTE_HABILITADO, el cierre de contingencia y la cola de facturación (procesar_tareas_pendientes)
+no hacen una petición por documento: firman las ventas, las agrupan por empresa y ambiente en lotes
+de hasta MH_LOTE_MAX_DOCUMENTOS y envían cada lote en una sola petición. MH resuelve los documentos
+de forma diferida; el lote se consulta cada MH_LOTE_CONSULTA_INTERVALO_SEGUNDOS (hasta
+MH_LOTE_CONSULTA_MAX_SEGUNDOS) y cada resultado se aplica a la venta igual que en el envío individual
+(FacturacionService.registrar_aceptacion / registrar_rechazo).
+
+Mientras MH no responde, la venta queda 'Enviado' con su codigo_generacion y JWS ya guardados y el
+LoteMH en estado Enviado; consultar_lotes_pendientes lo retoma en la siguiente pasada de la cola.
+"""
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import LoteMH, Venta
+from .mh_rate_limit import limitador_empresa
+
+logger = logging.getLogger(__name__)
+
+# Un lote sin respuesta completa tras este plazo se da por perdido: sus ventas vuelven a PendienteEnvio
+# (mismo codigo_generacion) para reenviarse.
+HORAS_MAX_LOTE = 24
+
+
+def habilitado() -> bool:
+    return bool(getattr(settings, 'MH_LOTE_HABILITADO', False))
+
+
+def _detalle(venta: Venta, tipo: str, mensaje: Optional[str]) -> Dict[str, Any]:
+    """Mismo formato que contingencia_job._enviar_venta (con '_tipo' para el conteo)."""
+    return {
+        "venta_id": venta.id,
+        "estado_dte": venta.estado_dte,
+        "mensaje": mensaje,
+        "codigo_generacion": venta.codigo_generacion,
+        "numero_control": venta.numero_control,
+        "_tipo": tipo,
+    }
+
+
+def _ventas_en_lotes_pendientes(empresa_id: int) -> set:
+    ids = set()
+    for venta_ids in LoteMH.objects.filter(empresa_id=empresa_id, estado='Enviado').values_list('venta_ids', flat=True):
+        ids.update(venta_ids)
+    return ids
+
+
+def _error_preparacion(venta: Venta, error: Exception) -> Dict[str, Any]:
+    """Generación/firma fallida: la venta vuelve a Borrador, como en procesar_factura."""
+    from ..utils.mh_schema_validator import MhSchemaValidationError
+
+    campos = ['estado_dte']
+    venta.estado_dte = 'Borrador'
+    if isinstance(error, MhSchemaValidationError):
+        mensaje = f"JSON DTE inválido (schema MH): {str(error)}"
+        venta.observaciones_mh = json.dumps({'schema_mh': error.errores[:20]}, ensure_ascii=False)[:4000]
+        campos.append('observaciones_mh')
+    else:
+        mensaje = f"Error preparando el DTE: {str(error)}"
+    logger.error('Venta %s no entra al lote MH: %s', venta.id, mensaje)
+    venta.save(update_fields=campos)
+    return _detalle(venta, "error", mensaje)
+
+
+def _enviar_lote(servicio, preparadas: List[Tuple[Venta, Dict[str, Any]]]) -> Tuple[Optional[LoteMH], Dict[int, Dict]]:
+    """Envía un lote ya firmado y registra LoteMH. Si MH no lo recibe, las ventas quedan PendienteEnvio."""
+    from .facturacion_service import EnvioMHError, EnvioMHTransitorioError
+
+    limitador_empresa(servicio.empresa.pk).adquirir()
+    try:
+        respuesta = servicio.enviar_lote([p["dte_firmado"] for _, p in preparadas])
+    except EnvioMHError as e:
+        tipo = "pendiente" if isinstance(e, EnvioMHTransitorioError) else "error"
+        logger.warning('Lote MH de %s DTE no enviado (empresa %s): %s', len(preparadas), servicio.empresa.pk, e)
+        detalles = {}
+        for venta, _ in preparadas:
+            venta.estado_dte = 'PendienteEnvio'
+            venta.error_envio_mensaje = str(e)[:500]
+            venta.save(update_fields=['estado_dte', 'error_envio_mensaje'])
+            detalles[venta.id] = _detalle(venta, tipo, f"Lote no recibido por MH: {str(e)}")
+        return None, detalles
+
+    documentos = {}
+    with transaction.atomic():
+        for venta, p in preparadas:
+            identificacion = p["json_dte"].get("identificacion", {})
+            documentos[p["codigo_generacion"]] = {
+                "venta_id": venta.id,
+                "fec_emi": identificacion.get("fecEmi"),
+                "hor_emi": identificacion.get("horEmi"),
+                "estado": None,
+            }
+            # Guardar código y JWS ya: un reenvío posterior usa el mismo documento y MH no lo duplica
+            venta.estado_dte = 'Enviado'
+            venta.codigo_generacion = p["codigo_generacion"]
+            venta.numero_control = p["numero_control"]
+            venta.dte_firmado = p["dte_firmado"]
+            venta.error_envio_mensaje = None
+            venta.save(update_fields=[
+                'estado_dte', 'codigo_generacion', 'numero_control', 'dte_firmado', 'error_envio_mensaje',
+            ])
+        lote = LoteMH.objects.create(
+            empresa=servicio.empresa,
+            ambiente=servicio.ambiente,
+            id_envio=str(respuesta.get("idEnvio") or "")[:36],
+            codigo_lote=str(respuesta["codigoLote"])[:100],
+            venta_ids=[venta.id for venta, _ in preparadas],
+            documentos=documentos,
+        )
+    return lote, {}
+
+
+def actualizar_lote(lote: LoteMH, servicio=None) -> Dict[int, Dict[str, Any]]:
+    """
+    Consulta el lote en MH y aplica a cada venta el resultado que ya esté disponible.
+    Retorna {venta_id: detalle} solo de los documentos resueltos en esta consulta.
+
+    El cierre de contingencia y la cola de facturación pueden consultar el mismo lote a la vez: los
+    resultados se aplican con la fila del LoteMH bloqueada (SKIP LOCKED) y releída, así cada
+    documento se registra una sola vez. Si otro proceso la tiene, esta consulta no aplica nada.
+    """
+    from .facturacion_service import EnvioMHError, FacturacionService
+
+    servicio = servicio or FacturacionService(lote.empresa)
+    try:
+        resultado = servicio.consultar_lote(lote.codigo_lote)
+    except EnvioMHError as e:
+        logger.warning('No se pudo consultar el lote MH %s: %s', lote.codigo_lote, e)
+        LoteMH.objects.filter(pk=lote.pk).update(
+            consultas=F('consultas') + 1, mensaje=str(e)[:500], actualizado_at=timezone.now(),
+        )
+        lote.refresh_from_db()
+        return {}
+
+    with transaction.atomic():
+        bloqueado = LoteMH.objects.select_for_update(skip_locked=True).filter(pk=lote.pk, estado='Enviado').first()
+        detalles = _aplicar_resultado(bloqueado, resultado, servicio) if bloqueado is not None else {}
+    # Estado y documentos vigentes (propios o del proceso que tenía el lote) para quien espera
+    lote.refresh_from_db()
+    return detalles
+
+
+def _aplicar_resultado(lote: LoteMH, resultado: Dict[str, Any], servicio) -> Dict[int, Dict[str, Any]]:
+    """Registra en las ventas los documentos que MH ya resolvió (lote bloqueado por el llamador)."""
+    lote.consultas += 1
+    detalles = {}
+    ventas = Venta.objects.select_related('empresa').in_bulk(lote.venta_ids)
+    items = [(item, True) for item in resultado["procesados"]]
+    items += [(item, False) for item in resultado["rechazados"]]
+    for item, aceptado in items:
+        doc = lote.documentos.get(str(item.get("codigoGeneracion") or "").upper())
+        if not doc or doc.get("estado"):
+            continue
+        venta = ventas.get(doc["venta_id"])
+        doc["estado"] = "PROCESADO" if aceptado else "RECHAZADO"
+        if venta is None:
+            continue
+        if aceptado:
+            servicio.registrar_aceptacion(
+                venta,
+                dte_firmado=venta.dte_firmado,
+                sello=item.get("selloRecibido"),
+                codigo_generacion=venta.codigo_generacion,
+                numero_control=venta.numero_control,
+                identificacion={"fecEmi": doc.get("fec_emi"), "horEmi": doc.get("hor_emi")},
+            )
+            detalles[venta.id] = _detalle(venta, "aceptada", "DTE procesado correctamente")
+        else:
+            servicio.registrar_rechazo(venta, item)
+            detalles[venta.id] = _detalle(venta, "rechazada", item.get("descripcionMsg") or "Rechazado por MH")
+
+    faltan = [doc for doc in lote.documentos.values() if not doc.get("estado")]
+    if not faltan:
+        lote.estado = 'Completado'
+        lote.finalizado_at = timezone.now()
+    elif lote.creado_at and lote.creado_at < timezone.now() - timedelta(hours=HORAS_MAX_LOTE):
+        # MH nunca respondió estos documentos: se reenviarán con el mismo codigo_generacion
+        Venta.objects.filter(pk__in=[doc["venta_id"] for doc in faltan], estado_dte='Enviado').update(
+            estado_dte='PendienteEnvio',
+            error_envio_mensaje=f"Lote MH {lote.codigo_lote} sin resultado tras {HORAS_MAX_LOTE} h",
+        )
+        lote.estado = 'Error'
+        lote.mensaje = f"{len(faltan)} documentos sin resultado de MH; vuelven a PendienteEnvio."
+        lote.finalizado_at = timezone.now()
+    lote.save()
+    return detalles
+
+
+def esperar_resultados(
+    lotes: Iterable[Tuple[Any, LoteMH]], max_espera_segundos: Optional[float] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Consulta los lotes hasta tener el resultado de todos sus documentos o agotar
+    MH_LOTE_CONSULTA_MAX_SEGUNDOS (o max_espera_segundos si es menor, p. ej. el margen del lease
+    de la cola). Los documentos sin resultado se reportan como 'pendiente' (venta en 'Enviado').
+    """
+    intervalo = max(0.0, float(getattr(settings, 'MH_LOTE_CONSULTA_INTERVALO_SEGUNDOS', 5)))
+    espera = max(0.0, float(getattr(settings, 'MH_LOTE_CONSULTA_MAX_SEGUNDOS', 120)))
+    if max_espera_segundos is not None:
+        espera = min(espera, max(0.0, max_espera_segundos))
+    limite = time.monotonic() + espera
+    detalles = {}
+    pendientes = list(lotes)
+    while pendientes:
+        time.sleep(min(intervalo, espera))  # MH no resuelve el lote en el mismo instante en que lo recibe
+        for servicio, lote in pendientes:
+            detalles.update(actualizar_lote(lote, servicio))
+        pendientes = [(s, lote) for s, lote in pendientes if lote.estado == 'Enviado']
+        if time.monotonic() >= limite:
+            break
+
+    for _, lote in pendientes:
+        ventas = Venta.objects.in_bulk([doc["venta_id"] for doc in lote.documentos.values() if not doc.get("estado")])
+        for venta in ventas.values():
+            detalles[venta.id] = _detalle(venta, "pendiente", f"Lote MH {lote.codigo_lote} sin resultado todavía")
+    return detalles
+
+
+def transmitir_ventas(venta_ids: List[int], max_espera_segundos: Optional[float] = None) -> Dict[int, Dict[str, Any]]:
+    """
+    Firma y envía las ventas en lotes (uno o más por empresa/ambiente) y espera sus resultados
+    (ver esperar_resultados para max_espera_segundos).
+
+    Returns:
+        {venta_id: detalle} con '_tipo' aceptada / rechazada / error / pendiente
+    """
+    from .facturacion_service import FacturacionService
+
+    ventas = (
+        Venta.objects.select_related('empresa', 'cliente')
+        .prefetch_related('detalles__producto')
+        .filter(pk__in=venta_ids)
+        .order_by('fecha_emision', 'id')
+    )
+    grupos = defaultdict(list)
+    for venta in ventas:
+        grupos[(venta.empresa_id, venta.empresa.ambiente or '01')].append(venta)
+
+    tamano = max(1, int(getattr(settings, 'MH_LOTE_MAX_DOCUMENTOS', 100)))
+    detalles = {}
+    enviados = []
+    for grupo in grupos.values():
+        try:
+            servicio = FacturacionService(grupo[0].empresa)
+        except ValueError as e:
+            detalles.update({v.id: _detalle(v, "error", str(e)) for v in grupo})
+            continue
+        en_lote = _ventas_en_lotes_pendientes(grupo[0].empresa_id)
+        preparadas = []
+        for venta in grupo:
+            if venta.id in en_lote:
+                detalles[venta.id] = _detalle(venta, "pendiente", "En un lote MH sin resultado todavía")
+                continue
+            try:
+                preparadas.append((venta, servicio.preparar_dte(venta)))
+            except Exception as e:
+                detalles[venta.id] = _error_preparacion(venta, e)
+        for i in range(0, len(preparadas), tamano):
+            lote, fallidas = _enviar_lote(servicio, preparadas[i:i + tamano])
+            detalles.update(fallidas)
+            if lote is not None:
+                enviados.append((servicio, lote))
+
+    detalles.update(esperar_resultados(enviados, max_espera_segundos))
+    return detalles
+
+
+def consultar_lotes_pendientes(limite: int = 50) -> Dict[int, Dict[str, Any]]:
+    """Retoma lotes que quedaron Enviado (una consulta por lote). Retorna los resultados nuevos."""
+    from .facturacion_service import FacturacionService
+
+    servicios = {}
+    detalles = {}
+    for lote in LoteMH.objects.select_related('empresa').filter(estado='Enviado').order_by('creado_at')[:limite]:
+        servicio = servicios.get(lote.empresa_id)
+        if servicio is None:
+            try:
+                servicio = servicios[lote.empresa_id] = FacturacionService(lote.empresa)
+            except ValueError:
+                logger.warning('Lote MH %s: la empresa %s ya no tiene credenciales MH', lote.codigo_lote, lote.empresa_id)
+                continue
+        detalles.update(actualizar_lote(lote, servicio))
+    return detalles
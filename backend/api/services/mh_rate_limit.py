@@ -0,0 +1,49 @@
+"""
+Límite de tasa de envíos a MH por empresa (token bucket en memoria del proceso).
+
+Se usa cuando varios hilos transmiten DTE de la misma empresa a la vez (cierre de contingencia,
+emisión masiva) para no superar MH_RATE_LIMIT_POR_SEGUNDO documentos por segundo.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+
+
+class LimitadorTasa:
+    """Token bucket: `tasa` permisos por segundo con ráfaga máxima `rafaga`."""
+
+    def __init__(self, tasa: float, rafaga: Optional[int] = None):
+        self.tasa = max(0.01, float(tasa))
+        self.rafaga = max(1, int(rafaga if rafaga is not None else self.tasa))
+        self._fichas = float(self.rafaga)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self) -> None:
+        """Bloquea hasta que haya un permiso disponible."""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(self.rafaga, self._fichas + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.tasa
+            time.sleep(espera)
+
+
+_limitadores: Dict[int, LimitadorTasa] = {}
+_limitadores_lock = threading.Lock()
+
+
+def limitador_empresa(empresa_id: int) -> LimitadorTasa:
+    """Limitador compartido por todos los hilos del proceso que envían DTE de la empresa."""
+    tasa = float(getattr(settings, 'MH_RATE_LIMIT_POR_SEGUNDO', 5))
+    with _limitadores_lock:
+        limitador = _limitadores.get(empresa_id)
+        if limitador is None or limitador.tasa != tasa:
+            limitador = _limitadores[empresa_id] = LimitadorTasa(tasa)
+        return limitador
@@ -0,0 +1,115 @@
+"""
+Caché del token de autenticación MH (/seguridad/auth) compartida entre procesos.
+
+El token vive en la tabla TokenMH (una fila por empresa + ambiente + user_api_mh), así que
+los workers de gunicorn y procesar_tareas_facturacion reutilizan el mismo token.
+- Se renueva antes de vencer (MH_TOKEN_MARGEN_RENOVACION_SECONDS).
+- Las renovaciones concurrentes se coalescen: candado por clave dentro del proceso
+  + select_for_update de la fila entre procesos. Una ráfaga de 200 facturas = 1 llamada a auth.
+- invalidar_token() descarta el token cuando MH responde 401.
+"""
+import logging
+import threading
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_locks: Dict[Tuple, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, 'MH_TOKEN_TTL_SECONDS', 24 * 3600)))
+
+
+def _margen_renovacion() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, 'MH_TOKEN_MARGEN_RENOVACION_SECONDS', 30 * 60)))
+
+
+def _lock_local(clave: Tuple) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(clave)
+        if lock is None:
+            lock = _locks[clave] = threading.Lock()
+        return lock
+
+
+def _vigente(fila) -> bool:
+    """True si la fila tiene token y aún no entra en la ventana de renovación."""
+    if fila is None or not fila.token or not fila.expira_at:
+        return False
+    return fila.expira_at - _margen_renovacion() > timezone.now()
+
+
+def obtener_token_cacheado(
+    empresa_id: int,
+    ambiente: str,
+    user_api_mh: str,
+    autenticar: Callable[[], str],
+) -> str:
+    """
+    Devuelve un token MH vigente para la clave (empresa_id, ambiente, user_api_mh).
+
+    Args:
+        autenticar: callable que hace el POST real a /seguridad/auth y devuelve el token
+                    (o lanza AutenticacionMHError). Solo se invoca si no hay token vigente.
+    """
+    from ..models import TokenMH
+
+    filtro = {'empresa_id': empresa_id, 'ambiente': ambiente, 'user_api_mh': user_api_mh}
+
+    # Camino rápido: lectura sin candado
+    fila = TokenMH.objects.filter(**filtro).first()
+    if _vigente(fila):
+        return fila.token
+
+    with _lock_local((empresa_id, ambiente, user_api_mh)):
+        if fila is None:
+            TokenMH.objects.get_or_create(**filtro)
+        with transaction.atomic():
+            fila = TokenMH.objects.select_for_update().get(**filtro)
+            if _vigente(fila):
+                # Otro hilo/proceso renovó mientras esperábamos el candado
+                return fila.token
+            token = autenticar()
+            ahora = timezone.now()
+            fila.token = token
+            fila.obtenido_at = ahora
+            fila.expira_at = ahora + _ttl()
+            fila.save(update_fields=['token', 'obtenido_at', 'expira_at', 'actualizada_at'])
+            logger.info(
+                'Token MH renovado (empresa=%s, ambiente=%s), vence %s',
+                empresa_id, ambiente, fila.expira_at,
+            )
+            return token
+
+
+def invalidar_token(
+    empresa_id: int,
+    ambiente: str,
+    user_api_mh: str,
+    token_rechazado: Optional[str] = None,
+) -> None:
+    """
+    Descarta el token cacheado (p. ej. tras un 401 de MH).
+    Si se indica token_rechazado, solo se borra si sigue siendo el mismo: así no se pierde
+    un token que otro proceso acaba de renovar.
+    """
+    from ..models import TokenMH
+
+    filtro = {'empresa_id': empresa_id, 'ambiente': ambiente, 'user_api_mh': user_api_mh}
+    with transaction.atomic():
+        fila = TokenMH.objects.select_for_update().filter(**filtro).first()
+        if fila is None or not fila.token:
+            return
+        if token_rechazado is not None and fila.token != token_rechazado:
+            return
+        fila.token = None
+        fila.expira_at = None
+        fila.save(update_fields=['token', 'expira_at', 'actualizada_at'])
+    logger.info('Token MH invalidado (empresa=%s, ambiente=%s)', empresa_id, ambiente)
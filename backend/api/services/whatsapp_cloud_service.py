@@ -18,6 +18,7 @@ import requests
 from django.conf import settings
 
 from api.models import Venta
+from api.services import http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -179,7 +180,7 @@ def _post_meta_messages(phone_number_id: str, access_token: str, payload: dict[s
         'Content-Type': 'application/json',
     }
     try:
-        r = requests.post(url, json=payload, headers=headers, timeout=30)
+        r = http_pool.post(http_pool.META, url, json=payload, headers=headers, timeout_lectura=30)
     except requests.RequestException as exc:
         logger.warning('WhatsApp Cloud request error: %s', exc)
         raise WhatsAppCloudError(f'Error de red al contactar Meta: {exc}', status_code=502) from exc
@@ -234,7 +235,7 @@ def subir_pdf_media_whatsapp(
         'type': 'application/pdf',
     }
     try:
-        r = requests.post(url, headers=headers, data=data, files=files, timeout=60)
+        r = http_pool.post(http_pool.META, url, headers=headers, data=data, files=files, timeout_lectura=60)
     except requests.RequestException as exc:
         logger.warning('WhatsApp media upload error: %s', exc)
         raise WhatsAppCloudError(f'Error de red al subir PDF a Meta: {exc}', status_code=502) from exc
@@ -259,16 +260,12 @@ def subir_pdf_media_whatsapp(
 
 
 def _generar_pdf_bytes_venta(venta: Venta) -> bytes:
-    from api.utils.pdf_generator import generar_pdf_venta
-
-    buffer = generar_pdf_venta(venta)
-    if hasattr(buffer, 'getvalue'):
-        return buffer.getvalue()
-    if hasattr(buffer, 'read'):
-        return buffer.read()
-    if isinstance(buffer, (bytes, bytearray)):
-        return bytes(buffer)
-    raise WhatsAppCloudError('No se pudo generar el PDF de la factura.', status_code=500)
+    from api.utils.pdf_cache import obtener_pdf_venta
+
+    pdf_bytes = obtener_pdf_venta(venta).contenido
+    if not pdf_bytes:
+        raise WhatsAppCloudError('No se pudo generar el PDF de la factura.', status_code=500)
+    return pdf_bytes
 
 
 def _componentes_plantilla(
@@ -5,11 +5,18 @@ Compatible con Celery, worker Docker (procesar_tareas_facturacion --loop)
 o disparo en hilo tras encolar (encolar_y_disparar_facturacion).
 """
 import logging
+import os
+import select
+import socket
 import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, List, Optional
 
-from django.db import close_old_connections, transaction
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
@@ -18,6 +25,154 @@ logger = logging.getLogger(__name__)
 BACKOFF_MINUTES = [1, 5, 15, 45, 120]
 MAX_INTENTOS = len(BACKOFF_MINUTES) + 2  # Hasta ~6 intentos
 
+# Canal LISTEN/NOTIFY (PostgreSQL) para despertar al worker al encolar tareas
+CANAL_NOTIFY_TAREAS = 'facturacion_tareas'
+
+
+def _lease() -> timedelta:
+    """Duración del lease de una tarea en Procesando (se extiende con heartbeat)."""
+    return timedelta(seconds=int(getattr(settings, 'FACTURACION_LEASE_SECONDS', 300)))
+
+
+def _nuevo_worker_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+
+def _q_reclamable(ahora: datetime) -> Q:
+    """
+    Tareas que un worker puede tomar: pendientes/reintento vencido o Procesando con lease vencido.
+    Un Error sin proximo_reintento (rechazo MH, intentos agotados) es final y no se vuelve a tomar.
+    """
+    return (
+        Q(estado='Pendiente') & (Q(proximo_reintento__isnull=True) | Q(proximo_reintento__lte=ahora))
+    ) | _q_error_reintentable(proximo_reintento__lte=ahora) | (
+        Q(estado='Procesando')
+        & (
+            Q(bloqueada_hasta__lt=ahora)
+            # Filas de antes del lease: Procesando sin heartbeat desde hace más de un lease
+            | Q(bloqueada_hasta__isnull=True, actualizada_at__lt=ahora - _lease())
+        )
+    )
+
+
+def _q_error_reintentable(**filtro_reintento) -> Q:
+    return Q(estado='Error', proximo_reintento__isnull=False, intentos__lt=MAX_INTENTOS, **filtro_reintento)
+
+
+def reclamar_tareas(limite: int, worker_id: str) -> List[int]:
+    """
+    Reclama hasta `limite` tareas con SELECT ... FOR UPDATE SKIP LOCKED y las marca Procesando
+    con lease para este worker. Varios workers pueden llamar a la vez sin tomar la misma tarea.
+    """
+    from .models import TareaFacturacion
+
+    if limite <= 0:
+        return []
+    ahora = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            TareaFacturacion.objects.select_for_update(skip_locked=True)
+            .filter(_q_reclamable(ahora))
+            .order_by('proximo_reintento', 'creada_at')
+            .values_list('id', flat=True)[:limite]
+        )
+        if ids:
+            TareaFacturacion.objects.filter(pk__in=ids).update(
+                estado='Procesando',
+                worker_id=worker_id,
+                bloqueada_hasta=ahora + _lease(),
+                actualizada_at=ahora,
+            )
+    return ids
+
+
+def _reclamar_tarea(tarea_id: int, worker_id: str) -> bool:
+    """Reclama una tarea concreta con un UPDATE condicional. False si otro worker la tiene o ya terminó."""
+    from .models import TareaFacturacion
+
+    ahora = timezone.now()
+    disponible = (
+        Q(estado='Pendiente') | _q_error_reintentable() | (Q(estado='Procesando') & _q_reclamable(ahora))
+    )
+    return TareaFacturacion.objects.filter(pk=tarea_id).filter(disponible).update(
+        estado='Procesando',
+        worker_id=worker_id,
+        bloqueada_hasta=ahora + _lease(),
+        actualizada_at=ahora,
+    ) == 1
+
+
+def renovar_lease(tarea_ids, worker_id: str) -> int:
+    """Heartbeat: extiende el lease de las tareas que este worker sigue procesando."""
+    from .models import TareaFacturacion
+
+    ids = list(tarea_ids)
+    if not ids:
+        return 0
+    return TareaFacturacion.objects.filter(
+        pk__in=ids, estado='Procesando', worker_id=worker_id,
+    ).update(bloqueada_hasta=timezone.now() + _lease())
+
+
+def confirmar_lease(tarea_ids, worker_id: str) -> List[int]:
+    """
+    Antes de transmitir: de las tareas indicadas, las que este worker sigue teniendo con lease
+    vigente, extendiendo su lease. Las demás las retomó otro worker (no deben enviarse dos veces).
+    """
+    from .models import TareaFacturacion
+
+    ids = list(tarea_ids)
+    if not ids:
+        return []
+    ahora = timezone.now()
+    with transaction.atomic():
+        propias = list(
+            TareaFacturacion.objects.select_for_update()
+            .filter(pk__in=ids, estado='Procesando', worker_id=worker_id, bloqueada_hasta__gt=ahora)
+            .values_list('id', flat=True)
+        )
+        if propias:
+            TareaFacturacion.objects.filter(pk__in=propias).update(bloqueada_hasta=ahora + _lease())
+    return propias
+
+
+def notificar_tareas_encoladas() -> None:
+    """NOTIFY al worker (solo PostgreSQL; se entrega al hacer commit). En otros motores el worker hace poll."""
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'NOTIFY {CANAL_NOTIFY_TAREAS}')
+    except Exception:
+        logger.warning('No se pudo enviar NOTIFY %s', CANAL_NOTIFY_TAREAS, exc_info=True)
+
+
+def _tras_aceptacion_mh(venta) -> None:
+    """PDF en caché, correo y WhatsApp de una venta que MH acaba de aceptar."""
+    from .services.email_service import enviar_factura_email
+    from .utils.pdf_cache import precalentar_pdf_venta
+
+    # DTE ya inmutable: dejar el PDF en caché para correo, WhatsApp y enlace público.
+    precalentar_pdf_venta(venta)
+
+    # Enviar correo solo cuando MH aceptó el DTE.
+    # enviar_factura_email ya maneja sus propios errores internamente;
+    # el try/except aquí es una red de seguridad extra para no bloquear el flujo.
+    try:
+        enviar_factura_email(venta)
+    except Exception as e:
+        logger.warning(f"No se pudo enviar correo para venta {venta.id}: {e}")
+
+    tarea = getattr(venta, 'tarea_facturacion', None)
+    if tarea and tarea.enviar_whatsapp_despues:
+        from .services.whatsapp_post_factura import enviar_whatsapp_tras_correo_si_aplica
+        tel = (tarea.whatsapp_telefono_destino or '').strip()
+        wa_err = enviar_whatsapp_tras_correo_si_aplica(
+            venta, enviar=True, telefono=tel,
+        )
+        if wa_err:
+            logger.warning('WhatsApp venta %s: %s', venta.id, wa_err)
+
 
 def procesar_factura_venta(venta_id: int) -> dict:
     """
@@ -30,8 +185,6 @@ def procesar_factura_venta(venta_id: int) -> dict:
         FacturacionServiceError,
         EnvioMHTransitorioError,
     )
-    from .services.email_service import enviar_factura_email
-
     try:
         venta = Venta.objects.select_related('empresa', 'cliente').prefetch_related('detalles__producto').get(pk=venta_id)
     except Venta.DoesNotExist:
@@ -46,23 +199,7 @@ def procesar_factura_venta(venta_id: int) -> dict:
         venta.refresh_from_db()
 
         if resultado.get('exito') and venta.estado_dte == 'AceptadoMH':
-            # Enviar correo solo cuando MH aceptó el DTE.
-            # enviar_factura_email ya maneja sus propios errores internamente;
-            # el try/except aquí es una red de seguridad extra para no bloquear el flujo.
-            try:
-                enviar_factura_email(venta)
-            except Exception as e:
-                logger.warning(f"No se pudo enviar correo para venta {venta_id}: {e}")
-
-            tarea = getattr(venta, 'tarea_facturacion', None)
-            if tarea and tarea.enviar_whatsapp_despues:
-                from .services.whatsapp_post_factura import enviar_whatsapp_tras_correo_si_aplica
-                tel = (tarea.whatsapp_telefono_destino or '').strip()
-                wa_err = enviar_whatsapp_tras_correo_si_aplica(
-                    venta, enviar=True, telefono=tel,
-                )
-                if wa_err:
-                    logger.warning('WhatsApp venta %s: %s', venta_id, wa_err)
+            _tras_aceptacion_mh(venta)
 
         return {
             'exito': resultado.get('exito', False),
@@ -79,59 +216,169 @@ def procesar_factura_venta(venta_id: int) -> dict:
         return {'exito': False, 'mensaje': str(e), 'estado': 'Error'}
 
 
-def ejecutar_tarea(tarea_id: int) -> bool:
+def ejecutar_tarea(tarea_id: int, worker_id: Optional[str] = None) -> bool:
     """
     Ejecuta una tarea de facturación. Retorna True si completó (éxito o error final), False si debe reintentar.
+    Si otro worker ya la tiene reclamada (lease vigente) o está Completada, no hace nada y retorna True.
+    """
+    worker_id = worker_id or _nuevo_worker_id()
+    if not _reclamar_tarea(tarea_id, worker_id):
+        return True
+    return _procesar_tarea_reclamada(tarea_id, worker_id)
+
+
+_CAMPOS_RESULTADO_TAREA = [
+    'estado', 'intentos', 'error_mensaje', 'proximo_reintento',
+    'worker_id', 'bloqueada_hasta', 'actualizada_at',
+]
+
+
+def _guardar_resultado(tarea, worker_id: str) -> bool:
+    """
+    Guarda el resultado (y libera el lease) solo si la tarea sigue siendo de este worker: si su
+    lease venció y otro la retomó, el resultado de ese otro worker es el que vale.
     """
     from .models import TareaFacturacion
+
+    tarea.worker_id = ''
+    tarea.bloqueada_hasta = None
+    tarea.actualizada_at = timezone.now()
+    guardada = TareaFacturacion.objects.filter(
+        pk=tarea.pk, estado='Procesando', worker_id=worker_id,
+    ).update(**{campo: getattr(tarea, campo) for campo in _CAMPOS_RESULTADO_TAREA}) == 1
+    if not guardada:
+        logger.warning('Tarea %s retomada por otro worker: se descarta el resultado de %s', tarea.pk, worker_id)
+    return guardada
+
+
+def _programar_reintento(tarea, mensaje: str, worker_id: str) -> bool:
+    """Error transitorio: reintento con backoff. False si se reintentará, True si se agotaron los intentos."""
+    tarea.intentos += 1
+    tarea.error_mensaje = mensaje[:500]
+    tarea.estado = 'Error'
+
+    if tarea.intentos < MAX_INTENTOS:
+        idx = min(tarea.intentos - 1, len(BACKOFF_MINUTES) - 1)
+        mins = BACKOFF_MINUTES[idx]
+        tarea.proximo_reintento = timezone.now() + timedelta(minutes=mins)
+        if _guardar_resultado(tarea, worker_id):
+            logger.info(f"Tarea {tarea.id} programada para reintento en {mins} min")
+        return False
+    tarea.proximo_reintento = None
+    _guardar_resultado(tarea, worker_id)
+    return True
+
+
+def _esperar_resultado_lote(tarea, mensaje: str, worker_id: str) -> bool:
+    """
+    La venta ya está en un lote MH que aún no tiene resultado: no hubo envío fallido, así que vuelve
+    a la cola sin gastar un intento. El resultado llega por _cerrar_tareas_de_lotes.
+    """
+    tarea.estado = 'Pendiente'
+    tarea.error_mensaje = mensaje[:500]
+    tarea.proximo_reintento = timezone.now() + timedelta(minutes=BACKOFF_MINUTES[0])
+    _guardar_resultado(tarea, worker_id)
+    return False
+
+
+def _procesar_tarea_reclamada(tarea_id: int, worker_id: str) -> bool:
+    """Procesa una tarea ya marcada Procesando por este worker (ver reclamar_tareas / _reclamar_tarea)."""
+    from .models import TareaFacturacion
     from .services.facturacion_service import EnvioMHTransitorioError
 
+    # El lease pudo vencer mientras esperaba (cola secuencial, MH lento): si otro worker la
+    # retomó no se transmite otra vez
+    if not confirmar_lease([tarea_id], worker_id):
+        return True
     try:
         tarea = TareaFacturacion.objects.select_related('venta').get(pk=tarea_id)
     except TareaFacturacion.DoesNotExist:
         return True
 
-    if tarea.estado not in ('Pendiente', 'Error'):
-        if tarea.estado == 'Completada':
-            return True
-        # Procesando - podría ser un worker que murió
-        tarea.estado = 'Pendiente'
-        tarea.save(update_fields=['estado'])
-
-    tarea.estado = 'Procesando'
-    tarea.save(update_fields=['estado', 'actualizada_at'])
-
     try:
         resultado = procesar_factura_venta(tarea.venta_id)
         tarea.intentos += 1
         tarea.error_mensaje = resultado.get('mensaje', '')
         tarea.proximo_reintento = None
-
-        if resultado.get('estado') == 'Completada':
-            tarea.estado = 'Completada'
-            tarea.save(update_fields=['estado', 'intentos', 'error_mensaje', 'proximo_reintento', 'actualizada_at'])
-            return True
-        else:
-            tarea.estado = 'Error'
-            tarea.save(update_fields=['estado', 'intentos', 'error_mensaje', 'proximo_reintento', 'actualizada_at'])
-            return True  # Error final, no reintentar
+        # Completada, o Error final (no reintentar)
+        tarea.estado = 'Completada' if resultado.get('estado') == 'Completada' else 'Error'
+        _guardar_resultado(tarea, worker_id)
+        return True
 
     except EnvioMHTransitorioError as e:
+        return _programar_reintento(tarea, str(e), worker_id)
+    except Exception as e:
+        # Fallo fuera de procesar_factura_venta (BD, etc.): liberar la tarea para no esperar el lease
+        logger.exception('Error procesando tarea %s: %s', tarea_id, e)
         tarea.intentos += 1
         tarea.error_mensaje = str(e)[:500]
         tarea.estado = 'Error'
+        tarea.proximo_reintento = timezone.now() + timedelta(minutes=BACKOFF_MINUTES[0])
+        _guardar_resultado(tarea, worker_id)
+        return False
+
+
+def _cerrar_tarea_lote(tarea, detalle: dict, worker_id: str) -> bool:
+    """Registra en una tarea reclamada el resultado de su venta en un lote MH (services.mh_lote)."""
+    from .models import Venta
+
+    tipo = detalle.get('_tipo')
+    if tipo == 'pendiente' and detalle.get('estado_dte') == 'Enviado':
+        return _esperar_resultado_lote(tarea, detalle.get('mensaje') or 'Lote MH sin resultado todavía', worker_id)
+    if tipo == 'pendiente':
+        # Lote no recibido por MH (error transitorio): cuenta como intento
+        return _programar_reintento(tarea, detalle.get('mensaje') or 'Lote MH sin resultado todavía', worker_id)
+    if tipo == 'aceptada':
+        try:
+            _tras_aceptacion_mh(Venta.objects.select_related('empresa', 'cliente').get(pk=tarea.venta_id))
+        except Exception:
+            logger.exception('Error tras aceptación MH de la venta %s (lote)', tarea.venta_id)
+    tarea.intentos += 1
+    tarea.error_mensaje = detalle.get('mensaje') or ''
+    tarea.proximo_reintento = None
+    tarea.estado = 'Completada' if tipo == 'aceptada' else 'Error'
+    _guardar_resultado(tarea, worker_id)
+    return True
+
+
+def _procesar_tareas_en_lote(tarea_ids: List[int], worker_id: str) -> None:
+    """Tareas ya reclamadas cuyas ventas se transmiten juntas en lotes MH (MH_LOTE_HABILITADO)."""
+    from .models import TareaFacturacion
+    from .services import mh_lote
 
-        if tarea.intentos < MAX_INTENTOS:
-            idx = min(tarea.intentos - 1, len(BACKOFF_MINUTES) - 1)
-            mins = BACKOFF_MINUTES[idx]
-            tarea.proximo_reintento = timezone.now() + timedelta(minutes=mins)
-            tarea.save(update_fields=['estado', 'intentos', 'error_mensaje', 'proximo_reintento', 'actualizada_at'])
-            logger.info(f"Tarea {tarea_id} programada para reintento en {mins} min")
-            return False
+    tareas = list(
+        TareaFacturacion.objects.select_related('venta').filter(pk__in=confirmar_lease(tarea_ids, worker_id))
+    )
+    # Ya aceptadas (p. ej. por un lote anterior): no reenviar, MH las rechazaría como duplicadas
+    por_enviar = [t.venta_id for t in tareas if t.venta.estado_dte != 'AceptadoMH']
+    try:
+        # Sin heartbeat en esta pasada: la espera del resultado queda muy por debajo del lease
+        resultados = mh_lote.transmitir_ventas(
+            por_enviar, max_espera_segundos=_lease().total_seconds() / 3,
+        ) if por_enviar else {}
+    except Exception as e:
+        logger.exception('Error transmitiendo lote de tareas %s', tarea_ids)
+        for tarea in tareas:
+            _programar_reintento(tarea, str(e), worker_id)
+        return
+    for tarea in tareas:
+        if tarea.venta.estado_dte == 'AceptadoMH' and tarea.venta_id not in resultados:
+            detalle = {'_tipo': 'aceptada', 'mensaje': 'DTE ya aceptado por MH'}
         else:
-            tarea.proximo_reintento = None
-            tarea.save(update_fields=['estado', 'intentos', 'error_mensaje', 'proximo_reintento', 'actualizada_at'])
-            return True
+            detalle = resultados.get(tarea.venta_id) or {'_tipo': 'error', 'mensaje': 'Venta no encontrada'}
+        _cerrar_tarea_lote(tarea, detalle, worker_id)
+
+
+def _cerrar_tareas_de_lotes(detalles: dict, worker_id: str) -> None:
+    """Resultados diferidos de lotes MH: cierra las tareas que esperaban a esas ventas."""
+    from .models import TareaFacturacion
+
+    for venta_id, detalle in detalles.items():
+        tarea = TareaFacturacion.objects.filter(venta_id=venta_id).exclude(estado='Completada').first()
+        if tarea is None or not _reclamar_tarea(tarea.id, worker_id):
+            continue
+        tarea.refresh_from_db()
+        _cerrar_tarea_lote(tarea, detalle, worker_id)
 
 
 def _ejecutar_tarea_en_hilo(tarea_id: int) -> None:
@@ -145,6 +392,18 @@ def _ejecutar_tarea_en_hilo(tarea_id: int) -> None:
         close_old_connections()
 
 
+def reanudar_jobs_segundo_plano() -> None:
+    """Retoma en este proceso las cargas masivas cuyo proceso web se reinició (sin latido)."""
+    from .services.carga_masiva_job import reanudar_jobs_interrumpidos
+
+    try:
+        reanudar_jobs_interrumpidos()
+    except Exception:
+        logger.exception('Error reanudando jobs de carga masiva interrumpidos')
+    finally:
+        close_old_connections()
+
+
 def _disparar_en_hilo(callback) -> None:
     threading.Thread(target=callback, daemon=True).start()
 
@@ -167,13 +426,18 @@ def encolar_y_disparar_facturacion(
     )
     if tarea.estado == 'Completada':
         return tarea.id
-    if tarea.estado not in ('Pendiente', 'Error'):
+    if tarea.estado == 'Error' and tarea.proximo_reintento is None:
+        # Error final (p. ej. rechazo MH): encolar de nuevo la venta es un reenvío explícito
+        tarea.estado = 'Pendiente'
+        tarea.intentos = 0
+    elif tarea.estado not in ('Pendiente', 'Error'):
         tarea.estado = 'Pendiente'
     tarea.enviar_whatsapp_despues = bool(enviar_whatsapp)
     tarea.whatsapp_telefono_destino = (whatsapp_telefono or '')[:32]
     tarea.save(
         update_fields=[
             'estado',
+            'intentos',
             'actualizada_at',
             'enviar_whatsapp_despues',
             'whatsapp_telefono_destino',
@@ -181,6 +445,7 @@ def encolar_y_disparar_facturacion(
     )
 
     tarea_id = tarea.id
+    notificar_tareas_encoladas()
 
     def _schedule():
         _disparar_en_hilo(lambda: _ejecutar_tarea_en_hilo(tarea_id))
@@ -191,6 +456,8 @@ def encolar_y_disparar_facturacion(
 
 def disparar_procesamiento_cola(limite: int = 20) -> None:
     """Procesa la cola en hilo (p. ej. al desactivar contingencia)."""
+    notificar_tareas_encoladas()
+
     def _schedule():
         def _run():
             close_old_connections()
@@ -208,21 +475,149 @@ def disparar_procesamiento_cola(limite: int = 20) -> None:
 
 def procesar_tareas_pendientes(limite: int = 20) -> int:
     """
-    Procesa tareas pendientes o con proximo_reintento <= now.
+    Procesa tareas pendientes o con proximo_reintento <= now (y Procesando con lease vencido).
+    Las reclama antes de procesarlas, así que es seguro junto a otros workers.
+    Con MH_LOTE_HABILITADO primero recoge resultados de lotes MH anteriores y envía las
+    tareas reclamadas en lotes (recepcionlote) en vez de una petición por venta.
     Retorna número de tareas procesadas.
     """
-    from django.db.models import Q
-    from .models import TareaFacturacion
+    from .services import mh_lote
+
+    worker_id = _nuevo_worker_id()
+    en_lote = mh_lote.habilitado()
+    if en_lote:
+        _cerrar_tareas_de_lotes(mh_lote.consultar_lotes_pendientes(), worker_id)
+    ids = reclamar_tareas(limite, worker_id)
+    if en_lote and len(ids) > 1:
+        _procesar_tareas_en_lote(ids, worker_id)
+    else:
+        for tarea_id in ids:
+            _procesar_tarea_reclamada(tarea_id, worker_id)
+    return len(ids)
+
+
+class _EsperaNotificaciones:
+    """
+    Espera NOTIFY facturacion_tareas en una conexión PostgreSQL dedicada.
+    En otros motores (o si LISTEN falla) se limita a dormir `timeout` segundos (poll corto).
+    """
 
-    ahora = timezone.now()
-    tareas = list(TareaFacturacion.objects.filter(
-        estado__in=('Pendiente', 'Error')
-    ).filter(
-        Q(proximo_reintento__isnull=True) | Q(proximo_reintento__lte=ahora)
-    ).select_related('venta')[:limite])
-
-    procesadas = 0
-    for t in tareas:
-        ejecutar_tarea(t.id)
-        procesadas += 1
-    return procesadas
+    def __init__(self):
+        self._conn = None
+        if connection.vendor != 'postgresql':
+            return
+        try:
+            import psycopg2
+            import psycopg2.extensions
+
+            self._conn = psycopg2.connect(**connection.get_connection_params())
+            self._conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with self._conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CANAL_NOTIFY_TAREAS}')
+        except Exception:
+            logger.warning('LISTEN %s no disponible; se usa poll', CANAL_NOTIFY_TAREAS, exc_info=True)
+            self._conn = None
+
+    def esperar(self, timeout: float, detener: threading.Event) -> None:
+        if self._conn is None:
+            detener.wait(timeout)
+            return
+        try:
+            if select.select([self._conn], [], [], timeout)[0]:
+                self._conn.poll()
+                self._conn.notifies.clear()
+        except Exception:
+            logger.warning('Conexión LISTEN perdida; se usa poll', exc_info=True)
+            self.cerrar()
+            detener.wait(timeout)
+
+    def cerrar(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+def ejecutar_worker(
+    hilos: int = 4,
+    poll_segundos: float = 2.0,
+    detener: Optional[threading.Event] = None,
+    on_tarea: Optional[Callable[[int, bool], None]] = None,
+) -> None:
+    """
+    Worker concurrente de la cola de facturación (procesar_tareas_facturacion --worker).
+
+    - Reclama tareas con FOR UPDATE SKIP LOCKED: varios workers/procesos no toman la misma.
+    - Procesa hasta `hilos` tareas a la vez en un ThreadPoolExecutor (las llamadas a MH son I/O).
+    - Un hilo de heartbeat extiende el lease de las tareas en curso; si el worker muere,
+      otro retoma sus tareas Procesando cuando el lease vence.
+    - Se despierta con LISTEN/NOTIFY (PostgreSQL) o con un poll corto de `poll_segundos`.
+    - Al arrancar y en cada heartbeat reanuda las cargas masivas interrumpidas por un reinicio.
+    """
+    detener = detener or threading.Event()
+    worker_id = _nuevo_worker_id()
+    activas = set()
+    lock = threading.Lock()
+    hay_hueco = threading.Event()
+    espera = _EsperaNotificaciones()
+    intervalo_heartbeat = max(1.0, _lease().total_seconds() / 3)
+
+    def _heartbeat():
+        reanudar_jobs_segundo_plano()
+        while not detener.wait(intervalo_heartbeat):
+            with lock:
+                ids = list(activas)
+            try:
+                renovar_lease(ids, worker_id)
+            except Exception:
+                logger.exception('Error renovando lease de tareas %s', ids)
+            finally:
+                close_old_connections()
+            reanudar_jobs_segundo_plano()
+
+    def _run(tarea_id: int):
+        terminada = True
+        try:
+            terminada = _procesar_tarea_reclamada(tarea_id, worker_id)
+        except Exception:
+            logger.exception('Error en worker tarea_id=%s', tarea_id)
+        finally:
+            close_old_connections()
+            with lock:
+                activas.discard(tarea_id)
+            hay_hueco.set()
+            if on_tarea:
+                on_tarea(tarea_id, terminada)
+
+    logger.info('Worker facturación %s iniciado (%s hilos)', worker_id, hilos)
+    threading.Thread(target=_heartbeat, daemon=True).start()
+    try:
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='facturacion') as pool:
+            while not detener.is_set():
+                with lock:
+                    libres = hilos - len(activas)
+                ids = []
+                if libres > 0:
+                    try:
+                        ids = reclamar_tareas(libres, worker_id)
+                    except Exception:
+                        logger.exception('Error reclamando tareas de facturación')
+                        close_old_connections()
+                    with lock:
+                        activas.update(ids)
+                    for tarea_id in ids:
+                        pool.submit(_run, tarea_id)
+                if libres <= 0:
+                    hay_hueco.clear()
+                    hay_hueco.wait(poll_segundos)
+                elif not ids:
+                    espera.esperar(poll_segundos, detener)
+    finally:
+        from .services import http_pool
+
+        detener.set()
+        espera.cerrar()
+        close_old_connections()
+        logger.info('Worker facturación %s detenido (HTTP: %s)', worker_id, http_pool.estadisticas())
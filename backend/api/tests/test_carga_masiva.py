@@ -0,0 +1,260 @@
+"""Carga masiva: upload (normalización y catálogo en memoria) y emisión en segundo plano por job."""
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DataError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import (
+    Cliente, DetalleVenta, Empresa, JobCargaMasiva, Producto, ReservaCorrelativo, TareaFacturacion, Venta,
+)
+from api.services.carga_masiva_job import ejecutar_job_carga_masiva
+
+ENCABEZADO = 'nrc,nit,tipo_dte,nombre_receptor,producto,cantidad,precio_unitario,producto_2,cantidad_2,precio_2\n'
+
+
+class CargaMasivaUploadTests(TestCase):
+    def setUp(self):
+        self.empresa = Empresa.objects.create(nombre='Empresa Carga', nrc='777-1')
+        self.cliente = Cliente.objects.create(
+            empresa=self.empresa, nrc='120589-4', nombre='L&K S.A.', nit='06141205891024',
+        )
+        self.servicio = Producto.objects.create(
+            empresa=self.empresa, codigo='SERV-01', descripcion='Servicio de consultoría', precio_unitario=500,
+        )
+        Producto.objects.create(empresa=self.empresa, codigo='CAFE', descripcion='Café molido 500 g')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('carga', 'carga@example.com', 'x'))
+
+    def _subir(self, csv):
+        archivo = SimpleUploadedFile('facturas.csv', csv.encode('utf-8'), content_type='text/csv')
+        return self.client.post(
+            '/api/carga-masiva/upload/', {'archivo': archivo, 'empresa_id': self.empresa.id}, format='multipart',
+        )
+
+    def test_resuelve_clientes_y_productos_existentes(self):
+        respuesta = self._subir(
+            ENCABEZADO
+            + '1205894,6141205891024,03-CCF,L&K,serv-01,1,500,café molido,2,"4,50"\n'
+            + 'CF,,01,,Servicio de consultoría,1,10,,,\n'
+        )
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        ccf, cf = respuesta.data['filas']
+        self.assertEqual(ccf['_errores'], [])
+        self.assertEqual(ccf['tipo_dte'], '03')
+        self.assertEqual(ccf['cliente_id'], self.cliente.id)
+        self.assertEqual(ccf['nit'], '06141205891024')  # Excel quitó el cero inicial del NIT de 14
+        self.assertEqual([i['producto_id'] for i in ccf['items']], [self.servicio.id, Producto.objects.get(codigo='CAFE').id])
+        self.assertEqual(ccf['items'][1]['precio_unitario'], 4.5)
+        self.assertIsNone(cf['cliente_id'])
+        self.assertEqual(cf['nombre_receptor'], 'Consumidor Final')
+        self.assertEqual(cf['producto_id'], self.servicio.id)
+        self.assertEqual(Producto.objects.filter(empresa=self.empresa).count(), 2)
+
+    def test_productos_nuevos_se_crean_una_vez(self):
+        respuesta = self._subir(
+            ENCABEZADO
+            + 'CF,,01,,Tornillo 1/4,10,0.25,tornillo 1/4,5,0.25\n'
+            + 'CF,,01,,Tuerca,3,0.10,,,\n'
+            + 'CF,,01,,TORNILLO 1/4,1,0.25,,,\n'
+            + 'XX,,07,,Tuerca hexagonal,1,1,,,\n'
+        )
+        filas = respuesta.data['filas']
+        tornillo = Producto.objects.get(empresa=self.empresa, descripcion='Tornillo 1/4')
+        self.assertTrue(tornillo.codigo.startswith('Tornillo 1-4-'))
+        self.assertEqual(tornillo.precio_unitario, 0.25)
+        self.assertEqual(
+            {i['producto_id'] for f in filas[:3] for i in f['items'] if i['producto'].lower() == 'tornillo 1/4'},
+            {tornillo.id},
+        )
+        self.assertTrue(filas[1]['_producto_reconocido'])
+        # Fila con error: no se resuelve ni crea nada
+        self.assertTrue(filas[3]['_errores'])
+        self.assertIsNone(filas[3]['producto_id'])
+        self.assertEqual(
+            sorted(Producto.objects.filter(empresa=self.empresa).values_list('descripcion', flat=True)),
+            ['Café molido 500 g', 'Servicio de consultoría', 'Tornillo 1/4', 'Tuerca'],
+        )
+
+    def test_producto_invalido_no_tumba_el_alta_en_bloque(self):
+        guardar = Producto.save
+
+        def _guardar(producto, *args, **kwargs):
+            if producto.descripcion == 'Tuerca':
+                raise DataError('value too long')
+            return guardar(producto, *args, **kwargs)
+
+        with patch.object(Producto.objects, 'bulk_create', side_effect=DataError('value too long')), \
+                patch.object(Producto, 'save', autospec=True, side_effect=_guardar), \
+                self.assertLogs('api.views_carga_masiva', 'WARNING'):
+            respuesta = self._subir(ENCABEZADO + 'CF,,01,,Tornillo 1/4,10,0.25,,,\n' + 'CF,,01,,Tuerca,3,0.10,,,\n')
+        tornillo, tuerca = respuesta.data['filas']
+        self.assertEqual(tornillo['producto_id'], Producto.objects.get(descripcion='Tornillo 1/4').id)
+        self.assertIsNone(tuerca['producto_id'])
+        self.assertFalse(tuerca['_producto_reconocido'])
+
+    def test_consultas_no_crecen_con_las_filas(self):
+        fila = '1205894,06141205891024,03,L&K,SERV-01,1,500,Producto nuevo {n},1,1\n'
+
+        def _consultas(n):
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = self._subir(ENCABEZADO + ''.join(fila.format(n=i % 5) for i in range(n)))
+            self.assertEqual(respuesta.status_code, 200)
+            return len(consultas)
+
+        pocas = _consultas(5)
+        Producto.objects.filter(descripcion__startswith='Producto nuevo').delete()
+        self.assertEqual(_consultas(200), pocas)
+        self.assertEqual(Producto.objects.filter(descripcion__startswith='Producto nuevo').count(), 5)
+
+
+@patch('api.tasks.disparar_procesamiento_cola')
+class CargaMasivaEmisionTests(TestCase):
+    def setUp(self):
+        self.empresa = Empresa.objects.create(nombre='Empresa Emisión', nrc='888-1', ambiente='01')
+        self.cliente = Cliente.objects.create(empresa=self.empresa, nrc='1205894', nombre='L&K S.A.', nit='06141205891024')
+        self.producto = Producto.objects.create(empresa=self.empresa, codigo='SERV-01', descripcion='Servicio')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('emite', 'emite@example.com', 'x'))
+
+    def _fila(self, n, tipo='01', **extra):
+        fila = {
+            '_fila': n, '_errores': [], 'tipo_dte': tipo, 'cliente': 'CF', 'nombre_receptor': None,
+            'items': [{'producto': 'Servicio', 'cantidad': 1.0, 'precio_unitario': 11.3, 'producto_id': self.producto.id}],
+            'fecha': '2026-10-15',
+        }
+        fila.update(extra)
+        return fila
+
+    def _post(self, filas, **headers):
+        return self.client.post(
+            '/api/carga-masiva/emitir/', {'empresa_id': self.empresa.id, 'filas': filas}, format='json', headers=headers,
+        )
+
+    def _emitir(self, filas):
+        respuesta = self._post(filas)
+        self.assertEqual(respuesta.status_code, 202, respuesta.data)
+        return ejecutar_job_carga_masiva(respuesta.data['job_id'])
+
+    def test_crea_ventas_correlativos_y_tareas(self, mock_disparar):
+        filas = [
+            self._fila(1),
+            self._fila(2, '03', cliente='120589-4', nit='06141205891024', cliente_id=self.cliente.id,
+                       items=[{'producto': 'Servicio', 'cantidad': 2, 'precio_unitario': 100, 'producto_id': self.producto.id},
+                              {'producto': 'Flete', 'cantidad': 1, 'precio_unitario': 5}]),
+            self._fila(3, '03', cliente='4455-6', nit='123456789', nombre_receptor='Nuevo S.A. de C.V.'),
+            self._fila(4, '07'),
+            self._fila(5),
+        ]
+        job = self._emitir(filas)
+
+        self.assertEqual((job.estado, job.total, job.creadas, job.errores), ('Completado', 5, 4, 1))
+        self.assertEqual(TareaFacturacion.objects.filter(venta_id__in=job.venta_ids, estado='Pendiente').count(), 4)
+        mock_disparar.assert_called_once_with(limite=4)
+        numeros = dict(Venta.objects.filter(pk__in=job.venta_ids).values_list('numero_control', 'tipo_venta'))
+        self.assertEqual(numeros, {
+            'DTE-01-M001P001-000000000000001': 'CF',
+            'DTE-01-M001P001-000000000000002': 'CF',
+            'DTE-03-M001P001-000000000000001': 'CCF',
+            'DTE-03-M001P001-000000000000002': 'CCF',
+        })
+
+        cf = Venta.objects.get(numero_control='DTE-01-M001P001-000000000000001')
+        self.assertEqual((cf.venta_gravada, cf.debito_fiscal), (Decimal('10.00'), Decimal('1.30')))
+        self.assertEqual((cf.nombre_receptor, cf.estado_dte, cf.periodo_aplicado), ('Consumidor Final', 'Generado', '2026-10'))
+        ccf = Venta.objects.get(cliente=self.cliente)
+        self.assertEqual((ccf.venta_gravada, ccf.debito_fiscal, ccf.nrc_receptor), (Decimal('205.00'), Decimal('26.65'), '1205894'))
+        self.assertEqual(
+            list(DetalleVenta.objects.filter(venta=ccf).order_by('numero_item').values_list('producto_id', 'codigo_libre')),
+            [(self.producto.id, None), (None, 'LIBRE')],
+        )
+        nuevo = Cliente.objects.get(empresa=self.empresa, nrc='44556')
+        self.assertEqual((nuevo.tipo_documento, nuevo.dui), ('DUI', '123456789'))
+
+        progreso = self.client.get(f'/api/carga-masiva/jobs/{job.id}/').data
+        self.assertEqual(progreso['por_estado_dte'], {'Generado': 4})
+        self.assertEqual(progreso['en_transmision'], 4)
+        self.assertEqual([r['_fila'] for r in progreso['resultados'] if 'error' in r], [4])
+
+    def test_consultas_por_bloque_no_por_fila(self, mock_disparar):
+        def _consultas(n):
+            filas = [self._fila(i) if i % 2 else self._fila(i, '03', cliente='4455-6', nit='123456789') for i in range(n)]
+            with CaptureQueriesContext(connection) as consultas:
+                job = self._emitir(filas)
+            self.assertEqual(job.creadas, n)
+            return len(consultas)
+
+        _consultas(2)  # crea el cliente nuevo y los Correlativo del año
+        pocas, muchas = _consultas(4), _consultas(60)
+        self.assertLess(muchas - pocas, 6)  # solo los lotes en que SQLite parte cada bulk_create
+
+    def test_en_contingencia_quedan_pendientes_de_envio(self, mock_disparar):
+        Empresa.objects.filter(pk=self.empresa.pk).update(contingencia_activa=True)
+        job = self._emitir([self._fila(1), self._fila(2)])
+        self.assertEqual(set(Venta.objects.filter(pk__in=job.venta_ids).values_list('estado_dte', flat=True)), {'PendienteEnvio'})
+        self.assertFalse(TareaFacturacion.objects.exists())
+        mock_disparar.assert_not_called()
+
+    def test_bloque_fallido_no_consume_correlativos(self, mock_disparar):
+        with self.settings(CARGA_MASIVA_FILAS_POR_TRANSACCION=2), patch(
+            'api.services.carga_masiva_job.TareaFacturacion.objects.bulk_create',
+            side_effect=[None, RuntimeError('sin conexión'), None],
+        ), self.assertLogs('api.services.carga_masiva_job', 'ERROR'):
+            job = self._emitir([self._fila(i) for i in range(1, 6)])
+        self.assertEqual((job.creadas, job.errores), (3, 2))
+        self.assertEqual(
+            sorted(Venta.objects.values_list('numero_control', flat=True)),
+            [f'DTE-01-M001P001-{n:015d}' for n in (1, 2, 3)],
+        )
+        self.assertEqual(JobCargaMasiva.objects.get(pk=job.id).resultados[2]['error'], 'No se pudo crear la venta: sin conexión')
+        self.assertEqual(
+            list(ReservaCorrelativo.objects.order_by('pk').values_list('desde', 'hasta', 'estado', 'devueltos')),
+            [(1, 2, 'Cerrada', 0), (3, 4, 'Cerrada', 2), (3, 3, 'Cerrada', 0)],
+        )
+
+    def test_reenvio_con_la_misma_clave_devuelve_el_job(self, mock_disparar):
+        primero = self._post([self._fila(1)], **{'Idempotency-Key': 'clave-1'})
+        self.assertEqual(primero.status_code, 202)
+        ejecutar_job_carga_masiva(primero.data['job_id'])
+        segundo = self._post([self._fila(1)], **{'Idempotency-Key': 'clave-1'})
+        self.assertEqual((segundo.status_code, segundo.data['job_id']), (200, primero.data['job_id']))
+        self.assertEqual(Venta.objects.count(), 1)
+
+    def test_segunda_emision_con_job_activo_responde_409(self, mock_disparar):
+        primero = self._post([self._fila(1)])
+        segundo = self._post([self._fila(1)])
+        self.assertEqual(segundo.status_code, 409)
+        self.assertEqual(segundo.data['job_id'], primero.data['job_id'])
+        self.assertEqual(JobCargaMasiva.objects.count(), 1)
+
+    def test_job_interrumpido_se_reanuda_sin_duplicar(self, mock_disparar):
+        with self.settings(CARGA_MASIVA_FILAS_POR_TRANSACCION=2), patch(
+            'api.services.carga_masiva_job.TareaFacturacion.objects.bulk_create',
+            side_effect=[None, SystemExit('worker reiniciado')],
+        ), self.assertRaises(SystemExit):
+            self._emitir([self._fila(i) for i in range(1, 6)])
+        job = JobCargaMasiva.objects.get()
+        self.assertEqual((job.estado, job.creadas), ('Procesando', 2))
+        self.assertTrue(ReservaCorrelativo.objects.filter(estado='Reservada').exists())
+
+        # Con latido vigente no se toca; sin latido la consulta de progreso lo vuelve a encolar
+        self.assertEqual(self.client.get(f'/api/carga-masiva/jobs/{job.id}/').data['estado'], 'Procesando')
+        JobCargaMasiva.objects.filter(pk=job.pk).update(actualizado_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('api.services.carga_masiva_job', 'WARNING'):
+            self.assertEqual(self.client.get(f'/api/carga-masiva/jobs/{job.id}/').data['estado'], 'EnCola')
+        with self.settings(CARGA_MASIVA_FILAS_POR_TRANSACCION=2):
+            job = ejecutar_job_carga_masiva(job.id)
+
+        self.assertEqual((job.estado, job.creadas, job.errores), ('Completado', 5, 0))
+        self.assertEqual(sorted(r['_fila'] for r in job.resultados), [1, 2, 3, 4, 5])
+        self.assertEqual(
+            sorted(Venta.objects.values_list('numero_control', flat=True)),
+            [f'DTE-01-M001P001-{n:015d}' for n in range(1, 6)],
+        )
+        self.assertFalse(ReservaCorrelativo.objects.filter(estado='Reservada').exists())
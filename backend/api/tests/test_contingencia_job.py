@@ -0,0 +1,120 @@
+"""Cierre de contingencia en segundo plano: límite de tasa por empresa y progreso del job (sin llamar a MH)."""
+import time
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Empresa, JobContingencia, Venta
+from api.services import contingencia_job
+from api.services.mh_rate_limit import LimitadorTasa, limitador_empresa
+
+
+class LimitadorTasaTests(SimpleTestCase):
+    def test_respeta_tasa_tras_rafaga(self):
+        limitador = LimitadorTasa(tasa=20, rafaga=1)
+        inicio = time.monotonic()
+        for _ in range(4):
+            limitador.adquirir()
+        # 1 permiso de ráfaga + 3 a 20/s => al menos ~0.15 s
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.14)
+
+    def test_limitador_compartido_por_empresa(self):
+        with self.settings(MH_RATE_LIMIT_POR_SEGUNDO=3):
+            self.assertIs(limitador_empresa(1), limitador_empresa(1))
+            self.assertIsNot(limitador_empresa(1), limitador_empresa(2))
+            self.assertEqual(limitador_empresa(1).tasa, 3)
+
+
+def _detalle(venta_id, empresa_id):
+    tipo = 'aceptada' if venta_id % 2 else 'rechazada'
+    estado = 'AceptadoMH' if tipo == 'aceptada' else 'RechazadoMH'
+    return {'venta_id': venta_id, 'estado_dte': estado, 'mensaje': 'ok', '_tipo': tipo}
+
+
+@patch('api.services.contingencia_job.generar_reporte_contingencia', return_value={'detalleDTE': []})
+@patch('api.services.facturacion_service.FacturacionService')
+class EjecutarJobContingenciaTests(TestCase):
+    def setUp(self):
+        self.empresa = Empresa.objects.create(nombre='Empresa Contingencia', nrc='777-1', contingencia_activa=True)
+        self.ventas = [
+            Venta.objects.create(
+                empresa=self.empresa, fecha_emision=date(2026, 10, 1), periodo_aplicado='2026-10',
+                estado_dte='PendienteEnvio',
+            )
+            for _ in range(4)
+        ]
+        self.job = JobContingencia.objects.create(
+            empresa=self.empresa, venta_ids=[v.id for v in self.ventas], total=len(self.ventas),
+        )
+
+    @patch('api.services.contingencia_job._enviar_venta', side_effect=_detalle)
+    def test_completa_y_resume_envio(self, mock_enviar, mock_servicio, mock_reporte):
+        mock_servicio.return_value.enviar_evento_contingencia.return_value = {'estado': 'RECIBIDO'}
+        job = contingencia_job.ejecutar_job_contingencia(self.job.id)
+
+        self.assertEqual(job.estado, 'Completado')
+        self.assertEqual(mock_enviar.call_count, 4)
+        self.assertEqual(job.aceptadas + job.rechazadas, 4)
+        self.assertEqual(job.pendientes, 0)
+        datos = contingencia_job.job_contingencia_dict(JobContingencia.objects.get(pk=job.id))
+        self.assertEqual(len(datos['resumen_envio']['detalles']), 4)
+        self.assertNotIn('_tipo', datos['resumen_envio']['detalles'][0])
+        self.empresa.refresh_from_db()
+        self.assertFalse(self.empresa.contingencia_activa)
+
+    @patch('api.services.contingencia_job._enviar_venta', side_effect=_detalle)
+    def test_evento_no_recibido_no_reenvia(self, mock_enviar, mock_servicio, mock_reporte):
+        mock_servicio.return_value.enviar_evento_contingencia.return_value = {'estado': 'RECHAZADO'}
+        job = contingencia_job.ejecutar_job_contingencia(self.job.id)
+
+        self.assertEqual(job.estado, 'Error')
+        self.assertEqual(job.resultado_contingencia, {'estado': 'RECHAZADO'})
+        mock_enviar.assert_not_called()
+        self.empresa.refresh_from_db()
+        self.assertTrue(self.empresa.contingencia_activa)
+
+    @patch('api.services.contingencia_job._enviar_venta', side_effect=_detalle)
+    def test_job_ya_tomado_no_se_ejecuta_otra_vez(self, mock_enviar, mock_servicio, mock_reporte):
+        JobContingencia.objects.filter(pk=self.job.pk).update(estado='Procesando')
+        job = contingencia_job.ejecutar_job_contingencia(self.job.id)
+        self.assertEqual(job.estado, 'Procesando')
+        mock_servicio.return_value.enviar_evento_contingencia.assert_not_called()
+        mock_enviar.assert_not_called()
+
+
+class ProcesarContingenciaEndpointTests(TestCase):
+    def setUp(self):
+        self.empresa = Empresa.objects.create(nombre='Empresa Cierre', nrc='777-2', contingencia_activa=True)
+        Venta.objects.create(
+            empresa=self.empresa, fecha_emision=date(2026, 10, 1), periodo_aplicado='2026-10',
+            estado_dte='PendienteEnvio',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('cierre', 'cierre@example.com', 'x'))
+        self.url = f'/api/empresas/{self.empresa.id}/procesar-contingencia-completa/'
+
+    def test_segundo_cierre_con_job_activo_responde_409(self):
+        primero = self.client.post(self.url, {}, format='json')
+        self.assertEqual(primero.status_code, 202, primero.data)
+        segundo = self.client.post(self.url, {}, format='json')
+        self.assertEqual(segundo.status_code, 409)
+        self.assertEqual(segundo.data['job_id'], primero.data['job_id'])
+        self.assertEqual(JobContingencia.objects.filter(empresa=self.empresa).count(), 1)
+
+    def test_job_sin_latido_se_marca_error_y_permite_relanzar(self):
+        viejo = JobContingencia.objects.create(empresa=self.empresa, estado='Procesando')
+        JobContingencia.objects.filter(pk=viejo.pk).update(actualizado_at=timezone.now() - timedelta(hours=1))
+
+        progreso = self.client.get(f'/api/empresas/{self.empresa.id}/contingencia-jobs/{viejo.id}/')
+        self.assertEqual(progreso.data['estado'], 'Error')
+        self.assertEqual(self.client.post(self.url, {}, format='json').status_code, 202)
+
+    def test_tipo_contingencia_fuera_de_rango(self):
+        for tipo in (0, 6, 'x'):
+            respuesta = self.client.post(self.url, {'tipoContingencia': tipo}, format='json')
+            self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(JobContingencia.objects.exists())
@@ -0,0 +1,73 @@
+"""KPIs del dashboard: agregación en BD, caché corta por empresa/ambiente e invalidación al aceptar MH."""
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from api.models import Empresa, Venta
+from api.services import dashboard_stats
+from api.views import _total_pagar_venta
+
+
+@override_settings(DASHBOARD_STATS_CACHE_SECONDS=60)
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.hoy = date(2026, 10, 17)
+        self.empresa = Empresa.objects.create(nombre='Empresa Dashboard', nrc='555-1', ambiente='01')
+        datos = [
+            (date(2026, 10, 1), 'AceptadoMH', '01', Decimal('100.00'), Decimal('13.00'), Decimal('1.00')),
+            (date(2026, 10, 1), 'Enviado', '01', Decimal('10.10'), Decimal('1.31'), Decimal('0')),
+            (self.hoy, 'AceptadoMH', '01', Decimal('50.55'), Decimal('6.57'), Decimal('0.51')),
+            (self.hoy, 'Borrador', '01', Decimal('999.00'), Decimal('0'), Decimal('0')),
+            (self.hoy, 'AceptadoMH', '00', Decimal('77.00'), Decimal('0'), Decimal('0')),
+            (date(2026, 9, 30), 'AceptadoMH', '01', Decimal('500.00'), Decimal('0'), Decimal('0')),
+        ]
+        self.ventas = [
+            Venta.objects.create(
+                empresa=self.empresa, fecha_emision=fecha, periodo_aplicado=fecha.strftime('%Y-%m'),
+                estado_dte=estado, ambiente_emision=ambiente, venta_gravada=vg, debito_fiscal=iva,
+                venta_exenta=Decimal('2.00'), iva_retenido_1=ret,
+            )
+            for fecha, estado, ambiente, vg, iva, ret in datos
+        ]
+
+    def test_agregado_coincide_con_calculo_por_venta(self):
+        with self.assertNumQueries(1):
+            resumen = dashboard_stats.calcular_resumen_mes([self.empresa.id], '01', self.hoy)
+
+        procesadas = self.ventas[:3]
+        esperado_mes = round(sum(_total_pagar_venta(v) for v in procesadas), 2)
+        self.assertEqual(resumen['total_ventas_mes'], esperado_mes)
+        self.assertEqual(resumen['cantidad_dtes_mes'], 3)
+        self.assertEqual(resumen['ventas_hoy'], _total_pagar_venta(self.ventas[2]))
+        self.assertEqual(len(resumen['ventas_por_dia']), 31)
+        self.assertEqual(resumen['ventas_por_dia'][0]['total'], round(sum(_total_pagar_venta(v) for v in procesadas[:2]), 2))
+        self.assertEqual(resumen['ventas_por_dia'][1], {'dia': '02', 'total': 0.0})
+
+    def test_sin_ambiente_suma_todos(self):
+        resumen = dashboard_stats.calcular_resumen_mes([self.empresa.id], None, self.hoy)
+        self.assertEqual(resumen['cantidad_dtes_mes'], 4)
+
+    def test_cache_y_invalidacion_al_aceptar(self):
+        primero = dashboard_stats.resumen_mes([self.empresa.id], '01', self.hoy)
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_stats.resumen_mes([self.empresa.id], '01', self.hoy), primero)
+
+        borrador = self.ventas[3]
+        borrador.estado_dte = 'AceptadoMH'
+        borrador.save()
+        self.assertEqual(dashboard_stats.resumen_mes([self.empresa.id], '01', self.hoy), primero)
+
+        dashboard_stats.invalidar_dashboard_stats(self.empresa.id)
+        actualizado = dashboard_stats.resumen_mes([self.empresa.id], '01', self.hoy)
+        self.assertEqual(actualizado['cantidad_dtes_mes'], 4)
+        self.assertEqual(actualizado['ventas_hoy'], round(primero['ventas_hoy'] + 1001.0, 2))
+
+    @override_settings(DASHBOARD_STATS_CACHE_SECONDS=0)
+    def test_ttl_cero_desactiva_cache(self):
+        dashboard_stats.resumen_mes([self.empresa.id], '01', self.hoy)
+        with self.assertNumQueries(1):
+            dashboard_stats.resumen_mes([self.empresa.id], '01', self.hoy)
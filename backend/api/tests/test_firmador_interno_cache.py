@@ -0,0 +1,97 @@
+"""Caché de claves de firma del firmador interno (certificado MH generado al vuelo)."""
+import base64
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import SimpleTestCase, TestCase
+
+from api import firmador_interno
+from api.firmador_interno import firmar_dte_interno, invalidar_cache_firmador
+from api.models import Empresa
+
+
+def _certificado_mh_xml(password: str) -> str:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    der = key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    return (
+        '<CertificadoMH><privateKey>'
+        f'<clave>{hashlib.sha512(password.encode()).hexdigest()}</clave>'
+        f'<encodied>{base64.b64encode(der).decode()}</encodied><format>PKCS#8</format>'
+        '</privateKey></CertificadoMH>'
+    )
+
+
+class FirmadorCacheTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.xml = _certificado_mh_xml('clave123')
+
+    def setUp(self):
+        invalidar_cache_firmador()
+        fd, ruta = tempfile.mkstemp(suffix='.crt')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.xml)
+        self.ruta = Path(ruta)
+        self.addCleanup(self.ruta.unlink)
+        self.addCleanup(invalidar_cache_firmador)
+
+    def _firmar(self, password='clave123'):
+        return firmar_dte_interno(self.ruta, password, '{"a": 1}', validar_password=True)
+
+    def test_no_reparsea_certificado_entre_documentos(self):
+        with patch.object(firmador_interno, '_parse_certificado_mh_xml',
+                          wraps=firmador_interno._parse_certificado_mh_xml) as parse:
+            jws1 = self._firmar()
+            jws2 = self._firmar()
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(jws1.count('.'), 2)
+        self.assertEqual(jws1.split('.')[1], jws2.split('.')[1])
+
+    def test_password_incorrecto_sigue_fallando(self):
+        self._firmar()
+        with self.assertRaisesRegex(ValueError, 'Password'):
+            self._firmar('otra')
+
+    def test_cambio_de_archivo_o_invalidacion_recarga(self):
+        with patch.object(firmador_interno, '_parse_certificado_mh_xml',
+                          wraps=firmador_interno._parse_certificado_mh_xml) as parse:
+            self._firmar()
+            st = self.ruta.stat()
+            os.utime(self.ruta, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            self._firmar()
+            invalidar_cache_firmador(self.ruta)
+            self._firmar()
+        self.assertEqual(parse.call_count, 3)
+
+    def test_cache_acotada(self):
+        with self.settings(FIRMADOR_CACHE_MAX_CERTIFICADOS=1):
+            self._firmar()
+            otro = Path(str(self.ruta) + '.b')
+            otro.write_text(self.xml)
+            self.addCleanup(otro.unlink)
+            firmar_dte_interno(otro, 'clave123', '{}')
+        self.assertEqual(len(firmador_interno._CLAVES_CACHE), 1)
+
+
+class EmpresaInvalidaFirmaTests(TestCase):
+    def test_cambiar_clave_certificado_invalida_cache(self):
+        Empresa.objects.create(nombre='E', nrc='1-1', archivo_certificado='certificados/a.crt', clave_certificado='x')
+        empresa = Empresa.objects.get()
+        with patch('api.firmador_interno.invalidar_cache_firmador') as invalidar:
+            empresa.nombre = 'Otro nombre'
+            empresa.save()
+            invalidar.assert_not_called()
+            empresa.clave_certificado = 'y'
+            empresa.save()
+        invalidar.assert_called_once()
+        self.assertTrue(str(invalidar.call_args.args[0]).endswith('a.crt'))
@@ -0,0 +1,77 @@
+"""Conexiones keep-alive compartidas entre hilos (contra el simulador local de MH)."""
+import threading
+from http.client import HTTPMessage
+from unittest.mock import patch
+
+import requests
+from requests.cookies import MockRequest, MockResponse
+
+from django.test import SimpleTestCase, override_settings
+
+from api.services import http_pool
+from api.utils.mh_simulador import SimuladorMH
+
+
+class HttpPoolTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.simulador = SimuladorMH().iniciar()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.simulador.detener()
+        super().tearDownClass()
+
+    def setUp(self):
+        adapters = patch.dict(http_pool._adapters, clear=True)
+        adapters.start()
+        self.addCleanup(adapters.stop)
+        self.url = self.simulador.url + '/seguridad/auth'
+
+    def _estadisticas(self):
+        (por_host,) = http_pool.estadisticas()[http_pool.MH].values()
+        return por_host
+
+    def test_reutiliza_la_conexion(self):
+        for _ in range(5):
+            self.assertEqual(http_pool.post(http_pool.MH, self.url, timeout_lectura=5).status_code, 200)
+        self.assertEqual(self._estadisticas(), {'peticiones': 5, 'conexiones': 1, 'reutilizadas': 4})
+
+    @override_settings(HTTP_POOL_MAXSIZE=4)
+    def test_hilos_con_sesion_propia_y_pool_compartido(self):
+        sesiones = []
+        barrera = threading.Barrier(4)
+
+        def _llamar():
+            sesiones.append(http_pool.sesion(http_pool.MH))
+            barrera.wait()
+            for _ in range(3):
+                http_pool.post(http_pool.MH, self.url, timeout_lectura=5)
+
+        hilos = [threading.Thread(target=_llamar) for _ in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len({id(s) for s in sesiones}), 4)
+        self.assertEqual(len({id(s.get_adapter('https://')) for s in sesiones}), 1)
+        estadisticas = self._estadisticas()
+        self.assertEqual(estadisticas['peticiones'], 12)
+        self.assertLessEqual(estadisticas['conexiones'], 4)
+
+    @override_settings(HTTP_CONNECT_TIMEOUT_SEGUNDOS=2)
+    def test_timeout_conexion_y_lectura(self):
+        with patch('requests.Session.request') as mock_request:
+            http_pool.post(http_pool.META, 'https://graph.facebook.com/x', timeout_lectura=45, json={})
+        self.assertEqual(mock_request.call_args.kwargs['timeout'], (2.0, 45.0))
+
+    def test_sesion_no_guarda_cookies_entre_empresas(self):
+        sesion = http_pool.sesion(http_pool.MH)
+        cabeceras = HTTPMessage()
+        cabeceras['Set-Cookie'] = 'JSESSIONID=empresa-a; Path=/'
+        peticion = requests.Request('POST', self.url).prepare()
+        sesion.cookies.extract_cookies(MockResponse(cabeceras), MockRequest(peticion))
+        self.assertEqual(len(sesion.cookies), 0)
+
@@ -0,0 +1,178 @@
+"""Transmisión por lotes contra el simulador local de MH (auth, firmador, recepcionlote y consultadtelote)."""
+import uuid
+from datetime import date
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from api import tasks
+from api.models import Empresa, JobContingencia, LoteMH, TareaFacturacion, Venta
+from api.services import contingencia_job, mh_lote
+from api.services.facturacion_service import FacturacionService
+from api.utils.mh_simulador import SimuladorMH
+
+
+def _dte_simulado(venta, ambiente=None, **kwargs):
+    return {
+        'identificacion': {
+            'ambiente': ambiente,
+            'codigoGeneracion': venta.codigo_generacion,
+            'numeroControl': f'DTE-01-M001P001-{venta.id:015d}',
+            'fecEmi': '2026-10-02',
+            'horEmi': '10:15:00',
+        },
+        'receptor': {},
+    }
+
+
+class LoteMHSimuladorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.simulador = SimuladorMH().iniciar()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.simulador.detener()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.simulador.peticiones.clear()
+        self.simulador.consultas_en_proceso = 1
+        ajustes = self.settings(
+            MH_URL_BASE=self.simulador.url,
+            USE_INTERNAL_FIRMADOR=False,
+            MH_LOTE_HABILITADO=True,
+            MH_LOTE_MAX_DOCUMENTOS=2,
+            MH_LOTE_CONSULTA_INTERVALO_SEGUNDOS=0,
+            MH_LOTE_CONSULTA_MAX_SEGUNDOS=5,
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        for parche in (
+            patch.object(FacturacionService, 'URL_FIRMADOR', self.simulador.url + '/firmardocumento/'),
+            patch('api.services.facturacion_service.generar_dte', side_effect=_dte_simulado),
+            patch('api.services.facturacion_service.validar_dte_contra_schema', return_value=[]),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+        self.empresa = Empresa.objects.create(
+            nombre='Empresa Lote', nrc='321-1', nit='06140101011019', ambiente='01',
+            user_api_mh='06140101011019', clave_api_mh='secreta',
+            archivo_certificado='certificados/prueba.crt', clave_certificado='clave',
+            contingencia_activa=True,
+        )
+        self.ventas = [
+            Venta.objects.create(
+                empresa=self.empresa, fecha_emision=date(2026, 10, 1), periodo_aplicado='2026-10',
+                tipo_venta='CF', estado_dte='PendienteEnvio', codigo_generacion=str(uuid.uuid4()).upper(),
+            )
+            for _ in range(3)
+        ]
+        self.rechazada = self.ventas[1]
+        self.simulador.rechazar = {self.rechazada.codigo_generacion}
+
+    def _peticiones(self, ruta):
+        return sum(1 for _, r in self.simulador.peticiones if r == ruta)
+
+    def test_agrupa_en_lotes_y_mapea_resultados(self):
+        detalles = mh_lote.transmitir_ventas([v.id for v in self.ventas])
+
+        self.assertEqual(sorted(d['_tipo'] for d in detalles.values()), ['aceptada', 'aceptada', 'rechazada'])
+        self.assertEqual(self._peticiones('/fesv/recepcionlote'), 2)  # 3 DTE, máximo 2 por lote
+        self.assertEqual(self._peticiones('/fesv/recepciondte'), 0)
+        self.assertEqual(LoteMH.objects.filter(estado='Completado').count(), 2)
+        for venta in self.ventas:
+            venta.refresh_from_db()
+        aceptada = self.ventas[0]
+        self.assertEqual(aceptada.estado_dte, 'AceptadoMH')
+        self.assertTrue(aceptada.sello_recepcion)
+        self.assertEqual(aceptada.fecha_emision, date(2026, 10, 2))
+        self.assertTrue(aceptada.dte_firmado.endswith('.simulado'))
+        self.assertEqual(self.rechazada.estado_dte, 'RechazadoMH')
+        self.assertIn('"codigo": "004"', self.rechazada.observaciones_mh)
+
+    def test_lote_sin_resultado_se_retoma_despues(self):
+        self.simulador.consultas_en_proceso = 5
+        with self.settings(MH_LOTE_CONSULTA_MAX_SEGUNDOS=0):
+            detalles = mh_lote.transmitir_ventas([v.id for v in self.ventas])
+        self.assertEqual({d['_tipo'] for d in detalles.values()}, {'pendiente'})
+        self.assertEqual(set(Venta.objects.values_list('estado_dte', flat=True)), {'Enviado'})
+
+        # Un reintento no reenvía ventas que ya están en un lote sin resultado
+        mh_lote.transmitir_ventas([self.ventas[0].id])
+        self.assertEqual(self._peticiones('/fesv/recepcionlote'), 2)
+
+        self.simulador.consultas_en_proceso = 0
+        resueltas = mh_lote.consultar_lotes_pendientes()
+        self.assertEqual(len(resueltas), 3)
+        self.assertFalse(LoteMH.objects.filter(estado='Enviado').exists())
+        self.assertEqual(Venta.objects.filter(estado_dte='AceptadoMH').count(), 2)
+
+    def test_lote_consultado_por_dos_procesos_se_aplica_una_vez(self):
+        self.simulador.consultas_en_proceso = 5
+        with self.settings(MH_LOTE_CONSULTA_MAX_SEGUNDOS=0):
+            mh_lote.transmitir_ventas([v.id for v in self.ventas[:2]])
+        self.simulador.consultas_en_proceso = 0
+        # Contingencia y cola tienen cada una su copia del lote en memoria
+        cola, contingencia = LoteMH.objects.get(), LoteMH.objects.get()
+
+        with patch.object(FacturacionService, 'registrar_aceptacion', autospec=True,
+                          side_effect=FacturacionService.registrar_aceptacion) as aceptacion:
+            self.assertEqual(len(mh_lote.actualizar_lote(cola)), 2)
+            self.assertEqual(mh_lote.actualizar_lote(contingencia), {})
+        self.assertEqual(aceptacion.call_count, 1)  # la otra venta es la rechazada
+        self.assertEqual(contingencia.estado, 'Completado')
+
+    @patch('api.services.contingencia_job.generar_reporte_contingencia', return_value={'detalleDTE': []})
+    def test_cierre_de_contingencia_por_lotes(self, mock_reporte):
+        job = JobContingencia.objects.create(empresa=self.empresa, venta_ids=[v.id for v in self.ventas])
+        job = contingencia_job.ejecutar_job_contingencia(job.id)
+
+        self.assertEqual(job.estado, 'Completado')
+        self.assertEqual((job.aceptadas, job.rechazadas, job.errores, job.pendientes), (2, 1, 0, 0))
+        self.assertEqual(self._peticiones('/fesv/contingencia'), 1)
+        self.assertEqual(self._peticiones('/fesv/recepcionlote'), 2)
+        self.empresa.refresh_from_db()
+        self.assertFalse(self.empresa.contingencia_activa)
+
+    @patch('api.tasks._tras_aceptacion_mh')
+    def test_cola_de_facturacion_por_lotes(self, mock_tras_aceptacion):
+        for venta in self.ventas:
+            TareaFacturacion.objects.create(venta=venta)
+
+        self.assertEqual(tasks.procesar_tareas_pendientes(limite=10), 3)
+
+        estados = dict(TareaFacturacion.objects.values_list('venta_id', 'estado'))
+        self.assertEqual(estados[self.rechazada.id], 'Error')
+        self.assertEqual(sorted(estados.values()), ['Completada', 'Completada', 'Error'])
+        self.assertEqual(mock_tras_aceptacion.call_count, 2)
+        self.assertEqual(self._peticiones('/fesv/recepciondte'), 0)
+
+    @patch('api.tasks._tras_aceptacion_mh')
+    def test_cola_lote_sin_resultado_no_gasta_intentos(self, mock_tras_aceptacion):
+        self.simulador.consultas_en_proceso = 100
+        for venta in self.ventas:
+            TareaFacturacion.objects.create(venta=venta)
+
+        with self.settings(MH_LOTE_CONSULTA_MAX_SEGUNDOS=0), \
+                patch.object(mh_lote, 'esperar_resultados', wraps=mh_lote.esperar_resultados) as esperar:
+            for _ in range(tasks.MAX_INTENTOS + 1):
+                TareaFacturacion.objects.update(proximo_reintento=None)
+                tasks.procesar_tareas_pendientes(limite=10)
+        # La espera del lote queda por debajo del lease de las tareas reclamadas
+        self.assertLess(esperar.call_args_list[0][0][1], tasks._lease().total_seconds())
+
+        self.assertEqual(self._peticiones('/fesv/recepcionlote'), 2)
+        self.assertEqual(
+            set(TareaFacturacion.objects.values_list('estado', 'intentos', 'worker_id')), {('Pendiente', 0, '')},
+        )
+
+        self.simulador.consultas_en_proceso = 0
+        TareaFacturacion.objects.update(proximo_reintento=None)
+        tasks.procesar_tareas_pendientes(limite=10)
+        self.assertEqual(
+            sorted(TareaFacturacion.objects.values_list('estado', flat=True)), ['Completada', 'Completada', 'Error'],
+        )
+
@@ -0,0 +1,36 @@
+"""Validación contra schemas MH: validador compilado en caché y multipleOf con floats."""
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from api.management.commands.benchmark_schema_mh import construir_dte
+from api.utils import mh_schema_validator
+from api.utils.mh_schema_validator import validar_dte_contra_schema
+
+
+class ValidadorSchemaTests(SimpleTestCase):
+    def _dte(self, total_compra):
+        dte = construir_dte('14', 3)
+        dte['resumen']['totalCompra'] = total_compra  # multipleOf 0.01
+        return dte
+
+    def test_float_binario_cumple_multiple_of(self):
+        # 39.55 % 0.01 en float no da 0; ambos caminos deben aceptarlo.
+        self.assertEqual(validar_dte_contra_schema(self._dte(39.55), tipo_dte='14', strict=False), [])
+        with patch.object(mh_schema_validator, '_validador_rapido', return_value=None):
+            self.assertEqual(validar_dte_contra_schema(self._dte(39.55), tipo_dte='14', strict=False), [])
+
+    def test_error_detallado_cuando_falla(self):
+        errores = validar_dte_contra_schema(self._dte(39.555), tipo_dte='14', strict=False)
+        self.assertTrue(any(e.startswith('resumen.totalCompra') for e in errores), errores)
+        with self.assertRaises(mh_schema_validator.MhSchemaValidationError):
+            validar_dte_contra_schema(self._dte(39.555), tipo_dte='14')
+
+    def test_validadores_se_compilan_una_vez(self):
+        mh_schema_validator._validador_rapido.cache_clear()
+        mh_schema_validator._validador.cache_clear()
+        for _ in range(3):
+            validar_dte_contra_schema(self._dte(1.5), tipo_dte='14', strict=False)
+            validar_dte_contra_schema(self._dte(1.555), tipo_dte='14', strict=False)
+        self.assertEqual(mh_schema_validator._validador_rapido.cache_info().misses, 1)
+        self.assertEqual(mh_schema_validator._validador.cache_info().misses, 1)
@@ -0,0 +1,81 @@
+"""Caché compartida del token MH (sin llamar a MH)."""
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import Empresa, TokenMH
+from api.services.facturacion_service import FacturacionService
+
+
+def _resp(status, body):
+    r = MagicMock()
+    r.status_code = status
+    r.json.return_value = body
+    r.text = str(body)
+    return r
+
+
+def _auth_ok(token):
+    return _resp(200, {'status': 'OK', 'body': {'token': token}})
+
+
+class TokenMHCacheTests(TestCase):
+    def setUp(self):
+        self.empresa = Empresa.objects.create(
+            nombre='Empresa Token', nrc='123456-7', user_api_mh='06140101011019',
+            clave_api_mh='secreta', ambiente='01',
+        )
+        self.servicio = FacturacionService(self.empresa)
+
+    @patch('api.services.facturacion_service.http_pool.post')
+    def test_reutiliza_token_entre_llamadas(self, mock_post):
+        mock_post.return_value = _auth_ok('Bearer T1')
+        self.assertEqual(self.servicio.obtener_token(), 'Bearer T1')
+        self.assertEqual(FacturacionService(self.empresa).obtener_token(), 'Bearer T1')
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('api.services.facturacion_service.http_pool.post')
+    def test_renueva_dentro_del_margen(self, mock_post):
+        TokenMH.objects.create(
+            empresa=self.empresa, ambiente='01', user_api_mh='06140101011019',
+            token='Bearer VIEJO', expira_at=timezone.now() + timedelta(minutes=5),
+        )
+        mock_post.return_value = _auth_ok('Bearer NUEVO')
+        self.assertEqual(self.servicio.obtener_token(), 'Bearer NUEVO')
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('api.services.facturacion_service.http_pool.post')
+    def test_sin_cache_siempre_autentica(self, mock_post):
+        mock_post.return_value = _auth_ok('Bearer T1')
+        self.servicio.obtener_token(usar_cache=False)
+        self.servicio.obtener_token(usar_cache=False)
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertFalse(TokenMH.objects.exists())
+
+    @patch('api.services.facturacion_service.http_pool.post')
+    def test_401_en_recepcion_invalida_y_reintenta(self, mock_post):
+        TokenMH.objects.create(
+            empresa=self.empresa, ambiente='01', user_api_mh='06140101011019',
+            token='Bearer REVOCADO', expira_at=timezone.now() + timedelta(hours=10),
+        )
+        mock_post.side_effect = [
+            _resp(401, {}),
+            _auth_ok('Bearer NUEVO'),
+            _resp(200, {'estado': 'PROCESADO', 'selloRecibido': 'S' * 40}),
+        ]
+        resultado = self.servicio.enviar_dte('jws', 'abc-123', '01')
+
+        self.assertTrue(resultado['exito'])
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(mock_post.call_args.kwargs['headers']['Authorization'], 'Bearer NUEVO')
+        self.assertEqual(TokenMH.objects.get().token, 'Bearer NUEVO')
+
+    def test_invalidar_no_borra_token_ya_renovado(self):
+        TokenMH.objects.create(
+            empresa=self.empresa, ambiente='01', user_api_mh='06140101011019',
+            token='Bearer OTRO', expira_at=timezone.now() + timedelta(hours=10),
+        )
+        self.servicio.invalidar_token('Bearer VIEJO')
+        self.assertEqual(TokenMH.objects.get().token, 'Bearer OTRO')
@@ -0,0 +1,60 @@
+"""Caché en disco de PDFs de ventas con sello MH y descarga pública con ETag."""
+import shutil
+import tempfile
+from datetime import date
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from api.models import Empresa, Venta
+from api.utils import pdf_cache, pdf_render_pool
+
+
+class PdfCacheTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        override = override_settings(PDF_CACHE_DIR=self.dir, PDF_RENDER_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.empresa = Empresa.objects.create(nombre='Empresa Cache', nrc='123-4', pdf_tema_color='ocean')
+        self.venta = Venta.objects.create(
+            empresa=self.empresa, fecha_emision=date(2026, 10, 1), periodo_aplicado='2026-10',
+            codigo_generacion='ABCDEF12-0000-0000-0000-000000000001', sello_recepcion='SELLO123',
+        )
+
+    def _render(self):
+        return patch.object(pdf_render_pool, '_render_bytes', return_value=(b'%PDF-fake', None))
+
+    def test_renderiza_una_sola_vez(self):
+        with self._render() as render:
+            primero = pdf_cache.obtener_pdf_venta(self.venta)
+            segundo = pdf_cache.obtener_pdf_venta(self.venta)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(primero.contenido, segundo.contenido)
+        self.assertEqual(primero.etag, segundo.etag)
+        self.assertIsNotNone(pdf_cache.ruta_pdf_cacheado(self.venta))
+
+    def test_sin_sello_no_se_cachea(self):
+        self.venta.sello_recepcion = ''
+        with self._render() as render:
+            pdf = pdf_cache.obtener_pdf_venta(self.venta)
+            pdf_cache.obtener_pdf_venta(self.venta)
+        self.assertIsNone(pdf.etag)
+        self.assertEqual(render.call_count, 2)
+
+    def test_cambio_de_tema_cambia_clave(self):
+        clave = pdf_cache.clave_pdf(self.venta)
+        self.empresa.pdf_tema_color = 'amber'
+        self.assertNotEqual(pdf_cache.clave_pdf(self.venta), clave)
+
+    def test_descarga_publica_responde_304(self):
+        url = f'/api/descargar-factura/?nis={self.venta.codigo_generacion}'
+        with self._render():
+            r1 = self.client.get(url)
+            r2 = self.client.get(url, HTTP_IF_NONE_MATCH=r1['ETag'])
+        self.assertEqual(r1.status_code, 200)
+        self.assertEqual(r1.content, b'%PDF-fake')
+        self.assertEqual(r2.status_code, 304)
+        self.assertEqual(r2.content, b'')
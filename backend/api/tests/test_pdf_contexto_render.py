@@ -0,0 +1,71 @@
+"""Contexto de render PDF por empresa: estilos y logo se preparan una vez y se reutilizan."""
+import io
+import os
+import shutil
+import tempfile
+from datetime import date
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from api.models import Empresa, Venta
+from api.utils import pdf_generator
+
+
+class ContextoRenderTests(TestCase):
+    def setUp(self):
+        pdf_generator.invalidar_contexto_render()
+        self.addCleanup(pdf_generator.invalidar_contexto_render)
+        self.empresa = Empresa.objects.create(nombre='Empresa Estilos', nrc='321-0', pdf_tema_color='ocean')
+        self.ventas = [
+            Venta.objects.create(empresa=self.empresa, fecha_emision=date(2026, 10, 1), periodo_aplicado='2026-10')
+            for _ in range(3)
+        ]
+
+    def test_estilos_se_arman_una_vez_por_empresa(self):
+        with patch.object(pdf_generator, 'getSampleStyleSheet', wraps=pdf_generator.getSampleStyleSheet) as hoja:
+            for venta in self.ventas:
+                self.assertTrue(pdf_generator.generar_pdf_venta(venta).getvalue().startswith(b'%PDF'))
+        self.assertEqual(hoja.call_count, 1)
+
+    def test_cambio_de_tema_arma_contexto_nuevo(self):
+        ctx = pdf_generator._contexto_render(self.empresa)
+        self.assertIs(pdf_generator._contexto_render(self.empresa), ctx)
+        self.empresa.pdf_tema_color = 'amber'
+        otro = pdf_generator._contexto_render(self.empresa)
+        self.assertIsNot(otro, ctx)
+        self.assertEqual(otro.pal, pdf_generator.PDF_TEMAS['amber'])
+
+    def test_logo_reducido_y_decodificado_una_vez(self):
+        fd, ruta = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        self.addCleanup(os.unlink, ruta)
+        PILImage.new('RGB', (2000, 1000), 'red').save(ruta)
+
+        with patch.object(pdf_generator, '_obtener_ruta_logo', return_value=ruta) as ruta_logo:
+            for venta in self.ventas:
+                pdf_generator.generar_pdf_venta(venta)
+        self.assertEqual(ruta_logo.call_count, 1)
+
+        ctx = pdf_generator._contexto_render(self.empresa)
+        with PILImage.open(io.BytesIO(ctx.logo_png)) as img:
+            self.assertLessEqual(img.width, pdf_generator.LOGO_W * pdf_generator._LOGO_ESCALA)
+
+    def test_logo_reemplazado_con_el_mismo_nombre_arma_contexto_nuevo(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        os.makedirs(os.path.join(media, 'logos'))
+        ruta = os.path.join(media, 'logos', 'logo.png')
+        PILImage.new('RGB', (40, 20), 'red').save(ruta)
+        self.empresa.logo.name = 'logos/logo.png'
+
+        with override_settings(MEDIA_ROOT=media):
+            ctx = pdf_generator._contexto_render(self.empresa)
+            self.assertIs(pdf_generator._contexto_render(self.empresa), ctx)
+            PILImage.new('RGB', (40, 20), 'blue').save(ruta)
+            mtime = os.stat(ruta).st_mtime + 5
+            os.utime(ruta, (mtime, mtime))
+            otro = pdf_generator._contexto_render(self.empresa)
+        self.assertIsNot(otro, ctx)
+        self.assertNotEqual(otro.logo_png, ctx.logo_png)
@@ -0,0 +1,93 @@
+"""Render de PDFs en pool de procesos: orden de resultados, errores y respaldo en proceso."""
+import os
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from api.models import DetalleVenta, Empresa, Venta
+from api.utils import pdf_render_pool
+
+
+def _render_en_hijo(venta):
+    """Se ejecuta en el proceso del pool: render con la BD bloqueada, devuelve pid y consultas."""
+    consultas = []
+
+    def _bloquear(execute, sql, params, many, context):
+        consultas.append(sql)
+        raise RuntimeError('consulta a BD desde el proceso de render')
+
+    with connection.execute_wrapper(_bloquear):
+        pdf, error = pdf_render_pool._render_bytes(venta)
+    return os.getpid(), consultas, pdf, error
+
+
+class RenderPoolTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        empresa = Empresa.objects.create(nombre='Empresa PDF', nrc='999-1')
+        cls.ventas = []
+        for i in range(3):
+            venta = Venta.objects.create(
+                empresa=empresa, fecha_emision=date(2026, 10, 1), periodo_aplicado='2026-10',
+                numero_control=f'DTE-01-{i:04d}', nombre_receptor='Cliente', venta_gravada=Decimal('10.00'),
+            )
+            DetalleVenta.objects.create(
+                venta=venta, descripcion_libre='Servicio', cantidad=Decimal('1'),
+                precio_unitario=Decimal('10.00'), venta_gravada=Decimal('10.00'),
+            )
+            cls.ventas.append(venta)
+
+    def tearDown(self):
+        pdf_render_pool.cerrar_pool()
+
+    def _ventas(self):
+        return list(Venta.objects.filter(pk__in=[v.pk for v in self.ventas]).order_by('-id'))
+
+    @override_settings(PDF_RENDER_WORKERS=0)
+    def test_en_proceso_conserva_orden_y_reporta_errores(self):
+        ventas = self._ventas()
+        real = pdf_render_pool._render_bytes
+
+        def _render(venta):
+            if venta.pk == ventas[1].pk:
+                return None, 'fallo de render'
+            return real(venta)
+
+        with patch.object(pdf_render_pool, '_render_bytes', side_effect=_render):
+            resultado = list(pdf_render_pool.renderizar_pdfs(ventas))
+
+        self.assertEqual([v.pk for v, _, _ in resultado], [v.pk for v in ventas])
+        self.assertTrue(resultado[0][1].startswith(b'%PDF'))
+        self.assertEqual(resultado[1][1:], (None, 'fallo de render'))
+
+    @override_settings(PDF_RENDER_WORKERS=2)
+    def test_pool_de_procesos_sin_consultas(self):
+        ventas = pdf_render_pool.preparar_instantaneas(self._ventas())
+        with self.assertNumQueries(0):
+            resultado = list(pdf_render_pool.renderizar_pdfs(ventas))
+        self.assertEqual([v.pk for v, _, _ in resultado], [v.pk for v in ventas])
+        for _, pdf, error in resultado:
+            self.assertIsNone(error)
+            self.assertTrue(pdf.startswith(b'%PDF'))
+
+    @override_settings(PDF_RENDER_WORKERS=2)
+    def test_proceso_hijo_renderiza_sin_tocar_la_bd(self):
+        ventas = pdf_render_pool.preparar_instantaneas(self._ventas())
+        pool = pdf_render_pool._obtener_pool()
+        self.assertIsNotNone(pool)
+        for venta in ventas:
+            pid, consultas, pdf, error = pool.submit(_render_en_hijo, venta).result()
+            self.assertNotEqual(pid, os.getpid())
+            self.assertEqual(consultas, [])
+            self.assertIsNone(error)
+            self.assertTrue(pdf.startswith(b'%PDF'))
+
+    @override_settings(PDF_RENDER_WORKERS=2)
+    def test_pdf_suelto_no_crea_el_pool(self):
+        with patch.object(pdf_render_pool, '_obtener_pool') as obtener_pool:
+            pdf = pdf_render_pool.renderizar_pdf(self._ventas()[0])
+        obtener_pool.assert_not_called()
+        self.assertTrue(pdf.startswith(b'%PDF'))
@@ -0,0 +1,139 @@
+"""Cola de facturación: reclamo de tareas, lease y worker concurrente (sin llamar a MH)."""
+import threading
+import unittest
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from api import tasks
+from api.models import Empresa, TareaFacturacion, Venta
+
+
+def _crear_tareas(n, **kwargs):
+    empresa = Empresa.objects.create(nombre='Empresa Cola', nrc='555-1')
+    tareas = []
+    for _ in range(n):
+        venta = Venta.objects.create(empresa=empresa, fecha_emision=date(2026, 10, 1), periodo_aplicado='2026-10')
+        tareas.append(TareaFacturacion.objects.create(venta=venta, **kwargs))
+    return tareas
+
+
+_OK = {'exito': True, 'mensaje': 'ok', 'estado': 'Completada'}
+
+
+class ReclamarTareasTests(TestCase):
+    def test_reclama_una_sola_vez(self):
+        _crear_tareas(3)
+        primeras = tasks.reclamar_tareas(2, 'w1')
+        resto = tasks.reclamar_tareas(5, 'w2')
+        self.assertEqual(len(primeras), 2)
+        self.assertEqual(len(resto), 1)
+        self.assertFalse(set(primeras) & set(resto))
+        self.assertEqual(tasks.reclamar_tareas(5, 'w3'), [])
+        t = TareaFacturacion.objects.get(pk=primeras[0])
+        self.assertEqual((t.estado, t.worker_id), ('Procesando', 'w1'))
+        self.assertIsNotNone(t.bloqueada_hasta)
+
+    def test_respeta_proximo_reintento(self):
+        _crear_tareas(1, estado='Error', proximo_reintento=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(tasks.reclamar_tareas(5, 'w1'), [])
+
+    @patch('api.tasks.procesar_factura_venta', return_value=_OK)
+    def test_error_final_no_se_vuelve_a_reclamar(self, mock_procesar):
+        pasado = timezone.now() - timedelta(minutes=1)
+        rechazada, agotada, reintento = _crear_tareas(3, estado='Error', intentos=1)
+        TareaFacturacion.objects.filter(pk=agotada.pk).update(intentos=tasks.MAX_INTENTOS, proximo_reintento=pasado)
+        TareaFacturacion.objects.filter(pk=reintento.pk).update(proximo_reintento=pasado)
+        for _ in range(3):
+            self.assertEqual(tasks.reclamar_tareas(5, 'w1'), [reintento.pk])
+            TareaFacturacion.objects.filter(pk=reintento.pk).update(estado='Error', worker_id='')
+        self.assertTrue(tasks.ejecutar_tarea(rechazada.pk))
+        self.assertTrue(tasks.ejecutar_tarea(agotada.pk))
+        mock_procesar.assert_not_called()
+        self.assertEqual(
+            list(TareaFacturacion.objects.filter(pk__in=[rechazada.pk, agotada.pk]).values_list('estado', flat=True)),
+            ['Error', 'Error'],
+        )
+
+    def test_retoma_procesando_con_lease_vencido(self):
+        vencida, vigente = _crear_tareas(2, estado='Procesando', worker_id='muerto')
+        TareaFacturacion.objects.filter(pk=vencida.pk).update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        TareaFacturacion.objects.filter(pk=vigente.pk).update(bloqueada_hasta=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(tasks.reclamar_tareas(5, 'w1'), [vencida.pk])
+
+    @patch('api.tasks.procesar_factura_venta', return_value=_OK)
+    def test_ejecutar_tarea_no_duplica_tarea_ajena(self, mock_procesar):
+        (tarea,) = _crear_tareas(1)
+        tasks.reclamar_tareas(1, 'otro-worker')
+        self.assertTrue(tasks.ejecutar_tarea(tarea.pk))
+        mock_procesar.assert_not_called()
+
+    @patch('api.tasks.procesar_factura_venta', return_value=_OK)
+    def test_ejecutar_tarea_completa_y_libera_lease(self, mock_procesar):
+        (tarea,) = _crear_tareas(1)
+        self.assertTrue(tasks.ejecutar_tarea(tarea.pk))
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'Completada')
+        self.assertIsNone(tarea.bloqueada_hasta)
+        self.assertEqual(tarea.worker_id, '')
+
+    @patch('api.tasks.procesar_factura_venta', return_value=_OK)
+    def test_no_transmite_si_el_lease_vencio_antes_de_enviar(self, mock_procesar):
+        (tarea,) = _crear_tareas(1)
+        tasks.reclamar_tareas(1, 'w1')
+        TareaFacturacion.objects.filter(pk=tarea.pk).update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tasks.reclamar_tareas(1, 'w2'), [tarea.pk])
+        self.assertTrue(tasks._procesar_tarea_reclamada(tarea.pk, 'w1'))
+        mock_procesar.assert_not_called()
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.worker_id), ('Procesando', 'w2'))
+
+    def test_resultado_de_worker_que_perdio_el_lease_no_se_guarda(self):
+        (tarea,) = _crear_tareas(1)
+        tasks.reclamar_tareas(1, 'w1')
+
+        def _mh_lento(venta_id):
+            # Durante el envío el lease vence y otro worker retoma la tarea
+            TareaFacturacion.objects.filter(pk=tarea.pk).update(worker_id='w2')
+            return _OK
+
+        with patch('api.tasks.procesar_factura_venta', side_effect=_mh_lento), self.assertLogs('api.tasks', 'WARNING'):
+            tasks._procesar_tarea_reclamada(tarea.pk, 'w1')
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.worker_id, tarea.intentos), ('Procesando', 'w2', 0))
+
+    def test_renovar_lease_solo_del_worker(self):
+        (tarea,) = _crear_tareas(1)
+        tasks.reclamar_tareas(1, 'w1')
+        self.assertEqual(tasks.renovar_lease([tarea.pk], 'w2'), 0)
+        self.assertEqual(tasks.renovar_lease([tarea.pk], 'w1'), 1)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'SQLite en memoria no admite escrituras concurrentes entre hilos')
+class WorkerConcurrenteTests(TransactionTestCase):
+    @patch('api.tasks.procesar_factura_venta', return_value=_OK)
+    def test_worker_procesa_todas_en_paralelo(self, mock_procesar):
+        tareas = _crear_tareas(5)
+        detener = threading.Event()
+        hechas = []
+
+        def _on_tarea(tarea_id, terminada):
+            hechas.append(tarea_id)
+            if len(hechas) == len(tareas):
+                detener.set()
+
+        hilo = threading.Thread(
+            target=tasks.ejecutar_worker,
+            kwargs={'hilos': 3, 'poll_segundos': 0.05, 'detener': detener, 'on_tarea': _on_tarea},
+        )
+        hilo.start()
+        hilo.join(timeout=20)
+        detener.set()
+
+        self.assertFalse(hilo.is_alive())
+        self.assertEqual(sorted(hechas), sorted(t.pk for t in tareas))
+        self.assertEqual(mock_procesar.call_count, len(tareas))
+        self.assertEqual(TareaFacturacion.objects.filter(estado='Completada').count(), len(tareas))
@@ -0,0 +1,47 @@
+"""POST /api/pos/procesar-venta/ con Idempotency-Key: un reintento devuelve la venta ya creada (sin MH)."""
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.models import Empresa, Venta
+
+
+class VentaIdempotenciaTests(TestCase):
+    def setUp(self):
+        # Contingencia activa: la venta queda PendienteEnvio sin llamar a MH.
+        self.empresa = Empresa.objects.create(nombre='Empresa POS', nrc='555-1', contingencia_activa=True)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('pos', 'pos@example.com', 'x'))
+        self.body = {
+            'empresa': self.empresa.id,
+            'empresa_id': self.empresa.id,
+            'fecha_emision': date(2026, 10, 1).isoformat(),
+            'periodo_aplicado': '2026-10',
+            'tipo_venta': 'CF',
+            'nombre_receptor': 'Consumidor Final',
+            'detalles': [
+                {'descripcion_libre': 'Leche 1 L', 'cantidad': '2', 'precio_unitario': '1.15', 'venta_gravada': '2.30'},
+            ],
+        }
+
+    def _post(self, clave=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': clave} if clave else {}
+        return self.client.post('/api/pos/procesar-venta/', self.body, format='json', **headers)
+
+    def test_reintento_con_misma_clave_no_duplica(self):
+        primera = self._post('abc123')
+        self.assertEqual(primera.status_code, 201, primera.data)
+        segunda = self._post('abc123')
+        self.assertEqual(segunda.status_code, 201, segunda.data)
+        self.assertTrue(segunda.data['ok'])
+        self.assertEqual(segunda.data['venta']['procesamiento'], 'idempotente')
+        self.assertEqual(segunda.data['venta']['id'], primera.data['venta']['id'])
+        self.assertEqual(Venta.objects.filter(empresa=self.empresa).count(), 1)
+
+    def test_sin_clave_o_con_otra_clave_crea_otra_venta(self):
+        self._post('abc123')
+        self._post('def456')
+        self._post()
+        self.assertEqual(Venta.objects.filter(empresa=self.empresa).count(), 3)
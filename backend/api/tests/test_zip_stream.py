@@ -0,0 +1,60 @@
+"""ZIP en streaming para la descarga masiva de ventas (descarga-zip)."""
+import io
+import os
+import tempfile
+import zipfile
+from datetime import date
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+
+from api.models import Empresa, Venta
+from api.utils.zip_stream import ZipStream, iterar_zip
+from api.views import _iterar_zip_ventas
+
+
+class ZipStreamTests(SimpleTestCase):
+    def test_genera_zip_valido_por_partes(self):
+        partes = list(iterar_zip([('a.txt', b'hola'), ('b.json', b'{"x": 1}' * 1000)]))
+        self.assertGreater(len(partes), 2)
+        with zipfile.ZipFile(io.BytesIO(b''.join(partes))) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.read('a.txt'), b'hola')
+            self.assertEqual(zf.read('b.json'), b'{"x": 1}' * 1000)
+
+    def test_archivo_en_disco_por_bloques(self):
+        contenido = os.urandom(200 * 1024)
+        fd, ruta = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contenido)
+        self.addCleanup(os.unlink, ruta)
+
+        zs = ZipStream()
+        partes = list(zs.agregar_archivo('doc.pdf', ruta)) + list(zs.cerrar())
+        self.assertGreater(len(partes), 2)
+        with zipfile.ZipFile(io.BytesIO(b''.join(partes))) as zf:
+            self.assertEqual(zf.read('doc.pdf'), contenido)
+
+
+class ZipVentasTests(TestCase):
+    def setUp(self):
+        empresa = Empresa.objects.create(nombre='Empresa ZIP', nrc='888-1')
+        self.ok = Venta.objects.create(
+            empresa=empresa, fecha_emision=date(2026, 10, 1), periodo_aplicado='2026-10',
+            numero_control='DTE-01-0001',
+        )
+        self.falla = Venta.objects.create(empresa=empresa, fecha_emision=date(2026, 10, 2), periodo_aplicado='2026-10')
+
+    def test_json_con_respaldo_de_error(self):
+        def _historico(venta):
+            if venta.pk == self.falla.pk:
+                raise ValueError('sin JWS')
+            return {'identificacion': {'numeroControl': venta.numero_control}}
+
+        with patch('api.views.obtener_dte_historico', side_effect=_historico):
+            data = b''.join(_iterar_zip_ventas([self.ok.pk, self.falla.pk], 'json'))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            nombres = zf.namelist()
+            self.assertEqual(nombres, ['DTE-01-0001.json', f'error_factura_{self.falla.pk}.txt'])
+            self.assertIn(b'sin JWS', zf.read(nombres[1]))
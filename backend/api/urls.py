@@ -3,7 +3,9 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from . import views
 from .views import EmpresaViewSet, VentaViewSet, ActividadEconomicaViewSet
-from .views_carga_masiva import carga_masiva_upload, carga_masiva_plantilla_ejemplo
+from .views_carga_masiva import (
+    carga_masiva_upload, carga_masiva_plantilla_ejemplo, carga_masiva_emitir, carga_masiva_job,
+)
 
 router = DefaultRouter()
 router.register(r'empresas', EmpresaViewSet, basename='empresa')
@@ -56,6 +58,8 @@ urlpatterns = [
     # CARGA MASIVA DE FACTURAS
     path('carga-masiva/upload/', carga_masiva_upload),
     path('carga-masiva/plantilla-ejemplo/', carga_masiva_plantilla_ejemplo),
+    path('carga-masiva/emitir/', carga_masiva_emitir),
+    path('carga-masiva/jobs/<int:job_id>/', carga_masiva_job),
 
     # PLANTILLAS DE FACTURACIÓN RÁPIDA
     path('plantillas-factura/', views.listar_plantillas_factura),
@@ -43,6 +43,9 @@ def _floats_a_decimal(obj: Any) -> Any:
     """
     jsonschema + multipleOf 0.01 falla con floats binarios (ej. 39.55).
     Convertimos floats del DTE a Decimal; los enteros se dejan intactos.
+
+    Ya no se usa al validar (ver _multiple_of_decimal); se conserva para el benchmark
+    de comparación (manage.py benchmark_schema_mh).
     """
     if isinstance(obj, bool):
         return obj
@@ -55,6 +58,20 @@ def _floats_a_decimal(obj: Any) -> Any:
     return obj
 
 
+def _multiple_of_decimal(validator, divisor, instance, schema):
+    """
+    multipleOf en aritmética decimal: solo el número evaluado pasa a Decimal (str(float)),
+    en vez de copiar todo el DTE convirtiendo floats antes de validar.
+    """
+    from jsonschema.exceptions import ValidationError
+
+    if not validator.is_type(instance, 'number'):
+        return
+    valor = Decimal(str(instance)) if isinstance(instance, float) else Decimal(instance)
+    if valor % Decimal(str(divisor)):
+        yield ValidationError(f'{valor!r} is not a multiple of {divisor!r}')
+
+
 @lru_cache(maxsize=16)
 def _cargar_schema(rel_path: str) -> dict[str, Any]:
     path = SCHEMAS_ROOT / rel_path
@@ -65,6 +82,39 @@ def _cargar_schema(rel_path: str) -> dict[str, Any]:
         return json.load(fh, parse_float=Decimal)
 
 
+@lru_cache(maxsize=16)
+def _validador_rapido(rel_path: str):
+    """
+    Schema compilado a código Python con fastjsonschema (mucho más rápido que jsonschema
+    para recorrer cuerpoDocumento con cientos de ítems). None si la dependencia no está.
+
+    Solo responde válido / inválido; los mensajes de error siguen saliendo de jsonschema.
+    El schema se carga con float: fastjsonschema compara multipleOf con Decimal(repr(x)).
+    Sin formatos: igual que Draft7Validator sin format_checker.
+    """
+    try:
+        import fastjsonschema
+    except ImportError:
+        return None
+    path = SCHEMAS_ROOT / rel_path
+    with path.open(encoding='utf-8') as fh:
+        schema = json.load(fh)
+    try:
+        return fastjsonschema.compile(schema, use_formats=False)
+    except Exception as exc:
+        logger.warning('No se pudo compilar %s con fastjsonschema: %s', rel_path, exc)
+        return None
+
+
+@lru_cache(maxsize=16)
+def _validador(rel_path: str):
+    """Validador jsonschema por schema (se arma una vez por proceso, no por DTE)."""
+    from jsonschema import Draft7Validator, validators
+
+    ValidadorMH = validators.extend(Draft7Validator, {'multipleOf': _multiple_of_decimal})
+    return ValidadorMH(_cargar_schema(rel_path))
+
+
 def resolver_schema_path(tipo_dte: str) -> str | None:
     tipo = str(tipo_dte or '').strip().zfill(2)
     return SCHEMA_BY_TIPO.get(tipo)
@@ -87,7 +137,7 @@ def validar_dte_contra_schema(
         ImportError si falta la dependencia jsonschema.
     """
     try:
-        from jsonschema import Draft7Validator
+        import jsonschema  # noqa: F401
     except ImportError as exc:
         msg = (
             'Falta dependencia jsonschema. Instale con: pip install jsonschema'
@@ -109,11 +159,19 @@ def validar_dte_contra_schema(
             raise MhSchemaValidationError(msg, errores=[msg])
         return [msg]
 
-    schema = _cargar_schema(rel)
-    validator = Draft7Validator(schema)
-    instancia = _floats_a_decimal(json_dte)
     errores: list[str] = []
-    for err in sorted(validator.iter_errors(instancia), key=lambda e: list(e.path)):
+    rapido = _validador_rapido(rel)
+    if rapido is not None:
+        try:
+            rapido(json_dte)
+            return errores
+        except Exception:
+            pass  # inválido (o caso no soportado): detalle con jsonschema
+
+    validator = _validador(rel)
+    if validator.is_valid(json_dte):
+        return errores
+    for err in sorted(validator.iter_errors(json_dte), key=lambda e: list(e.path)):
         ruta = '.'.join(str(p) for p in err.path) or '(raíz)'
         errores.append(f'{ruta}: {err.message}')
         if len(errores) >= 25:
@@ -0,0 +1,230 @@
+"""
+Simulador local del Ministerio de Hacienda (y del firmador) para probar la transmisión sin MH.
+
+Atiende las mismas rutas que usa FacturacionService cuando MH_URL_BASE apunta a él:
+
+  POST /seguridad/auth                          token fijo
+  POST /fesv/recepciondte                       PROCESADO con sello (o RECHAZADO)
+  POST /fesv/recepcionlote/                     RECIBIDO + codigoLote
+  GET  /fesv/recepcion/consultadtelote/<lote>   procesados / rechazados del lote
+  POST /fesv/contingencia                       RECIBIDO
+  POST /fesv/anulardte                          PROCESADO
+  POST /firmardocumento/                        JWS sin firma real (FIRMADOR_URL con USE_INTERNAL_FIRMADOR=false)
+
+Se rechazan los documentos cuyo codigoGeneracion esté en ``rechazar``. Como en MH, el resultado de
+un lote no está listo al recibirlo: las primeras ``consultas_en_proceso`` consultas lo devuelven vacío.
+
+Uso: python manage.py simulador_mh --puerto 8114
+"""
+import base64
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SIMULADO = 'Bearer SIMULADOR-MH'
+
+
+def _b64url(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(datos).rstrip(b'=').decode('ascii')
+
+
+def jws_sin_firma(dte: Dict[str, Any]) -> str:
+    """JWS con el DTE como payload y firma ficticia (lo que devolvería el firmador)."""
+    cabecera = _b64url(json.dumps({'alg': 'none', 'typ': 'JWS'}).encode('utf-8'))
+    cuerpo = _b64url(json.dumps(dte, ensure_ascii=False).encode('utf-8'))
+    return f'{cabecera}.{cuerpo}.simulado'
+
+
+def _codigo_generacion(jws: str) -> str:
+    try:
+        payload = (jws or '').split('.')[1]
+        dte = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return str(dte['identificacion']['codigoGeneracion']).upper()
+    except (IndexError, KeyError, TypeError, ValueError):
+        return ''
+
+
+def _ahora() -> str:
+    return datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+
+
+class SimuladorMH:
+    """Servidor HTTP en un hilo (``iniciar``/``detener``) o en primer plano (``servir``)."""
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        puerto: int = 0,
+        rechazar: Iterable[str] = (),
+        consultas_en_proceso: int = 1,
+    ):
+        self.rechazar = {c.upper() for c in rechazar}
+        self.consultas_en_proceso = max(0, int(consultas_en_proceso))
+        self.lotes: Dict[str, Dict[str, Any]] = {}
+        self.peticiones: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+        manejador = type('ManejadorSimuladorMH', (_ManejadorMH,), {'simulador': self})
+        self._servidor = ThreadingHTTPServer((host, puerto), manejador)
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._servidor.server_address[:2]
+        return f'http://{host}:{puerto}'
+
+    def iniciar(self) -> 'SimuladorMH':
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, name='simulador-mh', daemon=True)
+        self._hilo.start()
+        return self
+
+    def servir(self) -> None:
+        self._servidor.serve_forever()
+
+    def detener(self) -> None:
+        self._servidor.shutdown()
+        self._servidor.server_close()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+
+    def registrar(self, metodo: str, ruta: str) -> None:
+        with self._lock:
+            self.peticiones.append((metodo, ruta))
+
+    def resultado_documento(self, jws: str, ambiente: str = '00') -> Dict[str, Any]:
+        codigo = _codigo_generacion(jws)
+        base = {
+            'version': 2,
+            'ambiente': ambiente,
+            'versionApp': 2,
+            'codigoGeneracion': codigo,
+            'fhProcesamiento': _ahora(),
+            'clasificaMsg': '10',
+        }
+        if not codigo or codigo in self.rechazar:
+            return {
+                **base,
+                'estado': 'RECHAZADO',
+                'selloRecibido': None,
+                'codigoMsg': '004',
+                'descripcionMsg': '[SIMULADOR] DOCUMENTO RECHAZADO',
+                'observaciones': ['Rechazo configurado en el simulador de MH'],
+            }
+        return {
+            **base,
+            'estado': 'PROCESADO',
+            'selloRecibido': f'{datetime.now().year}{uuid.uuid4().hex.upper()}'[:40],
+            'codigoMsg': '001',
+            'descripcionMsg': 'RECIBIDO',
+            'observaciones': [],
+        }
+
+    def recibir_lote(self, envio: Dict[str, Any]) -> Dict[str, Any]:
+        codigo_lote = uuid.uuid4().hex.upper()
+        with self._lock:
+            self.lotes[codigo_lote] = {
+                'ambiente': envio.get('ambiente') or '00',
+                'documentos': list(envio.get('documentos') or []),
+                'consultas': 0,
+            }
+        return {
+            'version': envio.get('version'),
+            'ambiente': envio.get('ambiente'),
+            'versionApp': 2,
+            'estado': 'RECIBIDO',
+            'idEnvio': envio.get('idEnvio'),
+            'fhProcesamiento': _ahora(),
+            'codigoLote': codigo_lote,
+            'codigoMsg': '001',
+            'descripcionMsg': 'RECIBIDO',
+        }
+
+    def consultar_lote(self, codigo_lote: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            lote = self.lotes.get(codigo_lote)
+            if lote is None:
+                return None
+            lote['consultas'] += 1
+            if lote['consultas'] <= self.consultas_en_proceso:
+                return {'procesados': [], 'rechazados': []}
+            documentos = list(lote['documentos'])
+        resultados = [self.resultado_documento(jws, lote['ambiente']) for jws in documentos]
+        return {
+            'procesados': [r for r in resultados if r['estado'] == 'PROCESADO'],
+            'rechazados': [r for r in resultados if r['estado'] == 'RECHAZADO'],
+        }
+
+
+class _ManejadorMH(BaseHTTPRequestHandler):
+    simulador: SimuladorMH = None
+    protocol_version = 'HTTP/1.1'  # keep-alive, como MH (las respuestas siempre llevan Content-Length)
+
+    def log_message(self, formato, *args):
+        logger.debug('simulador MH: ' + formato, *args)
+
+    def _responder(self, status: int, datos: Dict[str, Any]) -> None:
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _ruta(self) -> str:
+        return self.path.split('?', 1)[0].rstrip('/')
+
+    def do_POST(self):
+        ruta = self._ruta()
+        largo = int(self.headers.get('Content-Length') or 0)
+        crudo = self.rfile.read(largo) if largo else b''
+        self.simulador.registrar('POST', ruta)
+
+        if ruta == '/seguridad/auth':
+            return self._responder(200, {'status': 'OK', 'body': {'token': TOKEN_SIMULADO, 'tokenType': 'Bearer'}})
+        try:
+            datos = json.loads(crudo or b'{}')
+        except ValueError:
+            return self._responder(400, {'estado': 'RECHAZADO', 'descripcionMsg': 'JSON inválido'})
+        if ruta == '/firmardocumento':
+            return self._responder(200, {'status': 'OK', 'body': jws_sin_firma(datos.get('dteJson') or {})})
+        if self.headers.get('Authorization') != TOKEN_SIMULADO:
+            return self._responder(401, {'descripcionMsg': 'Token inválido'})
+
+        if ruta == '/fesv/recepciondte':
+            return self._responder(200, self.simulador.resultado_documento(datos.get('documento'), datos.get('ambiente')))
+        if ruta == '/fesv/recepcionlote':
+            return self._responder(200, self.simulador.recibir_lote(datos))
+        if ruta == '/fesv/contingencia':
+            return self._responder(200, {
+                'estado': 'RECIBIDO',
+                'fechaHora': _ahora(),
+                'mensaje': 'EVENTO DE CONTINGENCIA RECIBIDO (SIMULADOR)',
+                'selloRecibido': uuid.uuid4().hex.upper(),
+                'observaciones': [],
+            })
+        if ruta == '/fesv/anulardte':
+            return self._responder(200, {
+                'estado': 'PROCESADO',
+                'selloRecibido': uuid.uuid4().hex.upper(),
+                'descripcionMsg': 'RECIBIDO',
+                'observaciones': [],
+            })
+        return self._responder(404, {'descripcionMsg': f'Ruta no simulada: {ruta}'})
+
+    def do_GET(self):
+        ruta = self._ruta()
+        self.simulador.registrar('GET', ruta)
+        if self.headers.get('Authorization') != TOKEN_SIMULADO:
+            return self._responder(401, {'descripcionMsg': 'Token inválido'})
+        prefijo = '/fesv/recepcion/consultadtelote/'
+        if ruta.startswith(prefijo):
+            resultado = self.simulador.consultar_lote(ruta[len(prefijo):])
+            if resultado is None:
+                return self._responder(404, {'descripcionMsg': 'Lote no encontrado'})
+            return self._responder(200, resultado)
+        return self._responder(404, {'descripcionMsg': f'Ruta no simulada: {ruta}'})
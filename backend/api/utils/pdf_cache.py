@@ -0,0 +1,139 @@
+"""
+Caché en disco de PDFs de ventas aceptadas por MH (direccionada por contenido).
+
+Un DTE con sello_recepcion es inmutable: su PDF solo cambia si cambia el tema/logo de la
+empresa. La clave combina (venta, codigo_generacion, sello, tema PDF, versión del logo), así
+que un cambio de logo o de color genera otra clave y los archivos viejos simplemente dejan de
+usarse. La misma clave sirve de ETag para las descargas (enlace público WhatsApp / correo).
+
+PDF_CACHE_DIR: carpeta de la caché (por defecto MEDIA_ROOT/pdf_cache).
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.utils.http import http_date, parse_http_date_safe
+
+logger = logging.getLogger(__name__)
+
+# Subir si cambia el diseño de generar_pdf_venta: invalida todos los PDF cacheados.
+VERSION_PLANTILLA_PDF = 2
+
+
+class PdfVenta(NamedTuple):
+    contenido: bytes
+    etag: Optional[str]
+    ultima_modificacion: Optional[float]
+
+
+def _directorio_cache() -> Path:
+    return Path(getattr(settings, 'PDF_CACHE_DIR', None) or Path(settings.MEDIA_ROOT) / 'pdf_cache')
+
+
+def version_logo(empresa) -> str:
+    """Nombre y mtime del logo: reemplazarlo con el mismo nombre también cambia la versión."""
+    logo = getattr(empresa, 'logo', None) if empresa else None
+    if not logo:
+        return ''
+    try:
+        return f'{logo.name}:{os.stat(logo.path).st_mtime_ns}'
+    except (ValueError, OSError):
+        return logo.name or ''
+
+
+def clave_pdf(venta) -> Optional[str]:
+    """Hash de la versión del PDF, o None si la venta aún no tiene sello (PDF no definitivo)."""
+    sello = (getattr(venta, 'sello_recepcion', None) or '').strip()
+    if not sello:
+        return None
+    empresa = venta.empresa
+    partes = [
+        str(VERSION_PLANTILLA_PDF),
+        str(venta.pk),
+        (venta.codigo_generacion or '').strip().upper(),
+        sello,
+        (getattr(empresa, 'pdf_tema_color', None) or '').strip().lower(),
+        version_logo(empresa),
+    ]
+    return hashlib.sha256('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+def ruta_pdf_cacheado(venta) -> Optional[Path]:
+    """Ruta del PDF cacheado si existe (None si la venta no es cacheable o aún no se generó)."""
+    clave = clave_pdf(venta)
+    if clave is None:
+        return None
+    ruta = _directorio_cache() / clave[:2] / f'{clave}.pdf'
+    return ruta if ruta.exists() else None
+
+
+def _guardar(clave: str, contenido: bytes) -> Optional[Path]:
+    destino = _directorio_cache() / clave[:2] / f'{clave}.pdf'
+    try:
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contenido)
+        os.replace(tmp, destino)
+        return destino
+    except OSError as e:
+        logger.warning('No se pudo guardar el PDF cacheado %s: %s', destino, e)
+        return None
+
+
+def obtener_pdf_venta(venta, en_pool: bool = False) -> PdfVenta:
+    """
+    PDF de la venta: lectura de disco si ya está cacheado; si no, render (y se guarda si tiene sello).
+    en_pool: renderizar en el pool de procesos (solo trabajo en segundo plano, ver pdf_render_pool).
+    """
+    from .pdf_render_pool import renderizar_pdf
+
+    clave = clave_pdf(venta)
+    if clave is not None:
+        ruta = _directorio_cache() / clave[:2] / f'{clave}.pdf'
+        try:
+            return PdfVenta(ruta.read_bytes(), f'"{clave}"', ruta.stat().st_mtime)
+        except OSError:
+            pass
+
+    contenido = renderizar_pdf(venta, en_pool=en_pool)
+    if clave is None:
+        return PdfVenta(contenido, None, None)
+    ruta = _guardar(clave, contenido)
+    return PdfVenta(contenido, f'"{clave}"', ruta.stat().st_mtime if ruta else None)
+
+
+def precalentar_pdf_venta(venta) -> None:
+    """Genera el PDF en caché tras la aceptación de MH (no falla la transmisión si algo sale mal)."""
+    try:
+        if clave_pdf(venta) and ruta_pdf_cacheado(venta) is None:
+            obtener_pdf_venta(venta, en_pool=True)
+    except Exception as e:
+        logger.warning('No se pudo precalentar el PDF de la venta %s: %s', getattr(venta, 'pk', None), e)
+
+
+def no_modificado(request, pdf: PdfVenta) -> bool:
+    """True si el cliente ya tiene esta versión (If-None-Match / If-Modified-Since)."""
+    if pdf.etag is None:
+        return False
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = [e.strip().removeprefix('W/') for e in if_none_match.split(',')]
+        return pdf.etag in etags or '*' in etags
+    desde = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return bool(desde and pdf.ultima_modificacion and int(pdf.ultima_modificacion) <= desde)
+
+
+def aplicar_cabeceras_cache(response, pdf: PdfVenta) -> None:
+    """ETag / Last-Modified para PDFs definitivos (con sello)."""
+    if pdf.etag is None:
+        return
+    response['ETag'] = pdf.etag
+    if pdf.ultima_modificacion:
+        response['Last-Modified'] = http_date(pdf.ultima_modificacion)
@@ -4,7 +4,9 @@ Diseño con cabecera de color, 3 temas por empresa (ocean/emerald/amber),
 datos obligatorios MH y pie «factura por AgilDTE.com».
 """
 import io
+import threading
 import xml.sax.saxutils as saxutils
+from collections import OrderedDict
 from decimal import Decimal
 from pathlib import Path
 from urllib.parse import urlencode
@@ -239,6 +241,159 @@ def _obtener_ruta_logo(empresa):
     return None
 
 
+# Caja del logo en la cabecera (puntos) y resolución con la que se incrusta.
+LOGO_W, LOGO_H = 72, 40
+_LOGO_ESCALA = 4
+
+# Contexto de render por empresa (estilos, paleta, logo ya decodificado). La clave incluye
+# tema y versión del logo (nombre + mtime, como la caché de PDF): al cambiar el tema o el logo,
+# aunque se reemplace con el mismo nombre, se arma un contexto nuevo.
+_CONTEXTOS_RENDER = OrderedDict()
+_CONTEXTOS_LOCK = threading.Lock()
+_MAX_CONTEXTOS_RENDER = 64
+
+
+class _ContextoRender:
+    __slots__ = ('pal', 'estilos', 'logo_png')
+
+    def __init__(self, pal, estilos, logo_png):
+        self.pal = pal
+        self.estilos = estilos
+        self.logo_png = logo_png
+
+    def imagen_logo(self):
+        """Image nuevo por documento (platypus guarda estado de layout en cada flowable)."""
+        if not self.logo_png:
+            return None
+        try:
+            return Image(io.BytesIO(self.logo_png), width=LOGO_W, height=LOGO_H)
+        except Exception:
+            return None
+
+
+def _construir_estilos(pal):
+    styles = getSampleStyleSheet()
+    normal = ParagraphStyle(
+        name='NormalWrap', parent=styles['Normal'],
+        fontName='Helvetica', fontSize=8, leading=10,
+        textColor=pal['text'], wordWrap='CJK',
+    )
+    bold = ParagraphStyle(
+        name='BoldWrap', parent=normal, fontName='Helvetica-Bold',
+    )
+    header_white = ParagraphStyle(
+        name='HeaderWhite', parent=normal,
+        fontName='Helvetica-Bold', fontSize=8, leading=10, textColor=pal['white'],
+    )
+    return {
+        'normal': normal,
+        'bold': bold,
+        'sello': ParagraphStyle(
+            name='SelloSmall', parent=normal, fontSize=6, leading=8, wordWrap='CJK',
+        ),
+        'header_white': header_white,
+        'title_white': ParagraphStyle(
+            name='TitleWhite', parent=normal,
+            fontName='Helvetica-Bold', fontSize=14, leading=17, textColor=pal['white'],
+            alignment=2,  # RIGHT
+        ),
+        'sub_white': ParagraphStyle(
+            name='SubWhite', parent=normal,
+            fontSize=8, leading=10, textColor=pal['white'], alignment=2,
+        ),
+        'section': ParagraphStyle(
+            name='Section', parent=bold,
+            fontSize=9, leading=11, textColor=pal['primary'],
+        ),
+        'footer': ParagraphStyle(
+            name='FooterTiny', parent=normal,
+            fontSize=7, leading=9, textColor=pal['muted'], alignment=1,
+        ),
+        'celda': ParagraphStyle(
+            name='CeldaTiny', parent=normal, fontSize=7, leading=9,
+        ),
+        'th': ParagraphStyle(
+            name='TH', parent=normal,
+            fontName='Helvetica-Bold', fontSize=7, leading=8, textColor=pal['white'],
+        ),
+        'brand_meta': ParagraphStyle(
+            name='BrandMeta', parent=header_white, fontName='Helvetica', fontSize=7,
+        ),
+        'qr_label': ParagraphStyle(
+            name='QRLab', parent=normal, fontSize=7, alignment=1, textColor=pal['primary'],
+        ),
+        'resolucion': ParagraphStyle(
+            name='Resol', parent=normal, fontSize=7, textColor=pal['muted'],
+        ),
+        'thanks': ParagraphStyle(
+            name='Thanks', parent=normal, fontSize=8, alignment=1,
+            textColor=pal['primary'], fontName='Helvetica-Bold',
+        ),
+    }
+
+
+def _logo_png(path):
+    """Logo decodificado una vez y reducido a LOGO_W×LOGO_H × _LOGO_ESCALA (PNG)."""
+    try:
+        from PIL import Image as PILImage
+
+        with PILImage.open(path) as img:
+            img.load()
+            if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                img = img.convert('RGBA')
+            img.thumbnail((LOGO_W * _LOGO_ESCALA, LOGO_H * _LOGO_ESCALA))
+            buf = io.BytesIO()
+            img.save(buf, format='PNG', optimize=True)
+            return buf.getvalue()
+    except Exception:
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+def _clave_contexto(empresa):
+    from .pdf_cache import version_logo
+
+    if not empresa:
+        return (None, '', '')
+    return (
+        empresa.pk,
+        (getattr(empresa, 'pdf_tema_color', None) or 'ocean').strip().lower(),
+        version_logo(empresa),
+    )
+
+
+def _contexto_render(empresa):
+    clave = _clave_contexto(empresa)
+    with _CONTEXTOS_LOCK:
+        ctx = _CONTEXTOS_RENDER.get(clave)
+        if ctx is not None:
+            _CONTEXTOS_RENDER.move_to_end(clave)
+            return ctx
+
+    pal = _palette(empresa)
+    logo_path = _obtener_ruta_logo(empresa) if empresa else None
+    ctx = _ContextoRender(pal, _construir_estilos(pal), _logo_png(logo_path) if logo_path else None)
+    with _CONTEXTOS_LOCK:
+        _CONTEXTOS_RENDER[clave] = ctx
+        _CONTEXTOS_RENDER.move_to_end(clave)
+        while len(_CONTEXTOS_RENDER) > _MAX_CONTEXTOS_RENDER:
+            _CONTEXTOS_RENDER.popitem(last=False)
+    return ctx
+
+
+def invalidar_contexto_render(empresa_id=None):
+    """Descarta el contexto de una empresa (o todos); p. ej. si se reemplaza el logo con el mismo nombre."""
+    with _CONTEXTOS_LOCK:
+        if empresa_id is None:
+            _CONTEXTOS_RENDER.clear()
+            return
+        for clave in [c for c in _CONTEXTOS_RENDER if c[0] == empresa_id]:
+            del _CONTEXTOS_RENDER[clave]
+
+
 def _generar_qr_imagen_reportlab(url, size_pt=70):
     if not qrcode:
         return None
@@ -448,48 +603,19 @@ def generar_pdf_venta(venta):
     """
     buffer = io.BytesIO()
     empresa = venta.empresa
-    pal = _palette(empresa)
-    styles = getSampleStyleSheet()
-
-    estilo_normal = ParagraphStyle(
-        name='NormalWrap', parent=styles['Normal'],
-        fontName='Helvetica', fontSize=8, leading=10,
-        textColor=pal['text'], wordWrap='CJK',
-    )
-    estilo_bold = ParagraphStyle(
-        name='BoldWrap', parent=estilo_normal, fontName='Helvetica-Bold',
-    )
-    estilo_sello = ParagraphStyle(
-        name='SelloSmall', parent=estilo_normal, fontSize=6, leading=8, wordWrap='CJK',
-    )
-    estilo_header_white = ParagraphStyle(
-        name='HeaderWhite', parent=estilo_normal,
-        fontName='Helvetica-Bold', fontSize=8, leading=10, textColor=pal['white'],
-    )
-    estilo_title_white = ParagraphStyle(
-        name='TitleWhite', parent=estilo_normal,
-        fontName='Helvetica-Bold', fontSize=14, leading=17, textColor=pal['white'],
-        alignment=2,  # RIGHT
-    )
-    estilo_sub_white = ParagraphStyle(
-        name='SubWhite', parent=estilo_normal,
-        fontSize=8, leading=10, textColor=pal['white'], alignment=2,
-    )
-    estilo_section = ParagraphStyle(
-        name='Section', parent=estilo_bold,
-        fontSize=9, leading=11, textColor=pal['primary'],
-    )
-    estilo_footer = ParagraphStyle(
-        name='FooterTiny', parent=estilo_normal,
-        fontSize=7, leading=9, textColor=pal['muted'], alignment=1,
-    )
-    estilo_celda = ParagraphStyle(
-        name='CeldaTiny', parent=estilo_normal, fontSize=7, leading=9,
-    )
-    estilo_th = ParagraphStyle(
-        name='TH', parent=estilo_normal,
-        fontName='Helvetica-Bold', fontSize=7, leading=8, textColor=pal['white'],
-    )
+    ctx = _contexto_render(empresa)
+    pal = ctx.pal
+    estilos = ctx.estilos
+
+    estilo_normal = estilos['normal']
+    estilo_sello = estilos['sello']
+    estilo_header_white = estilos['header_white']
+    estilo_title_white = estilos['title_white']
+    estilo_sub_white = estilos['sub_white']
+    estilo_section = estilos['section']
+    estilo_footer = estilos['footer']
+    estilo_celda = estilos['celda']
+    estilo_th = estilos['th']
 
     emisor = _obtener_datos_emisor(venta)
     receptor = _obtener_datos_receptor(venta)
@@ -525,19 +651,13 @@ def generar_pdf_venta(venta):
     elements = []
 
     # ----- CABECERA DE COLOR -----
-    logo_path = _obtener_ruta_logo(empresa) if empresa else None
-    img_logo = None
-    if logo_path:
-        try:
-            img_logo = Image(logo_path, width=72, height=40)
-        except Exception:
-            img_logo = None
+    img_logo = ctx.imagen_logo()
 
     brand_lines = [
         Paragraph(f"<b>{_escape_html(emisor['nombre'])}</b>", estilo_header_white),
         Paragraph(
             f"NRC: {_escape_html(emisor['nrc'])}  ·  NIT: {_escape_html(emisor['nit'])}",
-            ParagraphStyle(name='BrandMeta', parent=estilo_header_white, fontName='Helvetica', fontSize=7),
+            estilos['brand_meta'],
         ),
     ]
     # Con logo: columna logo + 2 cm de separación + texto (evita nombre/NRC sobre el logo).
@@ -641,9 +761,7 @@ def generar_pdf_venta(venta):
     qr_block = []
     if img_qr:
         qr_block = [
-            [Paragraph('<b>Consulta MH</b>', ParagraphStyle(
-                name='QRLab', parent=estilo_normal, fontSize=7, alignment=1, textColor=pal['primary'],
-            ))],
+            [Paragraph('<b>Consulta MH</b>', estilos['qr_label'])],
             [img_qr],
         ]
     else:
@@ -912,9 +1030,7 @@ def generar_pdf_venta(venta):
         if serie_documento:
             partes.append(f"Serie {_escape_html(serie_documento)}")
         info_izq.append([Spacer(1, 4)])
-        info_izq.append([Paragraph(' '.join(partes), ParagraphStyle(
-            name='Resol', parent=estilo_normal, fontSize=7, textColor=pal['muted'],
-        ))])
+        info_izq.append([Paragraph(' '.join(partes), estilos['resolucion'])])
 
     contenido_izquierdo = Table(info_izq, colWidths=[CONTENT_W * 0.55])
     contenido_izquierdo.setStyle(TableStyle([
@@ -944,10 +1060,7 @@ def generar_pdf_venta(venta):
 
     pie_bar = Table(
         [
-            [Paragraph('Gracias por su confianza', ParagraphStyle(
-                name='Thanks', parent=estilo_normal, fontSize=8, alignment=1,
-                textColor=pal['primary'], fontName='Helvetica-Bold',
-            ))],
+            [Paragraph('Gracias por su confianza', estilos['thanks'])],
             [Paragraph(contact_line, estilo_footer)] if contact_line else [Spacer(1, 1)],
             [Paragraph('factura por AgilDTE.com', estilo_footer)],
         ],
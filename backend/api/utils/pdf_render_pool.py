@@ -0,0 +1,174 @@
+"""
+Render de PDFs de ventas en un pool de procesos (ReportLab es CPU y no suelta el GIL).
+
+Las ventas se envían al pool como instantáneas picklables: la propia instancia con empresa,
+cliente y detalles/producto ya cargados, de modo que el proceso hijo no toca la base de datos.
+Los resultados vuelven en el mismo orden en que se pidieron (ZIP de descarga masiva).
+
+Solo se usa para render por lotes (ZIP de descarga masiva, precalentado de la caché tras la
+aceptación de MH): un PDF suelto en una petición solo ganaría el coste de pickle/IPC.
+
+PDF_RENDER_WORKERS: procesos del pool (por defecto 0 = desactivado, render en el mismo proceso).
+El pool se crea al primer lote en cada proceso que lo use (cada worker web de gunicorn tendría el
+suyo): conviene activarlo donde corre la cola de facturación o dimensionarlo con eso en cuenta.
+Si el pool no se puede crear o se rompe, se renderiza en el proceso actual.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _workers_configurados() -> int:
+    return max(0, int(getattr(settings, 'PDF_RENDER_WORKERS', 0) or 0))
+
+
+def _inicializar_proceso(settings_module: str) -> None:
+    """Arranque del proceso hijo (spawn): Django configurado, sin conexiones heredadas."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _obtener_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool, _pool_workers
+    workers = _workers_configurados()
+    if workers <= 1:
+        return None
+    with _pool_lock:
+        if _pool is not None and _pool_workers == workers:
+            return _pool
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        try:
+            # spawn (no fork): el hijo no comparte sockets de BD ni hilos del worker web.
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_inicializar_proceso,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'sistema_contable.settings'),),
+            )
+            _pool_workers = workers
+        except (OSError, ValueError) as e:
+            logger.warning('No se pudo crear el pool de render PDF (%s); se renderiza en proceso', e)
+            _pool = None
+        return _pool
+
+
+def _descartar_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def cerrar_pool() -> None:
+    """Apaga el pool (tests / fin del proceso)."""
+    _descartar_pool()
+
+
+def preparar_instantaneas(ventas: Iterable) -> list:
+    """Carga empresa, cliente y detalles/producto para que la venta se pueda renderizar sin BD."""
+    ventas = list(ventas)
+    prefetch_related_objects(ventas, 'empresa', 'cliente', 'detalles__producto')
+    return ventas
+
+
+def _render_bytes(venta) -> Tuple[Optional[bytes], Optional[str]]:
+    """Render en el proceso actual o en el hijo: (pdf, None) o (None, error)."""
+    from .pdf_generator import generar_pdf_venta
+
+    try:
+        buffer = generar_pdf_venta(venta)
+        data = buffer.getvalue() if hasattr(buffer, 'getvalue') else buffer.read()
+        return data, None
+    except Exception as e:
+        return None, str(e) or e.__class__.__name__
+
+
+def renderizar_pdfs(ventas: Iterable) -> Iterator[Tuple[object, Optional[bytes], Optional[str]]]:
+    """
+    Genera (venta, pdf_bytes, error) en el mismo orden de `ventas`.
+    Mantiene como máximo 2 × workers PDFs en vuelo para acotar la memoria.
+    """
+    ventas = preparar_instantaneas(ventas)
+    pool = _obtener_pool() if len(ventas) > 1 else None
+    if pool is None:
+        for venta in ventas:
+            yield (venta, *_render_bytes(venta))
+        return
+
+    ventana = max(2, 2 * _pool_workers)
+    en_vuelo: deque = deque()
+    pendientes = iter(ventas)
+    roto = False
+
+    def _llenar():
+        nonlocal roto
+        while not roto and len(en_vuelo) < ventana:
+            venta = next(pendientes, None)
+            if venta is None:
+                return
+            try:
+                en_vuelo.append((venta, pool.submit(_render_bytes, venta)))
+            except (BrokenProcessPool, RuntimeError):
+                roto = True
+                en_vuelo.append((venta, None))
+
+    _llenar()
+    while en_vuelo:
+        venta, futuro = en_vuelo.popleft()
+        resultado = None
+        if futuro is not None and not roto:
+            try:
+                resultado = futuro.result()
+            except BrokenProcessPool:
+                logger.warning('Pool de render PDF roto; se continúa en proceso')
+                roto = True
+                _descartar_pool()
+            except Exception as e:
+                resultado = (None, str(e))
+        if resultado is None:
+            resultado = _render_bytes(venta)
+        yield (venta, *resultado)
+        _llenar()
+    for venta in pendientes:
+        yield (venta, *_render_bytes(venta))
+
+
+def renderizar_pdf(venta, en_pool: bool = False) -> bytes:
+    """
+    PDF de una sola venta. Por defecto en el proceso actual (peticiones); en_pool=True para
+    trabajo en segundo plano (precalentado) si el pool está activo. Lanza ValueError si falla.
+    """
+    venta = preparar_instantaneas([venta])[0]
+    pool = _obtener_pool() if en_pool else None
+    data, error = None, None
+    if pool is not None:
+        try:
+            data, error = pool.submit(_render_bytes, venta).result()
+        except BrokenProcessPool:
+            logger.warning('Pool de render PDF roto; se renderiza en proceso')
+            _descartar_pool()
+            data, error = _render_bytes(venta)
+    else:
+        data, error = _render_bytes(venta)
+    if error is not None:
+        raise ValueError(error)
+    return data
@@ -0,0 +1,77 @@
+"""ZIP generado en streaming: cada entrada se emite en cuanto se escribe (memoria acotada por entrada)."""
+from __future__ import annotations
+
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+# Los PDF ya guardados en disco se copian al ZIP por bloques de este tamaño.
+_BLOQUE_COPIA = 64 * 1024
+
+
+class _SalidaNoSeekable:
+    """Destino de ZipFile sin seek/tell: zipfile usa descriptores de datos y no reescribe cabeceras."""
+
+    def __init__(self):
+        self._partes: list[bytes] = []
+
+    def write(self, data) -> int:
+        if data:
+            self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def vaciar(self) -> bytes:
+        data = b''.join(self._partes)
+        self._partes.clear()
+        return data
+
+
+class ZipStream:
+    """
+    Escribe un ZIP sobre un generador.
+
+    Uso:
+        zs = ZipStream()
+        yield from zs.agregar('a.pdf', pdf_bytes)
+        yield from zs.agregar_archivo('b.pdf', '/ruta/b.pdf')
+        yield from zs.cerrar()
+    """
+
+    def __init__(self, compresion: int = zipfile.ZIP_DEFLATED):
+        self._salida = _SalidaNoSeekable()
+        self._zf = zipfile.ZipFile(self._salida, 'w', compresion)
+
+    def agregar(self, nombre: str, data: bytes) -> Iterator[bytes]:
+        self._zf.writestr(nombre, data)
+        yield from self._pendiente()
+
+    def agregar_archivo(self, nombre: str, ruta: str) -> Iterator[bytes]:
+        with open(ruta, 'rb') as origen, self._zf.open(nombre, 'w', force_zip64=True) as destino:
+            while True:
+                bloque = origen.read(_BLOQUE_COPIA)
+                if not bloque:
+                    break
+                destino.write(bloque)
+                pendiente = self._salida.vaciar()
+                if pendiente:
+                    yield pendiente
+        yield from self._pendiente()
+
+    def cerrar(self) -> Iterator[bytes]:
+        self._zf.close()
+        yield from self._pendiente()
+
+    def _pendiente(self) -> Iterator[bytes]:
+        data = self._salida.vaciar()
+        if data:
+            yield data
+
+
+def iterar_zip(entradas: Iterable[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """Atajo: ZIP en streaming a partir de pares (nombre, bytes)."""
+    zs = ZipStream()
+    for nombre, data in entradas:
+        yield from zs.agregar(nombre, data)
+    yield from zs.cerrar()
@@ -2,10 +2,9 @@ import calendar
 import json
 import csv
 import logging
-import zipfile
 import io
-from decimal import Decimal
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import IntegrityError, transaction
 from django.db.models import Q, F, Sum
 from django.db.models.functions import TruncDay
 from django.utils import timezone
@@ -20,13 +19,13 @@ from rest_framework.permissions import IsAuthenticated as DRFIsAuthenticated
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
-from .models import Cliente, Compra, Venta, Retencion, Empresa, Liquidacion, RetencionRecibida, Producto, DetalleVenta, PerfilUsuario, ActividadEconomica, Correlativo, PlantillaFactura, TareaFacturacion
+from .models import Cliente, Compra, Venta, Retencion, Empresa, Liquidacion, RetencionRecibida, Producto, DetalleVenta, PerfilUsuario, ActividadEconomica, Correlativo, PlantillaFactura, TareaFacturacion, JobContingencia
 from .serializers import ClienteSerializer, CompraSerializer, VentaSerializer, RetencionSerializer, EmpresaSerializer, LiquidacionSerializer, RetencionRecibidaSerializer, ProductoSerializer, VentaConDetallesSerializer, ActividadEconomicaSerializer, PlantillaFacturaSerializer
-from .utils.pdf_generator import generar_pdf_venta
 from .utils.dte_historico import obtener_dte_historico
 from .utils.tenant import get_empresa_ids_allowlist, require_empresa_allowed, require_object_empresa_allowed, get_and_validate_empresa
 from .services import FacturacionService, FacturacionServiceError, AutenticacionMHError, FirmaDTEError, EnvioMHError
 from .services.email_service import enviar_factura_email
+from .services.dashboard_stats import resumen_mes
 from .utils.contingencia import generar_reporte_contingencia
 
 logger = logging.getLogger(__name__)
@@ -362,19 +361,23 @@ class EmpresaViewSet(viewsets.ModelViewSet):
     def procesar_contingencia_completa(self, request, pk=None):
         """
         1) Genera y ENVÍA a MH el reporte de contingencia (espera respuesta).
-        2) Si el reporte es PROCESADO, envía UNA A UNA las ventas PendienteEnvio de la empresa.
+        2) Si el reporte es RECIBIDO, reenvía en paralelo las ventas PendienteEnvio de la empresa
+           (respetando MH_RATE_LIMIT_POR_SEGUNDO por empresa).
         Body opcional: venta_ids — lista de IDs a incluir (útil en stress test / cierre parcial).
-        Devuelve resumen de aceptación/rechazo de cada factura.
+        El proceso corre en segundo plano: responde 202 con el job; el progreso y el resumen de
+        aceptación/rechazo se consultan en GET contingencia-jobs/<job_id>/.
         """
-        from .services.facturacion_service import FacturacionService, FacturacionServiceError, EnvioMHError, EnvioMHTransitorioError
+        from .services.contingencia_job import (
+            iniciar_job_contingencia,
+            job_contingencia_activo,
+            job_contingencia_dict,
+        )
 
         empresa = self.get_object()
         r = require_empresa_allowed(request, empresa.id)
         if r is not None:
             return r
 
-        now_sv = timezone.localtime(timezone.now())
-
         ventas_qs = Venta.objects.filter(
             empresa=empresa,
             estado_dte='PendienteEnvio',
@@ -397,136 +400,74 @@ class EmpresaViewSet(viewsets.ModelViewSet):
                 )
             total_pendientes = ventas_qs.count()
             ventas_qs = ventas_qs.filter(id__in=venta_ids)
-            ventas = list(ventas_qs)
-            ventas_excluidas = max(0, total_pendientes - len(ventas))
-            if not ventas:
+            ids = list(ventas_qs.values_list('id', flat=True))
+            ventas_excluidas = max(0, total_pendientes - len(ids))
+            if not ids:
                 return Response({
                     "mensaje": "Ninguna de las ventas indicadas está en PendienteEnvio.",
                     "venta_ids": venta_ids,
                     "pendientes_empresa": total_pendientes,
                 }, status=status.HTTP_400_BAD_REQUEST)
         else:
-            ventas = list(ventas_qs)
+            ids = list(ventas_qs.values_list('id', flat=True))
 
-        if not ventas:
+        if not ids:
             return Response({
                 "mensaje": "No hay ventas en estado PendienteEnvio para procesar.",
                 "empresa_id": empresa.id,
             }, status=status.HTTP_200_OK)
 
-        # Ambiente para el evento de contingencia:
-        # empresa.ambiente: '01' = PRUEBAS, '00' = PRODUCCIÓN
-        # Manual contingencia: ambiente '00' = Pruebas, '01' = Producción
-        # Usamos el mismo mapeo que para DTE (DTE_AMBIENTE_CODE).
-        servicio = FacturacionService(empresa)
-        ambiente_mh = servicio.DTE_AMBIENTE_CODE.get(servicio.codigo_ambiente_mh, servicio.codigo_ambiente_mh)
-
-        if empresa.contingencia_f_inicio and empresa.contingencia_h_inicio:
-            f_inicio_dt = datetime.combine(
-                empresa.contingencia_f_inicio,
-                empresa.contingencia_h_inicio,
-                tzinfo=timezone.get_current_timezone(),
-            )
-        else:
-            primera = ventas[0]
-            f_inicio_dt = datetime.combine(
-                primera.fecha_emision,
-                now_sv.time().replace(microsecond=0),
-                tzinfo=timezone.get_current_timezone(),
-            )
-
-        f_fin_dt = now_sv
-
-        tipo_cont = request.data.get('tipoContingencia') or empresa.contingencia_tipo or 1
+        tipo_cont = request.data.get('tipoContingencia')
+        if tipo_cont in (None, ''):
+            tipo_cont = empresa.contingencia_tipo or 1
         motivo_cont = request.data.get('motivo') or empresa.contingencia_motivo
-
-        # 1) Generar JSON de contingencia
-        reporte_json = generar_reporte_contingencia(
-            empresa=empresa,
-            ventas=ventas,
-            ambiente_mh=ambiente_mh,
-            f_inicio=f_inicio_dt,
-            f_fin=f_fin_dt,
-            tipo_contingencia=int(tipo_cont),
-            motivo=motivo_cont,
-            nombre_responsable=None,
-            tipo_doc_responsable=None,
-            numero_doc_responsable=None,
-        )
-
-        # 1b) Enviar evento de contingencia a MH y esperar respuesta
         try:
-            resultado_cont = servicio.enviar_evento_contingencia(reporte_json)
-        except (EnvioMHError, EnvioMHTransitorioError) as e:
-            return Response({
-                "mensaje": "Error al enviar el evento de contingencia a MH.",
-                "detalle": str(e),
-            }, status=status.HTTP_400_BAD_REQUEST)
+            tipo_cont = int(tipo_cont)
+        except (TypeError, ValueError):
+            tipo_cont = None
+        if tipo_cont not in range(1, 6):
+            return Response(
+                {'tipoContingencia': 'Debe ser un número entre 1 y 5.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        if (resultado_cont or {}).get("estado") != "RECIBIDO":
-            return Response({
-                "mensaje": "MH no recibió el evento de contingencia.",
-                "resultado_contingencia": resultado_cont,
-            }, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            # Bloquea la empresa: dos clics o reintentos simultáneos no lanzan dos cierres
+            Empresa.objects.select_for_update().only('pk').get(pk=empresa.pk)
+            activo = job_contingencia_activo(empresa.id)
+            if activo is not None:
+                return Response({
+                    **job_contingencia_dict(activo),
+                    "mensaje": "Ya hay un cierre de contingencia en curso para esta empresa.",
+                }, status=status.HTTP_409_CONFLICT)
+            job = JobContingencia.objects.create(
+                empresa=empresa,
+                creado_por=request.user if request.user.is_authenticated else None,
+                venta_ids=ids,
+                ventas_excluidas=ventas_excluidas,
+                tipo_contingencia=tipo_cont,
+                motivo=motivo_cont,
+                total=len(ids),
+                mensaje="Contingencia en cola de procesamiento.",
+            )
+            iniciar_job_contingencia(job)
 
-        # 2) Enviar todas las ventas pendientes, una por una, de forma SÍNCRONA.
-        resumen = {
-            "total": len(ventas),
-            "aceptadas": 0,
-            "rechazadas": 0,
-            "errores": 0,
-            "detalles": [],
-        }
-        for v in ventas:
-            try:
-                resultado = servicio.procesar_factura(v)
-                aceptado = resultado.get("exito") and v.estado_dte == "AceptadoMH"
-                if aceptado:
-                    resumen["aceptadas"] += 1
-                else:
-                    resumen["rechazadas"] += 1
-                resumen["detalles"].append({
-                    "venta_id": v.id,
-                    "estado_dte": v.estado_dte,
-                    "mensaje": resultado.get("mensaje"),
-                    "codigo_generacion": resultado.get("codigo_generacion"),
-                    "numero_control": resultado.get("numero_control"),
-                })
-            except FacturacionServiceError as e:
-                v.refresh_from_db()
-                resumen["errores"] += 1
-                resumen["detalles"].append({
-                    "venta_id": v.id,
-                    "estado_dte": v.estado_dte,
-                    "mensaje": str(e),
-                })
-            except Exception as e:
-                v.refresh_from_db()
-                resumen["errores"] += 1
-                resumen["detalles"].append({
-                    "venta_id": v.id,
-                    "estado_dte": v.estado_dte,
-                    "mensaje": f"Error inesperado: {str(e)}",
-                })
+        return Response(job_contingencia_dict(job), status=status.HTTP_202_ACCEPTED)
 
-        empresa.contingencia_activa = False
-        empresa.contingencia_f_fin = now_sv.date()
-        empresa.contingencia_h_fin = now_sv.time().replace(microsecond=0)
-        empresa.save(update_fields=[
-            'contingencia_activa',
-            'contingencia_f_fin',
-            'contingencia_h_fin',
-        ])
+    @action(detail=True, methods=['get'], url_path=r'contingencia-jobs/(?P<job_id>[0-9]+)')
+    def contingencia_job(self, request, pk=None, job_id=None):
+        """Progreso de un cierre de contingencia lanzado con procesar-contingencia-completa."""
+        from .services.contingencia_job import cerrar_jobs_interrumpidos, job_contingencia_dict
 
-        return Response({
-            "mensaje": "Proceso de contingencia completado.",
-            "empresa_id": empresa.id,
-            "ventas_procesadas": [v.id for v in ventas],
-            "ventas_excluidas": ventas_excluidas,
-            "reporte_contingencia": reporte_json,
-            "resultado_contingencia": resultado_cont,
-            "resumen_envio": resumen,
-        }, status=status.HTTP_200_OK)
+        empresa = self.get_object()
+        r = require_empresa_allowed(request, empresa.id)
+        if r is not None:
+            return r
+        cerrar_jobs_interrumpidos(empresa.id)
+        job = JobContingencia.objects.filter(empresa=empresa, pk=job_id).first()
+        if job is None:
+            return Response({"mensaje": "Job de contingencia no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job_contingencia_dict(job), status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['get', 'post'], url_path='modo-operacion')
     def modo_operacion(self, request, pk=None):
@@ -1387,55 +1328,19 @@ def _dashboard_stats_api_impl(request, empresa_ids):
             return r
         empresa_ids = [int(empresa_id)]
 
-    now = timezone.localdate()
-    year, month = now.year, now.month
-    first_day = timezone.datetime(year, month, 1).date()
-    _, last_day_num = calendar.monthrange(year, month)
-    last_day = timezone.datetime(year, month, last_day_num).date()
-
     filtro_tenant = Q(empresa_id__in=empresa_ids)
-    filtro_procesado = Q(estado_dte__in=['AceptadoMH', 'Enviado'])
-    filtro_mes = Q(fecha_emision__gte=first_day, fecha_emision__lte=last_day)
-    filtro_hoy = Q(fecha_emision=now)
+    ambiente = None
 
     # Filtrar por ambiente: en producción solo mostrar ventas del ambiente actual
     if empresa_id:
         try:
-            emp = Empresa.objects.get(pk=int(empresa_id))
-            filtro_tenant &= Q(ambiente_emision=emp.ambiente)
+            ambiente = Empresa.objects.only('ambiente').get(pk=int(empresa_id)).ambiente
+            filtro_tenant &= Q(ambiente_emision=ambiente)
         except (Empresa.DoesNotExist, ValueError):
             pass
 
-    base_mes = Venta.objects.filter(filtro_tenant, filtro_procesado, filtro_mes)
-    base_hoy = Venta.objects.filter(filtro_tenant, filtro_procesado, filtro_hoy)
-
-    # total_ventas_mes: suma de total_pagar
-    total_ventas_mes = Decimal('0.00')
-    for v in base_mes.only('venta_gravada', 'venta_exenta', 'venta_no_sujeta', 'debito_fiscal', 'iva_retenido_1', 'iva_retenido_2'):
-        total_ventas_mes += Decimal(str(_total_pagar_venta(v)))
-    total_ventas_mes = float(total_ventas_mes)
-
-    cantidad_dtes_mes = base_mes.count()
-
-    ventas_hoy = Decimal('0.00')
-    for v in base_hoy.only('venta_gravada', 'venta_exenta', 'venta_no_sujeta', 'debito_fiscal', 'iva_retenido_1', 'iva_retenido_2'):
-        ventas_hoy += Decimal(str(_total_pagar_venta(v)))
-    ventas_hoy = float(ventas_hoy)
-
-    # ventas_por_dia: agrupar por día del mes actual (todos los días 1..last_day_num)
-    ventas_por_dia_map = {}
-    for d in range(1, last_day_num + 1):
-        ventas_por_dia_map[d] = 0.0
-    ventas_mes = Venta.objects.filter(filtro_tenant, filtro_procesado, filtro_mes).only(
-        'fecha_emision', 'venta_gravada', 'venta_exenta', 'venta_no_sujeta', 'debito_fiscal', 'iva_retenido_1', 'iva_retenido_2'
-    )
-    for v in ventas_mes:
-        dia = v.fecha_emision.day
-        ventas_por_dia_map[dia] = ventas_por_dia_map.get(dia, 0) + _total_pagar_venta(v)
-    ventas_por_dia = [
-        {"dia": f"{d:02d}", "total": round(ventas_por_dia_map[d], 2)}
-        for d in range(1, last_day_num + 1)
-    ]
+    # Mes, hoy y serie por día: una consulta agregada (cacheada unos segundos)
+    resumen = resumen_mes(empresa_ids, ambiente, timezone.localdate())
 
     # ultimas_ventas: últimos 5 (cualquier estado), serializado simple
     ultimas = Venta.objects.filter(filtro_tenant).select_related('cliente').order_by('-fecha_emision', '-id')[:5]
@@ -1451,13 +1356,7 @@ def _dashboard_stats_api_impl(request, empresa_ids):
             "estado": v.estado_dte or 'Borrador',
         })
 
-    return Response({
-        "total_ventas_mes": total_ventas_mes,
-        "cantidad_dtes_mes": cantidad_dtes_mes,
-        "ventas_hoy": ventas_hoy,
-        "ventas_por_dia": ventas_por_dia,
-        "ultimas_ventas": ultimas_ventas,
-    })
+    return Response({**resumen, "ultimas_ventas": ultimas_ventas})
 
 
 # --- CARGA MASIVA ---
@@ -1910,11 +1809,26 @@ def crear_venta(request):
         return Response(serializer.data, status=201)
     return Response(serializer.errors, status=400)
 
+def _venta_ya_registrada_response(request, venta):
+    """Respuesta a un reintento con la misma Idempotency-Key: la venta existente, sin volver a crearla."""
+    if venta.empresa_id is not None:
+        r = require_empresa_allowed(request, venta.empresa_id)
+        if r is not None:
+            return r
+    data = VentaSerializer(venta).data
+    data['mensaje'] = 'Venta ya registrada con esta Idempotency-Key; no se creó otra.'
+    data['procesamiento'] = 'idempotente'
+    return Response(data, status=200)
+
+
 def _crear_venta_con_detalles_response(request, *, desde_pos=False):
     """Crea venta con detalles y facturación MH (compartido con endpoint PosAgil).
 
     desde_pos=True (solo /api/pos/procesar-venta/): por defecto facturación síncrona ante MH
     (POSAGIL_FACTURACION_SINCRONA) para que el comprobante pueda incluir sello sin cola asíncrona.
+
+    Cabecera Idempotency-Key (opcional, la envía la bandeja de PosAgil): si ya existe una venta con
+    esa clave se devuelve (200) en lugar de crear otra; así un reintento tras un timeout no duplica.
     """
     from django.conf import settings
     from .services.facturacion_service import FacturacionService, FacturacionServiceError
@@ -1929,11 +1843,27 @@ def _crear_venta_con_detalles_response(request, *, desde_pos=False):
         if r is not None:
             return r
 
+    idempotency_key = (request.headers.get('Idempotency-Key') or '').strip()[:64] or None
+    if idempotency_key:
+        previa = Venta.objects.filter(idempotency_key=idempotency_key).first()
+        if previa is not None:
+            return _venta_ya_registrada_response(request, previa)
+
     serializer = VentaConDetallesSerializer(data=request.data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=400)
 
-    venta = serializer.save()
+    if idempotency_key:
+        try:
+            venta = serializer.save(idempotency_key=idempotency_key)
+        except IntegrityError:
+            # Reintento concurrente con la misma clave: ganó la otra petición.
+            previa = Venta.objects.filter(idempotency_key=idempotency_key).first()
+            if previa is None:
+                raise
+            return _venta_ya_registrada_response(request, previa)
+    else:
+        venta = serializer.save()
 
     if desde_pos:
         try:
@@ -2058,7 +1988,7 @@ def pos_procesar_venta(request):
     Respuesta normalizada con ok/mensaje para cerrar venta en el POS.
     """
     inner = _crear_venta_con_detalles_response(request, desde_pos=True)
-    if inner.status_code != 201:
+    if inner.status_code not in (200, 201):
         return inner
     body = inner.data
     estado = (body.get('estado_dte') or '').strip()
@@ -2730,6 +2660,87 @@ def descargar_lote_ventas_api(request):
     return download_batch_ventas(request)
 
 
+def _iterar_zip_ventas(ids_ordenados, format_type, ambiente_q=None):
+    """
+    Genera el ZIP de download_batch_ventas entrada por entrada (StreamingHttpResponse).
+    Prefetch por bloques de 250 ventas; los PDF sin archivo en disco se renderizan en el
+    pool de procesos (pdf_render_pool) y vuelven en orden al ZIP.
+    """
+    import os
+    from .utils.builders import generar_dte
+    from .utils.pdf_cache import ruta_pdf_cacheado
+    from .utils.pdf_render_pool import renderizar_pdfs
+    from .utils.zip_stream import ZipStream
+
+    zs = ZipStream()
+    ext = 'pdf' if format_type == 'pdf' else 'json'
+    CHUNK_SIZE = 250
+
+    for i in range(0, len(ids_ordenados), CHUNK_SIZE):
+        chunk_ids = ids_ordenados[i : i + CHUNK_SIZE]
+        chunk_objs = (
+            Venta.objects.filter(pk__in=chunk_ids)
+            .select_related('empresa', 'cliente')
+            .prefetch_related('detalles__producto')
+        )
+        by_id = {v.pk: v for v in chunk_objs}
+        ventas_chunk = [by_id[vid] for vid in chunk_ids if vid in by_id]
+        del by_id
+        renders = iter(())
+        cacheados = {}
+        if format_type == 'pdf':
+            for v in ventas_chunk:
+                ruta = ruta_pdf_cacheado(v)
+                if ruta is not None:
+                    cacheados[v.pk] = str(ruta)
+            renders = renderizar_pdfs(
+                v for v in ventas_chunk
+                if not getattr(v, 'archivo_pdf', None) and v.pk not in cacheados
+            )
+        for v in ventas_chunk:
+            nombre_base = v.numero_control or f"venta_{v.id}"
+            nombre_safe = "".join(c if c.isalnum() or c in '-_' else '_' for c in str(nombre_base))
+            nombre_archivo = f"{nombre_safe}.{ext}"
+            path_fisico = None
+
+            try:
+                # PDF en disco solo para descarga PDF (no confundir con JSON DTE)
+                if format_type == 'pdf' and hasattr(v, 'archivo_pdf') and v.archivo_pdf:
+                    path_fisico = v.archivo_pdf.path
+                    if not os.path.exists(path_fisico):
+                        raise FileNotFoundError(f"Archivo no encontrado: {path_fisico}")
+                elif format_type == 'pdf' and v.pk in cacheados:
+                    path_fisico = cacheados[v.pk]
+                elif format_type == 'pdf':
+                    _, entrada, error = next(renders)
+                    if error is not None:
+                        raise ValueError(error)
+                else:
+                    # Un DTE aceptado se descarga desde su JWS histórico:
+                    # nunca se reconstruye con builders/versiones actuales.
+                    dte_json = obtener_dte_historico(v)
+                    if dte_json is None:
+                        if not v.empresa:
+                            raise ValueError('La venta debe tener empresa asociada para generar el DTE')
+                        ambiente_empresa = (v.empresa.ambiente or '01').strip()
+                        dte_ambiente_map = {'01': '00', '00': '01'}
+                        ambiente_dte = ambiente_q if ambiente_q else dte_ambiente_map.get(ambiente_empresa, '00')
+                        dte_json = generar_dte(v, ambiente=ambiente_dte)
+                    entrada = json.dumps(dte_json, indent=2, ensure_ascii=False).encode('utf-8')
+            except Exception as e:
+                logger.warning(f"Error generando {ext} para venta {v.id}: {e}")
+                msg_error = f"No se pudo generar este documento.\nVenta ID: {v.id}\nError: {str(e)}"
+                yield from zs.agregar(f"error_factura_{v.id}.txt", msg_error.encode('utf-8'))
+                continue
+
+            if path_fisico:
+                yield from zs.agregar_archivo(nombre_archivo, path_fisico)
+            else:
+                yield from zs.agregar(nombre_archivo, entrada)
+
+    yield from zs.cerrar()
+
+
 def download_batch_ventas(request):
     """
     Descarga PDFs o JSONs de ventas en un archivo ZIP.
@@ -2740,12 +2751,12 @@ def download_batch_ventas(request):
     Incluye todas las ventas que cumplan el filtro (sin tope artificial de 100).
     Genera archivos dinámicamente (no usa rutas de disco). Si un documento falla,
     agrega error_factura_X.txt en lugar de romper el ciclo.
+    El ZIP se envía en streaming (StreamingHttpResponse): cada entrada sale en cuanto se
+    genera, sin armar el archivo completo en memoria.
 
     Nota: la entrada HTTP es descargar_lote_ventas_api (@api_view); esta función solo recibe
     el Request ya envuelto por DRF (no anidar otro @api_view).
     """
-    from .utils.builders import generar_dte
-
     try:
         empresa_ids = get_empresa_ids_allowlist(request)
         if not empresa_ids:
@@ -2768,62 +2779,11 @@ def download_batch_ventas(request):
         if not ids_ordenados:
             return JsonResponse({'error': 'No hay ventas que coincidan con los filtros'}, status=400)
 
-        buffer = io.BytesIO()
-        ext = 'pdf' if format_type == 'pdf' else 'json'
-        CHUNK_SIZE = 250
-
-        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for i in range(0, len(ids_ordenados), CHUNK_SIZE):
-                chunk_ids = ids_ordenados[i : i + CHUNK_SIZE]
-                chunk_objs = (
-                    Venta.objects.filter(pk__in=chunk_ids)
-                    .select_related('empresa', 'cliente')
-                    .prefetch_related('detalles__producto')
-                )
-                by_id = {v.pk: v for v in chunk_objs}
-                for vid in chunk_ids:
-                    v = by_id.get(vid)
-                    if v is None:
-                        continue
-                    nombre_base = v.numero_control or f"venta_{v.id}"
-                    nombre_safe = "".join(c if c.isalnum() or c in '-_' else '_' for c in str(nombre_base))
-                    nombre_archivo = f"{nombre_safe}.{ext}"
-
-                    try:
-                        # PDF en disco solo para descarga PDF (no confundir con JSON DTE)
-                        if format_type == 'pdf' and hasattr(v, 'archivo_pdf') and v.archivo_pdf:
-                            import os
-                            path_fisico = v.archivo_pdf.path
-                            if os.path.exists(path_fisico):
-                                with open(path_fisico, 'rb') as f:
-                                    zf.writestr(nombre_archivo, f.read())
-                            else:
-                                raise FileNotFoundError(f"Archivo no encontrado: {path_fisico}")
-                        elif format_type == 'pdf':
-                            pdf_buffer = generar_pdf_venta(v)
-                            pdf_bytes = pdf_buffer.getvalue() if hasattr(pdf_buffer, 'getvalue') else pdf_buffer.read()
-                            zf.writestr(nombre_archivo, pdf_bytes)
-                        else:
-                            # Un DTE aceptado se descarga desde su JWS histórico:
-                            # nunca se reconstruye con builders/versiones actuales.
-                            dte_json = obtener_dte_historico(v)
-                            if dte_json is None:
-                                if not v.empresa:
-                                    raise ValueError('La venta debe tener empresa asociada para generar el DTE')
-                                ambiente_empresa = (v.empresa.ambiente or '01').strip()
-                                dte_ambiente_map = {'01': '00', '00': '01'}
-                                ambiente_q = request.GET.get('ambiente')
-                                ambiente_dte = ambiente_q if ambiente_q else dte_ambiente_map.get(ambiente_empresa, '00')
-                                dte_json = generar_dte(v, ambiente=ambiente_dte)
-                            json_bytes = json.dumps(dte_json, indent=2, ensure_ascii=False).encode('utf-8')
-                            zf.writestr(nombre_archivo, json_bytes)
-                    except Exception as e:
-                        logger.warning(f"Error generando {ext} para venta {v.id}: {e}")
-                        msg_error = f"No se pudo generar este documento.\nVenta ID: {v.id}\nError: {str(e)}"
-                        zf.writestr(f"error_factura_{v.id}.txt", msg_error.encode('utf-8'))
-
-        buffer.seek(0)
-        resp = HttpResponse(buffer.getvalue(), content_type='application/zip')
+        ambiente_q = request.GET.get('ambiente')
+        resp = StreamingHttpResponse(
+            _iterar_zip_ventas(ids_ordenados, format_type, ambiente_q),
+            content_type='application/zip',
+        )
         resp['Content-Disposition'] = 'attachment; filename="facturas.zip"'
         return resp
     except Exception as e:
@@ -2849,20 +2809,24 @@ def generar_pdf_venta_endpoint(request, pk):
     Genera y retorna el PDF de una factura individual.
     NO usa @api_view para evitar negociación de contenido de DRF.
     Devuelve HttpResponse directamente para PDFs binarios.
+    Ventas con sello: PDF desde caché en disco, con ETag / Last-Modified (304 si no cambió).
     """
+    from .utils.pdf_cache import aplicar_cabeceras_cache, no_modificado, obtener_pdf_venta
+
     try:
         venta = Venta.objects.select_related('empresa', 'cliente').prefetch_related('detalles__producto').get(pk=pk)
         
-        # Generar el PDF
-        buffer = generar_pdf_venta(venta)
-        
-        # Leer el contenido del buffer
-        pdf_content = buffer.getvalue()
+        pdf = obtener_pdf_venta(venta)
+        if no_modificado(request, pdf):
+            response = HttpResponse(status=304)
+            aplicar_cabeceras_cache(response, pdf)
+            return response
         
         # Crear la respuesta HTTP con el PDF (sin pasar por DRF)
-        response = HttpResponse(pdf_content, content_type='application/pdf')
+        response = HttpResponse(pdf.contenido, content_type='application/pdf')
         response['Content-Disposition'] = f'inline; filename="factura_{venta.numero_control or venta.id}.pdf"'
-        response['Content-Length'] = len(pdf_content)
+        response['Content-Length'] = len(pdf.contenido)
+        aplicar_cabeceras_cache(response, pdf)
         
         return response
     except Venta.DoesNotExist:
@@ -2881,7 +2845,10 @@ def descargar_factura_publica(request):
     Descarga pública del PDF por código de generación (enlace WhatsApp / correo).
     GET /api/descargar-factura/?nis={codigoGeneracion}
     Sin autenticación: el UUID es el secreto compartido.
+    Facturas con sello se sirven desde la caché de PDFs (ETag / Last-Modified, 304).
     """
+    from .utils.pdf_cache import aplicar_cabeceras_cache, no_modificado, obtener_pdf_venta
+
     if request.method not in ('GET', 'HEAD'):
         return JsonResponse({'error': 'Método no permitido'}, status=405)
 
@@ -2899,16 +2866,19 @@ def descargar_factura_publica(request):
         return JsonResponse({'error': 'Factura no encontrada.'}, status=404)
 
     try:
-        buffer = generar_pdf_venta(venta)
-        pdf_content = buffer.getvalue()
-        filename = f"factura_{venta.numero_control or venta.codigo_generacion or venta.id}.pdf".replace('/', '-')
-        response = HttpResponse(
-            pdf_content if request.method == 'GET' else b'',
-            content_type='application/pdf',
-        )
-        response['Content-Disposition'] = f'inline; filename="{filename}"'
-        response['Content-Length'] = len(pdf_content)
+        pdf = obtener_pdf_venta(venta)
+        if no_modificado(request, pdf):
+            response = HttpResponse(status=304)
+        else:
+            filename = f"factura_{venta.numero_control or venta.codigo_generacion or venta.id}.pdf".replace('/', '-')
+            response = HttpResponse(
+                pdf.contenido if request.method == 'GET' else b'',
+                content_type='application/pdf',
+            )
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+            response['Content-Length'] = len(pdf.contenido)
         response['Cache-Control'] = 'private, max-age=300'
+        aplicar_cabeceras_cache(response, pdf)
         return response
     except Exception as e:
         logger.exception('Error PDF público nis=%s: %s', nis, e)
@@ -3,23 +3,32 @@
 Vistas para Carga Masiva de Facturas.
 - POST /api/carga-masiva/upload/: recibe Excel/CSV, valida y devuelve filas parseadas
 - GET /api/carga-masiva/plantilla-ejemplo/: descarga plantilla Excel de ejemplo
+- POST /api/carga-masiva/emitir/: emite en segundo plano las filas validadas (job)
+- GET /api/carga-masiva/jobs/<id>/: progreso del job de emisión
 """
 import io
-from decimal import Decimal
+import logging
+import uuid
+from decimal import Decimal, InvalidOperation
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
+from django.db import DatabaseError, transaction
 from django.http import HttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 
-from django.db.models import Q
-
-from .models import Cliente, Producto
+from .models import Cliente, Empresa, JobCargaMasiva, Producto
 from .utils.tenant import get_empresa_ids_allowlist, require_empresa_allowed
 
+logger = logging.getLogger(__name__)
+
+# Filas por job de emisión (un cierre de mes típico son ~2.000 facturas)
+MAX_FILAS_EMISION = 10000
+
 
 def _limpiar_nrc(val):
     if not val:
@@ -27,18 +36,6 @@ def _limpiar_nrc(val):
     return str(val).replace("-", "").replace(" ", "").strip()
 
 
-def _extraer_tipo_dte(val):
-    """Extrae el código numérico del tipo DTE: '01', '01-CF', '03', '03-CCF' -> '01' o '03'."""
-    if not val or (isinstance(val, float) and pd.isna(val)):
-        return ''
-    s = str(val).strip().upper()
-    if s.startswith('01'):
-        return '01'
-    if s.startswith('03'):
-        return '03'
-    return s[:2] if len(s) >= 2 else s
-
-
 # Columnas requeridas: al menos item 1
 # 'nrc' es el NRC del cliente (para CCF) o 'CF' (para CF). Alias: 'cliente' para compatibilidad.
 COLUMNAS_REQUERIDAS = ['cliente', 'tipo_dte', 'producto', 'cantidad', 'precio_unitario']
@@ -115,6 +112,53 @@ def _normalizar_columnas(df):
     return df.rename(columns=cols)
 
 
+# Cantidades y precios: se convierten a número por columna en _normalizar_valores
+COLUMNAS_NUMERICAS = ['cantidad', 'precio_unitario', 'cantidad_2', 'precio_2', 'cantidad_3', 'precio_3']
+
+
+def _normalizar_valores(df):
+    """Limpia las celdas con operaciones por columna (no fila por fila) antes de validar.
+
+    - Texto: sin NaN ni espacios. Columnas que Excel leyó como float con valores enteros
+      (NRC, NIT, teléfono) se pasan a entero para no arrastrar '.0'.
+    - Cantidades y precios: número (acepta coma decimal); vacío → None; texto no numérico
+      se deja tal cual para que _parse_item lo descarte como antes.
+    - tipo_dte: '01-CF' → '01', '03-CCF' → '03', 1 → '01'.
+    - nit: solo dígitos, con el cero inicial que Excel elimina (DUI 8→9, NIT 13→14; 10→9).
+    La fecha no se toca: _validar_fila la interpreta.
+    """
+    df = df.loc[:, ~df.columns.duplicated()].copy()
+    for col in df.columns:
+        if col == 'fecha':
+            continue
+        serie = df[col]
+        if pd.api.types.is_float_dtype(serie):
+            valores = serie.dropna()
+            if len(valores) and (valores % 1 == 0).all():
+                serie = serie.astype('Int64')
+        texto = serie.astype(object).where(serie.notna(), '').astype(str).str.strip()
+        if col in COLUMNAS_NUMERICAS:
+            numero = pd.to_numeric(texto.str.replace(',', '.', regex=False), errors='coerce')
+            texto = texto.astype(object).where(texto != '', None)
+            df[col] = numero.astype(object).where(numero.notna(), texto)
+        else:
+            df[col] = texto
+
+    if 'tipo_dte' in df.columns:
+        tipo = df['tipo_dte'].str.upper()
+        tipo = tipo.mask(tipo.str.fullmatch(r'[13]'), '0' + tipo)  # Excel/CSV leyó 01 como 1
+        df['tipo_dte'] = np.select(
+            [tipo.str.startswith('01'), tipo.str.startswith('03')], ['01', '03'], default=tipo.str[:2]
+        )
+    if 'nit' in df.columns:
+        # Excel elimina ceros iniciales: 8 dígitos → DUI sin cero, 13 dígitos → NIT sin cero.
+        digitos = df['nit'].str.replace(r'\D', '', regex=True)
+        largo = digitos.str.len()
+        digitos = digitos.mask(largo.isin((8, 13)), '0' + digitos)
+        df['nit'] = digitos.mask(largo == 10, digitos.str[:9])  # DUI con dígito extra, recortar
+    return df
+
+
 def _parse_item(row, suffix):
     """Extrae un ítem de la fila. suffix='' para item 1, '_2' para item 2, '_3' para item 3."""
     prod = str(row.get('producto' + suffix, '') or '').strip() if pd.notna(row.get('producto' + suffix, '')) else ''
@@ -137,20 +181,20 @@ def _parse_item(row, suffix):
 
 
 def _validar_fila(row, idx, empresa_id):
-    """Valida una fila y devuelve (datos_ok, errores). Soporta 1 a 3 ítems por factura."""
+    """Valida una fila (dict ya pasado por _normalizar_valores) y devuelve (datos_ok, errores).
+    Soporta 1 a 3 ítems por factura."""
     errores = []
     datos = {}
 
     # Cliente (NRC o "CF")
-    cliente_raw = str(row.get('cliente', '')).strip() if pd.notna(row.get('cliente')) else ''
+    cliente_raw = row.get('cliente') or ''
     if not cliente_raw:
         errores.append('Cliente/NRC es requerido')
     else:
         datos['cliente'] = cliente_raw
 
     # Tipo DTE (acepta '01', '01-CF', '03', '03-CCF')
-    tipo_raw = str(row.get('tipo_dte', '')).strip() if pd.notna(row.get('tipo_dte')) else ''
-    tipo = _extraer_tipo_dte(tipo_raw) if tipo_raw else ''
+    tipo = row.get('tipo_dte') or ''
     if tipo not in ('01', '03'):
         errores.append('Tipo DTE debe ser 01 (Consumidor Final) o 03 (Crédito Fiscal)')
     else:
@@ -187,17 +231,8 @@ def _validar_fila(row, idx, empresa_id):
     # Opcionales. Para CF (01): si documento_receptor vacío, usar nombre 'Consumidor Final'
     datos['nombre_receptor'] = str(row.get('nombre_receptor', '')).strip() or None
     datos['nombre_comercial'] = str(row.get('nombre_comercial', '')).strip() or None
-    # Normalizar NIT/DUI: Excel elimina ceros iniciales.
-    # 8 dígitos → DUI sin cero → completar a 9. 13 dígitos → NIT sin cero → completar a 14.
-    _nit_raw = str(row.get('nit', '') or '').strip()
-    _nit_dig = ''.join(c for c in _nit_raw.replace('-', '').replace(' ', '') if c.isdigit())
-    if len(_nit_dig) == 8:
-        _nit_dig = '0' + _nit_dig   # DUI: Excel quitó el cero inicial
-    elif len(_nit_dig) == 13:
-        _nit_dig = '0' + _nit_dig   # NIT: Excel quitó el cero inicial
-    elif len(_nit_dig) == 10:
-        _nit_dig = _nit_dig[:9]     # DUI con dígito extra, recortar
-    datos['nit'] = _nit_dig if _nit_dig else None
+    # NIT/DUI ya normalizado en _normalizar_valores (ceros iniciales repuestos)
+    datos['nit'] = row.get('nit') or None
     doc_rep = str(row.get('documento_receptor', '')).strip() or None
     if datos.get('tipo_dte') == '01' and not doc_rep:
         datos['nombre_receptor'] = datos['nombre_receptor'] or 'Consumidor Final'
@@ -238,6 +273,127 @@ def _validar_fila(row, idx, empresa_id):
     return datos
 
 
+def _indice_clientes(empresa_id):
+    """NRC y NIT (sin guiones ni espacios, en minúsculas) → id del cliente de la empresa."""
+    indice = {}
+    for cliente_id, nrc, nit in (
+        Cliente.objects.filter(empresa_id=empresa_id).order_by('id').values_list('id', 'nrc', 'nit')
+    ):
+        for valor in (nrc, nit):
+            clave = _limpiar_nrc(valor).lower()
+            if clave:
+                indice.setdefault(clave, cliente_id)
+    return indice
+
+
+class _IndiceProductos:
+    """Productos activos de la empresa en memoria. Mismo orden de búsqueda que antes por consulta:
+    código exacto, descripción exacta y luego descripción que contiene el texto (sin mayúsculas)."""
+
+    def __init__(self, empresa_id):
+        self.por_codigo = {}
+        self.por_descripcion = {}
+        self.descripciones = []
+        self._contiene = {}
+        for producto_id, codigo, descripcion in (
+            Producto.objects.filter(empresa_id=empresa_id, activo=True)
+            .order_by('id')
+            .values_list('id', 'codigo', 'descripcion')
+        ):
+            if codigo:
+                self.por_codigo.setdefault(codigo.lower(), producto_id)
+            descripcion = (descripcion or '').lower()
+            self.por_descripcion.setdefault(descripcion, producto_id)
+            self.descripciones.append((descripcion, producto_id))
+
+    def buscar(self, texto):
+        clave = texto.lower()
+        producto_id = self.por_codigo.get(clave) or self.por_descripcion.get(clave)
+        if producto_id is None:
+            if clave not in self._contiene:
+                self._contiene[clave] = next((pid for d, pid in self.descripciones if clave in d), None)
+            producto_id = self._contiene[clave]
+        return producto_id
+
+    def agregar(self, descripcion, producto_id):
+        """Registra un producto por crear para que filas posteriores lo encuentren (como tras el INSERT)."""
+        clave = descripcion.lower()
+        self.por_descripcion.setdefault(clave, producto_id)
+        self.descripciones.append((clave, producto_id))
+        self._contiene = {k: v for k, v in self._contiene.items() if v is not None}
+
+
+def _crear_productos(empresa_id, nuevos):
+    """Crea en un solo INSERT los productos que no existen. nuevos: [(descripción, precio)].
+    Si el INSERT en bloque falla se crean uno a uno: solo las filas inválidas quedan fuera.
+    Devuelve descripción en minúsculas → id de los creados (los demás quedan como no reconocidos)."""
+    productos = []
+    for descripcion, precio in nuevos:
+        try:
+            precio = Decimal(str(precio))
+        except (InvalidOperation, ValueError, TypeError):
+            precio = Decimal('0')
+        codigo_safe = (descripcion[:40].replace('/', '-').replace('\\', '-') or 'ITEM') + '-' + str(uuid.uuid4())[:6].upper()
+        productos.append(Producto(
+            empresa_id=empresa_id,
+            codigo=codigo_safe[:50],
+            descripcion=descripcion[:1000],
+            precio_unitario=precio,
+        ))
+    try:
+        with transaction.atomic():
+            creados = Producto.objects.bulk_create(productos)
+        return {descripcion.lower(): p.id for (descripcion, _), p in zip(nuevos, creados)}
+    except DatabaseError as e:
+        logger.warning("Carga masiva: falló el alta en bloque de %s productos (empresa %s), se crean uno a uno: %s",
+                       len(productos), empresa_id, e)
+    ids = {}
+    for (descripcion, _), producto in zip(nuevos, productos):
+        producto.pk = None
+        try:
+            with transaction.atomic():
+                producto.save(force_insert=True)
+        except DatabaseError as e:
+            logger.warning("Carga masiva: no se pudo crear el producto %r (empresa %s): %s", descripcion, empresa_id, e)
+            continue
+        ids[descripcion.lower()] = producto.id
+    return ids
+
+
+def _resolver_catalogo(filas, empresa_id):
+    """Asigna cliente_id y producto_id a las filas válidas contra índices en memoria
+    (una consulta por catálogo) y crea de una vez los productos que no existen."""
+    validas = [f for f in filas if not f['_errores']]
+    con_nrc = [f for f in validas if f['tipo_dte'] == '03' and f.get('cliente')]
+    clientes = _indice_clientes(empresa_id) if con_nrc else {}
+    for datos in validas:
+        datos['cliente_id'] = None
+    for datos in con_nrc:
+        datos['cliente_id'] = clientes.get(_limpiar_nrc(datos['cliente']).lower())
+
+    items = [item for datos in validas for item in datos.get('items', [])]
+    productos = _IndiceProductos(empresa_id) if items else None
+    # Los productos por crear se marcan con ('nuevo', descripción) hasta tener id
+    nuevos = {}
+    for item in items:
+        prod_str = (item.get('producto') or '').strip()
+        item['producto_id'] = productos.buscar(prod_str) if prod_str else None
+        if item['producto_id'] is None and prod_str:
+            item['producto_id'] = ('nuevo', prod_str.lower())
+            nuevos[prod_str.lower()] = (prod_str, item.get('precio_unitario', 0))
+            productos.agregar(prod_str, item['producto_id'])
+    creados = _crear_productos(empresa_id, list(nuevos.values())) if nuevos else {}
+    for item in items:
+        if isinstance(item['producto_id'], tuple):
+            item['producto_id'] = creados.get(item['producto_id'][1])
+        item['_producto_reconocido'] = item['producto_id'] is not None
+
+    for datos in filas:
+        if datos.get('items'):
+            datos['producto_id'] = datos['items'][0].get('producto_id')
+            datos['_producto_reconocido'] = datos['items'][0].get('_producto_reconocido', True)
+
+
 def _crear_plantilla_ejemplo():
     """Genera plantilla completa con todos los datos del receptor e ítems (hasta 3 por factura).
     Columna nit/dui: acepta NIT (14 dígitos) o DUI (9 dígitos). Detección automática (ley de homologación).
@@ -331,51 +487,10 @@ def carga_masiva_upload(request):
             "detail": f"Faltan columnas requeridas: {', '.join(faltantes)}. Use la plantilla de ejemplo."
         }, status=status.HTTP_400_BAD_REQUEST)
 
-    filas = []
-    for idx, row in df.iterrows():
-        datos = _validar_fila(row, idx, empresa_id)
-        # Resolver cliente_id y producto_id para facilitar emisión
-        if not datos['_errores']:
-            if datos['tipo_dte'] == '03' and datos.get('cliente'):
-                cliente_obj = Cliente.objects.filter(
-                    empresa_id=empresa_id
-                ).filter(
-                    Q(nrc__iexact=_limpiar_nrc(datos['cliente'])) |
-                    Q(nit__iexact=_limpiar_nrc(datos['cliente']))
-                ).first()
-                datos['cliente_id'] = cliente_obj.id if cliente_obj else None
-            else:
-                datos['cliente_id'] = None
-            for item in datos.get('items', []):
-                prod_str = (item.get('producto') or '').strip()
-                prod_obj = None
-                if prod_str:
-                    prod_obj = Producto.objects.filter(
-                        empresa_id=empresa_id, activo=True, codigo__iexact=prod_str
-                    ).first()
-                if not prod_obj and prod_str:
-                    prod_obj = Producto.objects.filter(
-                        empresa_id=empresa_id, activo=True
-                    ).filter(Q(descripcion__iexact=prod_str) | Q(descripcion__icontains=prod_str)).first()
-                if not prod_obj and prod_str:
-                    try:
-                        import uuid
-                        precio = Decimal(str(item.get('precio_unitario', 0)))
-                        codigo_safe = (prod_str[:40].replace('/', '-').replace('\\', '-') or 'ITEM') + '-' + str(uuid.uuid4())[:6].upper()
-                        prod_obj = Producto.objects.create(
-                            empresa_id=empresa_id,
-                            codigo=codigo_safe[:50],
-                            descripcion=prod_str[:1000],
-                            precio_unitario=precio,
-                        )
-                    except Exception:
-                        pass
-                item['producto_id'] = prod_obj.id if prod_obj else None
-                item['_producto_reconocido'] = prod_obj is not None
-        if datos.get('items'):
-            datos['producto_id'] = datos['items'][0].get('producto_id')
-            datos['_producto_reconocido'] = datos['items'][0].get('_producto_reconocido', True)
-        filas.append(datos)
+    df = _normalizar_valores(df)
+    filas = [_validar_fila(row, idx, empresa_id) for idx, row in zip(df.index, df.to_dict('records'))]
+    # Resolver cliente_id y producto_id para facilitar emisión
+    _resolver_catalogo(filas, empresa_id)
 
     return Response({
         "filas": filas,
@@ -399,3 +514,90 @@ def carga_masiva_plantilla_ejemplo(request):
     )
     response['Content-Disposition'] = 'attachment; filename="plantilla_carga_masiva.xlsx"'
     return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def carga_masiva_emitir(request):
+    """
+    Emite en segundo plano las filas revisadas en el frontend (las de carga_masiva_upload).
+    Body JSON: {"empresa_id": 1, "filas": [...]}. Responde 202 con el job; el progreso se
+    consulta en GET /api/carga-masiva/jobs/<job_id>/.
+    Cabecera Idempotency-Key (opcional): un reenvío con la misma clave devuelve el job ya creado.
+    Si la empresa ya tiene una emisión en curso responde 409 con ese job.
+    """
+    from .services.carga_masiva_job import (
+        iniciar_job_carga_masiva,
+        job_carga_masiva_activo,
+        job_carga_masiva_dict,
+    )
+
+    empresa_ids = get_empresa_ids_allowlist(request)
+    if not empresa_ids:
+        return Response({"detail": "Autenticación requerida"}, status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        empresa_id = int(request.data.get('empresa_id'))
+    except (TypeError, ValueError):
+        return Response({"detail": "empresa_id es requerido"}, status=status.HTTP_400_BAD_REQUEST)
+    r = require_empresa_allowed(request, empresa_id)
+    if r is not None:
+        return r
+
+    filas = request.data.get('filas')
+    if not isinstance(filas, list) or not all(isinstance(f, dict) for f in filas):
+        return Response({"detail": "filas debe ser una lista de filas de la carga masiva"}, status=status.HTTP_400_BAD_REQUEST)
+    if not filas:
+        return Response({"detail": "No hay filas para emitir"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(filas) > MAX_FILAS_EMISION:
+        return Response({
+            "detail": f"Máximo {MAX_FILAS_EMISION} filas por emisión; divida el archivo."
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    # _fila identifica la fila en los resultados y al reanudar un job interrumpido
+    for n, fila in enumerate(filas, start=1):
+        fila.setdefault('_fila', n)
+    if len({f['_fila'] for f in filas}) != len(filas):
+        return Response({"detail": "Cada fila debe tener un _fila distinto"}, status=status.HTTP_400_BAD_REQUEST)
+
+    idempotency_key = (request.headers.get('Idempotency-Key') or '').strip()[:64] or None
+    with transaction.atomic():
+        # Bloquea la empresa: dos envíos simultáneos no crean dos jobs
+        if Empresa.objects.select_for_update().only('pk').filter(pk=empresa_id).first() is None:
+            return Response({"detail": "Empresa no encontrada"}, status=status.HTTP_404_NOT_FOUND)
+        if idempotency_key:
+            previo = JobCargaMasiva.objects.filter(empresa_id=empresa_id, idempotency_key=idempotency_key).first()
+            if previo is not None:
+                return Response(job_carga_masiva_dict(previo), status=status.HTTP_200_OK)
+        activo = job_carga_masiva_activo(empresa_id)
+        if activo is not None:
+            return Response({
+                **job_carga_masiva_dict(activo),
+                "detail": "Ya hay una carga masiva en emisión para esta empresa; espere a que termine.",
+            }, status=status.HTTP_409_CONFLICT)
+        job = JobCargaMasiva.objects.create(
+            empresa_id=empresa_id,
+            creado_por=request.user if request.user.is_authenticated else None,
+            filas=filas,
+            total=len(filas),
+            idempotency_key=idempotency_key,
+            mensaje="Carga masiva en cola de emisión.",
+        )
+        iniciar_job_carga_masiva(job.id)
+    return Response(job_carga_masiva_dict(job), status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def carga_masiva_job(request, job_id):
+    """Progreso de una emisión lanzada con carga-masiva/emitir/ (conteo de ventas por estado_dte)."""
+    from .services.carga_masiva_job import job_carga_masiva_dict, reanudar_jobs_interrumpidos
+
+    job = JobCargaMasiva.objects.filter(pk=job_id).first()
+    if job is None:
+        return Response({"detail": "Job de carga masiva no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    r = require_empresa_allowed(request, job.empresa_id)
+    if r is not None:
+        return r
+    if reanudar_jobs_interrumpidos(job.empresa_id):
+        job.refresh_from_db()
+    return Response(job_carga_masiva_dict(job))
@@ -167,6 +167,12 @@ WHATSAPP_TEMPLATE_HEADER_DOCUMENT = _raw_wa_header_doc in ('1', 'true', 'yes', '
 # Si True, se encola la tarea y se responde de inmediato (estado queda Pendiente hasta que el worker procese).
 USE_ASYNC_FACTURACION = os.environ.get('USE_ASYNC_FACTURACION', 'false').lower() in ('1', 'true', 'yes')
 
+# Worker de la cola (procesar_tareas_facturacion --worker): tareas en paralelo, poll si no hay NOTIFY,
+# y lease de una tarea Procesando (si el worker muere, otro la retoma al vencer).
+FACTURACION_WORKER_HILOS = int(os.environ.get('FACTURACION_WORKER_HILOS', '4'))
+FACTURACION_WORKER_POLL_SEGUNDOS = float(os.environ.get('FACTURACION_WORKER_POLL_SEGUNDOS', '2'))
+FACTURACION_LEASE_SECONDS = int(os.environ.get('FACTURACION_LEASE_SECONDS', '300'))
+
 # PosAgil (POST /api/pos/procesar-venta/): por defecto ignora USE_ASYNC_FACTURACION y procesa MH en la misma petición
 # para que el ticket pueda llevar sello sin cola. Desactivar solo si el POS debe comportarse como el resto de la API.
 POSAGIL_FACTURACION_SINCRONA = os.environ.get(
@@ -179,8 +185,48 @@ POSAGIL_FACTURACION_SINCRONA = os.environ.get(
 MH_PASSWORD_OVERRIDE = (os.environ.get('MH_PASSWORD_OVERRIDE') or None) if DEBUG else None
 # Firma: si True, se firma dentro del backend (no hace falta contenedor firmador).
 USE_INTERNAL_FIRMADOR = os.environ.get('USE_INTERNAL_FIRMADOR', 'true').lower() in ('1', 'true', 'yes')
+# Claves de firma ya parseadas que se mantienen en memoria por proceso (firmador interno).
+FIRMADOR_CACHE_MAX_CERTIFICADOS = int(os.environ.get('FIRMADOR_CACHE_MAX_CERTIFICADOS', '32'))
 # URL del firmador externo (solo si USE_INTERNAL_FIRMADOR=False). En Docker: FIRMADOR_URL=http://firmador:8113/
 DTE_FIRMADOR_URL = os.environ.get('FIRMADOR_URL', 'http://localhost:8113/').rstrip('/') + '/firmardocumento/'
+# Token /seguridad/auth compartido entre procesos (tabla TokenMH). MH emite tokens de 24 h;
+# se renueva MH_TOKEN_MARGEN_RENOVACION_SECONDS antes de vencer.
+MH_TOKEN_TTL_SECONDS = int(os.environ.get('MH_TOKEN_TTL_SECONDS', str(24 * 3600)))
+MH_TOKEN_MARGEN_RENOVACION_SECONDS = int(os.environ.get('MH_TOKEN_MARGEN_RENOVACION_SECONDS', str(30 * 60)))
+# Conexiones keep-alive hacia MH, firmador y Meta (api/services/http_pool.py): conexiones que se
+# conservan por host (>= hilos del worker/contingencia) y timeout de conexión; el de lectura es por endpoint.
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '10'))
+HTTP_CONNECT_TIMEOUT_SEGUNDOS = float(os.environ.get('HTTP_CONNECT_TIMEOUT_SEGUNDOS', '5'))
+# Envíos de DTE a MH por segundo y empresa cuando se transmite en paralelo (cierre de contingencia).
+MH_RATE_LIMIT_POR_SEGUNDO = float(os.environ.get('MH_RATE_LIMIT_POR_SEGUNDO', '5'))
+# Hilos que reenvían ventas PendienteEnvio al cerrar una contingencia.
+CONTINGENCIA_HILOS = int(os.environ.get('CONTINGENCIA_HILOS', '4'))
+# Jobs en hilo del proceso web (cierre de contingencia, carga masiva): sin latido durante este
+# tiempo se consideran interrumpidos por un reinicio y se cierran o reanudan.
+JOB_SIN_LATIDO_SEGUNDOS = int(os.environ.get('JOB_SIN_LATIDO_SEGUNDOS', '300'))
+# Transmisión por lotes (/fesv/recepcionlote/): el cierre de contingencia y la cola de facturación
+# (procesar_tareas_facturacion sin --worker) agrupan los DTE por empresa/ambiente en lotes de MH
+# en vez de un envío por documento. El resultado de cada DTE se consulta con consultadtelote.
+MH_LOTE_HABILITADO = os.environ.get('MH_LOTE_HABILITADO', 'false').lower() in ('1', 'true', 'yes')
+MH_LOTE_MAX_DOCUMENTOS = int(os.environ.get('MH_LOTE_MAX_DOCUMENTOS', '100'))
+MH_LOTE_CONSULTA_INTERVALO_SEGUNDOS = float(os.environ.get('MH_LOTE_CONSULTA_INTERVALO_SEGUNDOS', '5'))
+# Espera máxima por el resultado de un lote; lo que falte se consulta en la siguiente pasada de la cola.
+MH_LOTE_CONSULTA_MAX_SEGUNDOS = float(os.environ.get('MH_LOTE_CONSULTA_MAX_SEGUNDOS', '120'))
+# Host alternativo para todas las URLs de MH (mismas rutas). Vacío = MH real según empresa.ambiente.
+# Desarrollo sin MH: python manage.py simulador_mh y MH_URL_BASE=http://127.0.0.1:8114
+MH_URL_BASE = os.environ.get('MH_URL_BASE', '').strip()
+# Emisión de Carga Masiva en segundo plano: ventas creadas (bulk_create + correlativos en bloque)
+# por transacción. Bloques más grandes = menos viajes a la BD pero el Correlativo queda bloqueado más tiempo.
+CARGA_MASIVA_FILAS_POR_TRANSACCION = int(os.environ.get('CARGA_MASIVA_FILAS_POR_TRANSACCION', '250'))
+# Procesos que renderizan PDF por lotes (descarga ZIP, precalentado tras aceptación MH). Desactivado
+# por defecto: se crean al primer lote en cada proceso que lo usa (cada worker web tendría su pool);
+# 0 o 1 = render en el mismo proceso. Los PDF sueltos (descarga, correo, WhatsApp) nunca lo usan.
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', '0'))
+# PDFs de ventas con sello MH guardados en disco (se sirven con ETag en vez de renderizar otra vez).
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', str(MEDIA_ROOT / 'pdf_cache')))
+# KPIs del dashboard cacheados por empresa/ambiente (segundos; 0 = sin caché). Se invalidan al
+# aceptar MH una venta; con la caché local por proceso, en los demás workers vencen por TTL.
+DASHBOARD_STATS_CACHE_SECONDS = int(os.environ.get('DASHBOARD_STATS_CACHE_SECONDS', '60'))
 # URL invalidación (Manual MH 4.5). Override solo si necesitas otra URL.
 # DTE_ANULAR_URL = "https://apitest.dtes.mh.gob.sv/fesv/anulardte"
 
@@ -17,6 +17,38 @@ export async function subirArchivoCargaMasiva(archivo, empresaId) {
   return data
 }
 
+/**
+ * Emite en el servidor las filas validadas: un solo POST crea un job en segundo plano que
+ * registra las facturas y las encola para Hacienda. Se consulta el job hasta que termina.
+ * onProgress(job) opcional recibe cada actualización (creadas, errores, por_estado_dte...).
+ * idempotencyKey: misma clave = mismo job (reenviar no duplica las facturas ya creadas).
+ */
+export async function emitirCargaMasiva(filas, empresaId, { onProgress, intervaloMs = 2000, idempotencyKey } = {}) {
+  const { data } = await apiClient.post('/carga-masiva/emitir/', { empresa_id: empresaId, filas }, {
+    timeout: 120000,
+    headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
+  })
+  let job = data
+  while (job.estado === 'EnCola' || job.estado === 'Procesando') {
+    onProgress?.(job)
+    await new Promise((resolve) => setTimeout(resolve, intervaloMs))
+    job = await getJobCargaMasiva(data.job_id)
+  }
+  onProgress?.(job)
+  if (job.estado === 'Error') {
+    const err = new Error(job.mensaje || 'Error al emitir la carga masiva.')
+    err.response = { data: job }
+    throw err
+  }
+  return job
+}
+
+/** Progreso de una emisión de carga masiva (facturas creadas y conteo por estado_dte). */
+export async function getJobCargaMasiva(jobId) {
+  const { data } = await apiClient.get(`/carga-masiva/jobs/${jobId}/`)
+  return data
+}
+
 /**
  * Descarga la plantilla de ejemplo para carga masiva.
  */
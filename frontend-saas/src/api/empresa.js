@@ -66,9 +66,30 @@ export async function desactivarContingencia(empresaId, payload = {}) {
 /**
  * Procesa la contingencia completa:
  * 1) Genera y envía el reporte de contingencia.
- * 2) Envía todas las facturas en PendienteEnvio y devuelve un resumen.
+ * 2) Reenvía en paralelo las facturas en PendienteEnvio y devuelve un resumen.
+ * El backend lo ejecuta en segundo plano: se consulta el job hasta que termina.
+ * onProgress(job) opcional recibe cada actualización (aceptadas, rechazadas, pendientes...).
  */
-export async function procesarContingenciaCompleta(empresaId, payload = {}) {
-  const { data } = await apiClient.post(`/empresas/${empresaId}/procesar-contingencia-completa/`, payload, { timeout: 600000 })
+export async function procesarContingenciaCompleta(empresaId, payload = {}, { onProgress, intervaloMs = 2000 } = {}) {
+  const { data } = await apiClient.post(`/empresas/${empresaId}/procesar-contingencia-completa/`, payload)
+  if (!data?.job_id) return data
+  let job = data
+  while (job.estado === 'EnCola' || job.estado === 'Procesando') {
+    onProgress?.(job)
+    await new Promise((resolve) => setTimeout(resolve, intervaloMs))
+    job = await getContingenciaJob(empresaId, data.job_id)
+  }
+  onProgress?.(job)
+  if (job.estado === 'Error') {
+    const err = new Error(job.mensaje || 'Error al procesar la contingencia.')
+    err.response = { data: job }
+    throw err
+  }
+  return job
+}
+
+/** Estado y progreso de un cierre de contingencia en segundo plano. */
+export async function getContingenciaJob(empresaId, jobId) {
+  const { data } = await apiClient.get(`/empresas/${empresaId}/contingencia-jobs/${jobId}/`)
   return data
 }
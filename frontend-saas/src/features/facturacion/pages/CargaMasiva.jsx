@@ -1,105 +1,12 @@
 import { useState, useCallback } from 'react'
 import { Upload, Download, FileSpreadsheet, AlertCircle, CheckCircle2, Loader2 } from 'lucide-react'
 import toast from 'react-hot-toast'
-import { subirArchivoCargaMasiva, descargarPlantillaEjemplo } from '../../../api/cargaMasiva'
-import apiClient from '../../../api/axios'
+import { subirArchivoCargaMasiva, descargarPlantillaEjemplo, emitirCargaMasiva } from '../../../api/cargaMasiva'
 import { useEmpresaStore } from '../../../stores/useEmpresaStore'
-import { fechaHoyElSalvadorISO } from '../../../utils/format'
 
-/**
- * Convierte una fila de carga masiva al payload esperado por POST /ventas/crear-con-detalles/
- * Soporta múltiples ítems por factura (fila.items).
- */
-function filaToPayload(fila, empresaId) {
-  const tipo = fila.tipo_dte
-  const esCF = tipo === '01'
-  const items = fila.items && fila.items.length ? fila.items : [
-    { producto: fila.producto, cantidad: fila.cantidad || 1, precio_unitario: fila.precio_unitario || 0, producto_id: fila.producto_id },
-  ]
-
-  const detalles = []
-  let ventaGravadaTotal = 0
-  let debitoFiscalTotal = 0
-
-  items.forEach((it, idx) => {
-    const cant = Number(it.cantidad) || 1
-    const prec = Number(it.precio_unitario) || 0
-    const totalLinea = cant * prec
-
-    let gravadaItem, ivaItem, precioUnit
-    if (esCF) {
-      gravadaItem = Math.round((totalLinea / 1.13) * 100) / 100
-      ivaItem = Math.round((totalLinea - gravadaItem) * 100) / 100
-      precioUnit = cant > 0 ? Math.round((gravadaItem / cant) * 100) / 100 : 0
-    } else {
-      gravadaItem = totalLinea
-      ivaItem = Math.round(gravadaItem * 0.13 * 100) / 100
-      precioUnit = prec
-    }
-
-    ventaGravadaTotal += gravadaItem
-    debitoFiscalTotal += ivaItem
-
-    const det = {
-      cantidad: cant,
-      descripcion_libre: it.producto || null,
-      codigo_libre: null,
-      precio_unitario: precioUnit,
-      monto_descuento: 0,
-      venta_no_sujeta: 0,
-      venta_exenta: 0,
-      venta_gravada: gravadaItem,
-      iva_item: ivaItem,
-      numero_item: idx + 1,
-    }
-    if (it.producto_id) det.producto_id = it.producto_id
-    detalles.push(det)
-  })
-
-  const hoy = fechaHoyElSalvadorISO()
-  const periodo = (fila.fecha || hoy).slice(0, 7)
-  const tipoVenta = tipo === '01' ? 'CF' : 'CCF'
-  const nombreReceptor = esCF
-    ? (fila.nombre_receptor || 'Consumidor Final')
-    : (fila.nombre_receptor || fila.cliente || '')
-  const documentoReceptor = esCF ? (fila.documento_receptor ?? '') : null
-
-  const body = {
-    empresa: empresaId,
-    tipo_dte: tipo,
-    cliente_id: fila.cliente_id || null,
-    cliente: esCF ? null : (fila.cliente || null),
-    nombre_receptor: nombreReceptor,
-    nombre_comercial_receptor: fila.nombre_comercial || null,
-    nit_receptor: esCF ? null : (fila.nit || null),
-    documento_receptor: documentoReceptor,
-    tipo_doc_receptor: 'NIT',
-    receptor_direccion: fila.direccion || null,
-    receptor_correo: fila.correo || null,
-    receptor_departamento: fila.departamento || null,
-    receptor_municipio: fila.municipio || null,
-    receptor_telefono: fila.telefono || null,
-    cod_actividad_receptor: fila.cod_actividad || null,
-    desc_actividad_receptor: fila.desc_actividad || null,
-    fecha_emision: fila.fecha || hoy,
-    periodo_aplicado: periodo,
-    tipo_venta: tipoVenta,
-    nrc_receptor: esCF ? null : (fila.cliente || null),
-    venta_gravada: ventaGravadaTotal,
-    venta_exenta: 0,
-    venta_no_sujeta: 0,
-    debito_fiscal: debitoFiscalTotal,
-    estado_dte: 'Generado',
-    clase_documento: '4',
-    clasificacion_venta: '1',
-    tipo_ingreso: '3',
-    condicion_operacion: 1,
-    plazo_pago: null,
-    periodo_pago: null,
-    detalles,
-  }
-  return body
-}
+// Clave por versión de las filas: reenviar la misma emisión devuelve el job ya creado
+const nuevaClaveEmision = () =>
+  globalThis.crypto?.randomUUID?.() ?? `${Date.now()}-${Math.random().toString(16).slice(2)}`
 
 export function CargaMasiva() {
   const empresaId = useEmpresaStore((s) => s.empresaId)
@@ -110,6 +17,7 @@ export function CargaMasiva() {
   const [emitiendo, setEmitiendo] = useState(false)
   const [progreso, setProgreso] = useState({ actual: 0, total: 0 })
   const [errores, setErrores] = useState([])
+  const [claveEmision, setClaveEmision] = useState(null)
 
   const handleSubir = useCallback(async (e) => {
     const file = e?.target?.files?.[0]
@@ -123,6 +31,7 @@ export function CargaMasiva() {
       const data = await subirArchivoCargaMasiva(file, empresaId)
       setFilas(data.filas || [])
       setEmpresaIdArchivo(data.empresa_id)
+      setClaveEmision(nuevaClaveEmision())
       const conError = (data.filas || []).filter((f) => f._errores?.length > 0)
       if (conError.length > 0) {
         toast(`Se cargaron ${data.total} filas. ${conError.length} tienen errores de validación.`)
@@ -152,6 +61,7 @@ export function CargaMasiva() {
   }, [])
 
   const actualizarFila = useCallback((idx, campo, valor) => {
+    setClaveEmision(nuevaClaveEmision())
     setFilas((prev) => {
       const next = [...prev]
       if (!next[idx]) return next
@@ -188,63 +98,36 @@ export function CargaMasiva() {
     }
     setEmitiendo(true)
     setProgreso({ actual: 0, total: filasValidas.length })
-    const fallidas = []
-    let emitidas = 0
-    for (let i = 0; i < filasValidas.length; i++) {
-      const fila = filasValidas[i]
-      setProgreso((p) => ({ ...p, actual: i }))
-      try {
-        const body = filaToPayload(fila, empresaIdArchivo)
-        const { data } = await apiClient.post('/ventas/crear-con-detalles/', body, { timeout: 60000 })
-        const rechazado = (data?.estado_dte || '').includes('Rechazado') || (data?.estado_dte || '').includes('Error')
-        if (rechazado) {
-          const mensaje = data?.mensaje || data?.observaciones_mh || 'Rechazado por Hacienda'
-          fallidas.push({
-            fila: fila._fila,
-            mensaje,
-            receptor_preview: data?.receptor_preview,
-            dte_json_preview: data?.dte_json_preview,
-          })
-          setFilas((prev) =>
-            prev.map((f) =>
-              f === fila ? { ...f, _estado: 'error', _error_mensaje: mensaje } : f
-            )
-          )
-        } else {
-          emitidas++
-          const ventaId = data?.id
-          setFilas((prev) =>
-            prev.map((f) =>
-              f === fila ? { ...f, _estado: 'ok', _venta_id: ventaId } : f
-            )
-          )
-        }
-      } catch (err) {
-        const d = err.response?.data
-        const mensaje = d?.mensaje || d?.error || d?.detail
-          || (typeof d === 'object' ? JSON.stringify(d) : err.message)
-        fallidas.push({
-          fila: fila._fila,
-          mensaje,
-          receptor_preview: d?.receptor_preview,
-          dte_json_preview: d?.dte_json_preview,
+    try {
+      // Una sola petición: el servidor crea y encola las facturas aunque se cierre la pestaña
+      const job = await emitirCargaMasiva(filasValidas, empresaIdArchivo, {
+        onProgress: (j) => setProgreso({ actual: j.creadas + j.errores, total: j.total }),
+        idempotencyKey: claveEmision,
+      })
+      const resultados = job.resultados || []
+      const porFila = new Map(resultados.map((r) => [r._fila, r]))
+      const fallidas = resultados.filter((r) => r.error).map((r) => ({ fila: r._fila, mensaje: r.error }))
+      setFilas((prev) =>
+        prev.map((f) => {
+          const r = porFila.get(f._fila)
+          if (!r) return f
+          return r.error
+            ? { ...f, _estado: 'error', _error_mensaje: r.error }
+            : { ...f, _estado: 'ok', _venta_id: r.venta_id }
         })
-        setFilas((prev) =>
-          prev.map((f) =>
-            f === fila ? { ...f, _estado: 'error', _error_mensaje: mensaje } : f
-          )
-        )
+      )
+      setErrores(fallidas)
+      if (fallidas.length > 0) {
+        toast.error(`${job.creadas} emitidas. ${fallidas.length} fallaron. Revisa los detalles.`)
+      } else {
+        toast.success(job.mensaje || `Se emitieron ${job.creadas} facturas correctamente`)
       }
+    } catch (err) {
+      toast.error(err.response?.data?.detail || err.response?.data?.mensaje || err.message || 'Error al emitir')
+    } finally {
+      setEmitiendo(false)
     }
-    setProgreso({ actual: filasValidas.length, total: filasValidas.length })
-    setEmitiendo(false)
-    setErrores(fallidas)
-    if (fallidas.length > 0) {
-      toast.error(`${emitidas} emitidas. ${fallidas.length} fallaron. Revisa los detalles.`)
-    } else {
-      toast.success(`Se emitieron ${emitidas} facturas correctamente`)
-    }
-  }, [filasValidas, empresaIdArchivo, empresaId])
+  }, [filasValidas, empresaIdArchivo, empresaId, claveEmision])
 
   if (!empresaId) {
     return (